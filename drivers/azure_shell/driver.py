@@ -55,15 +55,30 @@ class AzureShellDriver(ResourceDriverInterface):
     def PowerOff(self, context, ports):
         return self.azure_shell.power_off_vm(context)
 
+    def PowerOnInstances(self, context, request):
+        return self.azure_shell.power_on_vms(command_context=context, request=request)
+
+    def PowerOffInstances(self, context, request):
+        return self.azure_shell.power_off_vms(command_context=context, request=request)
+
+    def GetPowerOperationsStatus(self, context, request):
+        return self.azure_shell.get_power_operations_status(command_context=context, request=request)
+
     def PowerCycle(self, context, ports, delay):
         pass
 
     def remote_refresh_ip(self, context, ports, cancellation_context):
         return self.azure_shell.refresh_ip(context)
 
+    def RefreshIPs(self, context, request):
+        return self.azure_shell.refresh_ips(command_context=context, request=request)
+
     def DeleteInstance(self, context, ports):
         self.azure_shell.delete_azure_vm(command_context=context)
 
+    def DeleteInstances(self, context, request):
+        return self.azure_shell.delete_azure_vms(command_context=context, request=request)
+
     def PrepareSandboxInfra(self, context, request, cancellation_context):
         actions = self.request_parser.convert_driver_request_to_actions(request)
         results = self.azure_shell.prepare_connectivity(context, actions, cancellation_context)
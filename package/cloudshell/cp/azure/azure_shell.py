@@ -1,5 +1,3 @@
-from threading import Lock
-
 import jsonpickle
 from cloudshell.core.context.error_handling_context import ErrorHandlingContext
 from cloudshell.cp.core.models import DeployApp, ConnectSubnet, ConnectToSubnetActionResult
@@ -21,12 +19,19 @@ from cloudshell.cp.azure.domain.networking_management.operations.add_route_opera
 from cloudshell.cp.azure.domain.networking_management.operations.ip_operation import IPAddressOperation
 from cloudshell.cp.azure.domain.services.command_cancellation import CommandCancellationService
 from cloudshell.cp.azure.domain.services.image_data import ImageDataFactory
+from cloudshell.cp.azure.domain.services.ip_release_coalescer import IpReleaseCoalescer
 from cloudshell.cp.azure.domain.services.ip_service import IpService
 from cloudshell.cp.azure.domain.services.key_pair import KeyPairService
+from cloudshell.cp.azure.domain.services.key_pair_pool import KeyPairPool
 from cloudshell.cp.azure.domain.services.lock_service import GenericLockProvider
 from cloudshell.cp.azure.domain.services.name_provider import NameProviderService
 from cloudshell.cp.azure.domain.services.network_service import NetworkService
+from cloudshell.cp.azure.domain.services.power_operation_tracker import PowerOperationTracker
+from cloudshell.cp.azure.domain.services.vm_state_service import VmStateService
+from cloudshell.cp.azure.domain.services.resource_group_deletion_tracker import ResourceGroupDeletionTracker
+from cloudshell.cp.azure.domain.services.resource_group_inventory import ResourceGroupInventoryProvider
 from cloudshell.cp.azure.domain.services.security_group import SecurityGroupService
+from cloudshell.cp.azure.domain.services.storage_account_pool import StorageAccountPool
 from cloudshell.cp.azure.domain.services.storage_service import StorageService
 from cloudshell.cp.azure.domain.services.subscription import SubscriptionService
 from cloudshell.cp.azure.domain.services.tags import TagService
@@ -34,6 +39,8 @@ from cloudshell.cp.azure.domain.services.task_waiter import TaskWaiterService
 from cloudshell.cp.azure.domain.services.virtual_machine_service import VirtualMachineService
 from cloudshell.cp.azure.domain.services.vm_credentials_service import VMCredentialsService
 from cloudshell.cp.azure.domain.services.vm_extension import VMExtensionService
+from cloudshell.cp.azure.domain.services.vnet_mutation_queue import VnetMutationQueue
+from cloudshell.cp.azure.domain.services.task_executor import TaskExecutorService
 from cloudshell.cp.azure.domain.vm_management.operations.PrepareSandboxInfraOperation import \
     PrepareSandboxInfraOperation
 from cloudshell.cp.azure.domain.vm_management.operations.access_key_operation import AccessKeyOperation
@@ -56,11 +63,12 @@ class AzureShell(object):
         self.resource_id_parser = AzureResourceIdParser()
         self.generic_lock_provider = GenericLockProvider()
         self.ip_service = IpService(self.generic_lock_provider)
+        self.ip_release_coalescer = IpReleaseCoalescer(ip_service=self.ip_service)
         self.tags_service = TagService()
         self.network_service = NetworkService(self.ip_service, self.tags_service)
         self.storage_service = StorageService(cancellation_service=self.cancellation_service)
         self.vm_credentials_service = VMCredentialsService()
-        self.key_pair_service = KeyPairService(storage_service=self.storage_service)
+        self.key_pair_service = KeyPairService(storage_service=self.storage_service, key_pair_pool=KeyPairPool())
         self.security_group_service = SecurityGroupService(self.network_service)
         self.vm_custom_params_extractor = VmCustomParamsExtractor()
         self.name_provider_service = NameProviderService()
@@ -68,13 +76,26 @@ class AzureShell(object):
         self.subscription_service = SubscriptionService()
         self.task_waiter_service = waiter_service
         self.vm_service = VirtualMachineService(task_waiter_service=self.task_waiter_service)
-        self.subnet_locker = Lock()
+        self.vnet_mutation_queue = VnetMutationQueue(network_service=self.network_service)
+        self.task_executor = TaskExecutorService()
+        self.resource_group_deletion_tracker = ResourceGroupDeletionTracker(vm_service=self.vm_service)
+        self.power_operation_tracker = PowerOperationTracker(vm_service=self.vm_service)
+        self.inventory_provider = ResourceGroupInventoryProvider(vm_service=self.vm_service,
+                                                                 network_service=self.network_service,
+                                                                 security_group_service=self.security_group_service)
+        self.vm_state_service = VmStateService(inventory_provider=self.inventory_provider,
+                                               vm_service=self.vm_service,
+                                               task_executor=self.task_executor)
+        self.storage_account_pool = StorageAccountPool(storage_service=self.storage_service,
+                                                       vm_service=self.vm_service,
+                                                       task_executor=self.task_executor)
         self.vm_details_provider = VmDetailsProvider(self.network_service, self.resource_id_parser)
         self.image_data_factory = ImageDataFactory(vm_service=self.vm_service)
 
         self.autoload_operation = AutoloadOperation(subscription_service=self.subscription_service,
                                                     vm_service=self.vm_service,
-                                                    network_service=self.network_service)
+                                                    network_service=self.network_service,
+                                                    task_executor=self.task_executor)
 
         self.access_key_operation = AccessKeyOperation(key_pair_service=self.key_pair_service,
                                                        storage_service=self.storage_service)
@@ -88,10 +109,13 @@ class AzureShell(object):
             security_group_service=self.security_group_service,
             name_provider_service=self.name_provider_service,
             cancellation_service=self.cancellation_service,
-            subnet_locker=self.subnet_locker,
+            vnet_mutation_queue=self.vnet_mutation_queue,
+            generic_lock_provider=self.generic_lock_provider,
+            task_executor=self.task_executor,
+            storage_account_pool=self.storage_account_pool,
             resource_id_parser=self.resource_id_parser)
 
-        self.create_route_operation = AddRouteOperation(self.network_service)
+        self.create_route_operation = AddRouteOperation(self.network_service, self.vnet_mutation_queue)
 
         self.deploy_azure_vm_operation = DeployAzureVMOperation(
             vm_service=self.vm_service,
@@ -107,13 +131,19 @@ class AzureShell(object):
             generic_lock_provider=self.generic_lock_provider,
             image_data_factory=self.image_data_factory,
             vm_details_provider=self.vm_details_provider,
-            ip_service=self.ip_service)
+            ip_release_coalescer=self.ip_release_coalescer,
+            task_executor=self.task_executor)
 
         self.power_vm_operation = PowerAzureVMOperation(vm_service=self.vm_service,
-                                                        vm_custom_params_extractor=self.vm_custom_params_extractor)
+                                                        vm_custom_params_extractor=self.vm_custom_params_extractor,
+                                                        task_executor=self.task_executor,
+                                                        power_operation_tracker=self.power_operation_tracker,
+                                                        vm_state_service=self.vm_state_service)
 
         self.refresh_ip_operation = RefreshIPOperation(vm_service=self.vm_service,
-                                                       resource_id_parser=self.resource_id_parser)
+                                                       resource_id_parser=self.resource_id_parser,
+                                                       inventory_provider=self.inventory_provider,
+                                                       vm_state_service=self.vm_state_service)
 
         self.delete_azure_vm_operation = DeleteAzureVMOperation(
             vm_service=self.vm_service,
@@ -122,20 +152,27 @@ class AzureShell(object):
             security_group_service=self.security_group_service,
             storage_service=self.storage_service,
             generic_lock_provider=self.generic_lock_provider,
-            subnet_locker=self.subnet_locker,
-            ip_service=self.ip_service)
+            vnet_mutation_queue=self.vnet_mutation_queue,
+            ip_release_coalescer=self.ip_release_coalescer,
+            task_executor=self.task_executor,
+            resource_group_deletion_tracker=self.resource_group_deletion_tracker,
+            inventory_provider=self.inventory_provider)
 
         self.deployed_app_ports_operation = DeployedAppPortsOperation(
             vm_custom_params_extractor=self.vm_custom_params_extractor)
 
         self.vm_details_operation = VmDetailsOperation(vm_service=self.vm_service,
-                                                       vm_details_provider=self.vm_details_provider)
+                                                       vm_details_provider=self.vm_details_provider,
+                                                       inventory_provider=self.inventory_provider,
+                                                       task_executor=self.task_executor)
 
-        self.set_app_security_groups_operation = SetAppSecurityGroupsOperation(vm_service=self.vm_service,
-                                                                               resource_id_parser=self.resource_id_parser,
-                                                                               nsg_service=self.security_group_service,
-                                                                               generic_lock_provider=self.generic_lock_provider,
-                                                                               name_provider=self.name_provider_service)
+        self.set_app_security_groups_operation = SetAppSecurityGroupsOperation(
+            vm_service=self.vm_service,
+            resource_id_parser=self.resource_id_parser,
+            nsg_service=self.security_group_service,
+            generic_lock_provider=self.generic_lock_provider,
+            name_provider=self.name_provider_service,
+            inventory_provider=self.inventory_provider)
 
         self.ip_address_operation = IPAddressOperation(self.ip_service, self.network_service,
                                                        self.name_provider_service)
@@ -220,8 +257,7 @@ class AzureShell(object):
                         self.create_route_operation.create_route_table(network_client=azure_clients.network_client,
                                                                        cloud_provider_model=cloud_provider_model,
                                                                        route_table_request=route_table_request_model,
-                                                                       sandbox_id=reservation_id,
-                                                                       subnet_lcoker=self.subnet_locker)
+                                                                       sandbox_id=reservation_id)
 
     def deploy_azure_vm(self, command_context, actions, cancellation_context):
         """ Will deploy Azure Image on the cloud provider
@@ -371,9 +407,38 @@ class AzureShell(object):
                         resource=command_context.resource,
                         cloudshell_session=cloudshell_session)
 
+                    # IPs of the deleted VMs that are still collected for the release
+                    try:
+                        self.ip_release_coalescer.flush(logger=logger,
+                                                        api=cloudshell_session,
+                                                        reservation_id=command_context.reservation.reservation_id)
+                    except Exception:
+                        logger.exception("Failed to release private IPs of the deleted VMs:")
+
+                    # IPs that were checked out from the pool in blocks but were not used by any NIC
+                    try:
+                        self.ip_service.release_prefetched_ips(
+                            logger=logger,
+                            api=cloudshell_session,
+                            reservation_id=command_context.reservation.reservation_id)
+                    except Exception:
+                        logger.exception("Failed to release prefetched private IPs:")
+                    self.ip_service.remove_subnet_address_indexes(command_context.reservation.reservation_id)
+                    self.vm_state_service.remove_group(command_context.reservation.reservation_id)
+
                 azure_clients = AzureClientsManager(cloud_provider_model)
                 resource_group_name = command_context.reservation.reservation_id
 
+                # storage account claimed from the pool is not deleted together with the sandbox resource group
+                if cloud_provider_model.storage_account_pool_depth > 0:
+                    try:
+                        self.storage_account_pool.release(storage_client=azure_clients.storage_client,
+                                                          group_name=resource_group_name,
+                                                          region=cloud_provider_model.region,
+                                                          logger=logger)
+                    except Exception:
+                        logger.exception("Failed to delete the storage account claimed from the pool:")
+
                 cleanup_connectivity_request = getattr(DeployDataHolder(jsonpickle.decode(request)),
                                                        'driverRequest', None)
 
@@ -422,6 +487,43 @@ class AzureShell(object):
 
                     logger.info('End Deleting Azure VM')
 
+    def delete_azure_vms(self, command_context, request):
+        """Delete many Azure VMs of the sandbox with all their resources
+
+        :param ResourceCommandContext command_context:
+        :param str request: json request with the deployed apps to delete, for example:
+            {"items": [{"deployedAppJson": {"name": "vm1"}}, {"deployedAppJson": {"name": "vm2"}}]}
+        :return: json with the result for every VM
+        """
+        with LoggingSessionContext(command_context) as logger:
+            with ErrorHandlingContext(logger):
+                with CloudShellSessionContext(command_context) as cloudshell_session:
+
+                    logger.info('Deleting Azure VMs...')
+
+                    items = DeployDataHolder(jsonpickle.decode(request)).items
+                    vm_names = [item.deployedAppJson.name for item in items]
+                    resource_group_name = self.model_parser.convert_to_reservation_model(
+                        command_context.reservation).reservation_id
+
+                    cloud_provider_model = self.model_parser.convert_to_cloud_provider_resource_model(
+                        resource=command_context.resource,
+                        cloudshell_session=cloudshell_session)
+
+                    azure_clients = AzureClientsManager(cloud_provider_model)
+
+                    results = self.delete_azure_vm_operation.delete_vms(
+                        compute_client=azure_clients.compute_client,
+                        network_client=azure_clients.network_client,
+                        storage_client=azure_clients.storage_client,
+                        group_name=resource_group_name,
+                        vm_names=vm_names,
+                        logger=logger,
+                        cloudshell_session=cloudshell_session)
+
+                    logger.info('End Deleting Azure VMs')
+                    return self.command_result_parser.set_command_result(results)
+
     def power_on_vm(self, command_context):
         """Power on Azure VM
 
@@ -483,6 +585,117 @@ class AzureShell(object):
 
                 logger.info('Azure VM {} was successfully powered off'.format(vm_name))
 
+    def power_on_vms(self, command_context, request):
+        """Power on many Azure VMs of the sandbox at the same time
+
+        :param ResourceCommandContext command_context:
+        :param str request: json request with the deployed apps to power on, for example:
+            {"items": [{"deployedAppJson": {"name": "vm1", "vmdetails": {"vmCustomParams": []}}}],
+             "waitForCompletion": false}
+            if "waitForCompletion" is false, command returns once Azure accepted the operations and their
+            status can be queried with get_power_operations_status
+            NOTE: it is not a CloudShell "power" command, so live status of the resources is set by the command
+            itself, for operations that finish after it returned - by get_power_operations_status
+        :return: json with the result for every VM
+        """
+        with LoggingSessionContext(command_context) as logger:
+            with ErrorHandlingContext(logger):
+                logger.info('Starting power on operation on Azure VMs...')
+
+                request_holder = DeployDataHolder(jsonpickle.decode(request))
+                data_holders = [item.deployedAppJson for item in request_holder.items]
+                group_name = self.model_parser.convert_to_reservation_model(command_context.reservation) \
+                    .reservation_id
+
+                with CloudShellSessionContext(command_context) as cloudshell_session:
+                    cloud_provider_model = self.model_parser.convert_to_cloud_provider_resource_model(
+                        resource=command_context.resource,
+                        cloudshell_session=cloudshell_session)
+
+                    azure_clients = AzureClientsManager(cloud_provider_model)
+
+                    results = self.power_vm_operation.power_on_vms(
+                        compute_client=azure_clients.compute_client,
+                        resource_group_name=group_name,
+                        data_holders=data_holders,
+                        cloudshell_session=cloudshell_session,
+                        logger=logger,
+                        wait=getattr(request_holder, "waitForCompletion", True))
+
+                logger.info('End power on operation on Azure VMs')
+                return self.command_result_parser.set_command_result(results)
+
+    def power_off_vms(self, command_context, request):
+        """Power off many Azure VMs of the sandbox at the same time
+
+        :param ResourceCommandContext command_context:
+        :param str request: json request with the deployed apps to power off, for example:
+            {"items": [{"deployedAppJson": {"name": "vm1"}}], "waitForCompletion": false}
+            if "waitForCompletion" is false, command returns once Azure accepted the operations and their
+            status can be queried with get_power_operations_status
+            NOTE: it is not a CloudShell "power" command, so live status of the resources is set by the command
+            itself, for operations that finish after it returned - by get_power_operations_status
+        :return: json with the result for every VM
+        """
+        with LoggingSessionContext(command_context) as logger:
+            with ErrorHandlingContext(logger):
+                logger.info('Starting power off operation on Azure VMs...')
+
+                request_holder = DeployDataHolder(jsonpickle.decode(request))
+                vm_names = [item.deployedAppJson.name for item in request_holder.items]
+                group_name = self.model_parser.convert_to_reservation_model(command_context.reservation) \
+                    .reservation_id
+
+                with CloudShellSessionContext(command_context) as cloudshell_session:
+                    cloud_provider_model = self.model_parser.convert_to_cloud_provider_resource_model(
+                        resource=command_context.resource,
+                        cloudshell_session=cloudshell_session)
+
+                    azure_clients = AzureClientsManager(cloud_provider_model)
+
+                    results = self.power_vm_operation.power_off_vms(
+                        compute_client=azure_clients.compute_client,
+                        resource_group_name=group_name,
+                        vm_names=vm_names,
+                        cloudshell_session=cloudshell_session,
+                        logger=logger,
+                        wait=getattr(request_holder, "waitForCompletion", True))
+
+                logger.info('End power off operation on Azure VMs')
+                return self.command_result_parser.set_command_result(results)
+
+    def get_power_operations_status(self, command_context, request):
+        """Get status of the last power operation and the current power state of many Azure VMs of the sandbox
+
+        :param ResourceCommandContext command_context:
+        :param str request: json request with the deployed apps, for example:
+            {"items": [{"deployedAppJson": {"name": "vm1"}}]}
+        :return: json with the status for every VM
+        """
+        with LoggingSessionContext(command_context) as logger:
+            with ErrorHandlingContext(logger):
+                items = DeployDataHolder(jsonpickle.decode(request)).items
+                vm_names = [item.deployedAppJson.name for item in items]
+                group_name = self.model_parser.convert_to_reservation_model(command_context.reservation) \
+                    .reservation_id
+
+                with CloudShellSessionContext(command_context) as cloudshell_session:
+                    cloud_provider_model = self.model_parser.convert_to_cloud_provider_resource_model(
+                        resource=command_context.resource,
+                        cloudshell_session=cloudshell_session)
+
+                    azure_clients = AzureClientsManager(cloud_provider_model)
+
+                    results = self.power_vm_operation.get_power_operations_status(
+                        resource_group_name=group_name,
+                        vm_names=vm_names,
+                        logger=logger,
+                        compute_client=azure_clients.compute_client,
+                        network_client=azure_clients.network_client,
+                        cloudshell_session=cloudshell_session)
+
+                return self.command_result_parser.set_command_result(results)
+
     def refresh_ip(self, command_context):
         """Refresh private and public IPs on the Cloudshell resource
 
@@ -521,6 +734,40 @@ class AzureShell(object):
 
                 logger.info('Azure VM IPs were successfully refreshed'.format(vm_name))
 
+    def refresh_ips(self, command_context, request):
+        """Refresh private and public IPs on many Cloudshell resources of the sandbox
+
+        :param ResourceCommandContext command_context:
+        :param str request: json request with the deployed apps to refresh, for example:
+            {"items": [{"deployedAppJson": {"name": "vm1", "address": "10.0.0.4",
+                                            "attributes": [{"name": "Public IP", "value": "1.2.3.4"}]}}]}
+        :return: json with the result for every VM
+        """
+        with LoggingSessionContext(command_context) as logger:
+            with ErrorHandlingContext(logger):
+                logger.info("Starting Refresh IPs operation...")
+
+                refresh_ip_requests = self.model_parser.convert_to_refresh_ip_requests(request)
+                resource_group_name = self.model_parser.convert_to_reservation_model(
+                    command_context.reservation).reservation_id
+
+                with CloudShellSessionContext(command_context) as cloudshell_session:
+                    cloud_provider_model = self.model_parser.convert_to_cloud_provider_resource_model(
+                        resource=command_context.resource,
+                        cloudshell_session=cloudshell_session)
+
+                    azure_clients = AzureClientsManager(cloud_provider_model)
+
+                    results = self.refresh_ip_operation.refresh_ips(cloudshell_session=cloudshell_session,
+                                                                    compute_client=azure_clients.compute_client,
+                                                                    network_client=azure_clients.network_client,
+                                                                    resource_group_name=resource_group_name,
+                                                                    refresh_ip_requests=refresh_ip_requests,
+                                                                    logger=logger)
+
+                logger.info('End Refresh IPs operation')
+                return self.command_result_parser.set_command_result(results)
+
     def get_access_key(self, command_context):
         """Returns public key
         :param ResourceRemoteCommandContext command_context:
@@ -540,7 +787,8 @@ class AzureShell(object):
                     self.model_parser.convert_to_reservation_model(command_context.remote_reservation).reservation_id
 
                 return self.access_key_operation.get_access_key(storage_client=azure_clients.storage_client,
-                                                                group_name=resource_group_name)
+                                                                group_name=resource_group_name,
+                                                                region=cloud_provider_model.region)
 
     def get_application_ports(self, command_context):
         """Get application ports in a nicely formatted manner
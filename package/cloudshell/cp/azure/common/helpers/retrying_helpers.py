@@ -30,6 +30,13 @@ def retry_if_retryable_error(exception):
     return isinstance(exception, CloudError) and _is_retryable_error_message(exception)
 
 
+def retry_if_precondition_failed(exception):
+    """Return True if we should retry (in this case when resource was changed since it was read), False otherwise
+    :param exceptions.Exception exception:
+    """
+    return isinstance(exception, CloudError) and exception.status_code == 412
+
+
 def _is_retryable_error_message(exception):
     error_has_retryable_in_message = retryable_error_string.lower() in exception.message.lower()
     return error_has_retryable_in_message
@@ -10,6 +10,7 @@ from cloudshell.cp.azure.models.deploy_azure_vm_resource_models import DeployAzu
     RouteTableRequestResourceModel, RouteResourceModel
 from cloudshell.cp.azure.models.deploy_azure_vm_resource_models import DeployAzureVMFromCustomImageResourceModel
 from cloudshell.cp.azure.common.deploy_data_holder import DeployDataHolder
+from cloudshell.cp.azure.models.refresh_ip_request import RefreshIpRequest
 from cloudshell.cp.azure.models.reservation_model import ReservationModel
 from cloudshell.cp.azure.domain.services.parsers.connection_params import convert_to_bool
 
@@ -209,6 +210,11 @@ class AzureModelsParser(object):
         azure_resource_model.region = resource_context['Region'].replace(" ", "").lower()
         azure_resource_model.management_group_name = resource_context['Management Group Name']
         azure_resource_model.private_ip_allocation_method = resource_context["Private IP Allocation Method"]
+        azure_resource_model.async_sandbox_teardown = AzureModelsParser.convert_to_boolean(
+            resource_context.get("Asynchronous Sandbox Teardown", "False"))
+        azure_resource_model.storage_account_pool_depth = int(
+            resource_context.get("Storage Account Pool Depth") or 0)
+        azure_resource_model.key_pair_pool_depth = int(resource_context.get("Key Pair Pool Depth") or 0)
 
         azure_resource_model.networks_in_use = AzureModelsParser._convert_list_attribute(
             resource_context['Networks In Use'])
@@ -256,6 +262,27 @@ class AzureModelsParser(object):
 
         return private_ip
 
+    @staticmethod
+    def convert_to_refresh_ip_requests(request):
+        """
+        :param str request: json request with the deployed apps to refresh, for example:
+            {"items": [{"deployedAppJson": {"name": "vm1", "address": "10.0.0.4",
+                                            "attributes": [{"name": "Public IP", "value": "1.2.3.4"}]}}]}
+        :rtype: list[RefreshIpRequest]
+        """
+        refresh_ip_requests = []
+        for item in DeployDataHolder(jsonpickle.decode(request)).items:
+            deployed_app = item.deployedAppJson
+            attributes = {attribute.name: attribute.value for attribute in getattr(deployed_app, "attributes", [])}
+            refresh_ip_requests.append(RefreshIpRequest(
+                vm_name=deployed_app.name,
+                resource_fullname=deployed_app.name,
+                private_ip_on_resource=getattr(deployed_app, "address", ""),
+                public_ip_on_resource_attr_tuple=AzureModelsParser.get_matching_attribute_tuple_ignoring_namespace(
+                    attributes, AzureModelsParser.PUBLIC_IP_KEY)))
+
+        return refresh_ip_requests
+
     @staticmethod
     def get_connected_resource_fullname(resource_context):
         if resource_context.remote_endpoints[0]:
@@ -14,13 +14,15 @@ class VmDetailsProvider(object):
         self.network_service = network_service
         self.resource_id_parser = resource_id_parser
 
-    def create(self, instance, is_market_place, logger, network_client, group_name):
+    def create(self, instance, is_market_place, logger, network_client, group_name, inventory=None):
         """
         :param group_name:
         :param network_client:
         :param instance: azure.mgmt.compute.models.VirtualMachine
         :param is_market_place: bool
         :param logging.Logger logger:
+        :param cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventory inventory:
+            snapshot of the resource group, NICs and public IPs that are missing in it are read from Azure one by one
         :return:
         """
         vm_instance_data = None
@@ -28,11 +30,11 @@ class VmDetailsProvider(object):
 
         if is_market_place:
             vm_instance_data = self._get_vm_instance_data_for_market_place(instance)
-            vm_network_data = self._get_vm_network_data(instance, network_client, group_name, logger)
+            vm_network_data = self._get_vm_network_data(instance, network_client, group_name, logger, inventory)
             logger.info("VM {} was created via market place.".format(instance.name))
         else:
             vm_instance_data = self._get_vm_instance_data_for_custom_image(instance)
-            vm_network_data = self._get_vm_network_data(instance, network_client, group_name, logger)
+            vm_network_data = self._get_vm_network_data(instance, network_client, group_name, logger, inventory)
             logger.info("VM {} was created via custom image.".format(instance.name))
 
         return VmDetailsData(vmInstanceData=vm_instance_data, vmNetworkData=vm_network_data)
@@ -64,13 +66,15 @@ class VmDetailsProvider(object):
         ]
         return data
 
-    def _get_vm_network_data(self, instance, network_client, group_name, logger):
+    def _get_vm_network_data(self, instance, network_client, group_name, logger, inventory=None):
 
         network_interface_objects = []
         for network_interface in instance.network_profile.network_interfaces:
             nic_name = self.resource_id_parser.get_name_from_resource_id(network_interface.id)
 
-            nic = network_client.network_interfaces.get(group_name, nic_name)
+            nic = inventory.get_network_interface(network_interface.id) if inventory else None
+            if nic is None:
+                nic = network_client.network_interfaces.get(group_name, nic_name)
 
             ip_configuration = nic.ip_configurations[0]
 
@@ -88,11 +92,12 @@ class VmDetailsProvider(object):
                                                           publicIpAddress=public_ip)
 
             if ip_configuration.public_ip_address:
-                public_ip_name = get_ip_from_interface_name(nic_name)
-
-                public_ip_object = self.network_service.get_public_ip(network_client=network_client,
-                                                                      group_name=group_name,
-                                                                      ip_name=public_ip_name)
+                public_ip_object = inventory.get_nic_public_ip(nic) if inventory else None
+                if public_ip_object is None:
+                    public_ip_name = get_ip_from_interface_name(nic_name)
+                    public_ip_object = self.network_service.get_public_ip(network_client=network_client,
+                                                                          group_name=group_name,
+                                                                          ip_name=public_ip_name)
                 public_ip = public_ip_object.ip_address
 
                 network_data.append(VmDetailsProperty(key="Public IP", value=public_ip))
@@ -6,12 +6,14 @@ from cloudshell.cp.azure.models.deploy_azure_vm_resource_models import RouteTabl
 
 
 class AddRouteOperation(object):
-    def __init__(self,network_service):
+    def __init__(self, network_service, vnet_mutation_queue):
         """
         :param cloudshell.cp.azure.domain.services.network_service.NetworkService network_service:
+        :param cloudshell.cp.azure.domain.services.vnet_mutation_queue.VnetMutationQueue vnet_mutation_queue:
 
         """
         self.network_service = network_service
+        self.vnet_mutation_queue = vnet_mutation_queue
 
     @retry(stop_max_attempt_number=retrying_helpers.retryable_error_max_attempts,
            wait_fixed=retrying_helpers.retryable_wait_time,
@@ -20,8 +22,7 @@ class AddRouteOperation(object):
                            route_table_request,
                            cloud_provider_model,
                            network_client,
-                           sandbox_id,
-                           subnet_lcoker):
+                           sandbox_id):
 
         """
         :param RouteTableRequestResourceModel route_table_request:
@@ -38,11 +39,10 @@ class AddRouteOperation(object):
                                                 cloud_provider_model,
                                                 route_table_request,
                                                 sandbox_id)
-        with subnet_lcoker:
-
-            self.network_service.add_route_table_to_subnets(sandbox_id,
-                                                            route_table_request.name,
-                                                            network_client,
-                                                            route_table_request.subnets,
-                                                            cloud_provider_model.management_group_name,
-                                                            sandbox_vnet)
+        self.network_service.add_route_table_to_subnets(sandbox_id,
+                                                        route_table_request.name,
+                                                        network_client,
+                                                        route_table_request.subnets,
+                                                        cloud_provider_model.management_group_name,
+                                                        sandbox_vnet,
+                                                        self.vnet_mutation_queue)
@@ -1,3 +1,4 @@
+from functools import partial
 from logging import Logger
 
 from azure.mgmt.network import NetworkManagementClient
@@ -37,7 +38,18 @@ class IPAddressOperation(object):
         logger.info("Received request to get next available private ip for reservation {} in subnet {} "
                     "for owner '{}' ".format(reservation_id, subnet_cidr, owner))
 
-        self._validate(cloud_provider_model, logger, network_client, reservation_id, subnet_cidr)
+        self._validate_allocation_method(cloud_provider_model)
+
+        # subnet is validated and its used addresses are indexed only on the first request for it, IPs are
+        # checked out for the owner from the pool on every request as the pool tracks the owners
+        if not self.ip_service.is_subnet_seeded(reservation_id, subnet_cidr):
+            self._validate_subnet_exists(cloud_provider_model, logger, network_client, reservation_id, subnet_cidr)
+            self.ip_service.seed_subnet_addresses(
+                reservation_id=reservation_id,
+                subnet_cidr=subnet_cidr,
+                get_network_interfaces=partial(self.network_service.get_network_interfaces,
+                                               network_client=network_client,
+                                               group_name=reservation_id))
 
         ip_address = self.ip_service.get_next_available_ip_from_cs_pool(
             logger, cloudshell_session, reservation_id, subnet_cidr, owner)
@@ -47,16 +59,12 @@ class IPAddressOperation(object):
 
         return ip_address
 
-    def _validate(self, cloud_provider_model, logger, network_client, reservation_id, subnet_cidr):
-        self._validate_allocation_method(cloud_provider_model)
-        self._validate_subnet_exists(cloud_provider_model, logger, network_client, reservation_id, subnet_cidr)
-
     def _validate_subnet_exists(self, cloud_provider_model, logger, network_client, reservation_id, subnet_cidr):
         sandbox_vnet = self.network_service.get_sandbox_virtual_network(
             network_client, cloud_provider_model.management_group_name)
         subnet_name = self.name_provider_service.format_subnet_name(reservation_id, subnet_cidr)
         try:
-            network_client.subnets.get(cloud_provider_model.management_group_name,
+            return network_client.subnets.get(cloud_provider_model.management_group_name,
                                        sandbox_vnet.name,
                                        subnet_name)
         except CloudError as e:
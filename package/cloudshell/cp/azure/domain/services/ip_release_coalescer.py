@@ -0,0 +1,320 @@
+import json
+import os
+import tempfile
+import time
+from threading import Lock, Thread
+
+
+class _PendingRelease(object):
+    def __init__(self):
+        self.api = None
+        self.logger = None
+        self.ips_by_owner = {}
+        self.failed_attempts = 0
+        self.release_lock = Lock()
+
+    def add(self, ips, owner):
+        """
+        :param list[str] ips:
+        :param str owner:
+        """
+        owner_ips = self.ips_by_owner.setdefault(owner, [])
+        owner_ips.extend(ip for ip in ips if ip not in owner_ips)
+
+    def remove(self, ips, owner):
+        """
+        :param list[str] ips:
+        :param str owner:
+        """
+        owner_ips = [ip for ip in self.ips_by_owner.get(owner, []) if ip not in ips]
+        if owner_ips:
+            self.ips_by_owner[owner] = owner_ips
+        else:
+            self.ips_by_owner.pop(owner, None)
+
+
+class IpReleaseCoalescer(object):
+    """Collects private IPs that should be released back to the CloudShell pool
+
+    IPs of the deleted (or rolled back) VMs are collected per reservation and owner and released with
+    a single ReleaseFromPool call per owner, either by the background thread after a short window or by
+    an explicit flush at the end of the sandbox teardown. Collected IPs are written to a journal file per
+    reservation and driver process before the call returns, so several driver processes never overwrite
+    each other's journal. The flush also releases IPs from the journals of the other processes (e.g. of
+    the driver process that was restarted) for that reservation.
+
+    The background thread releases IPs with the CloudShell API session and logger of the last command
+    that collected them, after that command has returned. The flush always uses its own session and logger
+    """
+    WINDOW = 5
+    MAX_ATTEMPTS = 3
+    JOURNAL_DIR_NAME = "cloudshell-azure-ip-release"
+
+    def __init__(self, ip_service, journal_dir=None, window=WINDOW):
+        """
+        :param cloudshell.cp.azure.domain.services.ip_service.IpService ip_service:
+        :param str journal_dir: directory for the journal files, system temp directory is used by default
+        :param int window: time (in seconds) to collect IPs before they are released by the background thread
+        """
+        self.ip_service = ip_service
+        self.journal_dir = journal_dir or os.path.join(tempfile.gettempdir(), self.JOURNAL_DIR_NAME)
+        self.window = window
+        self._pending = {}
+        self._lock = Lock()
+        self._thread = None
+
+    def release_ips(self, logger, api, reservation_id, ips_to_release, owner=None):
+        """Add IPs to the next release of the reservation without calling the CloudShell API
+
+        :param logging.Logger logger: logger that is also used by the background release of the IPs
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession api: session that is also used by the background
+            release of the IPs, so it must stay valid after the command returns
+        :param str reservation_id:
+        :param list[str] ips_to_release:
+        :param str owner:
+        :return:
+        """
+        if not ips_to_release:
+            return
+
+        with self._lock:
+            pending = self._get_pending(reservation_id, logger)
+            pending.api = api
+            pending.logger = logger
+            pending.add(ips_to_release, owner)
+            self._save_journal(reservation_id, pending, pending.logger)
+
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="IpReleaseCoalescer")
+                self._thread.daemon = True
+                self._thread.start()
+
+        logger.info("Private IPs {} will be released from the pool".format(','.join(ips_to_release)))
+
+    def flush(self, logger, api, reservation_id):
+        """Release all collected IPs of the reservation, including the ones from the journals
+
+        :param logging.Logger logger:
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession api:
+        :param str reservation_id:
+        :return:
+        """
+        with self._lock:
+            pending = self._get_pending(reservation_id, logger)
+            pending.api = api
+            pending.logger = logger
+
+            adopted_journal_paths = self._adopt_journals(reservation_id, pending, logger)
+            if adopted_journal_paths:
+                # adopted journals are removed only after their IPs are written to the own journal
+                self._save_journal(reservation_id, pending, logger)
+                self._remove_journals(adopted_journal_paths, logger)
+
+        self._release(reservation_id)
+
+    def _run(self):
+        while True:
+            time.sleep(self.window)
+
+            with self._lock:
+                reservation_ids = self._pending.keys()
+
+            for reservation_id in reservation_ids:
+                self._release(reservation_id)
+
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+
+    def _release(self, reservation_id):
+        """Release collected IPs of the reservation with one API call per owner
+
+        IPs that failed to be released are retried after the next window. After MAX_ATTEMPTS failures
+        they are kept in the journal only and will be read from it on the next use of the reservation
+
+        :param str reservation_id:
+        :return:
+        """
+        with self._lock:
+            pending = self._pending.get(reservation_id)
+
+        if pending is None:
+            return
+
+        with pending.release_lock:
+            with self._lock:
+                ips_by_owner = [(owner, list(ips)) for owner, ips in pending.ips_by_owner.iteritems()]
+
+            released = []
+            for owner, ips in ips_by_owner:
+                try:
+                    self.ip_service.release_ips(logger=pending.logger,
+                                                api=pending.api,
+                                                reservation_id=reservation_id,
+                                                ips_to_release=ips,
+                                                owner=owner)
+                    released.append((owner, ips))
+                except Exception:
+                    pending.logger.exception("Failed to release private IPs {} from the pool:".format(','.join(ips)))
+
+            with self._lock:
+                for owner, ips in released:
+                    pending.remove(ips, owner)
+
+                pending.failed_attempts = 0 if len(released) == len(ips_by_owner) else pending.failed_attempts + 1
+                self._save_journal(reservation_id, pending, pending.logger)
+
+                if not pending.ips_by_owner:
+                    self._pending.pop(reservation_id, None)
+                elif pending.failed_attempts >= self.MAX_ATTEMPTS:
+                    pending.logger.warning("Private IPs of the reservation {} were not released after {} attempts, "
+                                           "they are kept in the journal {}".format(
+                                               reservation_id, self.MAX_ATTEMPTS,
+                                               self._get_journal_path(reservation_id)))
+                    self._pending.pop(reservation_id, None)
+
+    def _get_pending(self, reservation_id, logger):
+        """Get the IPs collected for the reservation, the journal is read on the first use of it
+
+        :param str reservation_id:
+        :param logging.Logger logger:
+        :rtype: _PendingRelease
+        """
+        pending = self._pending.get(reservation_id)
+
+        if pending is None:
+            pending = self._pending[reservation_id] = _PendingRelease()
+            for owner, ips in self._load_journal(reservation_id, logger):
+                pending.add(ips, owner)
+
+        return pending
+
+    def _get_journal_path(self, reservation_id):
+        """Get the journal path of the reservation for the current driver process
+
+        :param str reservation_id:
+        :rtype: str
+        """
+        return os.path.join(self.journal_dir, "{}.{}.json".format(reservation_id, os.getpid()))
+
+    def _load_journal(self, reservation_id, logger):
+        """
+        :param str reservation_id:
+        :param logging.Logger logger:
+        :return: list of (owner, IPs) pairs
+        :rtype: list[tuple[str, list[str]]]
+        """
+        journal_path = self._get_journal_path(reservation_id)
+        if not os.path.exists(journal_path):
+            # driver process could be stopped while the journal file was being replaced
+            journal_path += ".tmp"
+            if not os.path.exists(journal_path):
+                return []
+
+        return self._read_journal(journal_path, logger)
+
+    def _read_journal(self, journal_path, logger):
+        """
+        :param str journal_path:
+        :param logging.Logger logger:
+        :return: list of (owner, IPs) pairs
+        :rtype: list[tuple[str, list[str]]]
+        """
+        try:
+            with open(journal_path) as journal_file:
+                return [(owner, ips) for owner, ips in json.load(journal_file)]
+        except Exception:
+            logger.exception("Failed to read private IPs release journal {}:".format(journal_path))
+            return []
+
+    def _adopt_journals(self, reservation_id, pending, logger):
+        """Move IPs from the journals of the other driver processes to the pending IPs of the reservation
+
+        Journal is renamed before it is read, so the same journal is never adopted by two processes.
+        IPs that are still collected by another running process can be released twice at worst
+
+        :param str reservation_id:
+        :param _PendingRelease pending:
+        :param logging.Logger logger:
+        :return: paths of the adopted journals
+        :rtype: list[str]
+        """
+        if not os.path.isdir(self.journal_dir):
+            return []
+
+        own_journal_name = os.path.basename(self._get_journal_path(reservation_id))
+        adopted_journal_paths = []
+
+        for file_name in os.listdir(self.journal_dir):
+            if not file_name.startswith(reservation_id + ".") or not file_name.endswith((".json", ".json.tmp")):
+                continue
+
+            if file_name in (own_journal_name, own_journal_name + ".tmp"):
+                continue
+
+            journal_path = os.path.join(self.journal_dir, file_name)
+            if file_name.endswith(".tmp") and os.path.exists(journal_path[:-len(".tmp")]):
+                # journal of another process is being replaced right now, its complete version is adopted
+                continue
+
+            adopted_journal_path = "{}.{}.adopted".format(journal_path, os.getpid())
+            try:
+                os.rename(journal_path, adopted_journal_path)
+            except OSError:
+                # journal was removed or adopted by another process
+                continue
+
+            for owner, ips in self._read_journal(adopted_journal_path, logger):
+                pending.add(ips, owner)
+
+            adopted_journal_paths.append(adopted_journal_path)
+
+        return adopted_journal_paths
+
+    def _remove_journals(self, journal_paths, logger):
+        """
+        :param list[str] journal_paths:
+        :param logging.Logger logger:
+        :return:
+        """
+        for journal_path in journal_paths:
+            try:
+                os.remove(journal_path)
+            except OSError:
+                logger.warning("Failed to remove private IPs release journal {}".format(journal_path), exc_info=1)
+
+    def _save_journal(self, reservation_id, pending, logger):
+        """Write IPs to the journal file or remove it if there is nothing to release
+
+        :param str reservation_id:
+        :param _PendingRelease pending:
+        :param logging.Logger logger:
+        :return:
+        """
+        journal_path = self._get_journal_path(reservation_id)
+        tmp_journal_path = journal_path + ".tmp"
+        entries = [[owner, ips] for owner, ips in pending.ips_by_owner.iteritems() if ips]
+
+        try:
+            if not entries:
+                for path in (journal_path, tmp_journal_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                return
+
+            if not os.path.isdir(self.journal_dir):
+                os.makedirs(self.journal_dir)
+
+            # write the whole journal to a temp file first, so a crash never leaves a partially written journal
+            with open(tmp_journal_path, "w") as journal_file:
+                json.dump(entries, journal_file)
+
+            try:
+                os.rename(tmp_journal_path, journal_path)
+            except OSError:
+                # rename doesn't replace the existing file on Windows
+                os.remove(journal_path)
+                os.rename(tmp_journal_path, journal_path)
+        except Exception:
+            logger.exception("Failed to write private IPs release journal {}:".format(journal_path))
@@ -1,26 +1,40 @@
 import json
+import sys
 from logging import Logger
+from threading import Lock
 
 from azure.mgmt.network import NetworkManagementClient
 from cloudshell.api.cloudshell_api import CloudShellAPISession
-from netaddr import IPNetwork
-
 from cloudshell.cp.azure.domain.services.lock_service import GenericLockProvider
+from cloudshell.cp.azure.domain.services.subnet_address_index import SubnetAddressIndexProvider
 
 
 class IpService(object):
     SANDBOX_LOCK_KEY = '{}-available-private-ip-key'
+    PREFETCHED_IPS_LOCK_KEY = '{}-{}-prefetched-private-ips-key'
+    PREFETCH_BLOCK_SIZE = 8
 
-    def __init__(self, generic_lock_provider):
+    def __init__(self, generic_lock_provider, prefetch_block_size=PREFETCH_BLOCK_SIZE):
         """
         :param GenericLockProvider generic_lock_provider:
+        :param int prefetch_block_size: number of IPs that are checked out from the pool with a single API call
         """
         self.generic_lock_provider = generic_lock_provider
+        self.prefetch_block_size = prefetch_block_size
         self._cached_available_private_ips = {}
+        self._prefetched_ips = {}
+        self._address_indexes = SubnetAddressIndexProvider()
+        self._seeded_subnets = set()
+        self._seed_lock = Lock()
 
     def get_next_available_ip_from_cs_pool(self, logger, api, reservation_id, subnet_cidr, owner=None):
         """
         Call the generic pool api to checkout the next available ip
+
+        IPs for the default owner are checked out in blocks and handed out locally, so the API is called
+        once per block instead of once per NIC. Block takes at most half of the free addresses of the subnet.
+        If the checkout for the explicit owner fails, unused prefetched IPs of the subnet are returned to
+        the pool and the checkout is retried. Unused IPs are returned by the "release_prefetched_ips"
         :param Logger logger:
         :param CloudShellAPISession api:
         :param str reservation_id:
@@ -28,37 +42,204 @@ class IpService(object):
         :return: IP address
         :rtype: str
         """
+        if owner:
+            available_ip = self._checkout_owner_ip(logger, api, reservation_id, subnet_cidr, owner)
+        else:
+            lock_key = self.PREFETCHED_IPS_LOCK_KEY.format(reservation_id, subnet_cidr)
+            with self.generic_lock_provider.get_resource_lock(lock_key=lock_key, logger=logger):
+                prefetched_ips = self._prefetched_ips.setdefault((reservation_id, subnet_cidr), [])
+
+                if not prefetched_ips:
+                    prefetched_ips.extend(self._checkout_prefetch_block(logger, api, reservation_id, subnet_cidr))
+                    logger.info("Checked out IPs '{}' in subnet '{}'".format(','.join(prefetched_ips), subnet_cidr))
+
+                available_ip = prefetched_ips.pop(0)
+
+        logger.info("Retrieved next available IP '{}' in subnet '{}'".format(available_ip, subnet_cidr))
+
+        return available_ip
+
+    def _checkout_owner_ip(self, logger, api, reservation_id, subnet_cidr, owner):
+        """Checkout IP for the explicit owner, prefetched IPs of the default owner are released if the pool is full
+
+        :param Logger logger:
+        :param CloudShellAPISession api:
+        :param str reservation_id:
+        :param str subnet_cidr:
+        :param str owner:
+        :return: IP address
+        :rtype: str
+        """
+        try:
+            return self._checkout_ips(api, reservation_id, subnet_cidr, owner, count=1)[0]
+        except Exception:
+            exc_info = sys.exc_info()
+
+            if not self._release_subnet_prefetched_ips(logger, api, reservation_id, subnet_cidr):
+                raise exc_info[0], exc_info[1], exc_info[2]
+
+            logger.warning("Failed to checkout IP in subnet '{}' for the owner '{}', retrying after the release "
+                           "of the prefetched IPs".format(subnet_cidr, owner), exc_info=exc_info)
+
+        return self._checkout_ips(api, reservation_id, subnet_cidr, owner, count=1)[0]
+
+    def _release_subnet_prefetched_ips(self, logger, api, reservation_id, subnet_cidr):
+        """Return IPs that were checked out for the subnet in blocks but not used yet
+
+        :param Logger logger:
+        :param CloudShellAPISession api:
+        :param str reservation_id:
+        :param str subnet_cidr:
+        :return: True if any IPs were released
+        :rtype: bool
+        """
+        lock_key = self.PREFETCHED_IPS_LOCK_KEY.format(reservation_id, subnet_cidr)
+
+        with self.generic_lock_provider.get_resource_lock(lock_key=lock_key, logger=logger):
+            prefetched_ips = self._prefetched_ips.pop((reservation_id, subnet_cidr), [])
+            if prefetched_ips:
+                self.release_ips(logger=logger,
+                                 api=api,
+                                 reservation_id=reservation_id,
+                                 ips_to_release=prefetched_ips)
+
+        return bool(prefetched_ips)
+
+    def _checkout_prefetch_block(self, logger, api, reservation_id, subnet_cidr):
+        """Checkout block of IPs for the default owner
+
+        Block size is limited by half of the free addresses of the subnet known by the local index, so small
+        subnets (for example /29 with 3 usable addresses) don't fail the checkout and the addresses are left
+        for the explicit owners. The pool can still have fewer free addresses than the index (for example
+        the ones checked out for other owners), so the failed block checkout is retried for a single IP
+        :param Logger logger:
+        :param CloudShellAPISession api:
+        :param str reservation_id:
+        :param str subnet_cidr:
+        :return: IP addresses
+        :rtype: list[str]
+        """
+        count = max(1, min(self.prefetch_block_size, self.get_available_ips_count(reservation_id, subnet_cidr) / 2))
+
+        try:
+            return self._checkout_ips(api, reservation_id, subnet_cidr, owner=None, count=count)
+        except Exception:
+            if count == 1:
+                raise
+
+            logger.warning("Failed to checkout {} IPs in subnet '{}', checking out a single IP".format(
+                count, subnet_cidr), exc_info=1)
+
+        return self._checkout_ips(api, reservation_id, subnet_cidr, owner=None, count=1)
+
+    def _checkout_ips(self, api, reservation_id, subnet_cidr, owner, count):
+        """
+        :param CloudShellAPISession api:
+        :param str reservation_id:
+        :param str subnet_cidr:
+        :param str owner:
+        :param int count: number of IPs to checkout
+        :return: IP addresses
+        :rtype: list[str]
+        """
+        address_index = self._address_indexes.get_index(reservation_id, subnet_cidr)
 
         # Build request
+        # addresses that are known to be used in the subnet (including the ones used by Azure) are excluded
         request = {'type': 'NextAvailableIP',
                    'poolId': self._get_pool_id(reservation_id),
                    'reservationId': reservation_id,
                    'ownerId': self._get_pool_item_owner(owner),
                    'isolation': 'Exclusive',
                    'subnetRange': subnet_cidr,
-                   'reservedIps': self._get_reserved_ips(subnet_cidr)}
+                   'reservedIps': address_index.get_used_ips(),
+                   'count': count}
 
-        # Get next available ip from pool
+        # Get next available ips from pool
         # If no ip is available api will throw an error:
         # 'CloudShell API error 100: Error occurred in CheckoutFromPool. Error: Could not find available IP.'
         result = api.CheckoutFromPool(selectionCriteriaJson=json.dumps(request))
-        available_ip = result.Items[0]
+        checked_out_ips = list(result.Items)
 
-        logger.info("Retrieved next available IP '{}' in subnet '{}'".format(available_ip, subnet_cidr))
+        for ip in checked_out_ips:
+            address_index.reserve(ip)
 
-        return available_ip
+        return checked_out_ips
+
+    def is_subnet_seeded(self, reservation_id, subnet_cidr):
+        """
+        :param str reservation_id:
+        :param str subnet_cidr:
+        :rtype: bool
+        """
+        return (reservation_id, subnet_cidr) in self._seeded_subnets
+
+    def seed_subnet_addresses(self, reservation_id, subnet_cidr, get_network_interfaces):
+        """Mark private IPs of the NICs in the subnet as used in the local subnet index, once per subnet
+
+        Subnet returns its IP configurations as id references only, so the addresses are taken from the NICs
+        of the sandbox resource group (sandbox subnets are used only by its NICs). After that the index is kept
+        up to date by the checkouts and releases of the driver
+        :param str reservation_id:
+        :param str subnet_cidr:
+        :param get_network_interfaces: function without arguments that lists NICs of the sandbox resource group
+        :return:
+        """
+        if self.is_subnet_seeded(reservation_id, subnet_cidr):
+            return
+
+        with self._seed_lock:
+            if self.is_subnet_seeded(reservation_id, subnet_cidr):
+                return
+
+            address_index = self._address_indexes.get_index(reservation_id, subnet_cidr)
+
+            # addresses that don't belong to the subnet are ignored by the index
+            for nic in get_network_interfaces():
+                for ip_configuration in nic.ip_configurations or []:
+                    if ip_configuration.private_ip_address:
+                        address_index.reserve(ip_configuration.private_ip_address)
+
+            self._seeded_subnets.add((reservation_id, subnet_cidr))
+
+    def get_available_ips_count(self, reservation_id, subnet_cidr):
+        """Get number of free addresses of the subnet from the local index without calling Azure or CloudShell
+
+        :param str reservation_id:
+        :param str subnet_cidr:
+        :rtype: int
+        """
+        return self._address_indexes.get_index(reservation_id, subnet_cidr).get_available_count()
+
+    def remove_subnet_address_indexes(self, reservation_id):
+        """Remove local indexes of all subnets of the reservation
+
+        :param str reservation_id:
+        :return:
+        """
+        self._address_indexes.remove_indexes(reservation_id)
+
+        with self._seed_lock:
+            self._seeded_subnets = {key for key in self._seeded_subnets if key[0] != reservation_id}
+
+    def release_prefetched_ips(self, logger, api, reservation_id):
+        """Return IPs that were checked out from the pool for the reservation but not used
+
+        :param Logger logger:
+        :param CloudShellAPISession api:
+        :param str reservation_id:
+        :return:
+        """
+        for prefetched_key in [key for key in self._prefetched_ips.keys() if key[0] == reservation_id]:
+            subnet_cidr = prefetched_key[1]
+            self._release_subnet_prefetched_ips(logger, api, reservation_id, subnet_cidr)
+
+            lock_key = self.PREFETCHED_IPS_LOCK_KEY.format(reservation_id, subnet_cidr)
+            self.generic_lock_provider.remove_lock_resource(lock_key=lock_key, logger=logger)
 
     def _get_pool_item_owner(self, owner):
         return 'Azure-Shell' if not owner else owner
 
-    def _get_reserved_ips(self, subnet_cidr):
-        # Calculate reserved ips by azure - The first and last IP addresses of each subnet are reserved for protocol
-        # conformance, along with the x.x.x.1-x.x.x.3 addresses of each subnet, which are used for Azure services.
-        ip_network = IPNetwork(subnet_cidr)
-        reserved_ips = list(ip_network[0:4]) + [ip_network[-1]]
-        reserved_ips_str_arr = map(lambda x: str(x), reserved_ips)
-        return reserved_ips_str_arr
-
     def _get_pool_id(self, reservation_id):
         return '{}-private-ips'.format(reservation_id)
 
@@ -75,4 +256,9 @@ class IpService(object):
                             poolId=self._get_pool_id(reservation_id),
                             reservationId=reservation_id,
                             ownerId=self._get_pool_item_owner(owner))
+
+        for address_index in self._address_indexes.get_indexes(reservation_id):
+            for ip in ips_to_release:
+                address_index.release(ip)
+
         logger.info('Released ips from pool: {}'.format(','.join(ips_to_release)))
\ No newline at end of file
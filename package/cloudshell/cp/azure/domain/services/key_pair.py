@@ -1,7 +1,6 @@
 from threading import Lock
 
-from Crypto.PublicKey import RSA
-
+from cloudshell.cp.azure.domain.services.key_pair_pool import generate_rsa_key_pair
 from cloudshell.cp.azure.models.ssh_key import SSHKey
 
 
@@ -11,26 +10,30 @@ class KeyPairService(object):
     SSH_PUB_KEY_NAME = "id_rsa.pub"
     SSH_PRIVATE_KEY_NAME = "id_rsa"
 
-    def __init__(self, storage_service):
+    def __init__(self, storage_service, key_pair_pool=None):
         """
         :param storage_service: cloudshell.cp.azure.domain.services.storage_service.StorageService instance
+        :param cloudshell.cp.azure.domain.services.key_pair_pool.KeyPairPool key_pair_pool: pool of pre-generated
+            key pairs, if not provided key pairs are generated in place
         """
         self._storage_service = storage_service
+        self._key_pair_pool = key_pair_pool
         self._key_pair_lock = Lock()
         self._cached_key_pairs = {}
 
-    def generate_key_pair(self, key_length=2048):
+    def generate_key_pair(self, key_length=2048, pool_depth=0, logger=None):
         """
-        Generate SSH key pair model
+        Generate SSH key pair model, a ready one is taken from the key pairs pool if possible
 
         :param key_length: (int) SSH key length
+        :param int pool_depth: number of key pairs that are kept ready in the pool, 0 disables the pool
+        :param logging.Logger logger:
         :return: cloudshell.cp.azure.models.ssh_key.SSHKey instance
         """
-        key = RSA.generate(key_length)
-        pubkey = key.publickey()
-
-        private_key = key.exportKey('PEM')
-        public_key = pubkey.exportKey('OpenSSH')
+        if self._key_pair_pool is not None and self._key_pair_pool.key_length == key_length:
+            private_key, public_key = self._key_pair_pool.get_key_pair(depth=pool_depth, logger=logger)
+        else:
+            private_key, public_key = generate_rsa_key_pair(key_length)
 
         return SSHKey(private_key=private_key, public_key=public_key)
 
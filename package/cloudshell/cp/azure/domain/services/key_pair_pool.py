@@ -0,0 +1,220 @@
+import Queue
+import multiprocessing
+import time
+from functools import partial
+from threading import Lock
+
+from Crypto import Random
+from Crypto.PublicKey import RSA
+
+
+def generate_rsa_key_pair(key_length):
+    """Generate RSA key pair
+
+    Function is executed in the worker process, so it returns plain strings instead of the SSHKey model
+    :param int key_length: SSH key length
+    :return: private key in PEM format and public key in OpenSSH format
+    :rtype: tuple[str, str]
+    """
+    key = RSA.generate(key_length)
+    return key.exportKey('PEM'), key.publickey().exportKey('OpenSSH')
+
+
+def _generate_rsa_key_pair_safe(key_length):
+    # exception in the worker process would leave the pool waiting for a key that never comes
+    try:
+        return generate_rsa_key_pair(key_length)
+    except Exception:
+        return None
+
+
+class KeyPairPool(object):
+    """Pool of pre-generated RSA key pairs
+
+    Keys are generated by a background worker process, so the CPU-heavy generation doesn't compete
+    with the driver threads for the GIL. The pool keeps up to "depth" ready (or being generated) keys
+    and is refilled every time a key is taken from it. Depth is passed with every request from the
+    "Key Pair Pool Depth" attribute, zero depth generates keys in place and stops the worker process.
+    The worker process is started on the first request and is replaced if it doesn't return the requested
+    keys in "wait_timeout" seconds
+    """
+    DEFAULT_KEY_LENGTH = 2048
+    WAIT_TIMEOUT = 30
+    MAX_FAILED_ATTEMPTS = 3
+
+    def __init__(self, key_length=DEFAULT_KEY_LENGTH, wait_timeout=WAIT_TIMEOUT):
+        """
+        :param int key_length: length of the generated keys
+        :param int wait_timeout: max time (in seconds) to wait for the key being generated by the worker,
+            the key is generated in the current process after it
+        """
+        self.depth = 0
+        self.key_length = key_length
+        self.wait_timeout = wait_timeout
+        self._ready = Queue.Queue()
+        self._pending = 0
+        self._failed_attempts = 0
+        self._last_activity = None
+        self._generation = 0
+        self._lock = Lock()
+        self._worker = None
+
+    def get_key_pair(self, depth, logger=None):
+        """Take a ready key pair from the pool
+
+        :param int depth: max number of keys that are kept ready, 0 to generate the key in place
+        :param logging.Logger logger:
+        :return: private key in PEM format and public key in OpenSSH format
+        :rtype: tuple[str, str]
+        """
+        if depth <= 0:
+            self._stop_worker(logger)
+            return generate_rsa_key_pair(self.key_length)
+
+        with self._lock:
+            self.depth = depth
+
+        generation = self._fill(logger)
+
+        try:
+            if generation is not None:
+                key_pair = self._ready.get(timeout=self.wait_timeout)
+            else:
+                key_pair = self._ready.get_nowait()
+        except Queue.Empty:
+            if generation is not None:
+                if logger:
+                    logger.warning("Key pairs worker process didn't return a key pair in {} seconds, "
+                                   "restarting it".format(self.wait_timeout))
+                self._reset_worker(generation=generation, logger=logger)
+            elif logger:
+                logger.warning("There is no ready key pair in the pool, generating it in the current process")
+            return generate_rsa_key_pair(self.key_length)
+
+        self._fill(logger)
+        return key_pair
+
+    def _fill(self, logger):
+        """Request generation of the missing keys from the worker
+
+        :param logging.Logger logger:
+        :return: generation of the worker process or None if the worker process is not available
+        :rtype: int
+        """
+        hung_worker = None
+
+        with self._lock:
+            if self._worker and self._is_worker_hung():
+                if logger:
+                    logger.warning("Key pairs worker process didn't return any key pair in {} seconds, "
+                                   "restarting it".format(self.wait_timeout))
+                hung_worker = self._detach_worker()
+
+            if self._worker is None:
+                try:
+                    # random generator state must be re-initialized in the forked worker
+                    self._worker = multiprocessing.Pool(processes=1, initializer=Random.atfork)
+                except Exception:
+                    if logger:
+                        logger.exception("Failed to start the key pairs worker process:")
+                    self._worker = False
+
+            if self._worker:
+                self._request_missing_key_pairs()
+                generation = self._generation
+            else:
+                generation = None
+
+        if hung_worker is not None:
+            self._terminate_worker(hung_worker, logger)
+
+        return generation
+
+    def _is_worker_hung(self):
+        """Check whether the worker process stopped returning the requested keys (it died or hung)
+
+        :rtype: bool
+        """
+        return self._pending > 0 and time.time() - self._last_activity > self.wait_timeout
+
+    def _request_missing_key_pairs(self):
+        """Must be called under the lock"""
+        missing_count = self.depth - self._ready.qsize() - self._pending
+        if missing_count > 0 and self._pending == 0:
+            self._last_activity = time.time()
+
+        for _ in xrange(missing_count):
+            self._pending += 1
+            self._worker.apply_async(_generate_rsa_key_pair_safe, (self.key_length,),
+                                     callback=partial(self._on_key_pair_generated, self._generation))
+
+    def _stop_worker(self, logger):
+        """Stop the worker process once the pool is disabled
+
+        :param logging.Logger logger:
+        """
+        with self._lock:
+            self.depth = 0
+            if not self._worker:
+                return
+            worker = self._detach_worker()
+
+        self._terminate_worker(worker, logger)
+
+    def _reset_worker(self, generation, logger):
+        """Replace the worker process unless it was already replaced by another thread
+
+        :param int generation: generation of the worker process that failed to return the key
+        :param logging.Logger logger:
+        """
+        with self._lock:
+            if generation != self._generation or not self._worker:
+                return
+            worker = self._detach_worker()
+
+        self._terminate_worker(worker, logger)
+
+    def _detach_worker(self):
+        """Must be called under the lock. Keys requested from the detached worker are not waited anymore
+
+        :return: detached worker process pool
+        :rtype: multiprocessing.pool.Pool
+        """
+        worker = self._worker
+        self._worker = None
+        self._pending = 0
+        self._failed_attempts = 0
+        self._generation += 1
+        return worker
+
+    def _terminate_worker(self, worker, logger):
+        """Must be called without the lock, terminate() waits for the thread that runs the pool callbacks
+
+        :param multiprocessing.pool.Pool worker:
+        :param logging.Logger logger:
+        """
+        try:
+            worker.terminate()
+        except Exception:
+            if logger:
+                logger.warning("Failed to terminate the key pairs worker process", exc_info=1)
+
+    def _on_key_pair_generated(self, generation, key_pair):
+        with self._lock:
+            if generation != self._generation:
+                # result of the replaced worker process
+                return
+
+            self._pending -= 1
+            self._last_activity = time.time()
+
+            if key_pair is None:
+                self._failed_attempts += 1
+                # don't re-request keys forever if generation fails constantly,
+                # the next get_key_pair call will request them again
+                if self._failed_attempts < self.MAX_FAILED_ATTEMPTS:
+                    self._request_missing_key_pairs()
+                return
+
+            self._failed_attempts = 0
+            self._ready.put(key_pair)
@@ -1,4 +1,5 @@
 import time
+from functools import partial
 
 import azure
 from azure.mgmt.network.models import NetworkInterface, NetworkInterfaceIPConfiguration, VirtualNetwork, RouteTable, \
@@ -7,8 +8,10 @@ from retrying import retry
 
 from cloudshell.cp.azure.common.helpers.ip_allocation_helper import is_static_allocation, to_azure_type
 from cloudshell.cp.azure.common.helpers.retrying_helpers import retry_if_connection_error, retryable_error_max_attempts, \
-    retryable_wait_time, retry_if_retryable_error
+    retryable_wait_time, retry_if_retryable_error, retry_if_precondition_failed
 from cloudshell.cp.azure.domain.services.security_group import SANDBOX_NSG_NAME
+from cloudshell.cp.azure.domain.services.vnet_mutation_queue import UpdateSubnetMutation
+from cloudshell.cp.azure.models.nsg_artifacts_index import NsgArtifactsIndex
 
 
 class NetworkService(object):
@@ -44,20 +47,21 @@ class NetworkService(object):
 
     def add_route_table_to_subnets(self, routes_rg,
                                    route_table_name, network_client,
-                                   subnets, subnets_rg, subnets_vnet):
+                                   subnets, subnets_rg, subnets_vnet, vnet_mutation_queue):
         """
         :param NetworkManagementClient network_client: network client
         :param route_table_name:
         :param subnets:
+        :param cloudshell.cp.azure.domain.services.vnet_mutation_queue.VnetMutationQueue vnet_mutation_queue:
         :return:
         """
         route_table = network_client.route_tables.get(routes_rg,
                                                       route_table_name)
-        for subnet in subnets:
-            subnet_obj = network_client.subnets.get(subnets_rg, subnets_vnet, subnet)
-            subnet_obj.route_table = route_table
-            poller = network_client.subnets.create_or_update(subnets_rg, subnets_vnet, subnet, subnet_obj)
-            poller.result()
+        vnet_mutation_queue.submit(network_client=network_client,
+                                   resource_group_name=subnets_rg,
+                                   virtual_network_name=subnets_vnet,
+                                   mutations=[UpdateSubnetMutation(subnet_name=subnet, route_table=route_table)
+                                              for subnet in subnets])
 
     def create_network_for_vm(self,
                               network_client,
@@ -156,6 +160,11 @@ class NetworkService(object):
 
         private_ip_address = None
         if is_static_allocation(private_ip_allocation_method):
+            self.ip_service.seed_subnet_addresses(reservation_id=reservation_id,
+                                                  subnet_cidr=subnet.address_prefix,
+                                                  get_network_interfaces=partial(self.get_network_interfaces,
+                                                                                 network_client=network_client,
+                                                                                 group_name=group_name))
             private_ip_address = self.ip_service.get_next_available_ip_from_cs_pool(logger=logger,
                                                                                     api=cloudshell_session,
                                                                                     reservation_id=reservation_id,
@@ -268,6 +277,36 @@ class NetworkService(object):
         if wait_for_result:
             return operation_poller.result()
 
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    @retry(stop_max_attempt_number=retryable_error_max_attempts,
+           wait_fixed=retryable_wait_time,
+           retry_on_exception=retry_if_precondition_failed)
+    def update_virtual_network(self, network_client, resource_group_name, virtual_network_name, update_func):
+        """Read-modify-write the vNet on the Azure
+
+        vNet is updated only if it was not changed since it was read (If-Match on the vNet ETag),
+        otherwise the whole read-modify-write cycle is retried
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param str resource_group_name: vNet resource group name
+        :param str virtual_network_name: vNet name
+        :param update_func: function that gets VirtualNetwork, changes it in place and returns True
+            if anything was changed
+        :return: updated vNet
+        :rtype: VirtualNetwork
+        """
+        virtual_network = network_client.virtual_networks.get(resource_group_name, virtual_network_name)
+
+        if not update_func(virtual_network):
+            return virtual_network
+
+        operation_poller = network_client.virtual_networks.create_or_update(
+            resource_group_name,
+            virtual_network_name,
+            virtual_network,
+            custom_headers={'If-Match': virtual_network.etag})
+
+        return operation_poller.result()
+
     @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
     def update_subnet(self, network_client, resource_group_name, virtual_network_name, subnet_name, subnet):
         """
@@ -420,6 +459,26 @@ class NetworkService(object):
                                                subnet_name=subnet_name)
         result.wait()
 
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def get_network_interfaces(self, network_client, group_name):
+        """
+        :param azure.mgmt.network.network_management_client.NetworkManagementClient network_client:
+        :param str group_name:
+        :return: list of NICs in group
+        :rtype: list[azure.mgmt.network.models.NetworkInterface]
+        """
+        return list(network_client.network_interfaces.list(group_name))
+
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def get_public_ips(self, network_client, group_name):
+        """
+        :param azure.mgmt.network.network_management_client.NetworkManagementClient network_client:
+        :param str group_name:
+        :return: list of public IPs in group
+        :rtype: list[azure.mgmt.network.models.PublicIPAddress]
+        """
+        return list(network_client.public_ip_addresses.list(group_name))
+
     @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
     def get_virtual_networks(self, network_client, group_name):
         """
@@ -460,26 +519,106 @@ class NetworkService(object):
                     None)
 
     @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
-    def delete_nsg_artifacts_associated_with_vm(self, network_client, resource_group_name, vm_name):
+    @retry(stop_max_attempt_number=retryable_error_max_attempts,
+           wait_fixed=retryable_wait_time,
+           retry_on_exception=retry_if_precondition_failed)
+    def update_network_security_group_rules(self, network_client, group_name, security_group_name,
+                                            rules_to_add=None, rule_names_to_remove=None, remove_rules_filter=None):
+        """Add and remove NSG rules with a single NSG update on the Azure
+
+        NSG is updated only if it was not changed since it was read (If-Match on the NSG ETag),
+        otherwise the whole read-modify-write cycle is retried
+        :param azure.mgmt.network.network_management_client.NetworkManagementClient network_client:
+        :param str group_name: resource group name (reservation id)
+        :param str security_group_name: NSG name from the Azure
+        :param list[azure.mgmt.network.models.SecurityRule] rules_to_add: rules to create (or replace by name)
+        :param list[str] rule_names_to_remove: names of the rules to delete
+        :param remove_rules_filter: function that gets existing SecurityRule and returns True if it must be deleted
+        :return: updated NSG
+        :rtype: azure.mgmt.network.models.NetworkSecurityGroup
+        """
+        rules_to_add = rules_to_add or []
+        rule_names_to_remove = set(rule_names_to_remove or [])
+        nsg = network_client.network_security_groups.get(group_name, security_group_name)
+        existing_rules = nsg.security_rules or []
+
+        if remove_rules_filter is not None:
+            rule_names_to_remove.update(rule.name for rule in existing_rules if remove_rules_filter(rule))
+
+        if not rules_to_add and not any(rule.name in rule_names_to_remove for rule in existing_rules):
+            return nsg
+
+        replaced_rule_names = rule_names_to_remove | {rule.name for rule in rules_to_add}
+        nsg.security_rules = [rule for rule in existing_rules if rule.name not in replaced_rule_names] + rules_to_add
+
+        operation_poller = network_client.network_security_groups.create_or_update(
+            group_name,
+            security_group_name,
+            nsg,
+            custom_headers={'If-Match': nsg.etag})
+
+        return operation_poller.result()
+
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def get_nsg_artifacts_index(self, network_client, resource_group_name):
+        """Index NSG artifacts of all VMs in the resource group with a single NSGs listing
+
+        :param azure.mgmt.network.network_management_client.NetworkManagementClient network_client:
+        :param str resource_group_name:
+        :rtype: NsgArtifactsIndex
+        """
+        network_security_groups = network_client.network_security_groups.list(resource_group_name)
+        return NsgArtifactsIndex(network_security_groups=list(network_security_groups),
+                                 sandbox_nsg_name_prefix=SANDBOX_NSG_NAME)
+
+    def delete_nsg_artifacts_associated_with_vm(self, network_client, resource_group_name, vm_name,
+                                                nsg_artifacts_index=None):
         """
         :param azure.mgmt.network.network_management_client.NetworkManagementClient network_client:
         :param str resource_group_name:
         :param str vm_name:
+        :param NsgArtifactsIndex nsg_artifacts_index: index shared by the whole teardown batch, NSGs will be listed
+            for this VM only if it wasn't provided
         """
+        self.delete_nsg_artifacts_associated_with_vms(network_client=network_client,
+                                                      resource_group_name=resource_group_name,
+                                                      vm_names=[vm_name],
+                                                      nsg_artifacts_index=nsg_artifacts_index)
 
-        network_security_groups = network_client.network_security_groups.list(resource_group_name)
-        for nsg in network_security_groups:
-            if vm_name in nsg.name:
-                # rollback vm nsg
-                poller = network_client.network_security_groups.delete(resource_group_name,
-                                                                       nsg.name)
-                poller.wait()
-
-            if SANDBOX_NSG_NAME in nsg.name:
-                for rule in nsg.security_rules:
-                    if vm_name in rule.name:
-                        # rollback inbound ports
-                        poller = network_client.security_rules.delete(resource_group_name,
-                                                                      nsg.name,
-                                                                      rule.name)
-                        poller.wait()
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def delete_nsg_artifacts_associated_with_vms(self, network_client, resource_group_name, vm_names,
+                                                 nsg_artifacts_index=None):
+        """Delete NSGs of the VMs and remove their inbound ports rules with a single update per NSG
+
+        :param azure.mgmt.network.network_management_client.NetworkManagementClient network_client:
+        :param str resource_group_name:
+        :param list[str] vm_names:
+        :param NsgArtifactsIndex nsg_artifacts_index: index shared by the whole teardown batch, NSGs will be listed
+            only if it wasn't provided
+        """
+        if nsg_artifacts_index is None:
+            nsg_artifacts_index = self.get_nsg_artifacts_index(network_client=network_client,
+                                                               resource_group_name=resource_group_name)
+
+        # rollback vm nsgs, all deletions are started before waiting for any of them
+        pollers = [network_client.network_security_groups.delete(resource_group_name, nsg_name)
+                   for vm_name in vm_names
+                   for nsg_name in nsg_artifacts_index.get_vm_network_security_group_names(vm_name)]
+
+        for poller in pollers:
+            poller.wait()
+
+        rule_names_by_nsg = {}
+        for vm_name in vm_names:
+            for nsg_name, rule_names in nsg_artifacts_index.get_vm_security_rule_names(vm_name).items():
+                rule_names_by_nsg.setdefault(nsg_name, []).extend(rule_names)
+
+        for nsg_name, rule_names in rule_names_by_nsg.items():
+            # rollback inbound ports
+            self.update_network_security_group_rules(network_client=network_client,
+                                                     group_name=resource_group_name,
+                                                     security_group_name=nsg_name,
+                                                     rule_names_to_remove=rule_names)
+
+        for vm_name in vm_names:
+            nsg_artifacts_index.remove_vm(vm_name)
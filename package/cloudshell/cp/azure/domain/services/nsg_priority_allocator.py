@@ -0,0 +1,136 @@
+from threading import Lock
+
+
+class NsgPriorityAllocator(object):
+    """In-memory map of the rule priorities that are taken in a single NSG
+
+    Azure allows priorities in the 100-4096 range only, so the whole range fits into one small bytearray
+    where every item marks a single priority as taken (1) or free (0)
+    """
+    MIN_PRIORITY = 100
+    MAX_PRIORITY = 4096
+    FREE = b'\x00'
+
+    def __init__(self, priorities=None):
+        """
+        :param priorities: list[int] priorities that are already taken in the NSG
+        """
+        self._lock = Lock()
+        self._taken = bytearray(self.MAX_PRIORITY + 1)
+        self.reset(priorities or [])
+
+    def _is_valid(self, priority):
+        return isinstance(priority, (int, long)) and self.MIN_PRIORITY <= priority <= self.MAX_PRIORITY
+
+    def reset(self, priorities):
+        """Replace the allocator state with the given taken priorities
+
+        :param priorities: list[int] priorities that are taken in the NSG
+        :return:
+        """
+        taken = bytearray(self.MAX_PRIORITY + 1)
+        for priority in priorities:
+            if self._is_valid(priority):
+                taken[priority] = 1
+
+        with self._lock:
+            self._taken = taken
+
+    def allocate(self, start_from, step):
+        """Take the first free priority in the sequence start_from, start_from + step, ...
+
+        :param int start_from: rule priority number to start from
+        :param int step: distance between two candidate priorities
+        :return: (int) allocated priority
+        :raise ValueError: if there is no free priority left in the sequence
+        """
+        start_from = max(start_from, self.MIN_PRIORITY)
+
+        with self._lock:
+            index = self._taken[start_from::step].find(self.FREE)
+            if index < 0:
+                raise ValueError("There is no free NSG rule priority starting from {}".format(start_from))
+
+            priority = start_from + index * step
+            self._taken[priority] = 1
+
+        return priority
+
+    def reserve(self, priority):
+        """Mark given priority as taken
+
+        :param int priority:
+        :return:
+        """
+        if self._is_valid(priority):
+            with self._lock:
+                self._taken[priority] = 1
+
+    def release(self, priority):
+        """Mark given priority as free
+
+        :param int priority:
+        :return:
+        """
+        if self._is_valid(priority):
+            with self._lock:
+                self._taken[priority] = 0
+
+    def is_taken(self, priority):
+        """
+        :param int priority:
+        :rtype: bool
+        """
+        return self._is_valid(priority) and self._taken[priority] == 1
+
+
+class NsgPriorityAllocatorProvider(object):
+    """Keeps a single NsgPriorityAllocator per (resource group, NSG name)"""
+
+    def __init__(self):
+        self._allocators = {}
+        self._lock = Lock()
+
+    def get_allocator(self, group_name, security_group_name):
+        """
+        :param str group_name: resource group name (reservation id)
+        :param str security_group_name: NSG name from the Azure
+        :return: NsgPriorityAllocator instance or None if NSG was not seeded yet
+        :rtype: NsgPriorityAllocator
+        """
+        return self._allocators.get((group_name, security_group_name))
+
+    def seed_allocator(self, group_name, security_group_name, security_rules):
+        """Create (or replace) allocator for the NSG from its security rules
+
+        :param str group_name: resource group name (reservation id)
+        :param str security_group_name: NSG name from the Azure
+        :param security_rules: list[azure.mgmt.network.models.SecurityRule] existing NSG rules
+        :rtype: NsgPriorityAllocator
+        """
+        allocator = NsgPriorityAllocator(priorities=[rule.priority for rule in security_rules])
+
+        with self._lock:
+            self._allocators[(group_name, security_group_name)] = allocator
+
+        return allocator
+
+    def remove_allocator(self, group_name, security_group_name):
+        """Remove allocator for the NSG, so it will be seeded from the Azure on the next use
+
+        :param str group_name: resource group name (reservation id)
+        :param str security_group_name: NSG name from the Azure
+        :return:
+        """
+        with self._lock:
+            self._allocators.pop((group_name, security_group_name), None)
+
+    def remove_allocators(self, group_name):
+        """Remove all allocators for the NSGs from given resource group
+
+        :param str group_name: resource group name (reservation id)
+        :return:
+        """
+        with self._lock:
+            for key in [key for key in self._allocators if key[0] == group_name]:
+                del self._allocators[key]
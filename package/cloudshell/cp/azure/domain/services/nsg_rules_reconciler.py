@@ -0,0 +1,87 @@
+from enum import Enum
+
+
+class NsgRulesDiff(object):
+    def __init__(self, rules_to_add, rules_to_remove, rules_to_keep):
+        """
+        :param rules_to_add: list[azure.mgmt.network.models.SecurityRule] desired rules missing in the NSG
+        :param rules_to_remove: list[azure.mgmt.network.models.SecurityRule] existing rules that are not desired
+        :param rules_to_keep: list[azure.mgmt.network.models.SecurityRule] existing rules that match desired ones
+        """
+        self.rules_to_add = rules_to_add
+        self.rules_to_remove = rules_to_remove
+        self.rules_to_keep = rules_to_keep
+
+    @property
+    def is_empty(self):
+        """
+        :rtype: bool
+        """
+        return not self.rules_to_add and not self.rules_to_remove
+
+
+class NsgRulesReconciler(object):
+    """Computes minimal set of changes that brings NSG rules to the desired state
+
+    Rules are compared by what they do (direction, access, protocol, addresses and ports), not by their
+    names or priorities, so a rule that already exists in the NSG is kept as is with its current priority
+    """
+
+    @staticmethod
+    def _normalize(value):
+        if isinstance(value, Enum):
+            value = value.value
+
+        return str(value).lower() if value is not None else None
+
+    def get_rule_key(self, rule):
+        """
+        :param azure.mgmt.network.models.SecurityRule rule:
+        :rtype: tuple
+        """
+        return tuple(self._normalize(value) for value in (rule.direction,
+                                                          rule.access,
+                                                          rule.protocol,
+                                                          rule.source_address_prefix,
+                                                          rule.source_port_range,
+                                                          rule.destination_address_prefix,
+                                                          rule.destination_port_range))
+
+    def get_diff(self, existing_rules, desired_rules):
+        """Compare existing NSG rules with the desired ones
+
+        :param existing_rules: list[azure.mgmt.network.models.SecurityRule] rules managed by the caller
+            that currently exist in the NSG
+        :param desired_rules: list[azure.mgmt.network.models.SecurityRule] rules that should exist in the NSG
+        :rtype: NsgRulesDiff
+        """
+        existing_by_key = {}
+        rules_to_remove = []
+
+        for rule in existing_rules:
+            key = self.get_rule_key(rule)
+            if key in existing_by_key:
+                # duplicated rule, only one copy of it is needed
+                rules_to_remove.append(rule)
+            else:
+                existing_by_key[key] = rule
+
+        rules_to_add = []
+        rules_to_keep = []
+        desired_keys = set()
+
+        for rule in desired_rules:
+            key = self.get_rule_key(rule)
+            if key in desired_keys:
+                continue
+
+            desired_keys.add(key)
+
+            if key in existing_by_key:
+                rules_to_keep.append(existing_by_key[key])
+            else:
+                rules_to_add.append(rule)
+
+        rules_to_remove.extend(rule for key, rule in existing_by_key.iteritems() if key not in desired_keys)
+
+        return NsgRulesDiff(rules_to_add=rules_to_add, rules_to_remove=rules_to_remove, rules_to_keep=rules_to_keep)
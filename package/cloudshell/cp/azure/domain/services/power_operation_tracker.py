@@ -0,0 +1,190 @@
+import time
+from threading import Event, Lock, Thread
+
+
+class PowerOperation(object):
+    ACCEPTED = "Accepted"
+    SUCCEEDED = "Succeeded"
+    FAILED = "Failed"
+
+    def __init__(self, group_name, vm_name, action, compute_client, status_url, logger):
+        """
+        :param str group_name: resource group name
+        :param str vm_name: name of the VM
+        :param str action: "PowerOn" or "PowerOff"
+        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_client:
+        :param str status_url: URL of the operation status, None if the operation was finished right away
+        :param logging.Logger logger:
+        """
+        self.group_name = group_name
+        self.vm_name = vm_name
+        self.action = action
+        self.compute_client = compute_client
+        self.status_url = status_url
+        self.logger = logger
+        self.status = self.ACCEPTED
+        self.error = ''
+        self.failed_polls = 0
+        self.finished_at = None
+        self.finished = Event()
+
+    def finish(self, error=None):
+        """
+        :param str error: error message if the operation failed
+        """
+        self.status = self.FAILED if error is not None else self.SUCCEEDED
+        self.error = error or ''
+        self.finished_at = time.time()
+        self.finished.set()
+
+
+class PowerOperationTracker(object):
+    """Tracks start and deallocate operations of the VMs with a single shared poller
+
+    Power operations of many VMs are started without the SDK pollers (each of them runs its own polling
+    thread), and a single background thread polls the status URLs of all operations. Callers can wait for
+    the operations they started or return right away and query the status of the operations later.
+    Statuses of the finished operations are kept for RESULT_TTL
+    """
+    POLL_INTERVAL = 5
+    RESULT_TTL = 3600
+    MAX_FAILED_POLLS = 5
+
+    def __init__(self, vm_service, poll_interval=POLL_INTERVAL, result_ttl=RESULT_TTL):
+        """
+        :param cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService vm_service:
+        :param int poll_interval: interval (in seconds) between checks of the tracked operations
+        :param int result_ttl: time (in seconds) to keep status of the finished operation
+        """
+        self.vm_service = vm_service
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self._operations = {}
+        self._running = []
+        self._lock = Lock()
+        self._thread = None
+
+    def track(self, compute_client, group_name, vm_name, action, status_url, logger):
+        """Start tracking of the power operation
+
+        Status of the previous operation of the same VM is replaced, but the operation itself is still polled,
+        so callers waiting for it are not blocked
+
+        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_client:
+        :param str group_name: resource group name
+        :param str vm_name: name of the VM
+        :param str action: "PowerOn" or "PowerOff"
+        :param str status_url: URL of the operation status, None if the operation was finished right away
+        :param logging.Logger logger:
+        :rtype: PowerOperation
+        """
+        operation = PowerOperation(group_name=group_name, vm_name=vm_name, action=action,
+                                   compute_client=compute_client, status_url=status_url, logger=logger)
+
+        with self._lock:
+            self._operations[(group_name, vm_name)] = operation
+            self._running.append(operation)
+
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="PowerOperationTracker")
+                self._thread.daemon = True
+                self._thread.start()
+
+        return operation
+
+    def get_operation(self, group_name, vm_name):
+        """
+        :param str group_name: resource group name
+        :param str vm_name: name of the VM
+        :return: the last power operation of the VM or None if there is no known operation
+        :rtype: PowerOperation
+        """
+        with self._lock:
+            return self._operations.get((group_name, vm_name))
+
+    @staticmethod
+    def wait(operations, timeout=None):
+        """Wait for all given operations to finish
+
+        :param list[PowerOperation] operations:
+        :param int timeout: max time (in seconds) to wait for all operations, wait without a limit by default
+        :return: True if all operations are finished
+        :rtype: bool
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+
+        for operation in operations:
+            # Event.wait() without a timeout can't be interrupted on Python 2, so wait in short intervals
+            while not operation.finished.wait(1 if deadline is None else max(min(deadline - time.time(), 1), 0)):
+                if deadline is not None and time.time() >= deadline:
+                    return False
+
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.check_operations()
+
+            with self._lock:
+                if not self._running:
+                    self._thread = None
+                    return
+
+    def check_operations(self):
+        """Finish all tracked operations that are done and forget statuses of the old ones"""
+        with self._lock:
+            running = list(self._running)
+            expired_keys = [key for key, operation in self._operations.iteritems()
+                            if operation.finished_at is not None and
+                            time.time() - operation.finished_at > self.result_ttl]
+            for key in expired_keys:
+                del self._operations[key]
+
+        for operation in running:
+            if not self._check_operation(operation):
+                continue
+
+            with self._lock:
+                if operation in self._running:
+                    self._running.remove(operation)
+
+    def _check_operation(self, operation):
+        """Poll status of the operation and finish it if it is done
+
+        :param PowerOperation operation:
+        :return: True if the operation is finished
+        :rtype: bool
+        """
+        if operation.status_url is None:
+            status, error = self.vm_service.OPERATION_SUCCEEDED_STATUS, ''
+        else:
+            try:
+                status, error = self.vm_service.get_operation_status(
+                    compute_management_client=operation.compute_client,
+                    status_url=operation.status_url)
+            except Exception as e:
+                operation.failed_polls += 1
+                if operation.failed_polls < self.MAX_FAILED_POLLS:
+                    operation.logger.warning("Failed to get status of the {} operation for the VM {}".format(
+                        operation.action, operation.vm_name), exc_info=1)
+                    return False
+
+                status, error = None, e.message or str(e)
+            else:
+                operation.failed_polls = 0
+
+        if status == self.vm_service.OPERATION_IN_PROGRESS_STATUS:
+            return False
+
+        if status == self.vm_service.OPERATION_SUCCEEDED_STATUS:
+            operation.logger.info("{} operation succeeded for the VM {}".format(operation.action,
+                                                                               operation.vm_name))
+            operation.finish()
+        else:
+            error = error or "{} operation finished with the status {}".format(operation.action, status)
+            operation.logger.warning("{} operation failed for the VM {}: {}".format(
+                operation.action, operation.vm_name, error))
+            operation.finish(error=error)
+
+        return True
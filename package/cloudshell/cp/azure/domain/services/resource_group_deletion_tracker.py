@@ -0,0 +1,156 @@
+import time
+from threading import Lock, Thread
+
+from msrestazure.azure_exceptions import CloudError
+
+
+class _TrackedDeletion(object):
+    def __init__(self, resource_client, group_name, poller, logger, on_deleted):
+        """
+        :param azure.mgmt.resource.ResourceManagementClient resource_client:
+        :param str group_name:
+        :param msrestazure.azure_operation.AzureOperationPoller poller:
+        :param logging.Logger logger:
+        :param on_deleted: function without arguments that is called after the resource group is deleted
+        """
+        self.resource_client = resource_client
+        self.group_name = group_name
+        self.poller = poller
+        self.logger = logger
+        self.on_deleted = on_deleted
+        self.attempt = 1
+
+
+class ResourceGroupDeletionTracker(object):
+    """Tracks resource group deletions that were started without waiting for them
+
+    Deletion of the resource group with all its VMs, disks and NICs can take a long time. The tracker
+    keeps the started deletions and checks them from a single background thread: finished deletion
+    is logged, failed one is started again until the max number of attempts is reached
+    """
+    MAX_ATTEMPTS = 3
+    POLL_INTERVAL = 10
+
+    def __init__(self, vm_service, max_attempts=MAX_ATTEMPTS, poll_interval=POLL_INTERVAL):
+        """
+        :param cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService vm_service:
+        :param int max_attempts: max number of attempts to delete the resource group
+        :param int poll_interval: interval (in seconds) between checks of the tracked deletions
+        """
+        self.vm_service = vm_service
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._tracked = []
+        self._lock = Lock()
+        self._thread = None
+
+    def start_deletion(self, resource_client, group_name, logger, on_deleted=None):
+        """Start the resource group deletion and return without waiting for it
+
+        :param azure.mgmt.resource.ResourceManagementClient resource_client:
+        :param str group_name: resource group name
+        :param logging.Logger logger:
+        :param on_deleted: function without arguments that will be called after the resource group is deleted
+        :return:
+        """
+        poller = self.vm_service.begin_delete_resource_group(resource_management_client=resource_client,
+                                                              group_name=group_name)
+
+        with self._lock:
+            self._tracked.append(_TrackedDeletion(resource_client=resource_client,
+                                                  group_name=group_name,
+                                                  poller=poller,
+                                                  logger=logger,
+                                                  on_deleted=on_deleted))
+
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="ResourceGroupDeletionTracker")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def is_tracked(self, group_name):
+        """
+        :param str group_name: resource group name
+        :return: True if deletion of the resource group is still in progress
+        :rtype: bool
+        """
+        with self._lock:
+            return any(deletion.group_name == group_name for deletion in self._tracked)
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.check_deletions()
+
+            with self._lock:
+                if not self._tracked:
+                    self._thread = None
+                    return
+
+    def check_deletions(self):
+        """Process all tracked deletions that are finished"""
+        with self._lock:
+            finished = [deletion for deletion in self._tracked if deletion.poller.done()]
+
+        for deletion in finished:
+            if self._is_deleted(deletion) or not self._restart_deletion(deletion):
+                with self._lock:
+                    self._tracked.remove(deletion)
+
+    def _is_deleted(self, deletion):
+        """
+        :param _TrackedDeletion deletion:
+        :return: True if the resource group was deleted
+        :rtype: bool
+        """
+        try:
+            deletion.poller.result()
+        except Exception as e:
+            if not (isinstance(e, CloudError) and e.status_code == 404):
+                deletion.logger.warning("Failed to delete resource group {} (attempt {}/{}): {}".format(
+                    deletion.group_name, deletion.attempt, self.max_attempts, e.message))
+                return False
+
+        self._on_deleted(deletion)
+        return True
+
+    def _on_deleted(self, deletion):
+        """
+        :param _TrackedDeletion deletion:
+        """
+        deletion.logger.info("Deleted resource group {}".format(deletion.group_name))
+
+        if deletion.on_deleted is not None:
+            try:
+                deletion.on_deleted()
+            except Exception:
+                deletion.logger.exception("Error after deletion of the resource group {}:".format(deletion.group_name))
+
+    def _restart_deletion(self, deletion):
+        """
+        :param _TrackedDeletion deletion:
+        :return: True if the deletion was started again and should be tracked
+        :rtype: bool
+        """
+        while deletion.attempt < self.max_attempts:
+            deletion.attempt += 1
+            deletion.logger.info("Retrying deletion of the resource group {} (attempt {}/{})".format(
+                deletion.group_name, deletion.attempt, self.max_attempts))
+            try:
+                deletion.poller = self.vm_service.begin_delete_resource_group(
+                    resource_management_client=deletion.resource_client,
+                    group_name=deletion.group_name)
+                return True
+            except CloudError as e:
+                if e.status_code == 404:
+                    self._on_deleted(deletion)
+                    return False
+                deletion.logger.warning("Failed to start deletion of the resource group {}".format(
+                    deletion.group_name), exc_info=1)
+            except Exception:
+                deletion.logger.warning("Failed to start deletion of the resource group {}".format(
+                    deletion.group_name), exc_info=1)
+
+        deletion.logger.error("Resource group {} was not deleted after {} attempts".format(deletion.group_name,
+                                                                                          self.max_attempts))
+        return False
@@ -0,0 +1,254 @@
+import time
+from threading import Lock
+
+from cloudshell.cp.azure.domain.services.security_group import SANDBOX_NSG_NAME
+from cloudshell.cp.azure.models.nsg_artifacts_index import NsgArtifactsIndex
+
+
+class _ResourceIndex(object):
+    def __init__(self, resources):
+        """
+        :param list resources: Azure resources of a single type
+        """
+        self.resources = resources
+        self.by_id = {resource.id.lower(): resource for resource in resources}
+        self.by_name = {resource.name: resource for resource in resources}
+
+
+class ResourceGroupInventory(object):
+    """Snapshot of the VMs, NICs, public IPs and NSGs of a single resource group
+
+    Each resource type is listed once, on the first access to it, and is indexed by the lower-cased resource id
+    and by the resource name. References between the resources (VM to NICs, NIC to public IP, subnet and NSG)
+    are resolved from the snapshot without any additional call to Azure. Resources that were created after
+    the type was listed are not in the snapshot, so callers should fall back to reading them from Azure
+    """
+    VIRTUAL_MACHINES = "virtual_machines"
+    NETWORK_INTERFACES = "network_interfaces"
+    PUBLIC_IPS = "public_ips"
+    NETWORK_SECURITY_GROUPS = "network_security_groups"
+
+    def __init__(self, vm_service, network_service, security_group_service, compute_client, network_client,
+                 group_name):
+        """
+        :param cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService vm_service:
+        :param cloudshell.cp.azure.domain.services.network_service.NetworkService network_service:
+        :param cloudshell.cp.azure.domain.services.security_group.SecurityGroupService security_group_service:
+        :param azure.mgmt.compute.ComputeManagementClient compute_client:
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param str group_name: Azure resource group name (reservation id)
+        """
+        self.group_name = group_name
+        self.created_at = time.time()
+        self._list_funcs = {
+            self.VIRTUAL_MACHINES: lambda: vm_service.list_virtual_machines(compute_management_client=compute_client,
+                                                                             group_name=group_name),
+            self.NETWORK_INTERFACES: lambda: network_service.get_network_interfaces(network_client=network_client,
+                                                                                    group_name=group_name),
+            self.PUBLIC_IPS: lambda: network_service.get_public_ips(network_client=network_client,
+                                                                    group_name=group_name),
+            self.NETWORK_SECURITY_GROUPS: lambda: security_group_service.list_network_security_group(
+                network_client=network_client,
+                group_name=group_name),
+        }
+        self._indexes = {}
+        self._locks = {resource_type: Lock() for resource_type in self._list_funcs}
+
+    def get_age(self):
+        """
+        :return: number of seconds since the snapshot was created
+        :rtype: float
+        """
+        return time.time() - self.created_at
+
+    def is_loaded(self, resource_type):
+        """
+        :param str resource_type: one of the resource type constants of the class
+        :rtype: bool
+        """
+        return resource_type in self._indexes
+
+    def _get_index(self, resource_type):
+        """Get index of the resource type, the type is listed from Azure on the first use
+
+        :param str resource_type: one of the resource type constants of the class
+        :rtype: _ResourceIndex
+        """
+        index = self._indexes.get(resource_type)
+
+        if index is None:
+            with self._locks[resource_type]:
+                index = self._indexes.get(resource_type)
+                if index is None:
+                    index = self._indexes[resource_type] = _ResourceIndex(list(self._list_funcs[resource_type]()))
+
+        return index
+
+    def _get_by_id(self, resource_type, resource_id):
+        if not resource_id:
+            return None
+
+        return self._get_index(resource_type).by_id.get(resource_id.lower())
+
+    def get_virtual_machines(self):
+        """
+        :rtype: list[azure.mgmt.compute.models.VirtualMachine]
+        """
+        return self._get_index(self.VIRTUAL_MACHINES).resources
+
+    def get_virtual_machine(self, vm_name):
+        """
+        :param str vm_name:
+        :return: VM or None if it is not in the snapshot
+        :rtype: azure.mgmt.compute.models.VirtualMachine
+        """
+        return self._get_index(self.VIRTUAL_MACHINES).by_name.get(vm_name)
+
+    def get_network_interfaces(self):
+        """
+        :rtype: list[azure.mgmt.network.models.NetworkInterface]
+        """
+        return self._get_index(self.NETWORK_INTERFACES).resources
+
+    def get_network_interface(self, nic_id):
+        """
+        :param str nic_id: NIC resource id
+        :return: NIC or None if it is not in the snapshot
+        :rtype: azure.mgmt.network.models.NetworkInterface
+        """
+        return self._get_by_id(self.NETWORK_INTERFACES, nic_id)
+
+    def get_public_ips(self):
+        """
+        :rtype: list[azure.mgmt.network.models.PublicIPAddress]
+        """
+        return self._get_index(self.PUBLIC_IPS).resources
+
+    def get_public_ip(self, public_ip_id):
+        """
+        :param str public_ip_id: public IP resource id
+        :return: public IP or None if it is not in the snapshot
+        :rtype: azure.mgmt.network.models.PublicIPAddress
+        """
+        return self._get_by_id(self.PUBLIC_IPS, public_ip_id)
+
+    def get_network_security_groups(self):
+        """
+        :rtype: list[azure.mgmt.network.models.NetworkSecurityGroup]
+        """
+        return self._get_index(self.NETWORK_SECURITY_GROUPS).resources
+
+    def get_network_security_group(self, nsg_name):
+        """
+        :param str nsg_name:
+        :return: NSG or None if it is not in the snapshot
+        :rtype: azure.mgmt.network.models.NetworkSecurityGroup
+        """
+        return self._get_index(self.NETWORK_SECURITY_GROUPS).by_name.get(nsg_name)
+
+    def get_vm_network_interfaces(self, vm):
+        """Resolve NICs of the VM, NICs that are not in the snapshot are skipped
+
+        :param azure.mgmt.compute.models.VirtualMachine vm:
+        :return: NICs in the order of the VM network profile
+        :rtype: list[azure.mgmt.network.models.NetworkInterface]
+        """
+        nics = [self.get_network_interface(nic_reference.id) for nic_reference in vm.network_profile.network_interfaces]
+        return [nic for nic in nics if nic is not None]
+
+    def get_vm_primary_network_interface(self, vm):
+        """
+        :param azure.mgmt.compute.models.VirtualMachine vm:
+        :return: primary NIC of the VM (the first one if none is marked as primary) or None if it is not in
+            the snapshot
+        :rtype: azure.mgmt.network.models.NetworkInterface
+        """
+        nic_references = vm.network_profile.network_interfaces
+        nic_reference = next((nic_ref for nic_ref in nic_references if nic_ref.primary), nic_references[0])
+        return self.get_network_interface(nic_reference.id)
+
+    def get_nic_public_ip(self, nic):
+        """
+        :param azure.mgmt.network.models.NetworkInterface nic:
+        :return: public IP of the NIC or None if there is no public IP or it is not in the snapshot
+        :rtype: azure.mgmt.network.models.PublicIPAddress
+        """
+        public_ip_reference = nic.ip_configurations[0].public_ip_address
+        return self.get_public_ip(public_ip_reference.id) if public_ip_reference else None
+
+    @staticmethod
+    def get_nic_subnet_name(nic):
+        """Subnets belong to the management resource group, so only the name is resolved from the reference
+
+        :param azure.mgmt.network.models.NetworkInterface nic:
+        :rtype: str
+        """
+        return nic.ip_configurations[0].subnet.id.split('/')[-1]
+
+    def get_nic_network_security_group(self, nic):
+        """
+        :param azure.mgmt.network.models.NetworkInterface nic:
+        :return: NSG attached to the NIC or None if there is no NSG or it is not in the snapshot
+        :rtype: azure.mgmt.network.models.NetworkSecurityGroup
+        """
+        nsg_reference = nic.network_security_group
+        return self._get_by_id(self.NETWORK_SECURITY_GROUPS, nsg_reference.id) if nsg_reference else None
+
+    def get_nsg_artifacts_index(self):
+        """
+        :rtype: NsgArtifactsIndex
+        """
+        return NsgArtifactsIndex(network_security_groups=self.get_network_security_groups(),
+                                 sandbox_nsg_name_prefix=SANDBOX_NSG_NAME)
+
+
+class ResourceGroupInventoryProvider(object):
+    """Keeps the latest inventory snapshot per resource group, so it can be shared between commands"""
+    # max age (in seconds) of the snapshot for the commands that run for all apps of the sandbox at the same time
+    # and don't depend on the resources created or changed by each other
+    SHARED_MAX_AGE = 10
+
+    def __init__(self, vm_service, network_service, security_group_service):
+        """
+        :param cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService vm_service:
+        :param cloudshell.cp.azure.domain.services.network_service.NetworkService network_service:
+        :param cloudshell.cp.azure.domain.services.security_group.SecurityGroupService security_group_service:
+        """
+        self.vm_service = vm_service
+        self.network_service = network_service
+        self.security_group_service = security_group_service
+        self._inventories = {}
+        self._lock = Lock()
+
+    def get_inventory(self, compute_client, network_client, group_name, max_age=0):
+        """Get inventory snapshot of the resource group
+
+        :param azure.mgmt.compute.ComputeManagementClient compute_client:
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param str group_name: Azure resource group name (reservation id)
+        :param float max_age: max age (in seconds) of the snapshot that can be reused, by default a new snapshot
+            is created for each call, so it reflects the resource group state at the moment of the command
+        :rtype: ResourceGroupInventory
+        """
+        with self._lock:
+            inventory = self._inventories.get(group_name)
+
+            if inventory is None or inventory.get_age() > max_age:
+                inventory = self._inventories[group_name] = ResourceGroupInventory(
+                    vm_service=self.vm_service,
+                    network_service=self.network_service,
+                    security_group_service=self.security_group_service,
+                    compute_client=compute_client,
+                    network_client=network_client,
+                    group_name=group_name)
+
+        return inventory
+
+    def invalidate(self, group_name):
+        """Forget the snapshot of the resource group (once its resources were changed or deleted)
+
+        :param str group_name: Azure resource group name (reservation id)
+        :return:
+        """
+        with self._lock:
+            self._inventories.pop(group_name, None)
@@ -1,10 +1,13 @@
-from threading import Lock
+from functools import partial
 
 from azure.mgmt.network.models import NetworkSecurityGroup, RouteNextHopType, SecurityRuleProtocol, SecurityRuleAccess
 from azure.mgmt.network.models import SecurityRule
+from msrestazure.azure_exceptions import CloudError
 from retrying import retry
 
 from cloudshell.cp.azure.common.helpers.retrying_helpers import retry_if_connection_error
+from cloudshell.cp.azure.domain.services.nsg_priority_allocator import NsgPriorityAllocatorProvider
+from cloudshell.cp.azure.domain.services.nsg_rules_reconciler import NsgRulesReconciler
 from cloudshell.cp.azure.models.port_data import PortData
 from cloudshell.cp.azure.models.rule_data import RuleData
 
@@ -16,33 +19,85 @@ class SecurityGroupService(object):
 
     def __init__(self, network_service):
         self.network_service = network_service
+        self._priority_allocators = NsgPriorityAllocatorProvider()
+        self._rules_reconciler = NsgRulesReconciler()
 
-    def _rule_priority_generator(self, existing_rules, start_from=None):
-        """Endless priority generator for NSG rules
+    def _get_priority_allocator(self, network_client, group_name, security_group_name):
+        """Get cached priority allocator for the NSG. Allocator is seeded from the Azure only once per NSG
 
-        :param existing_rules: list[azure.mgmt.network.models.SecurityRule] instances
+        :param network_client: azure.mgmt.network.NetworkManagementClient instance
+        :param group_name: resource group name (reservation id)
+        :param security_group_name: NSG name from the Azure
+        :rtype: cloudshell.cp.azure.domain.services.nsg_priority_allocator.NsgPriorityAllocator
+        """
+        allocator = self._priority_allocators.get_allocator(group_name, security_group_name)
+
+        if allocator is None:
+            allocator = self._reconcile_priority_allocator(network_client=network_client,
+                                                           group_name=group_name,
+                                                           security_group_name=security_group_name)
+        return allocator
+
+    def _reconcile_priority_allocator(self, network_client, group_name, security_group_name):
+        """Re-seed priority allocator for the NSG with the rules that actually exist on the Azure
+
+        :param network_client: azure.mgmt.network.NetworkManagementClient instance
+        :param group_name: resource group name (reservation id)
+        :param security_group_name: NSG name from the Azure
+        :rtype: cloudshell.cp.azure.domain.services.nsg_priority_allocator.NsgPriorityAllocator
+        """
+        security_rules = network_client.security_rules.list(resource_group_name=group_name,
+                                                            network_security_group_name=security_group_name)
+
+        return self._priority_allocators.seed_allocator(group_name=group_name,
+                                                        security_group_name=security_group_name,
+                                                        security_rules=list(security_rules))
+
+    def _allocate_priority(self, network_client, group_name, security_group_name, start_from=None):
+        """Get next available priority for the NSG rule without listing NSG rules on the Azure
+
+        :param network_client: azure.mgmt.network.NetworkManagementClient instance
+        :param group_name: resource group name (reservation id)
+        :param security_group_name: NSG name from the Azure
         :param start_from: (int) rule priority number to start from
-        :return: priority generator => (int) next available priority
+        :return: (int) next available priority
         """
         if start_from is None:
             start_from = self.RULE_DEFAULT_PRIORITY
 
-        existing_priorities = [rule.priority for rule in existing_rules]
-        start_limit = start_from - self.RULE_PRIORITY_INCREASE_STEP
-        end_limit = float("inf")
-        existing_priorities.extend([start_limit, end_limit])
+        allocator = self._get_priority_allocator(network_client=network_client,
+                                                 group_name=group_name,
+                                                 security_group_name=security_group_name)
+        try:
+            return allocator.allocate(start_from=start_from, step=self.RULE_PRIORITY_INCREASE_STEP)
+        except ValueError:
+            # cached priorities might be stale (rules deleted outside of the allocator), re-sync it with the Azure
+            allocator = self._reconcile_priority_allocator(network_client=network_client,
+                                                           group_name=group_name,
+                                                           security_group_name=security_group_name)
 
-        relevant_existing_priorities = [ep for ep in existing_priorities if ep >= start_limit]
-        relevant_existing_priorities = sorted(relevant_existing_priorities)
+            return allocator.allocate(start_from=start_from, step=self.RULE_PRIORITY_INCREASE_STEP)
 
-        i = 0
-        while True:
-            priority = relevant_existing_priorities[i] + self.RULE_PRIORITY_INCREASE_STEP
-            if relevant_existing_priorities[i + 1] > priority:
-                relevant_existing_priorities.insert(i + 1, priority)
-                yield priority
+    def _release_priority(self, group_name, security_group_name, priority):
+        """Return priority of the deleted NSG rule back to the allocator
 
-            i += 1
+        :param group_name: resource group name (reservation id)
+        :param security_group_name: NSG name from the Azure
+        :param priority: (int) rule priority number
+        :return:
+        """
+        allocator = self._priority_allocators.get_allocator(group_name, security_group_name)
+
+        if allocator is not None:
+            allocator.release(priority)
+
+    def remove_priority_allocators(self, group_name):
+        """Forget cached NSG rule priorities for all NSGs in the resource group
+
+        :param group_name: resource group name (reservation id)
+        :return:
+        """
+        self._priority_allocators.remove_allocators(group_name)
 
     @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
     def list_network_security_group(self, network_client, group_name):
@@ -71,7 +126,11 @@ class SecurityGroupService(object):
             network_security_group_name=security_group_name,
             parameters=nsg_model)
 
-        return operation_poler.result()
+        nsg = operation_poler.result()
+        self._priority_allocators.seed_allocator(group_name=group_name,
+                                                 security_group_name=security_group_name,
+                                                 security_rules=nsg.security_rules or [])
+        return nsg
 
     def _prepare_security_group_rule(self, rule_data, destination_address, priority, access="Allow",
                                      source_address=RouteNextHopType.internet):
@@ -201,20 +260,235 @@ class SecurityGroupService(object):
         :return: None
         """
         with lock:
-            security_rules = network_client.security_rules.list(resource_group_name=group_name,
-                                                                network_security_group_name=security_group_name)
-            security_rules = list(security_rules)
-            priority_generator = self._rule_priority_generator(existing_rules=security_rules, start_from=start_from)
-
             for rule_data in inbound_rules:
-                self.create_network_security_group_rule(
-                    network_client=network_client,
-                    group_name=group_name,
-                    security_group_name=security_group_name,
-                    rule_data=rule_data,
-                    destination_addr=destination_addr,
-                    priority=next(priority_generator),
-                    source_address=source_address)
+                priority = self._allocate_priority(network_client=network_client,
+                                                   group_name=group_name,
+                                                   security_group_name=security_group_name,
+                                                   start_from=start_from)
+                create_rule_command = partial(self.create_network_security_group_rule,
+                                              network_client=network_client,
+                                              group_name=group_name,
+                                              security_group_name=security_group_name,
+                                              rule_data=rule_data,
+                                              destination_addr=destination_addr,
+                                              source_address=source_address)
+                try:
+                    create_rule_command(priority=priority)
+                except CloudError as e:
+                    self._release_priority(group_name, security_group_name, priority)
+                    if not self._is_priority_conflict_error(e):
+                        raise
+
+                    # rule with such priority was created outside of the allocator, re-sync it with the Azure
+                    self._reconcile_priority_allocator(network_client=network_client,
+                                                       group_name=group_name,
+                                                       security_group_name=security_group_name)
+
+                    create_rule_command(priority=self._allocate_priority(network_client=network_client,
+                                                                         group_name=group_name,
+                                                                         security_group_name=security_group_name,
+                                                                         start_from=start_from))
+
+    def create_network_security_group_rules_batch(self, network_client, group_name, security_group_name,
+                                                  rules_requests, lock, remove_rules_filter=None):
+        """Create NSG inbound rules on the Azure with a single NSG update
+
+        :param network_client: azure.mgmt.network.NetworkManagementClient instance
+        :param group_name: resource group name (reservation id)
+        :param security_group_name: NSG name from the Azure
+        :param rules_requests: list[cloudshell.cp.azure.models.security_rule_request.SecurityRuleRequest]
+        :param threading.Lock lock: The locker object to use to sync between concurrent operations on the NSG
+        :param remove_rules_filter: function that gets existing SecurityRule and returns True if it must be deleted
+            in the same NSG update
+        :return: azure.mgmt.network.models.NetworkSecurityGroup instance
+        """
+        with lock:
+            try:
+                return self._update_rules_with_allocated_priorities(network_client=network_client,
+                                                                    group_name=group_name,
+                                                                    security_group_name=security_group_name,
+                                                                    rules_requests=rules_requests,
+                                                                    remove_rules_filter=remove_rules_filter)
+            except CloudError as e:
+                if not self._is_priority_conflict_error(e):
+                    raise
+
+                # some priorities were taken outside of the allocator, re-sync it with the Azure
+                self._reconcile_priority_allocator(network_client=network_client,
+                                                   group_name=group_name,
+                                                   security_group_name=security_group_name)
+
+                return self._update_rules_with_allocated_priorities(network_client=network_client,
+                                                                    group_name=group_name,
+                                                                    security_group_name=security_group_name,
+                                                                    rules_requests=rules_requests,
+                                                                    remove_rules_filter=remove_rules_filter)
+
+    def _update_rules_with_allocated_priorities(self, network_client, group_name, security_group_name,
+                                                rules_requests, remove_rules_filter=None):
+        """Allocate priorities for the requested rules and add all of them to the NSG in one update
+
+        :param network_client: azure.mgmt.network.NetworkManagementClient instance
+        :param group_name: resource group name (reservation id)
+        :param security_group_name: NSG name from the Azure
+        :param rules_requests: list[cloudshell.cp.azure.models.security_rule_request.SecurityRuleRequest]
+        :param remove_rules_filter: function that gets existing SecurityRule and returns True if it must be deleted
+        :return: azure.mgmt.network.models.NetworkSecurityGroup instance
+        """
+        security_rules = []
+
+        try:
+            for rule_request in rules_requests:
+                priority = self._allocate_priority(network_client=network_client,
+                                                   group_name=group_name,
+                                                   security_group_name=security_group_name,
+                                                   start_from=rule_request.start_from)
+
+                security_rules.append(self._prepare_security_group_rule(
+                    rule_data=rule_request.rule_data,
+                    destination_address=rule_request.destination_addr,
+                    priority=priority,
+                    source_address=rule_request.source_address))
+
+            nsg = self.network_service.update_network_security_group_rules(
+                network_client=network_client,
+                group_name=group_name,
+                security_group_name=security_group_name,
+                rules_to_add=security_rules,
+                remove_rules_filter=remove_rules_filter)
+        except Exception:
+            for rule in security_rules:
+                self._release_priority(group_name, security_group_name, rule.priority)
+            raise
+
+        # updated NSG holds the full list of its rules, so the allocator can be synced without an extra call
+        self._priority_allocators.seed_allocator(group_name=group_name,
+                                                 security_group_name=security_group_name,
+                                                 security_rules=nsg.security_rules or [])
+        return nsg
+
+    def reconcile_network_security_group_rules(self, network_client, group_name, security_group_name,
+                                               rules_requests, lock, is_managed_rule):
+        """Bring managed NSG rules to the desired state with a minimal change
+
+        Existing rules that match requested ones keep their names and priorities, only missing rules are added
+        and not requested ones are removed, all in a single NSG update. No update is made if the NSG is
+        already in the desired state
+
+        :param network_client: azure.mgmt.network.NetworkManagementClient instance
+        :param group_name: resource group name (reservation id)
+        :param security_group_name: NSG name from the Azure
+        :param rules_requests: list[cloudshell.cp.azure.models.security_rule_request.SecurityRuleRequest]
+            desired state of the managed rules
+        :param threading.Lock lock: The locker object to use to sync between concurrent operations on the NSG
+        :param is_managed_rule: function that gets existing SecurityRule and returns True if it is
+            managed by the caller (only such rules can be removed)
+        :return: azure.mgmt.network.models.NetworkSecurityGroup instance
+        """
+        with lock:
+            try:
+                return self._reconcile_rules(network_client=network_client,
+                                             group_name=group_name,
+                                             security_group_name=security_group_name,
+                                             rules_requests=rules_requests,
+                                             is_managed_rule=is_managed_rule)
+            except CloudError as e:
+                if not self._is_priority_conflict_error(e):
+                    raise
+
+                # NSG was changed outside of this lock after it was read, compute the diff again
+                return self._reconcile_rules(network_client=network_client,
+                                             group_name=group_name,
+                                             security_group_name=security_group_name,
+                                             rules_requests=rules_requests,
+                                             is_managed_rule=is_managed_rule)
+
+    def _reconcile_rules(self, network_client, group_name, security_group_name, rules_requests, is_managed_rule):
+        """Compute diff between the NSG and the requested rules and apply it in one NSG update
+
+        :param network_client: azure.mgmt.network.NetworkManagementClient instance
+        :param group_name: resource group name (reservation id)
+        :param security_group_name: NSG name from the Azure
+        :param rules_requests: list[cloudshell.cp.azure.models.security_rule_request.SecurityRuleRequest]
+        :param is_managed_rule: function that gets existing SecurityRule and returns True if it is managed
+        :return: azure.mgmt.network.models.NetworkSecurityGroup instance
+        """
+        nsg = self.get_network_security_group(network_client=network_client,
+                                              group_name=group_name,
+                                              nsg_name=security_group_name)
+        existing_rules = nsg.security_rules or []
+
+        desired_rules = [self._prepare_security_group_rule(rule_data=rule_request.rule_data,
+                                                           destination_address=rule_request.destination_addr,
+                                                           priority=None,
+                                                           source_address=rule_request.source_address)
+                         for rule_request in rules_requests]
+
+        diff = self._rules_reconciler.get_diff(existing_rules=[rule for rule in existing_rules
+                                                               if is_managed_rule(rule)],
+                                               desired_rules=desired_rules)
+
+        if diff.is_empty:
+            self._priority_allocators.seed_allocator(group_name=group_name,
+                                                     security_group_name=security_group_name,
+                                                     security_rules=existing_rules)
+            return nsg
+
+        # priorities of the removed rules can be reused by the added ones in the same NSG update
+        removed_rule_names = {rule.name for rule in diff.rules_to_remove}
+        remaining_rules = [rule for rule in existing_rules if rule.name not in removed_rule_names]
+        allocator = self._priority_allocators.seed_allocator(group_name=group_name,
+                                                             security_group_name=security_group_name,
+                                                             security_rules=remaining_rules)
+        remaining_rule_names = {rule.name for rule in remaining_rules}
+        added_rule_ids = {id(rule) for rule in diff.rules_to_add}
+
+        for rule, rule_request in zip(desired_rules, rules_requests):
+            if id(rule) not in added_rule_ids:
+                continue
+
+            rule.priority = allocator.allocate(start_from=rule_request.start_from or self.RULE_DEFAULT_PRIORITY,
+                                               step=self.RULE_PRIORITY_INCREASE_STEP)
+
+            if not rule_request.rule_data.name:
+                rule.name = "rule_{}".format(rule.priority)
+            elif rule.name in remaining_rule_names:
+                # name is already used by the kept rule that does something else
+                rule.name = "{}_{}".format(rule.name, rule.priority)
+
+        try:
+            nsg = self.network_service.update_network_security_group_rules(
+                network_client=network_client,
+                group_name=group_name,
+                security_group_name=security_group_name,
+                rules_to_add=diff.rules_to_add,
+                rule_names_to_remove=removed_rule_names)
+        except Exception:
+            self._priority_allocators.remove_allocator(group_name, security_group_name)
+            raise
+
+        self._priority_allocators.seed_allocator(group_name=group_name,
+                                                 security_group_name=security_group_name,
+                                                 security_rules=nsg.security_rules or [])
+        return nsg
+
+    @staticmethod
+    def is_custom_rule(rule):
+        """Custom rules are simply rules whose name contains custom_rule
+
+        :param azure.mgmt.network.models.SecurityRule rule:
+        :rtype: bool
+        """
+        return 'custom_rule' in rule.name
+
+    @staticmethod
+    def _is_priority_conflict_error(exception):
+        """Check if the Azure rejected NSG rule because its priority is already used by another rule
+
+        :param CloudError exception:
+        :rtype: bool
+        """
+        return "SecurityRuleConflict" in str(exception.error) or "same Priority" in exception.message
 
     @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
     def create_isolated_network_security_group_rules(self, network_client, group_name, security_group_name, lock):
@@ -286,17 +560,12 @@ class SecurityGroupService(object):
 
         logger.info('Preparing to delete custom security rules in {0}'.format(network_security_group_name))
 
-        rules_in_nsg = list(network_client.security_rules.list(resource_group_name, network_security_group_name))
-        custom_rules = [r for r in rules_in_nsg if 'custom_rule' in r.name]
-
-        with lock:
-            for rule in custom_rules:
-                result = network_client.security_rules.delete(resource_group_name,
-                                                              network_security_group_name,
-                                                              rule.name)
-                logger.info("Deleting custom security rule: {0} in {1}".format(rule.name, network_security_group_name))
-                result.wait()
-                logger.info("Deleted custom security rule: {0} in {1}".format(rule.name, network_security_group_name))
+        self.reconcile_network_security_group_rules(network_client=network_client,
+                                                    group_name=resource_group_name,
+                                                    security_group_name=network_security_group_name,
+                                                    rules_requests=[],
+                                                    lock=lock,
+                                                    is_managed_rule=self.is_custom_rule)
 
         logger.info('Finished deleting custom security rules in {0}'.format(network_security_group_name))
 
@@ -339,6 +608,7 @@ class SecurityGroupService(object):
                     network_security_group_name=security_group.name,
                     security_rule_name=vm_rule.name)
                 result.wait()
+                self._release_priority(resource_group_name, security_group.name, vm_rule.priority)
                 logger.info("Security group rule '{}' deleted.".format(vm_rule.name))
 
     def get_subnets_nsg_name(self, reservation_id):
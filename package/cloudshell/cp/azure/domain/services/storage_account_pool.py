@@ -0,0 +1,167 @@
+import uuid
+from threading import Lock
+
+
+class StorageAccountPool(object):
+    """Pool of pre-created storage accounts for the sandbox prepare
+
+    Creation of the storage account is one of the slowest steps of the prepare connectivity. The pool keeps
+    up to "depth" untagged storage accounts per subscription and region in a separate resource group.
+    Prepare claims one of them by re-tagging it with the sandbox tags in place, the account is not moved
+    into the sandbox resource group (a move locks both resource groups and may take longer than the creation
+    of a new account). The sandbox storage account is found by its sandbox id tag and is deleted on the sandbox
+    cleanup. The pool is refilled by a background task after each claim. Depth is set by the
+    "Storage Account Pool Depth" attribute, zero depth disables the pool
+    """
+    ACCOUNT_NAME_PREFIX = "cspool"
+    ACCOUNT_NAME_MAX_LENGTH = 24
+
+    def __init__(self, storage_service, vm_service, task_executor):
+        """
+        :param cloudshell.cp.azure.domain.services.storage_service.StorageService storage_service:
+        :param cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService vm_service:
+        :param cloudshell.cp.azure.domain.services.task_executor.TaskExecutorService task_executor:
+        """
+        self.storage_service = storage_service
+        self.vm_service = vm_service
+        self.task_executor = task_executor
+        self._ready = {}
+        self._refilling = set()
+        self._lock = Lock()
+
+    def claim(self, storage_client, resource_client, group_name, region, depth, tags, logger):
+        """Take a ready storage account out of the pool and tag it with the sandbox tags
+
+        :param azure.mgmt.storage.storage_management_client.StorageManagementClient storage_client:
+        :param azure.mgmt.resource.ResourceManagementClient resource_client:
+        :param str group_name: sandbox resource group name
+        :param str region: Azure region
+        :param int depth: number of the storage accounts kept ready per subscription and region
+        :param dict tags: sandbox tags, they must contain the sandbox id
+        :param logging.Logger logger:
+        :return: name of the resource group that contains the claimed storage account and the account name
+            or None if there is no ready account in the pool or it couldn't be claimed
+        :rtype: tuple[str, str]
+        """
+        if depth <= 0:
+            return None
+
+        pool_key = (resource_client.config.subscription_id, region)
+        self._refill_async(pool_key, storage_client, resource_client, region, depth, logger)
+
+        with self._lock:
+            ready = self._ready.get(pool_key)
+            storage_account_name = ready.pop(0) if ready else None
+
+        if storage_account_name is None:
+            logger.info("There is no ready storage account in the pool for the region {}".format(region))
+            return None
+
+        pool_group_name = self.storage_service.get_pool_group_name(region)
+        try:
+            logger.info("Claiming storage account {} from the pool for the sandbox {}".format(
+                storage_account_name, group_name))
+            self.storage_service.update_storage_account_tags(storage_client=storage_client,
+                                                             group_name=pool_group_name,
+                                                             storage_account_name=storage_account_name,
+                                                             tags=tags)
+        except Exception:
+            logger.exception("Failed to claim storage account {} from the pool:".format(storage_account_name))
+            return None
+
+        return pool_group_name, storage_account_name
+
+    def release(self, storage_client, group_name, region, logger):
+        """Delete the storage accounts claimed by the sandbox, they are not deleted with the sandbox resource group
+
+        :param azure.mgmt.storage.storage_management_client.StorageManagementClient storage_client:
+        :param str group_name: sandbox resource group name
+        :param str region: Azure region
+        :param logging.Logger logger:
+        :return:
+        """
+        pool_group_name = self.storage_service.get_pool_group_name(region)
+        storage_accounts = self.storage_service.get_pool_storage_accounts(storage_client=storage_client,
+                                                                          region=region,
+                                                                          sandbox_id=group_name)
+        for storage_account in storage_accounts:
+            logger.info("Deleting storage account {} claimed from the pool".format(storage_account.name))
+            self.storage_service.delete_storage_account(storage_client=storage_client,
+                                                        group_name=pool_group_name,
+                                                        storage_account_name=storage_account.name)
+
+    def _refill_async(self, pool_key, storage_client, resource_client, region, depth, logger):
+        """Start refill of the pool in the background unless it is already running
+
+        :param tuple pool_key: subscription id and region
+        :param azure.mgmt.storage.storage_management_client.StorageManagementClient storage_client:
+        :param azure.mgmt.resource.ResourceManagementClient resource_client:
+        :param str region: Azure region
+        :param int depth: number of the storage accounts kept ready
+        :param logging.Logger logger:
+        :return:
+        """
+        with self._lock:
+            if pool_key in self._refilling:
+                return
+            self._refilling.add(pool_key)
+
+        self.task_executor.submit(self._refill, pool_key, storage_client, resource_client, region, depth, logger)
+
+    def _refill(self, pool_key, storage_client, resource_client, region, depth, logger):
+        """Create the missing storage accounts in the pool resource group
+
+        :param tuple pool_key: subscription id and region
+        :param azure.mgmt.storage.storage_management_client.StorageManagementClient storage_client:
+        :param azure.mgmt.resource.ResourceManagementClient resource_client:
+        :param str region: Azure region
+        :param int depth: number of the storage accounts kept ready
+        :param logging.Logger logger:
+        :return:
+        """
+        pool_group_name = self.storage_service.get_pool_group_name(region)
+
+        try:
+            with self._lock:
+                is_discovered = pool_key in self._ready
+
+            if not is_discovered:
+                self.vm_service.create_resource_group(resource_management_client=resource_client,
+                                                      group_name=pool_group_name,
+                                                      region=region,
+                                                      tags={})
+
+                # accounts that were left in the pool by the previous driver process and were not claimed
+                accounts = self.storage_service.get_pool_storage_accounts(storage_client=storage_client,
+                                                                          region=region)
+                with self._lock:
+                    self._ready[pool_key] = [account.name for account in accounts]
+
+            while True:
+                with self._lock:
+                    if len(self._ready[pool_key]) >= depth:
+                        break
+
+                storage_account_name = self._generate_account_name()
+                logger.info("Creating storage account {} in the pool".format(storage_account_name))
+                self.storage_service.create_storage_account(storage_client=storage_client,
+                                                            group_name=pool_group_name,
+                                                            region=region,
+                                                            storage_account_name=storage_account_name,
+                                                            tags={},
+                                                            wait_until_created=True)
+
+                with self._lock:
+                    self._ready[pool_key].append(storage_account_name)
+        except Exception:
+            logger.exception("Failed to refill the storage accounts pool for the region {}:".format(region))
+        finally:
+            with self._lock:
+                self._refilling.discard(pool_key)
+
+    def _generate_account_name(self):
+        """Storage account name in azure must be between 3-24 chars of lowercase letters and numbers
+
+        :rtype: str
+        """
+        return (self.ACCOUNT_NAME_PREFIX + uuid.uuid4().hex)[:self.ACCOUNT_NAME_MAX_LENGTH]
@@ -5,14 +5,16 @@ import time
 from urlparse import urlparse
 
 import azure
-from azure.mgmt.storage.models import SkuName, StorageAccountCreateParameters
+from azure.mgmt.storage.models import SkuName, StorageAccountCreateParameters, StorageAccountUpdateParameters
 from azure.storage.file import FileService
 from azure.storage.blob import BlockBlobService
 from azure.storage.blob.models import BlobPermissions
+from msrestazure.azure_exceptions import CloudError
 from retrying import retry
 
 from cloudshell.cp.azure.common.exceptions.validation_error import ValidationError
 from cloudshell.cp.azure.common.helpers.retrying_helpers import retry_if_connection_error
+from cloudshell.cp.azure.domain.services.tags import TagNames
 from cloudshell.cp.azure.models.azure_blob_url import AzureBlobUrlModel
 from cloudshell.cp.azure.models.blob_copy_operation import BlobCopyOperationState
 from cloudshell.cp.azure.common.exceptions.cancellation_exception import CancellationException
@@ -20,6 +22,7 @@ from cloudshell.cp.azure.common.exceptions.cancellation_exception import Cancell
 
 class StorageService(object):
     SAS_TOKEN_EXPIRATION_DAYS = 365
+    POOL_GROUP_NAME_TEMPLATE = "cloudshell-storage-pool-{}"
 
     def __init__(self, cancellation_service):
         """
@@ -65,6 +68,20 @@ class StorageService(object):
 
         return storage_account_name
 
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def update_storage_account_tags(self, storage_client, group_name, storage_account_name, tags):
+        """Replace tags of the storage account
+
+        :param azure.mgmt.storage.storage_management_client.StorageManagementClient storage_client:
+        :param str group_name:
+        :param str storage_account_name:
+        :param dict tags:
+        :return:
+        """
+        storage_client.storage_accounts.update(group_name,
+                                               storage_account_name,
+                                               StorageAccountUpdateParameters(tags=tags))
+
     @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
     def get_storage_per_resource_group(self, storage_client, group_name):
         """
@@ -75,6 +92,44 @@ class StorageService(object):
         """
         return list(storage_client.storage_accounts.list_by_resource_group(group_name))
 
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def delete_storage_account(self, storage_client, group_name, storage_account_name):
+        """
+
+        :param azure.mgmt.storage.storage_management_client.StorageManagementClient storage_client:
+        :param str group_name:
+        :param str storage_account_name:
+        :return:
+        """
+        storage_client.storage_accounts.delete(group_name, storage_account_name)
+
+    def get_pool_group_name(self, region):
+        """Get the name of the resource group with the pre-created storage accounts
+
+        :param str region: Azure region
+        :rtype: str
+        """
+        return self.POOL_GROUP_NAME_TEMPLATE.format(region)
+
+    def get_pool_storage_accounts(self, storage_client, region, sandbox_id=None):
+        """Get the pre-created storage accounts of the region claimed by the sandbox
+
+        :param azure.mgmt.storage.storage_management_client.StorageManagementClient storage_client:
+        :param str region: Azure region
+        :param str sandbox_id: id of the sandbox that claimed the accounts, None for the accounts that are not claimed
+        :rtype: list[azure.mgmt.storage.models.StorageAccount]
+        """
+        try:
+            storage_accounts = self.get_storage_per_resource_group(storage_client, self.get_pool_group_name(region))
+        except CloudError as e:
+            if e.status_code == 404:
+                # pool was never used in the region
+                return []
+            raise
+
+        return [storage_account for storage_account in storage_accounts
+                if (storage_account.tags or {}).get(TagNames.SandboxId) == sandbox_id]
+
     # changed the retry max attempt number to 20, because when deploying multiple sandboxes, would get an error that
     # resource group had not been created quite consistently. This is not a magic number, its just found
     # to be effective with 8~ concurrent sandbox launches. Might be changed in the future
@@ -440,15 +495,38 @@ class StorageService(object):
                     "Sandbox Resource Group should contain only one storage account but found {} storage accounts"
                     .format(len(storage_accounts_list)))
 
-    def get_sandbox_storage_account_name(self, storage_client, group_name):
+    def get_sandbox_storage_accounts(self, storage_client, group_name, region):
+        """Get storage accounts of the sandbox and the resource group that contains them
+
+        Storage account is created in the sandbox resource group or claimed from the pre-created ones,
+        the claimed account stays in the pool resource group and is tagged with the sandbox id
+
+        :param azure.mgmt.storage.storage_management_client.StorageManagementClient storage_client:
+        :param str group_name: sandbox resource group name
+        :param str region: Azure region
+        :return: resource group name and the storage accounts of the sandbox
+        :rtype: tuple[str, list[azure.mgmt.storage.models.StorageAccount]]
+        """
+        storage_accounts_list = self.get_storage_per_resource_group(storage_client, group_name)
+        if storage_accounts_list:
+            return group_name, storage_accounts_list
+
+        return self.get_pool_group_name(region), self.get_pool_storage_accounts(storage_client=storage_client,
+                                                                                region=region,
+                                                                                sandbox_id=group_name)
+
+    def get_sandbox_storage_account(self, storage_client, group_name, region):
         """
         Get storage account name for given reservation
 
         :param azure.mgmt.storage.storage_management_client.StorageManagementClient storage_client:
-        :param str group_name:
-        :return: storage account name
-        :rtype: str
+        :param str group_name: sandbox resource group name
+        :param str region: Azure region
+        :return: name of the resource group that contains the storage account and the storage account name
+        :rtype: tuple[str, str]
         """
-        storage_accounts_list = self.get_storage_per_resource_group(storage_client, group_name)
+        storage_group_name, storage_accounts_list = self.get_sandbox_storage_accounts(storage_client=storage_client,
+                                                                                      group_name=group_name,
+                                                                                      region=region)
         self.validate_single_storage_account(storage_accounts_list)
-        return storage_accounts_list[0].name
+        return storage_group_name, storage_accounts_list[0].name
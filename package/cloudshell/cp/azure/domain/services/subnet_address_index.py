@@ -0,0 +1,170 @@
+from threading import Lock
+
+from netaddr import IPAddress, IPNetwork
+
+
+class SubnetAddressIndex(object):
+    """In-memory map of the private IP addresses that are used in a single subnet
+
+    The whole subnet is kept as a single integer bitmap where the bit number N marks the N-th address
+    of the subnet as used (1) or free (0). The first and last IP addresses of each subnet are reserved for
+    protocol conformance, along with the x.x.x.1-x.x.x.3 addresses, which are used for Azure services,
+    so they are always marked as used
+    """
+    AZURE_RESERVED_HEAD = 4
+
+    def __init__(self, subnet_cidr, addresses=None):
+        """
+        :param str subnet_cidr: subnet CIDR
+        :param addresses: list[str] addresses that are already used in the subnet
+        """
+        network = IPNetwork(subnet_cidr)
+        self._first = network.first
+        self._size = network.size
+        self._full_mask = (1 << self._size) - 1
+        self._reserved_mask = ((1 << min(self.AZURE_RESERVED_HEAD, self._size)) - 1) | (1 << (self._size - 1))
+        self._lock = Lock()
+        self._used = self._reserved_mask
+        self.reset(addresses or [])
+
+    @staticmethod
+    def _iter_offsets(bitmap):
+        """Iterate over the numbers of all set bits in the bitmap starting from the lowest one"""
+        while bitmap:
+            lowest_bit = bitmap & -bitmap
+            yield lowest_bit.bit_length() - 1
+            bitmap ^= lowest_bit
+
+    def _get_offset(self, address):
+        """
+        :param str address: IP address
+        :return: (int) number of the address in the subnet or None if address doesn't belong to the subnet
+        """
+        try:
+            offset = int(IPAddress(address)) - self._first
+        except Exception:
+            return None
+
+        return offset if 0 <= offset < self._size else None
+
+    def contains(self, address):
+        """
+        :param str address: IP address
+        :rtype: bool
+        """
+        return self._get_offset(address) is not None
+
+    def reset(self, addresses):
+        """Replace the index state with the given used addresses
+
+        :param addresses: list[str] addresses that are used in the subnet
+        :return:
+        """
+        used = self._reserved_mask
+        for offset in map(self._get_offset, addresses):
+            if offset is not None:
+                used |= 1 << offset
+
+        with self._lock:
+            self._used = used
+
+    def reserve(self, address):
+        """Mark given address as used
+
+        :param str address: IP address
+        :return:
+        """
+        offset = self._get_offset(address)
+        if offset is not None:
+            with self._lock:
+                self._used |= 1 << offset
+
+    def release(self, address):
+        """Mark given address as free. Addresses reserved by Azure are never released
+
+        :param str address: IP address
+        :return:
+        """
+        offset = self._get_offset(address)
+        if offset is not None:
+            with self._lock:
+                self._used &= ~(1 << offset) | self._reserved_mask
+
+    def is_available(self, address):
+        """
+        :param str address: IP address
+        :return: True if address belongs to the subnet and is not used
+        :rtype: bool
+        """
+        offset = self._get_offset(address)
+        return offset is not None and not (self._used >> offset) & 1
+
+    def get_next_available(self):
+        """
+        :return: the lowest free address of the subnet or None if all addresses are used
+        :rtype: str
+        """
+        free = ~self._used & self._full_mask
+        if not free:
+            return None
+
+        return str(IPAddress(self._first + ((free & -free).bit_length() - 1)))
+
+    def get_available_count(self):
+        """
+        :return: number of free addresses of the subnet
+        :rtype: int
+        """
+        return bin(~self._used & self._full_mask).count("1")
+
+    def get_used_ips(self):
+        """
+        :return: all used addresses of the subnet including the ones reserved by Azure
+        :rtype: list[str]
+        """
+        return [str(IPAddress(self._first + offset)) for offset in self._iter_offsets(self._used)]
+
+
+class SubnetAddressIndexProvider(object):
+    """Keeps a single SubnetAddressIndex per (reservation id, subnet CIDR)"""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = Lock()
+
+    def get_index(self, reservation_id, subnet_cidr):
+        """Get the index for the subnet, the empty one is created on the first use
+
+        :param str reservation_id:
+        :param str subnet_cidr:
+        :rtype: SubnetAddressIndex
+        """
+        key = (reservation_id, subnet_cidr)
+        index = self._indexes.get(key)
+
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(key)
+                if index is None:
+                    index = self._indexes[key] = SubnetAddressIndex(subnet_cidr)
+
+        return index
+
+    def get_indexes(self, reservation_id):
+        """
+        :param str reservation_id:
+        :return: indexes of all subnets of the reservation
+        :rtype: list[SubnetAddressIndex]
+        """
+        with self._lock:
+            return [index for key, index in self._indexes.iteritems() if key[0] == reservation_id]
+
+    def remove_indexes(self, reservation_id):
+        """Remove indexes of all subnets of the reservation
+
+        :param str reservation_id:
+        :return:
+        """
+        with self._lock:
+            for key in [key for key in self._indexes if key[0] == reservation_id]:
+                del self._indexes[key]
@@ -0,0 +1,101 @@
+import time
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+
+from cloudshell.cp.azure.models.task_executor_stats import TaskExecutorStats
+
+
+class TaskExecutorService(object):
+    """Driver-wide bounded pool of worker threads for the background work of the operations
+
+    Worker threads are created once on the first submitted task and are reused by all commands.
+    NOTE: tasks must not wait for other tasks of the same executor, otherwise all workers can be blocked
+    """
+    DEFAULT_MAX_WORKERS = 32
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        :param int max_workers: max number of tasks that can run at the same time
+        """
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._total_run_time = 0.0
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPool(self.max_workers)
+
+        return self._pool
+
+    def submit(self, func, *args, **kwargs):
+        """Run function in the background
+
+        :param func: function to run
+        :return: result that can be waited with get() method, it re-raises exception of the function
+        :rtype: multiprocessing.pool.AsyncResult
+        """
+        with self._lock:
+            self._queued += 1
+
+        return self._get_pool().apply_async(self._run_task, (func, time.time(), args, kwargs))
+
+    def map(self, func, iterable):
+        """Run function for every item in the background and wait for all results
+
+        :param func: function to run
+        :param iterable: items to run function with
+        :return: results in the same order as items
+        :rtype: list
+        """
+        async_results = [self.submit(func, item) for item in iterable]
+        return [async_result.get() for async_result in async_results]
+
+    def _run_task(self, func, submitted_at, args, kwargs):
+        started_at = time.time()
+        wait_time = started_at - submitted_at
+
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._total_wait_time += wait_time
+            self._max_wait_time = max(self._max_wait_time, wait_time)
+
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._total_run_time += time.time() - started_at
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+    def get_stats(self):
+        """
+        :rtype: TaskExecutorStats
+        """
+        with self._lock:
+            finished = self._completed + self._failed
+            started = finished + self._active
+
+            return TaskExecutorStats(max_workers=self.max_workers,
+                                     queue_depth=self._queued,
+                                     active_workers=self._active,
+                                     completed_tasks=self._completed,
+                                     failed_tasks=self._failed,
+                                     avg_wait_time=self._total_wait_time / started if started else 0.0,
+                                     max_wait_time=self._max_wait_time,
+                                     avg_run_time=self._total_run_time / finished if finished else 0.0)
@@ -1,12 +1,16 @@
+from threading import Lock
+
 from azure.mgmt.compute.models import OSProfile, HardwareProfile, NetworkProfile, \
     NetworkInterfaceReference, DiskCreateOptionTypes, ImageReference, OSDisk, \
     VirtualMachine, StorageProfile, Plan, ManagedDiskParameters, StorageAccountTypes, DiagnosticsProfile, \
-    BootDiagnostics
+    BootDiagnostics, InstanceViewTypes
 from azure.mgmt.compute.models import OperatingSystemTypes, VirtualMachineImage
 from azure.mgmt.compute.models.linux_configuration import LinuxConfiguration
 from azure.mgmt.compute.models.ssh_configuration import SshConfiguration
 from azure.mgmt.compute.models.ssh_public_key import SshPublicKey
 from azure.mgmt.resource.resources.models import ResourceGroup
+from msrest.service_client import ServiceClient
+from msrestazure.azure_exceptions import CloudError
 from retrying import retry
 
 from cloudshell.cp.azure.common.helpers.retrying_helpers import retry_if_connection_error, retryable_error_max_attempts, \
@@ -15,6 +19,8 @@ from cloudshell.cp.azure.common.helpers.retrying_helpers import retry_if_connect
 
 class VirtualMachineService(object):
     SUCCEEDED_PROVISIONING_STATE = "Succeeded"
+    OPERATION_IN_PROGRESS_STATUS = "InProgress"
+    OPERATION_SUCCEEDED_STATUS = "Succeeded"
 
     def __init__(self, task_waiter_service):
         """
@@ -22,6 +28,8 @@ class VirtualMachineService(object):
         :param task_waiter_service: package.cloudshell.cp.azure.domain.services.task_waiter.TaskWaiterService
         """
         self.task_waiter_service = task_waiter_service
+        self._operation_status_clients = {}
+        self._operation_status_clients_lock = Lock()
 
     def get_active_vm(self, compute_management_client, group_name, vm_name):
         """Get VM from Azure and check if it exists and in "Succeeded" provisioning state
@@ -52,6 +60,19 @@ class VirtualMachineService(object):
 
         return compute_management_client.virtual_machines.get(group_name, vm_name)
 
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def get_vm_instance_view(self, compute_management_client, group_name, vm_name):
+        """Get VM from Azure with its instance view (power state, statuses of the VM agent, disks, etc.)
+
+        :param compute_management_client: azure.mgmt.compute.ComputeManagementClient instance
+        :param group_name: Azure resource group name (reservation id)
+        :param vm_name: name for VM
+        :return: azure.mgmt.compute.models.VirtualMachine
+        """
+        return compute_management_client.virtual_machines.get(resource_group_name=group_name,
+                                                              vm_name=vm_name,
+                                                              expand=InstanceViewTypes.instance_view)
+
     def _prepare_linux_configuration(self, ssh_key):
         """Create LinuxConfiguration object with nested SshPublicKey object for Azure client
 
@@ -342,6 +363,17 @@ class VirtualMachineService(object):
         result = resource_management_client.resource_groups.delete(group_name)
         result.wait()
 
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def begin_delete_resource_group(self, resource_management_client, group_name):
+        """Start deletion of the resource group without waiting for it
+
+        :param azure.mgmt.resource.ResourceManagementClient resource_management_client:
+        :param str group_name:
+        :return: poller of the deletion operation
+        :rtype: msrestazure.azure_operation.AzureOperationPoller
+        """
+        return resource_management_client.resource_groups.delete(group_name)
+
     @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
     def delete_vm(self, compute_management_client, group_name, vm_name):
         """
@@ -385,6 +417,88 @@ class VirtualMachineService(object):
         if not async:
             async_vm_deallocate.wait()
 
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def begin_start_vm(self, compute_management_client, group_name, vm_name):
+        """Start Azure VM instance without waiting for it
+
+        Only the request is sent, the SDK poller (which starts its own polling thread) is not created
+        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_management_client:
+        :param str group_name: The name of the resource group.
+        :param str vm_name: The name of the virtual machine.
+        :return: URL of the operation status for the "get_operation_status" or None if it is already finished
+        :rtype: str
+        """
+        raw_response = compute_management_client.virtual_machines.start(resource_group_name=group_name,
+                                                                         vm_name=vm_name,
+                                                                         raw=True)
+        return self._get_operation_status_url(raw_response.response)
+
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def begin_deallocate_vm(self, compute_management_client, group_name, vm_name):
+        """Deallocate Azure VM instance without waiting for it
+
+        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_management_client:
+        :param str group_name: The name of the resource group.
+        :param str vm_name: The name of the virtual machine.
+        :return: URL of the operation status for the "get_operation_status" or None if it is already finished
+        :rtype: str
+        """
+        raw_response = compute_management_client.virtual_machines.deallocate(resource_group_name=group_name,
+                                                                              vm_name=vm_name,
+                                                                              raw=True)
+        return self._get_operation_status_url(raw_response.response)
+
+    @staticmethod
+    def _get_operation_status_url(response):
+        """
+        :param requests.Response response: response on the request that started the long running operation
+        :return: URL of the operation status or None if the operation is already finished
+        :rtype: str
+        """
+        if response.status_code != 202:
+            return None
+
+        return response.headers.get("Azure-AsyncOperation") or response.headers.get("Location")
+
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def get_operation_status(self, compute_management_client, status_url):
+        """Get status of the long running operation started without the SDK poller
+
+        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_management_client:
+        :param str status_url: URL returned by "begin_start_vm" or "begin_deallocate_vm"
+        :return: operation status ("InProgress", "Succeeded", "Failed" or "Canceled") and the error message
+        :rtype: tuple[str, str]
+        """
+        client = self._get_operation_status_client(compute_management_client)
+        response = client.send(client.get(status_url))
+
+        if response.status_code == 202:
+            # location URL returns 202 until the operation is finished
+            return self.OPERATION_IN_PROGRESS_STATUS, ''
+
+        if response.status_code != 200:
+            raise CloudError(response)
+
+        body = response.json() if response.content else {}
+        error = body.get("error") or {}
+        return body.get("status", self.OPERATION_SUCCEEDED_STATUS), error.get("message", '')
+
+    def _get_operation_status_client(self, compute_management_client):
+        """Get service client that polls operation statuses with the credentials of the compute client
+
+        Client is kept per compute client, so its HTTP session is reused between the polls
+        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_management_client:
+        :rtype: ServiceClient
+        """
+        config = compute_management_client.config
+
+        with self._operation_status_clients_lock:
+            client = self._operation_status_clients.get(config)
+            if client is None:
+                client = self._operation_status_clients[config] = ServiceClient(config.credentials, config)
+
+        return client
+
     @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
     def get_virtual_machine_image(self, compute_management_client, location, publisher_name, offer, skus):
         """Get operation system from the given image
@@ -415,6 +529,17 @@ class VirtualMachineService(object):
 
         return deployed_image
 
+    @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
+    def list_virtual_machines(self, compute_management_client, group_name):
+        """List all virtual machines in the resource group
+
+        :param compute_management_client: azure.mgmt.compute.compute_management_client.ComputeManagementClient
+        :param str group_name: Azure resource group name (reservation id)
+        :return: list of VMs in group
+        :rtype: list[azure.mgmt.compute.models.VirtualMachine]
+        """
+        return list(compute_management_client.virtual_machines.list(group_name))
+
     @retry(stop_max_attempt_number=5, wait_fixed=2000, retry_on_exception=retry_if_connection_error)
     def list_virtual_machine_sizes(self, compute_management_client, location):
         """List available virtual machine sizes within given location
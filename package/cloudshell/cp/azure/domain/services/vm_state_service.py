@@ -0,0 +1,181 @@
+from threading import Lock
+
+from cloudshell.cp.azure.domain.services.resource_group_inventory import ResourceGroupInventoryProvider
+from cloudshell.cp.azure.domain.services.virtual_machine_service import VirtualMachineService
+
+
+class VmState(object):
+    POWER_STATE_CODE_PREFIX = "PowerState/"
+
+    def __init__(self, vm_name, provisioning_state=None, power_state=None):
+        """
+        :param str vm_name:
+        :param str provisioning_state: for example "Succeeded", None if the VM was not found
+        :param str power_state: for example "running" or "deallocated", None if it is unknown
+        """
+        self.vm_name = vm_name
+        self.provisioning_state = provisioning_state
+        self.power_state = power_state
+
+    @classmethod
+    def get_power_state(cls, instance_view):
+        """
+        :param azure.mgmt.compute.models.VirtualMachineInstanceView instance_view:
+        :return: power state code without the "PowerState/" prefix or None if there is no power state status
+        :rtype: str
+        """
+        for status in (instance_view.statuses if instance_view else None) or []:
+            if status.code and status.code.startswith(cls.POWER_STATE_CODE_PREFIX):
+                return status.code[len(cls.POWER_STATE_CODE_PREFIX):]
+
+
+class VmStateService(object):
+    """Provisioning and power states of many VMs of the resource group with a short-lived cache
+
+    Provisioning states of all VMs are taken from the shared resource group inventory snapshot, which is reused
+    for TTL seconds, so the commands that run for all apps of the sandbox at the same time share a single VMs
+    listing. The listing doesn't contain the instance view in the Azure compute API used by the driver, so power
+    states are read only for the requested VMs that were provisioned, concurrently, and are cached together with
+    the snapshot they were read for
+    """
+    TTL = ResourceGroupInventoryProvider.SHARED_MAX_AGE
+
+    def __init__(self, inventory_provider, vm_service, task_executor, ttl=TTL):
+        """
+        :param cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventoryProvider
+            inventory_provider:
+        :param cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService vm_service:
+        :param cloudshell.cp.azure.domain.services.task_executor.TaskExecutorService task_executor:
+        :param int ttl: max age (in seconds) of the resource group snapshot that can be reused
+        """
+        self.inventory_provider = inventory_provider
+        self.vm_service = vm_service
+        self.task_executor = task_executor
+        self.ttl = ttl
+        # (inventory snapshot, power states by the VM name) by the resource group name
+        self._power_states = {}
+        self._lock = Lock()
+
+    def _get_inventory(self, compute_client, network_client, group_name):
+        """
+        :param azure.mgmt.compute.ComputeManagementClient compute_client:
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param str group_name: Azure resource group name (reservation id)
+        :rtype: cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventory
+        """
+        return self.inventory_provider.get_inventory(compute_client=compute_client,
+                                                     network_client=network_client,
+                                                     group_name=group_name,
+                                                     max_age=self.ttl)
+
+    def _get_power_states(self, group_name, inventory):
+        """Get cached power states of the VMs, they are dropped once a new snapshot of the resource group is taken
+
+        :param str group_name: Azure resource group name (reservation id)
+        :param cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventory inventory:
+        :rtype: dict[str, str]
+        """
+        with self._lock:
+            cached_inventory, power_states = self._power_states.get(group_name, (None, None))
+            if cached_inventory is not inventory:
+                power_states = {}
+                self._power_states[group_name] = (inventory, power_states)
+
+        return power_states
+
+    def get_active_vm(self, compute_client, network_client, group_name, vm_name):
+        """Get VM and check that it exists and is in "Succeeded" provisioning state
+
+        The VM is taken from the shared snapshot of the resource group and is read from Azure only if it is
+        not there or is not in the "Succeeded" state yet
+
+        :param azure.mgmt.compute.ComputeManagementClient compute_client:
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param str group_name: Azure resource group name (reservation id)
+        :param str vm_name:
+        :rtype: azure.mgmt.compute.models.VirtualMachine
+        """
+        vm = self._get_inventory(compute_client, network_client, group_name).get_virtual_machine(vm_name)
+
+        if self._is_provisioned(vm):
+            return vm
+
+        return self.vm_service.get_active_vm(compute_management_client=compute_client,
+                                             group_name=group_name,
+                                             vm_name=vm_name)
+
+    def get_vm_states(self, compute_client, network_client, group_name, logger, vm_names=None,
+                      include_power_state=True):
+        """Get provisioning and power states of the VMs
+
+        :param azure.mgmt.compute.ComputeManagementClient compute_client:
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param str group_name: Azure resource group name (reservation id)
+        :param logging.Logger logger:
+        :param list[str] vm_names: names of the VMs, all VMs of the resource group by default
+        :param bool include_power_state: whether read power states of the provisioned VMs
+        :return: states by the VM name
+        :rtype: dict[str, VmState]
+        """
+        inventory = self._get_inventory(compute_client, network_client, group_name)
+        vm_names = [vm.name for vm in inventory.get_virtual_machines()] if vm_names is None else vm_names
+        power_states = self._get_power_states(group_name, inventory)
+
+        if include_power_state:
+            with self._lock:
+                missing_vm_names = [vm_name for vm_name in vm_names
+                                    if vm_name not in power_states and
+                                    self._is_provisioned(inventory.get_virtual_machine(vm_name))]
+
+            instance_views = self.task_executor.map(lambda vm_name: self._get_instance_view(compute_client,
+                                                                                            group_name,
+                                                                                            vm_name,
+                                                                                            logger),
+                                                    missing_vm_names)
+            with self._lock:
+                for vm_name, instance_view in zip(missing_vm_names, instance_views):
+                    power_states[vm_name] = VmState.get_power_state(instance_view)
+
+        result = {}
+        for vm_name in vm_names:
+            vm = inventory.get_virtual_machine(vm_name)
+            result[vm_name] = VmState(vm_name=vm_name,
+                                      provisioning_state=vm.provisioning_state if vm is not None else None,
+                                      power_state=power_states.get(vm_name))
+        return result
+
+    def invalidate(self, group_name):
+        """Forget cached states of the resource group (once the VMs were changed)
+
+        :param str group_name: Azure resource group name (reservation id)
+        :return:
+        """
+        self.inventory_provider.invalidate(group_name)
+        with self._lock:
+            self._power_states.pop(group_name, None)
+
+    def remove_group(self, group_name):
+        """Forget all data of the resource group, including its shared inventory snapshot (once it was deleted)
+
+        :param str group_name: Azure resource group name (reservation id)
+        :return:
+        """
+        self.invalidate(group_name)
+
+    @staticmethod
+    def _is_provisioned(vm):
+        return vm is not None and vm.provisioning_state == VirtualMachineService.SUCCEEDED_PROVISIONING_STATE
+
+    def _get_instance_view(self, compute_client, group_name, vm_name, logger):
+        """
+        :return: instance view of the VM or None if it can't be read
+        :rtype: azure.mgmt.compute.models.VirtualMachineInstanceView
+        """
+        try:
+            return self.vm_service.get_vm_instance_view(compute_management_client=compute_client,
+                                                        group_name=group_name,
+                                                        vm_name=vm_name).instance_view
+        except Exception:
+            logger.warning("Failed to get instance view of the VM {}, its power state is unknown".format(vm_name),
+                           exc_info=1)
+            return None
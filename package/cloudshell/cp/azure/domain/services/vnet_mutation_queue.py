@@ -0,0 +1,254 @@
+import sys
+from threading import Event, Lock
+
+from azure.mgmt.network.models import Subnet
+
+_KEEP = object()
+
+
+class CreateSubnetMutation(object):
+    def __init__(self, subnet_name, subnet_cidr, network_security_group=None):
+        """
+        :param str subnet_name:
+        :param str subnet_cidr:
+        :param network_security_group: NSG to attach to the subnet
+        """
+        self.subnet_name = subnet_name
+        self.subnet_cidr = subnet_cidr
+        self.network_security_group = network_security_group
+
+    def apply(self, virtual_network):
+        """Add subnet to the vNet model. Subnet that already exists with the same CIDR is left as is
+
+        :param azure.mgmt.network.models.VirtualNetwork virtual_network:
+        :return: True if vNet model was changed
+        :rtype: bool
+        """
+        subnets = virtual_network.subnets or []
+        existing_subnet = next((subnet for subnet in subnets if subnet.name == self.subnet_name), None)
+
+        if existing_subnet is not None and existing_subnet.address_prefix == self.subnet_cidr:
+            return False
+
+        virtual_network.subnets = [subnet for subnet in subnets if subnet.name != self.subnet_name]
+        virtual_network.subnets.append(Subnet(name=self.subnet_name,
+                                              address_prefix=self.subnet_cidr,
+                                              network_security_group=self.network_security_group))
+        return True
+
+
+class DeleteSubnetMutation(object):
+    def __init__(self, subnet_name):
+        """
+        :param str subnet_name:
+        """
+        self.subnet_name = subnet_name
+
+    def apply(self, virtual_network):
+        """Remove subnet from the vNet model
+
+        :param azure.mgmt.network.models.VirtualNetwork virtual_network:
+        :return: True if vNet model was changed
+        :rtype: bool
+        """
+        subnets = virtual_network.subnets or []
+        virtual_network.subnets = [subnet for subnet in subnets if subnet.name != self.subnet_name]
+
+        return len(virtual_network.subnets) != len(subnets)
+
+
+class UpdateSubnetMutation(object):
+    def __init__(self, subnet_name, network_security_group=_KEEP, route_table=_KEEP):
+        """
+        :param str subnet_name:
+        :param network_security_group: NSG to attach to the subnet, None to detach it
+        :param route_table: route table to attach to the subnet, None to detach it
+        """
+        self.subnet_name = subnet_name
+        self.network_security_group = network_security_group
+        self.route_table = route_table
+
+    def apply(self, virtual_network):
+        """Set NSG and/or route table of the subnet in the vNet model
+
+        :param azure.mgmt.network.models.VirtualNetwork virtual_network:
+        :return: True if vNet model was changed
+        :rtype: bool
+        """
+        subnet = next((subnet for subnet in virtual_network.subnets or [] if subnet.name == self.subnet_name), None)
+
+        if subnet is None:
+            return False
+
+        if self.network_security_group is not _KEEP:
+            subnet.network_security_group = self.network_security_group
+
+        if self.route_table is not _KEEP:
+            subnet.route_table = self.route_table
+
+        return True
+
+
+class _VnetMutationRequest(object):
+    def __init__(self, mutations):
+        """
+        :param list mutations: mutations that must be applied to the vNet together
+        """
+        self.mutations = mutations
+        self.is_writer = False
+        # set when the request is written or when the request becomes the writer of the vNet
+        self.wake = Event()
+        self.result = None
+        self.exc_info = None
+
+    def apply(self, virtual_network):
+        changed = False
+        for mutation in self.mutations:
+            changed = mutation.apply(virtual_network) or changed
+
+        return changed
+
+    def complete(self, result=None, exc_info=None):
+        """
+        :param result: updated vNet
+        :param tuple exc_info: sys.exc_info() of the failed vNet update
+        """
+        self.result = result
+        self.exc_info = exc_info
+        self.wake.set()
+
+
+class _VnetMutationBatch(object):
+    def __init__(self, requests):
+        """
+        :param list[_VnetMutationRequest] requests:
+        """
+        self.requests = requests
+
+    def apply(self, virtual_network):
+        changed = False
+        for request in self.requests:
+            changed = request.apply(virtual_network) or changed
+
+        return changed
+
+
+class VnetMutationQueue(object):
+    """Coalesces subnet changes requested for the same vNet into grouped vNet updates
+
+    Azure serializes all subnet operations on a vNet, so instead of writing subnets one by one under a single
+    process-wide lock, every caller puts its changes into the per-vNet queue. The first caller that finds no
+    update in progress becomes the writer: it takes everything that is pending for the vNet (from all sandboxes)
+    and applies it with one conditional vNet update. Once its own changes are written, the writer hands the role
+    to the first caller that is still waiting, so no caller keeps writing changes of the others under a steady
+    flow of requests. Other callers just wait until their changes are written. Different vNets are updated
+    independently
+    """
+
+    def __init__(self, network_service):
+        """
+        :param cloudshell.cp.azure.domain.services.network_service.NetworkService network_service:
+        """
+        self.network_service = network_service
+        self._pending = {}
+        self._writers = set()
+        self._lock = Lock()
+
+    def submit(self, network_client, resource_group_name, virtual_network_name, mutations):
+        """Apply mutations to the vNet together with the mutations pending from other callers
+
+        Method blocks until the mutations are written to the Azure
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param str resource_group_name: vNet resource group name
+        :param str virtual_network_name: vNet name
+        :param list mutations: list of CreateSubnetMutation/DeleteSubnetMutation/UpdateSubnetMutation
+        :return: updated vNet
+        :rtype: azure.mgmt.network.models.VirtualNetwork
+        """
+        key = (network_client.config.subscription_id, resource_group_name, virtual_network_name)
+        request = _VnetMutationRequest(mutations)
+
+        with self._lock:
+            self._pending.setdefault(key, []).append(request)
+            if key not in self._writers:
+                self._writers.add(key)
+                request.is_writer = True
+
+        if not request.is_writer:
+            request.wake.wait()
+
+        if request.is_writer:
+            self._write_pending(key=key,
+                                network_client=network_client,
+                                resource_group_name=resource_group_name,
+                                virtual_network_name=virtual_network_name)
+
+        if request.exc_info is not None:
+            raise request.exc_info[0], request.exc_info[1], request.exc_info[2]
+
+        return request.result
+
+    def _write_pending(self, key, network_client, resource_group_name, virtual_network_name):
+        """Write everything that is pending for the vNet (including the writer's own request) with one update
+
+        :param tuple key: vNet key
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param str resource_group_name:
+        :param str virtual_network_name:
+        """
+        with self._lock:
+            requests = self._pending.pop(key, [])
+
+        try:
+            self._write_requests(network_client=network_client,
+                                 resource_group_name=resource_group_name,
+                                 virtual_network_name=virtual_network_name,
+                                 requests=requests)
+        finally:
+            self._hand_off(key)
+
+    def _hand_off(self, key):
+        """Make the first waiting request the next writer of the vNet or release the vNet if nothing is pending
+
+        :param tuple key: vNet key
+        """
+        with self._lock:
+            requests = self._pending.get(key)
+            if not requests:
+                self._writers.discard(key)
+                return
+
+            next_writer = requests[0]
+            next_writer.is_writer = True
+            next_writer.wake.set()
+
+    def _write_requests(self, network_client, resource_group_name, virtual_network_name, requests):
+        """Write all requests with a single vNet update
+
+        If the grouped update fails, every request is written separately, so invalid changes from one caller
+        (for example, overlapping subnet CIDR) do not fail changes of the others
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param str resource_group_name:
+        :param str virtual_network_name:
+        :param list[_VnetMutationRequest] requests:
+        """
+        try:
+            virtual_network = self.network_service.update_virtual_network(
+                network_client=network_client,
+                resource_group_name=resource_group_name,
+                virtual_network_name=virtual_network_name,
+                update_func=_VnetMutationBatch(requests).apply)
+        except Exception:
+            if len(requests) == 1:
+                requests[0].complete(exc_info=sys.exc_info())
+                return
+
+            for request in requests:
+                self._write_requests(network_client=network_client,
+                                     resource_group_name=resource_group_name,
+                                     virtual_network_name=virtual_network_name,
+                                     requests=[request])
+            return
+
+        for request in requests:
+            request.complete(result=virtual_network)
@@ -1,7 +1,5 @@
 import traceback
 from functools import partial
-from multiprocessing.pool import ThreadPool
-from threading import Lock
 
 import jsonpickle
 from azure.mgmt.network.models import SecurityRuleProtocol, SecurityRule, SecurityRuleAccess, RouteNextHopType
@@ -12,12 +10,15 @@ from azure.mgmt.network.models import VirtualNetwork
 
 from cloudshell.cp.azure.common.exceptions.virtual_network_not_found_exception import VirtualNetworkNotFoundException
 from cloudshell.cp.azure.domain.services.network_service import NetworkService
+from cloudshell.cp.azure.domain.services.vnet_mutation_queue import CreateSubnetMutation, DeleteSubnetMutation, \
+    UpdateSubnetMutation
 
 from cloudshell.cp.azure.models.azure_cloud_provider_resource_model import AzureCloudProviderResourceModel
 from cloudshell.cp.azure.common.parsers.azure_resource_id_parser import AzureResourceIdParser
 from cloudshell.cp.azure.models.network_actions_models import PrepareNetworkActionResult, ConnectivityActionResult, \
     PrepareNetworkParams
 from cloudshell.cp.azure.models.rule_data import RuleData
+from cloudshell.cp.azure.models.security_rule_request import SecurityRuleRequest
 
 INVALID_REQUEST_ERROR = 'Invalid request: {0}'
 
@@ -32,7 +33,10 @@ class PrepareSandboxInfraOperation(object):
                  security_group_service,
                  name_provider_service,
                  cancellation_service,
-                 subnet_locker,
+                 vnet_mutation_queue,
+                 generic_lock_provider,
+                 task_executor,
+                 storage_account_pool,
                  resource_id_parser):
         """
 
@@ -44,7 +48,10 @@ class PrepareSandboxInfraOperation(object):
         :param cloudshell.cp.azure.domain.services.security_group.SecurityGroupService security_group_service:
         :param cloudshell.cp.azure.domain.services.name_provider.NameProviderService name_provider_service:
         :param cloudshell.cp.azure.domain.services.command_cancellation.CommandCancellationService cancellation_service:
-        :param threading.Lock subnet_locker:
+        :param cloudshell.cp.azure.domain.services.vnet_mutation_queue.VnetMutationQueue vnet_mutation_queue:
+        :param cloudshell.cp.azure.domain.services.lock_service.GenericLockProvider generic_lock_provider:
+        :param cloudshell.cp.azure.domain.services.task_executor.TaskExecutorService task_executor:
+        :param cloudshell.cp.azure.domain.services.storage_account_pool.StorageAccountPool storage_account_pool:
         :param AzureResourceIdParser resource_id_parser:
         :return:
         """
@@ -57,7 +64,10 @@ class PrepareSandboxInfraOperation(object):
         self.security_group_service = security_group_service
         self.name_provider_service = name_provider_service
         self.cancellation_service = cancellation_service
-        self.subnet_locker = subnet_locker
+        self.vnet_mutation_queue = vnet_mutation_queue
+        self.generic_lock_provider = generic_lock_provider
+        self.task_executor = task_executor
+        self.storage_account_pool = storage_account_pool
         self.resource_id_parser = resource_id_parser
 
     def action_with_cidr(action):
@@ -100,49 +110,33 @@ class PrepareSandboxInfraOperation(object):
         create_key_action_result = CreateKeysActionResult()
         subnet_actions = [a for a in actions if isinstance(a, PrepareSubnet)]
 
-        # 1. Create a resource group
-        logger.info("Creating a resource group: {0} .".format(group_name))
-        self.vm_service.create_resource_group(resource_management_client=resource_client, group_name=group_name,
-                                              region=cloud_provider_model.region, tags=tags)
-
-        self.cancellation_service.check_if_cancelled(cancellation_context)
-        storage_account_name = self._prepare_storage_account_name(reservation_id)
+        logger.info("Background tasks executor state: {}".format(self.task_executor.get_stats()))
 
-        # 2+3. create storage account and keypairs (async)
-        pool = ThreadPool()
-        storage_res = pool.apply_async(self._create_storage_and_keypairs,
-                                       (logger, storage_client, storage_account_name, group_name, cloud_provider_model,
-                                        tags, cancellation_context, create_key_action_result))
+        # 1. Create a resource group (async). Discovery of the MGMT vNets doesn't depend on it
+        logger.info("Creating a resource group: {0} .".format(group_name))
+        resource_group_res = self.task_executor.submit(self.vm_service.create_resource_group,
+                                                       resource_management_client=resource_client,
+                                                       group_name=group_name,
+                                                       region=cloud_provider_model.region,
+                                                       tags=tags)
 
-        logger.info("Retrieving MGMT vNet from resource group {} by tag {}={}".format(
-            cloud_provider_model.management_group_name,
-            NetworkService.NETWORK_TYPE_TAG_NAME,
-            NetworkService.MGMT_NETWORK_TAG_VALUE))
+        management_vnet, sandbox_vnet = self._get_validated_virtual_networks(
+            network_client=network_client,
+            cloud_provider_model=cloud_provider_model,
+            cancellation_context=cancellation_context,
+            logger=logger)
 
-        virtual_networks = self.network_service \
-            .get_virtual_networks(network_client=network_client,
-                                  group_name=cloud_provider_model.management_group_name)
+        # storage account and NSG are created inside the resource group
+        resource_group_res.get()
 
         self.cancellation_service.check_if_cancelled(cancellation_context)
+        storage_account_name = self._prepare_storage_account_name(reservation_id)
 
-        management_vnet = self.network_service.get_virtual_network_by_tag(
-            virtual_networks=virtual_networks,
-            tag_key=NetworkService.NETWORK_TYPE_TAG_NAME,
-            tag_value=NetworkService.MGMT_NETWORK_TAG_VALUE)
-
-        self._validate_management_vnet(management_vnet)
-
-        logger.info("Retrieving sandbox vNet from resource group {} by tag {}={}".format(
-            cloud_provider_model.management_group_name,
-            NetworkService.NETWORK_TYPE_TAG_NAME,
-            NetworkService.SANDBOX_NETWORK_TAG_VALUE))
-
-        sandbox_vnet = self.network_service.get_virtual_network_by_tag(
-            virtual_networks=virtual_networks,
-            tag_key=NetworkService.NETWORK_TYPE_TAG_NAME,
-            tag_value=NetworkService.SANDBOX_NETWORK_TAG_VALUE)
-
-        self._validate_sandbox_vnet(sandbox_vnet)
+        # 2+3. create storage account and keypairs (async)
+        storage_res = self.task_executor.submit(self._create_storage_and_keypairs,
+                                                logger, storage_client, resource_client, storage_account_name,
+                                                group_name, cloud_provider_model, tags, cancellation_context,
+                                                create_key_action_result)
 
         # 4. Create the sandbox NSG object
         #
@@ -162,42 +156,44 @@ class PrepareSandboxInfraOperation(object):
         self.cancellation_service.check_if_cancelled(cancellation_context)
 
         logger.info("Creating management rules for {0}...".format(security_group_name))
-        # 5. Set rules on the subnets nsg - which handles security for all subnets in sandbox.
+        # 5. Set rules on the subnets nsg - which handles security for all subnets in sandbox (async).
         # Support "additional management traffic" inbound traffic
         # allow management vnet traffic
         # deny inbound from other subnets in vnet
-        self._create_subnet_nsg_rules(
-            group_name=group_name,
-            management_vnet=management_vnet,
-            network_client=network_client,
-            sandbox_vnet=sandbox_vnet,
-            sandbox_cidr=cidr,
-            security_group_name=security_group_name,
-            additional_mgmt_networks=cloud_provider_model.additional_mgmt_networks,
-            logger=logger,
-            subnet_actions=subnet_actions)
-
-        self.cancellation_service.check_if_cancelled(cancellation_context)
-
-        # 6. Create additional subnets requested by server
-        for subnet in subnet_actions:
-            logger.warn('creating: ' + subnet.actionParams.cidr)
-            subnet_name = self.name_provider_service.format_subnet_name(group_name, subnet.actionParams.cidr)
-            self._create_subnet(cidr=subnet.actionParams.cidr,
-                                cloud_provider_model=cloud_provider_model,
-                                logger=logger,
-                                network_client=network_client,
-                                resource_client=resource_client,
-                                network_security_group=sandbox_network_security_group,
-                                sandbox_vnet=sandbox_vnet,
-                                subnet_name=subnet_name)
-            results.append(self._create_result(subnet, subnet_name))
-
+        create_nsg_rules_command = partial(self._create_subnet_nsg_rules,
+                                           group_name=group_name,
+                                           management_vnet=management_vnet,
+                                           network_client=network_client,
+                                           sandbox_vnet=sandbox_vnet,
+                                           sandbox_cidr=cidr,
+                                           security_group_name=security_group_name,
+                                           additional_mgmt_networks=cloud_provider_model.additional_mgmt_networks,
+                                           logger=logger,
+                                           subnet_actions=subnet_actions)
+        nsg_rules_res = self.task_executor.submit(create_nsg_rules_command)
+
+        # 6. Create additional subnets requested by server. Only the NSG object is needed for it,
+        # so subnets are created while NSG rules are being written
+        subnet_names = [self.name_provider_service.format_subnet_name(group_name, subnet.actionParams.cidr)
+                        for subnet in subnet_actions]
+
+        if subnet_actions:
+            self._create_subnets(subnet_actions=subnet_actions,
+                                 subnet_names=subnet_names,
+                                 cloud_provider_model=cloud_provider_model,
+                                 logger=logger,
+                                 network_client=network_client,
+                                 resource_client=resource_client,
+                                 network_security_group=sandbox_network_security_group,
+                                 sandbox_vnet=sandbox_vnet)
+
+        results.extend(self._create_result(subnet, subnet_name)
+                       for subnet, subnet_name in zip(subnet_actions, subnet_names))
+
+        nsg_rules_res.get()
         self.cancellation_service.check_if_cancelled(cancellation_context)
 
         # wait for all async operations
-        pool.close()
-        pool.join()
         storage_res.get(timeout=900)  # will wait for 15 min and raise exception if storage account creation failed
 
         results.append(PrepareCloudInfraResult(self._get_action_id_by_type(actions, PrepareCloudInfra)))
@@ -206,6 +202,48 @@ class PrepareSandboxInfraOperation(object):
 
         return results
 
+    def _get_validated_virtual_networks(self, network_client, cloud_provider_model, cancellation_context, logger):
+        """Find MGMT and sandbox vNets in the MGMT resource group
+
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param AzureCloudProviderResourceModel cloud_provider_model: cloud provider
+        :param cancellation_context cloudshell.shell.core.driver_context.CancellationContext instance
+        :param logging.Logger logger:
+        :return: MGMT vNet and sandbox vNet
+        :rtype: tuple[VirtualNetwork, VirtualNetwork]
+        """
+        logger.info("Retrieving MGMT vNet from resource group {} by tag {}={}".format(
+            cloud_provider_model.management_group_name,
+            NetworkService.NETWORK_TYPE_TAG_NAME,
+            NetworkService.MGMT_NETWORK_TAG_VALUE))
+
+        virtual_networks = self.network_service \
+            .get_virtual_networks(network_client=network_client,
+                                  group_name=cloud_provider_model.management_group_name)
+
+        self.cancellation_service.check_if_cancelled(cancellation_context)
+
+        management_vnet = self.network_service.get_virtual_network_by_tag(
+            virtual_networks=virtual_networks,
+            tag_key=NetworkService.NETWORK_TYPE_TAG_NAME,
+            tag_value=NetworkService.MGMT_NETWORK_TAG_VALUE)
+
+        self._validate_management_vnet(management_vnet)
+
+        logger.info("Retrieving sandbox vNet from resource group {} by tag {}={}".format(
+            cloud_provider_model.management_group_name,
+            NetworkService.NETWORK_TYPE_TAG_NAME,
+            NetworkService.SANDBOX_NETWORK_TAG_VALUE))
+
+        sandbox_vnet = self.network_service.get_virtual_network_by_tag(
+            virtual_networks=virtual_networks,
+            tag_key=NetworkService.NETWORK_TYPE_TAG_NAME,
+            tag_value=NetworkService.SANDBOX_NETWORK_TAG_VALUE)
+
+        self._validate_sandbox_vnet(sandbox_vnet)
+
+        return management_vnet, sandbox_vnet
+
     def _prepare_results(self, create_key_action_result, actions):
         network_action_result = PrepareCloudInfraResult(self._get_action_id_by_type(actions, PrepareCloudInfra))
 
@@ -236,13 +274,14 @@ class PrepareSandboxInfraOperation(object):
         return self.name_provider_service.generate_name(name=reservation_id, postfix="cs", max_length=24).replace("-",
                                                                                                                   "")
 
-    def _create_storage_and_keypairs(self, logger, storage_client, storage_account_name, group_name,
+    def _create_storage_and_keypairs(self, logger, storage_client, resource_client, storage_account_name, group_name,
                                      cloud_provider_model, tags, cancellation_context, create_key_action_result):
         """
 
         :param logger:
         :param storage_client:
-        :param storage_account_name:
+        :param resource_client:
+        :param storage_account_name: name of the storage account that is created if the pool has no ready one
         :param group_name:
         :param cloud_provider_model:
         :param tags:
@@ -251,22 +290,25 @@ class PrepareSandboxInfraOperation(object):
         :return:
         """
         try:
-            # 2. Create a storage account
-            logger.info("Creating a storage account {0} .".format(storage_account_name))
-            self.storage_service.create_storage_account(storage_client=storage_client,
-                                                        group_name=group_name,
-                                                        region=cloud_provider_model.region,
-                                                        storage_account_name=storage_account_name,
-                                                        tags=tags,
-                                                        wait_until_created=True)
+            # 2. Claim a pre-created storage account or create a new one
+            storage_group_name, storage_account_name = self._get_or_create_storage_account(
+                logger=logger,
+                storage_client=storage_client,
+                resource_client=resource_client,
+                storage_account_name=storage_account_name,
+                group_name=group_name,
+                cloud_provider_model=cloud_provider_model,
+                tags=tags)
 
             self.cancellation_service.check_if_cancelled(cancellation_context)
 
             # 3 Create a Key pair for the sandbox
             logger.info("Creating an SSH key pair in the storage account {}".format(storage_account_name))
-            key_pair = self._create_key_pair(group_name=group_name,
+            key_pair = self._create_key_pair(group_name=storage_group_name,
                                              storage_account_name=storage_account_name,
-                                             storage_client=storage_client)
+                                             storage_client=storage_client,
+                                             key_pair_pool_depth=cloud_provider_model.key_pair_pool_depth,
+                                             logger=logger)
 
             self.cancellation_service.check_if_cancelled(cancellation_context)
 
@@ -278,60 +320,160 @@ class PrepareSandboxInfraOperation(object):
 
         return True
 
+    def _get_or_create_storage_account(self, logger, storage_client, resource_client, storage_account_name, group_name,
+                                       cloud_provider_model, tags):
+        """Get the storage account of the sandbox, claim a pre-created one or create a new one
+
+        :param logging.Logger logger:
+        :param azure.mgmt.storage.storage_management_client.StorageManagementClient storage_client:
+        :param azure.mgmt.resource.ResourceManagementClient resource_client:
+        :param str storage_account_name: name of the storage account that is created if the pool has no ready one
+        :param str group_name: sandbox resource group name
+        :param AzureCloudProviderResourceModel cloud_provider_model:
+        :param dict tags:
+        :return: name of the resource group that contains the storage account and the storage account name
+        :rtype: tuple[str, str]
+        """
+        region = cloud_provider_model.region
+
+        # prepare connectivity can run more than once for the same sandbox
+        storage_group_name, storage_accounts = self.storage_service.get_sandbox_storage_accounts(
+            storage_client=storage_client,
+            group_name=group_name,
+            region=region)
+
+        if storage_accounts:
+            return storage_group_name, storage_accounts[0].name
+
+        claimed_storage_account = self.storage_account_pool.claim(
+            storage_client=storage_client,
+            resource_client=resource_client,
+            group_name=group_name,
+            region=region,
+            depth=cloud_provider_model.storage_account_pool_depth,
+            tags=tags,
+            logger=logger)
+
+        if claimed_storage_account:
+            return claimed_storage_account
+
+        if cloud_provider_model.storage_account_pool_depth > 0:
+            # failed claim could still tag the pooled account, the sandbox must never have two storage accounts
+            storage_group_name, storage_accounts = self.storage_service.get_sandbox_storage_accounts(
+                storage_client=storage_client,
+                group_name=group_name,
+                region=region)
+
+            if storage_accounts:
+                return storage_group_name, storage_accounts[0].name
+
+        logger.info("Creating a storage account {0} .".format(storage_account_name))
+        self.storage_service.create_storage_account(storage_client=storage_client,
+                                                    group_name=group_name,
+                                                    region=region,
+                                                    storage_account_name=storage_account_name,
+                                                    tags=tags,
+                                                    wait_until_created=True)
+
+        return group_name, storage_account_name
+
     def _wait_on_operations(self, async_operations, logger):
         logger.info("Waiting for async create operations to be done... {}".format(async_operations))
         for operation_poller in async_operations:
             operation_poller.wait()
 
-    def _create_key_pair(self, group_name, storage_account_name, storage_client):
-        key_pair = self.key_pair_service.generate_key_pair()
+    def _create_key_pair(self, group_name, storage_account_name, storage_client, key_pair_pool_depth, logger):
+        key_pair = self.key_pair_service.generate_key_pair(pool_depth=key_pair_pool_depth, logger=logger)
         self.key_pair_service.save_key_pair(storage_client=storage_client,
                                             group_name=group_name,
                                             storage_name=storage_account_name,
                                             key_pair=key_pair)
         return key_pair
 
+    def _create_subnets(self, subnet_actions, subnet_names, cloud_provider_model, logger, network_client,
+                        resource_client, network_security_group, sandbox_vnet):
+        """Create all requested subnets with a single sandbox vNet update
+
+        Subnets are written through the vNet mutation queue, so they can be grouped with the subnet changes
+        of other sandboxes. If some CIDR is still used by a stale subnet, subnets are created one by one
+        with the stale data cleanup
+        :param list[PrepareSubnet] subnet_actions:
+        :param list[str] subnet_names:
+        :param AzureCloudProviderResourceModel cloud_provider_model:
+        :param logging.Logger logger:
+        :param VirtualNetwork sandbox_vnet:
+        """
+        subnets_cidrs = [(subnet_name, subnet.actionParams.cidr)
+                         for subnet, subnet_name in zip(subnet_actions, subnet_names)]
+
+        logger.info("Creating subnets {0} under: {1}/{2}.".format(subnets_cidrs,
+                                                                  cloud_provider_model.management_group_name,
+                                                                  sandbox_vnet.name))
+        mutations = [CreateSubnetMutation(subnet_name=subnet_name,
+                                          subnet_cidr=subnet_cidr,
+                                          network_security_group=network_security_group)
+                     for subnet_name, subnet_cidr in subnets_cidrs]
+        try:
+            self.vnet_mutation_queue.submit(network_client=network_client,
+                                            resource_group_name=cloud_provider_model.management_group_name,
+                                            virtual_network_name=sandbox_vnet.name,
+                                            mutations=mutations)
+        except CloudError as e:
+            logger.warn(e.message)
+            if "NetcfgInvalidSubnet" not in str(e.error):
+                raise
+
+            logger.info("Some of the subnets CIDRs exist in vnet with a different name. "
+                        "Will create subnets one by one with the stale data cleanup.")
+
+            for subnet_name, subnet_cidr in subnets_cidrs:
+                self._create_subnet(cidr=subnet_cidr,
+                                    cloud_provider_model=cloud_provider_model,
+                                    logger=logger,
+                                    network_client=network_client,
+                                    resource_client=resource_client,
+                                    network_security_group=network_security_group,
+                                    sandbox_vnet=sandbox_vnet,
+                                    subnet_name=subnet_name)
+
     def _create_subnet(self, cidr, cloud_provider_model, logger, network_client, resource_client,
                        network_security_group, sandbox_vnet,
                        subnet_name):
         """
-        This method is atomic because we have to sync subnet creation for the entire sandbox vnet
+        Subnet is written through the vNet mutation queue because subnet changes have to be synced
+        for the entire sandbox vnet
         :param VirtualNetwork sandbox_vnet:
         :param AzureCloudProviderResourceModel cloud_provider_model:
         """
-
-        with self.subnet_locker:
+        logger.info(
+            "Creating a subnet {0} under: {1}/{2}.".format(subnet_name,
+                                                           cloud_provider_model.management_group_name,
+                                                           sandbox_vnet.name))
+        create_subnet_command = partial(self.vnet_mutation_queue.submit,
+                                        network_client=network_client,
+                                        resource_group_name=cloud_provider_model.management_group_name,
+                                        virtual_network_name=sandbox_vnet.name,
+                                        mutations=[CreateSubnetMutation(subnet_name=subnet_name,
+                                                                        subnet_cidr=cidr,
+                                                                        network_security_group=network_security_group)])
+        try:
+            create_subnet_command()
+        except CloudError as e:
+            logger.warn(e.message)
+            if "NetcfgInvalidSubnet" not in str(e.error):
+                raise
+            # try to cleanup stale subnet
             logger.info(
-                "Creating a subnet {0} under: {1}/{2}.".format(subnet_name,
-                                                               cloud_provider_model.management_group_name,
-                                                               sandbox_vnet.name))
-            create_subnet_command = partial(self.network_service.create_subnet,
-                                            network_client=network_client,
-                                            resource_group_name=cloud_provider_model.management_group_name,
-                                            subnet_name=subnet_name,
-                                            subnet_cidr=cidr,
-                                            virtual_network=sandbox_vnet,
-                                            region=cloud_provider_model.region,
-                                            network_security_group=network_security_group,
-                                            wait_for_result=True)
-            try:
-                create_subnet_command()
-            except CloudError as e:
-                logger.warn(e.message)
-                if "NetcfgInvalidSubnet" not in str(e.error):
-                    raise
-                # try to cleanup stale subnet
-                logger.info(
-                    "Subnet with cidr {0} exist in vnet with a different name. Will try to cleanup the stale data."
-                        .format(cidr))
-                self._cleanup_stale_data(network_client=network_client,
-                                         resource_client=resource_client,
-                                         cloud_provider_model=cloud_provider_model,
-                                         sandbox_vnet=sandbox_vnet,
-                                         subnet_cidr=cidr,
-                                         logger=logger)
-                # try to create subnet again
-                create_subnet_command()
+                "Subnet with cidr {0} exist in vnet with a different name. Will try to cleanup the stale data."
+                    .format(cidr))
+            self._cleanup_stale_data(network_client=network_client,
+                                     resource_client=resource_client,
+                                     cloud_provider_model=cloud_provider_model,
+                                     sandbox_vnet=sandbox_vnet,
+                                     subnet_cidr=cidr,
+                                     logger=logger)
+            # try to create subnet again
+            create_subnet_command()
 
     def _cleanup_stale_data(self, network_client, resource_client, cloud_provider_model, sandbox_vnet, subnet_cidr,
                             logger):
@@ -348,28 +490,20 @@ class PrepareSandboxInfraOperation(object):
             return
         subnet = stale_subnets[0]
 
-        if subnet.network_security_group is not None:
-            logger.info("Detaching NSG from subnet {}".format(subnet.id))
-
-            subnet.network_security_group = None
-            self.network_service.update_subnet(network_client=network_client,
-                                               resource_group_name=cloud_provider_model.management_group_name,
-                                               virtual_network_name=sandbox_vnet.name,
-                                               subnet_name=subnet.name,
-                                               subnet=subnet)
-            logger.info("NSG from subnet {} was successfully detached".format(subnet.id))
-
         resource_groups = []
         if subnet.ip_configurations is not None:
             for ip_conf in subnet.ip_configurations:
                 resource_group = self.resource_id_parser.get_resource_group_name(resource_id=ip_conf.id)
                 resource_groups.append(resource_group)
 
+        # NSG is detached in the same vNet update that deletes the subnet
         logger.info("Deleting Subnet {}...".format(subnet.id))
-        self.network_service.delete_subnet(network_client=network_client,
-                                           group_name=cloud_provider_model.management_group_name,
-                                           vnet_name=sandbox_vnet.name,
-                                           subnet_name=subnet.name)
+        self.vnet_mutation_queue.submit(network_client=network_client,
+                                        resource_group_name=cloud_provider_model.management_group_name,
+                                        virtual_network_name=sandbox_vnet.name,
+                                        mutations=[UpdateSubnetMutation(subnet_name=subnet.name,
+                                                                        network_security_group=None),
+                                                   DeleteSubnetMutation(subnet_name=subnet.name)])
 
         logger.info("Subnet {} was successfully deleted".format(subnet.id))
 
@@ -377,7 +511,7 @@ class PrepareSandboxInfraOperation(object):
                                  security_group_name, additional_mgmt_networks, logger, subnet_actions):
         """Creates NSG management rules
 
-        NOTE: NSG rules must be created only one by one, without concurrency
+        NOTE: all rules are written to the NSG with a single NSG update
         :param str group_name: resource group name (reservation id)
         :param VirtualNetwork management_vnet: management network
         :param azure.mgmt.network.NetworkManagementClient network_client:
@@ -388,6 +522,7 @@ class PrepareSandboxInfraOperation(object):
         """
         management_vnet_cidr = management_vnet.address_space.address_prefixes[0]
         sandbox_vnet_cidr = sandbox_vnet.address_space.address_prefixes[0]
+        rules_requests = []
 
         # RULES OVERVIEW
         #
@@ -422,19 +557,10 @@ class PrepareSandboxInfraOperation(object):
         for s in subnet_actions:
             subnet_cidr = s.actionParams.cidr
             security_rule_name = 'Allow_Sandbox_Traffic_To_{0}'.format(subnet_cidr.replace('/', '-'))
-            allow_all_traffic = [self.allow_all_rule(security_rule_name)]
-
-            self.security_group_service.create_network_security_group_rules(
-                network_client=network_client,
-                group_name=group_name,
-                security_group_name=security_group_name,
-                inbound_rules=allow_all_traffic,
-                destination_addr=subnet_cidr,
-                source_address=sandbox_cidr,
-                lock=self.subnet_locker,
-                start_from=2000)
-
-            logger.info("Created security rule {0} on NSG {1}".format(security_rule_name, security_group_name))
+            rules_requests.append(SecurityRuleRequest(rule_data=self.allow_all_rule(security_rule_name),
+                                                      destination_addr=subnet_cidr,
+                                                      source_address=sandbox_cidr,
+                                                      start_from=2000))
 
         # block access from internet to private subnets
         private_subnets = [s for s in subnet_actions if not s.actionParams.isPublic]
@@ -443,19 +569,10 @@ class PrepareSandboxInfraOperation(object):
             private_subnet_cidr = p.actionParams.cidr
             security_rule_name = 'Deny_Internet_Traffic_To_Private_Subnet_{0}' \
                 .format(private_subnet_cidr.replace('/', '-'))
-            deny_all_traffic = [self.deny_all_rule(security_rule_name)]
-
-            self.security_group_service.create_network_security_group_rules(
-                network_client=network_client,
-                group_name=group_name,
-                security_group_name=security_group_name,
-                inbound_rules=deny_all_traffic,
-                destination_addr=private_subnet_cidr,
-                source_address=RouteNextHopType.internet,
-                lock=self.subnet_locker,
-                start_from=2000)
-
-            logger.info("Created security rule {0} on NSG {1}".format(security_rule_name, security_group_name))
+            rules_requests.append(SecurityRuleRequest(rule_data=self.deny_all_rule(security_rule_name),
+                                                      destination_addr=private_subnet_cidr,
+                                                      source_address=RouteNextHopType.internet,
+                                                      start_from=2000))
         #
         # PRIORITY 4xxx:
         #
@@ -465,19 +582,10 @@ class PrepareSandboxInfraOperation(object):
 
         for a in additional_mgmt_networks:
             security_rule_name = 'Allow_{0}_To_{1}'.format(a.replace('/', '-'), sandbox_cidr.replace('/', '-'))
-            allow_traffic_from_additional_mgmt_network = [self.allow_all_rule(security_rule_name)]
-
-            self.security_group_service.create_network_security_group_rules(
-                network_client=network_client,
-                group_name=group_name,
-                security_group_name=security_group_name,
-                inbound_rules=allow_traffic_from_additional_mgmt_network,
-                destination_addr=sandbox_cidr,
-                source_address=a,
-                lock=self.subnet_locker,
-                start_from=4000)
-
-            logger.info("Created security rule {0} on NSG {1}".format(security_rule_name, security_group_name))
+            rules_requests.append(SecurityRuleRequest(rule_data=self.allow_all_rule(security_rule_name),
+                                                      destination_addr=sandbox_cidr,
+                                                      source_address=a,
+                                                      start_from=4000))
         #
         # PRIORITY 4080
         #
@@ -487,19 +595,10 @@ class PrepareSandboxInfraOperation(object):
 
         security_rule_name = 'Allow_{0}_To_{1}'.format(management_vnet_cidr.replace('/', '-'),
                                                        sandbox_cidr.replace('/', '-'))
-        allow_traffic_from_management_vnet_cidr = [self.allow_all_rule(security_rule_name)]
-
-        self.security_group_service.create_network_security_group_rules(
-            network_client=network_client,
-            group_name=group_name,
-            security_group_name=security_group_name,
-            inbound_rules=allow_traffic_from_management_vnet_cidr,
-            destination_addr=sandbox_cidr,
-            source_address=management_vnet_cidr,
-            lock=self.subnet_locker,
-            start_from=4080)
-
-        logger.info("Created security rule {0} on NSG {1}".format(security_rule_name, security_group_name))
+        rules_requests.append(SecurityRuleRequest(rule_data=self.allow_all_rule(security_rule_name),
+                                                  destination_addr=sandbox_cidr,
+                                                  source_address=management_vnet_cidr,
+                                                  start_from=4080))
 
         #
         # PRIORITY 4090
@@ -510,19 +609,20 @@ class PrepareSandboxInfraOperation(object):
         #   The idea is to block traffic from other sandboxes in the account.
 
         security_rule_name = 'Deny_Traffic_From_Other_Sandboxes_To_Sandbox_CIDR'
-        deny_all_traffic = [self.deny_all_rule(security_rule_name)]
+        rules_requests.append(SecurityRuleRequest(rule_data=self.deny_all_rule(security_rule_name),
+                                                  destination_addr=sandbox_cidr,
+                                                  source_address=sandbox_vnet_cidr,
+                                                  start_from=4090))
 
-        self.security_group_service.create_network_security_group_rules(
+        self.security_group_service.create_network_security_group_rules_batch(
             network_client=network_client,
             group_name=group_name,
             security_group_name=security_group_name,
-            inbound_rules=deny_all_traffic,
-            destination_addr=sandbox_cidr,
-            source_address=sandbox_vnet_cidr,
-            lock=self.subnet_locker,
-            start_from=4090)
+            rules_requests=rules_requests,
+            lock=self.generic_lock_provider.get_resource_lock(lock_key=security_group_name, logger=logger))
 
-        logger.info("Created security rule {0} on NSG {1}".format(security_rule_name, security_group_name))
+        logger.info("Created security rules {0} on NSG {1}".format(
+            ', '.join(rule_request.rule_data.name for rule_request in rules_requests), security_group_name))
 
     def allow_all_rule(self, security_rule_name):
         return RuleData(protocol=SecurityRuleProtocol.asterisk,
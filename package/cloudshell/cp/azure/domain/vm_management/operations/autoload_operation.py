@@ -1,3 +1,5 @@
+from functools import partial
+
 import netaddr
 from msrest.exceptions import AuthenticationError
 from msrestazure.azure_exceptions import CloudError
@@ -9,17 +11,27 @@ from cloudshell.cp.azure.common.exceptions.autoload_exception import AutoloadExc
 
 
 class AutoloadOperation(object):
-    def __init__(self, subscription_service, vm_service, network_service):
+    AZURE_PROVIDERS = ("Microsoft.Authorization",
+                       "Microsoft.Storage",
+                       "Microsoft.Network",
+                       "Microsoft.Compute")
+    # providers in these states don't need to be registered again
+    REGISTERED_PROVIDER_STATES = ("Registered", "Registering")
+
+    def __init__(self, subscription_service, vm_service, network_service, task_executor):
         """
 
         :param cloudshell.cp.azure.domain.services.subscription.SubscriptionService subscription_service:
         :param cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService vm_service:
         :param cloudshell.cp.azure.domain.services.network_service.NetworkService network_service:
+        :param cloudshell.cp.azure.domain.services.task_executor.TaskExecutorService task_executor:
         :return:
         """
         self.subscription_service = subscription_service
         self.vm_service = vm_service
         self.network_service = network_service
+        self.task_executor = task_executor
+        self._registered_subscriptions = set()
 
     def _validate_region(self, subscription_client, subscription_id, region):
         """Verify Azure region
@@ -120,21 +132,34 @@ class AutoloadOperation(object):
         if vm_size not in (azure_vm_size.name for azure_vm_size in azure_vm_sizes):
             raise AutoloadException("VM Size {} is not valid".format(vm_size))
 
-    def _register_azure_providers(self, resource_client, logger):
-        """Add registration to the azure providers
+    def _register_azure_providers(self, resource_client, subscription_id, logger):
+        """Add registration to the azure providers that are not registered yet
+
+        Registration is a subscription-wide state, so once all providers are registered, the subscription is
+        remembered and the next autoloads don't call Azure at all
 
         :param resource_client: azure.mgmt.resource.ResourceManagementClient instance
+        :param str subscription_id: Azure Subscription ID
         :param logger: logging.Logger instance
         :return:
         """
-        for provider in ("Microsoft.Authorization",
-                         "Microsoft.Storage",
-                         "Microsoft.Network",
-                         "Microsoft.Compute"):
+        if subscription_id in self._registered_subscriptions:
+            logger.info("Resource providers are already registered for the subscription {}".format(subscription_id))
+            return
+
+        registration_states = {provider.namespace.lower(): provider.registration_state
+                               for provider in resource_client.providers.list()}
+
+        missing_providers = [provider for provider in self.AZURE_PROVIDERS
+                             if registration_states.get(provider.lower()) not in self.REGISTERED_PROVIDER_STATES]
 
+        def register_provider(provider):
             logger.info("Register subscription with a {} resource provider".format(provider))
             resource_client.providers.register(provider)
 
+        self.task_executor.map(register_provider, missing_providers)
+        self._registered_subscriptions.add(subscription_id)
+
     def _validate_cidr_format(self, cidr, logger):
         """Validate that CIDR have a correct format. Example "10.10.10.10/24"
 
@@ -189,6 +214,22 @@ class AutoloadOperation(object):
                 raise AutoloadException('CIDR {} under the "Additional Mgmt Networks" attribute is not '
                                         'in the valid format'.format(cidr))
 
+    @staticmethod
+    def _run_validation(validation, errors, logger):
+        """Run validation and collect its error instead of raising it
+
+        :param validation: function without arguments to run
+        :param list[Exception] errors: list to add the validation error to
+        :param logging.Logger logger:
+        :return: result of the validation or None if it failed
+        """
+        try:
+            return validation()
+        except Exception as e:
+            if not isinstance(e, AutoloadException):
+                logger.exception("Failed to validate the Cloud Provider:")
+            errors.append(e)
+
     def get_inventory(self, cloud_provider_model, logger):
         """Check that all needed resources are valid and present on the Azure
 
@@ -198,47 +239,75 @@ class AutoloadOperation(object):
         """
         logger.info("Starting Autoload Operation...")
 
+        # all other validations need the Azure API clients
         azure_clients = self._validate_api_credentials(cloud_provider_model=cloud_provider_model, logger=logger)
 
-        self._validate_region(subscription_client=azure_clients.subscription_client,
-                              subscription_id=cloud_provider_model.azure_subscription_id,
-                              region=cloud_provider_model.region)
+        # validations are independent of each other, so they run at the same time
+        # and all found errors are reported together
+        validations = [
+            self.task_executor.submit(self._validate_region,
+                                      subscription_client=azure_clients.subscription_client,
+                                      subscription_id=cloud_provider_model.azure_subscription_id,
+                                      region=cloud_provider_model.region),
+            self.task_executor.submit(self._validate_mgmt_resource_group,
+                                      resource_client=azure_clients.resource_client,
+                                      mgmt_group_name=cloud_provider_model.management_group_name,
+                                      region=cloud_provider_model.region,
+                                      logger=logger)]
 
-        self._register_azure_providers(resource_client=azure_clients.resource_client, logger=logger)
-
-        self._validate_mgmt_resource_group(resource_client=azure_clients.resource_client,
-                                           mgmt_group_name=cloud_provider_model.management_group_name,
-                                           region=cloud_provider_model.region,
-                                           logger=logger)
+        if cloud_provider_model.vm_size:
+            validations.append(self.task_executor.submit(self._validate_vm_size,
+                                                         compute_client=azure_clients.compute_client,
+                                                         region=cloud_provider_model.region,
+                                                         vm_size=cloud_provider_model.vm_size))
 
         logger.info("Retrieving virtual networks from MGMT resource group {}".format(
             cloud_provider_model.management_group_name))
 
-        virtual_networks = self.network_service.get_virtual_networks(
-            network_client=azure_clients.network_client,
-            group_name=cloud_provider_model.management_group_name)
+        virtual_networks_result = self.task_executor.submit(self.network_service.get_virtual_networks,
+                                                            network_client=azure_clients.network_client,
+                                                            group_name=cloud_provider_model.management_group_name)
+        errors = []
 
-        # verify that "sandbox" vNet exists under the MGMT resource group
-        sandbox_vnet = self._validate_vnet(virtual_networks=virtual_networks,
-                                           mgmt_group_name=cloud_provider_model.management_group_name,
-                                           network_tag=self.network_service.SANDBOX_NETWORK_TAG_VALUE,
-                                           logger=logger)
-
-        # verify that "mgmt" vNet exists under the MGMT resource group
-        self._validate_vnet(virtual_networks=virtual_networks,
-                            mgmt_group_name=cloud_provider_model.management_group_name,
-                            network_tag=self.network_service.MGMT_NETWORK_TAG_VALUE,
-                            logger=logger)
-
-        if cloud_provider_model.vm_size:
-            self._validate_vm_size(compute_client=azure_clients.compute_client,
-                                   region=cloud_provider_model.region,
-                                   vm_size=cloud_provider_model.vm_size)
+        # providers are registered concurrently on the task executor, so registration is not submitted
+        # to it as a task itself (tasks must not wait for other tasks of the same executor)
+        self._run_validation(partial(self._register_azure_providers,
+                                     resource_client=azure_clients.resource_client,
+                                     subscription_id=cloud_provider_model.azure_subscription_id,
+                                     logger=logger),
+                             errors=errors,
+                             logger=logger)
 
         # Note - removed _validate_networks_in_use from main flow following bug #162008
-
-        self._validate_additional_mgmt_networks(additional_mgmt_networks=cloud_provider_model.additional_mgmt_networks,
-                                                logger=logger)
+        self._run_validation(partial(self._validate_additional_mgmt_networks,
+                                     additional_mgmt_networks=cloud_provider_model.additional_mgmt_networks,
+                                     logger=logger),
+                             errors=errors,
+                             logger=logger)
+
+        for validation in validations:
+            self._run_validation(validation.get, errors=errors, logger=logger)
+
+        virtual_networks = self._run_validation(virtual_networks_result.get, errors=errors, logger=logger)
+
+        if virtual_networks is not None:
+            # verify that "sandbox" and "mgmt" vNets exist under the MGMT resource group
+            for network_tag in (self.network_service.SANDBOX_NETWORK_TAG_VALUE,
+                                self.network_service.MGMT_NETWORK_TAG_VALUE):
+                self._run_validation(partial(self._validate_vnet,
+                                             virtual_networks=virtual_networks,
+                                             mgmt_group_name=cloud_provider_model.management_group_name,
+                                             network_tag=network_tag,
+                                             logger=logger),
+                                     errors=errors,
+                                     logger=logger)
+
+        if len(errors) == 1:
+            raise errors[0]
+
+        if errors:
+            raise AutoloadException("Cloud Provider validation failed:\n{}".format(
+                "\n".join(error.message or str(error) for error in errors)))
 
         logger.info("Autoload Operation was successfully completed")
 
@@ -1,4 +1,4 @@
-import traceback
+import sys
 from functools import partial
 
 from azure.mgmt.network.models import VirtualNetwork, Subnet
@@ -7,21 +7,29 @@ from msrestazure.azure_exceptions import CloudError
 
 from cloudshell.cp.azure.common.helpers.ip_allocation_helper import is_static_allocation
 from cloudshell.cp.azure.domain.services.ip_service import IpService
+from cloudshell.cp.azure.domain.services.resource_group_inventory import ResourceGroupInventoryProvider
+from cloudshell.cp.azure.domain.services.vnet_mutation_queue import DeleteSubnetMutation, UpdateSubnetMutation
+from cloudshell.cp.azure.models.network_actions_models import DeleteInstanceActionResult
 
 
 class DeleteAzureVMOperation(object):
     def __init__(self, vm_service, network_service, tags_service, security_group_service, storage_service,
-                 generic_lock_provider, subnet_locker, ip_service):
+                 generic_lock_provider, vnet_mutation_queue, ip_release_coalescer, task_executor,
+                 resource_group_deletion_tracker, inventory_provider):
         """
-        :param ip_service:
         :param cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService vm_service:
         :param cloudshell.cp.azure.domain.services.network_service.NetworkService network_service:
         :param cloudshell.cp.azure.domain.services.tags.TagService tags_service:
         :param cloudshell.cp.azure.domain.services.security_group.SecurityGroupService security_group_service:
         :param cloudshell.cp.azure.domain.services.storage_service.StorageService storage_service:
         :param cloudshell.cp.azure.domain.services.lock_service.GenericLockProvider generic_lock_provider:
-        :param threading.Lock subnet_locker:
-        :param cloudshell.cp.azure.domain.services.ip_service.IpService ip_service:
+        :param cloudshell.cp.azure.domain.services.vnet_mutation_queue.VnetMutationQueue vnet_mutation_queue:
+        :param cloudshell.cp.azure.domain.services.ip_release_coalescer.IpReleaseCoalescer ip_release_coalescer:
+        :param cloudshell.cp.azure.domain.services.task_executor.TaskExecutorService task_executor:
+        :param cloudshell.cp.azure.domain.services.resource_group_deletion_tracker.ResourceGroupDeletionTracker
+            resource_group_deletion_tracker:
+        :param cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventoryProvider
+            inventory_provider:
         :return:
         """
         self.vm_service = vm_service
@@ -29,9 +37,12 @@ class DeleteAzureVMOperation(object):
         self.tags_service = tags_service
         self.security_group_service = security_group_service
         self.storage_service = storage_service
-        self.subnet_locker = subnet_locker
+        self.vnet_mutation_queue = vnet_mutation_queue
         self.generic_lock_provider = generic_lock_provider
-        self.ip_service = ip_service
+        self.ip_release_coalescer = ip_release_coalescer
+        self.task_executor = task_executor
+        self.resource_group_deletion_tracker = resource_group_deletion_tracker
+        self.inventory_provider = inventory_provider
 
     def cleanup_connectivity(self, network_client, resource_client, cloud_provider_model,
                              resource_group_name, request, logger):
@@ -64,19 +75,31 @@ class DeleteAzureVMOperation(object):
                                                 group_name=resource_group_name,
                                                 logger=logger)
 
-        """
-        The order of execution is very important and it should be:
-        1. remove nsg from subnet
-        2. delete resource group
-        3. delete sandbox subnet
-        """
-        errors = []
-        for command in (remove_nsg_from_subnets_command, delete_resource_group_command, delete_sandbox_subnets_command):
-            try:
-                command()
-            except Exception as e:
-                logger.exception("Error in cleanup connectivity. Error: ")
-                errors.append(e.message)
+        # resource group deletion is tracked only in the memory of the driver process and its failures are
+        # not reported to the teardown, so the asynchronous mode is enabled explicitly on the cloud provider
+        if cloud_provider_model.async_sandbox_teardown:
+            errors = self._cleanup_connectivity_without_waiting(
+                remove_nsg_from_subnets_command=remove_nsg_from_subnets_command,
+                delete_sandbox_subnets_command=delete_sandbox_subnets_command,
+                resource_client=resource_client,
+                resource_group_name=resource_group_name,
+                logger=logger)
+        else:
+            """
+            The order of execution is very important and it should be:
+            1. remove nsg from subnet
+            2. delete resource group
+            3. delete sandbox subnet
+            """
+            errors = []
+            for command in (remove_nsg_from_subnets_command,
+                            delete_resource_group_command,
+                            delete_sandbox_subnets_command):
+                try:
+                    command()
+                except Exception as e:
+                    logger.exception("Error in cleanup connectivity. Error: ")
+                    errors.append(e.message)
 
         if errors:
             result['success'] = False
@@ -85,9 +108,57 @@ class DeleteAzureVMOperation(object):
         # release the generic lock for reservation in context
         self.generic_lock_provider.remove_lock_resource(resource_group_name, logger)
         self.generic_lock_provider.remove_lock_resource(IpService.SANDBOX_LOCK_KEY.format(resource_group_name), logger)
+        self.generic_lock_provider.remove_lock_resource(
+            self.security_group_service.get_subnets_nsg_name(resource_group_name), logger)
+        self.security_group_service.remove_priority_allocators(resource_group_name)
 
         return result
 
+    def _cleanup_connectivity_without_waiting(self, remove_nsg_from_subnets_command, delete_sandbox_subnets_command,
+                                              resource_client, resource_group_name, logger):
+        """Release the sandbox subnets and start the resource group deletion without waiting for it
+
+        1. delete sandbox subnets with a single vNet update. Subnets are removed from the vNet together with
+           their NSG and route table associations, so there is no need to detach them with a separate update
+        2. if some subnet is still used by a NIC of the sandbox, subnets can't be deleted until the resource
+           group is deleted. In such case only nsg and route table are removed from subnets now and
+           subnets are deleted after the resource group deletion is finished
+        3. start the resource group deletion, it is tracked (and retried on failure) in the background
+        :param remove_nsg_from_subnets_command:
+        :param delete_sandbox_subnets_command:
+        :param azure.mgmt.resource.ResourceManagementClient resource_client:
+        :param str resource_group_name:
+        :param logging.Logger logger:
+        :return: error messages
+        :rtype: list[str]
+        """
+        errors = []
+        on_deleted = None
+        try:
+            delete_sandbox_subnets_command()
+        except Exception:
+            logger.warning("Failed to delete sandbox subnets, they will be deleted after the resource group {} "
+                           "is deleted".format(resource_group_name), exc_info=1)
+            on_deleted = delete_sandbox_subnets_command
+
+            try:
+                remove_nsg_from_subnets_command()
+            except Exception as e:
+                logger.exception("Error in cleanup connectivity. Error: ")
+                errors.append(e.message)
+
+        try:
+            logger.info("Starting deletion of the resource group {0}.".format(resource_group_name))
+            self.resource_group_deletion_tracker.start_deletion(resource_client=resource_client,
+                                                                group_name=resource_group_name,
+                                                                logger=logger,
+                                                                on_deleted=on_deleted)
+        except Exception as e:
+            logger.exception("Error in cleanup connectivity. Error: ")
+            errors.append(e.message)
+
+        return errors
+
     def remove_nsg_and_routetable_from_subnets(self, network_client, resource_group_name, cloud_provider_model, logger):
         logger.info("Removing NSG from the sandbox subnets...")
 
@@ -101,19 +172,19 @@ class DeleteAzureVMOperation(object):
             logger.warning("Could not find subnets in sandbox {} to detach NSG".format(resource_group_name))
             return
 
-        for subnet in subnets:
-            subnet.network_security_group = None
-            subnet.route_table = None
-            """
-            # This call is atomic because we have to sync subnet updating for the entire sandbox vnet
-            """
-            with self.subnet_locker:
-                logger.info("Updating subnet {} with NSG set to null".format(subnet.name))
-                self.network_service.update_subnet(network_client=network_client,
-                                                   resource_group_name=management_group_name,
-                                                   virtual_network_name=sandbox_virtual_network.name,
-                                                   subnet_name=subnet.name,
-                                                   subnet=subnet)
+        logger.info("Updating subnets {} with NSG and route table set to null".format(
+            [subnet.name for subnet in subnets]))
+        """
+        # Subnets are updated through the vNet mutation queue because we have to sync subnet updating
+        # for the entire sandbox vnet
+        """
+        self.vnet_mutation_queue.submit(network_client=network_client,
+                                        resource_group_name=management_group_name,
+                                        virtual_network_name=sandbox_virtual_network.name,
+                                        mutations=[UpdateSubnetMutation(subnet_name=subnet.name,
+                                                                        network_security_group=None,
+                                                                        route_table=None)
+                                                   for subnet in subnets])
 
     def delete_resource_group(self, resource_client, group_name, logger):
         logger.info("Deleting resource group {0}.".format(group_name))
@@ -135,14 +206,14 @@ class DeleteAzureVMOperation(object):
                 sandbox_virtual_network.name, resource_group_name))
             return
 
-        for subnet in subnets:
-            with self.subnet_locker:
-                logger.info("Deleting subnet {}".format(subnet.name))
-                self.network_service.delete_subnet(network_client=network_client,
-                                                   group_name=cloud_provider_model.management_group_name,
-                                                   vnet_name=sandbox_virtual_network.name,
-                                                   subnet_name=subnet.name)
-                logger.info("Deleted subnet {}".format(subnet.name))
+        subnet_names = [subnet.name for subnet in subnets]
+        logger.info("Deleting subnets {}".format(subnet_names))
+        self.vnet_mutation_queue.submit(network_client=network_client,
+                                        resource_group_name=cloud_provider_model.management_group_name,
+                                        virtual_network_name=sandbox_virtual_network.name,
+                                        mutations=[DeleteSubnetMutation(subnet_name=subnet_name)
+                                                   for subnet_name in subnet_names])
+        logger.info("Deleted subnets {}".format(subnet_names))
 
     def _find_sandbox_subnets(self, resource_group_name, sandbox_virtual_network):
         """
@@ -225,38 +296,69 @@ class DeleteAzureVMOperation(object):
                                   group_name=group_name,
                                   vm_name=vm_name)
 
-    def _delete_nics(self, network_client, group_name, vm_name, logger, interface_names):
-        """Delete NIC resource on the azure for given VM
+    def _delete_nic_with_public_ip(self, network_client, group_name, logger, network_interface):
+        """Delete NIC resource on the azure and then the Public IP that was attached to it
 
         :param network_client: azure.mgmt.network.NetworkManagementClient instance
         :param group_name: (str) The name of the resource group
-        :param vm_name: (str) the same as ip_name and interface_name
         :param logger: logging.Logger instance
-        :param interface_names: list(str)
+        :param azure.mgmt.network.models.NetworkInterface network_interface:
         :return:
         """
-        logger.info("Deleting Interface {}...".format(vm_name))
-        self.network_service.delete_nics(network_client=network_client,
+        logger.info("Deleting Interface {}...".format(network_interface.name))
+        self._run_delete_command(partial(self.network_service.delete_nic,
+                                         network_client=network_client,
                                          group_name=group_name,
-                                         interface_names=interface_names)
+                                         interface_name=network_interface.name),
+                                 logger=logger)
+
+        public_ip_name = self._get_public_ip_name(network_interface)
+        if public_ip_name is not None:
+            logger.info("Deleting Public IP {}...".format(public_ip_name))
+            self._run_delete_command(partial(self.network_service.delete_ip,
+                                             network_client=network_client,
+                                             group_name=group_name,
+                                             ip_name=public_ip_name),
+                                     logger=logger)
+
+    @staticmethod
+    def _get_public_ip_name(network_interface):
+        """
+        :param azure.mgmt.network.models.NetworkInterface network_interface:
+        :return: name of the Public IP attached to the NIC or None
+        :rtype: str
+        """
+        if len(network_interface.ip_configurations) > 0 and \
+                hasattr(network_interface.ip_configurations[0], 'public_ip_address') and \
+                network_interface.ip_configurations[0].public_ip_address is not None:
+            return network_interface.ip_configurations[0].public_ip_address.id.split('/')[-1]
 
-    def _delete_public_ip(self, network_client, group_name, vm_name, logger, public_ip_names):
-        """Delete Public IP resource on the azure for given VM
+    def _run_delete_command(self, command, logger):
+        """Run delete command ignoring the error if the resource was already deleted
 
-        :param network_client: azure.mgmt.network.NetworkManagementClient instance
-        :param group_name: (str) The name of the resource group
-        :param vm_name: (str) the same as ip_name and interface_name
-        :param logger: logging.Logger instance
+        :param command: function without arguments that deletes Azure resource
+        :param logging.Logger logger:
         :return:
         """
-        logger.info("Deleting Public IP {}...".format(vm_name))
-        self.network_service.delete_ips(network_client=network_client,
-                                        group_name=group_name,
-                                        public_ip_names=public_ip_names)
+        try:
+            command()
+        except CloudError as e:
+            if e.response.reason == "Not Found":
+                logger.info('Deleting Azure Resource Not Found Exception:', exc_info=1)
+                logger.info(e.message)
+            else:
+                logger.exception('Deleting Azure VM Exception:')
+                raise
+        except Exception:
+            logger.exception('Deleting Azure VM Exception:')
+            raise
 
     def delete(self, compute_client, network_client, storage_client, group_name, vm_name, logger, cloudshell_session):
         """Delete VM and all related resources
 
+        VM is deleted first, after that its NICs (each one followed by its Public IP) and the disk
+        don't depend on each other and are deleted at the same time. Teardown deletes all apps of the sandbox
+        at the same time, so the VM, its NICs and the NSG artifacts are taken from a shared snapshot of the group
         :param azure.mgmt.compute.ComputeManagementClient compute_client:
         :param azure.mgmt.network.NetworkManagementClient network_client:
         :param azure.mgmt.storage.StorageManagementClient storage_client:
@@ -266,84 +368,226 @@ class DeleteAzureVMOperation(object):
         :param CloudShellAPISession cloudshell_session:
         :return:
         """
+        inventory = self._get_shared_inventory(compute_client=compute_client,
+                                               network_client=network_client,
+                                               group_name=group_name,
+                                               vm_name=vm_name,
+                                               logger=logger)
+        if inventory is not None:
+            vm = inventory.get_virtual_machine(vm_name)
+        else:
+            vm = self.vm_service.get_vm(compute_management_client=compute_client,
+                                        group_name=group_name,
+                                        vm_name=vm_name)
+
+        network_interfaces = self.task_executor.map(partial(self._get_network_interface,
+                                                            network_client=network_client,
+                                                            group_name=group_name,
+                                                            inventory=inventory),
+                                                    vm.network_profile.network_interfaces)
 
-        vm = compute_client.virtual_machines.get(group_name, vm_name)
-        network_interface_names = [nir.id.split('/')[-1] for nir in vm.network_profile.network_interfaces]
-        network_interfaces = [network_client.network_interfaces.get(group_name, nin) for nin in network_interface_names]
-        public_ip_names = [ni.ip_configurations[0].public_ip_address.id.split('/')[-1] for ni in network_interfaces
-                           if len(ni.ip_configurations) > 0 and
-                           hasattr(ni.ip_configurations[0], 'public_ip_address') and
-                           ni.ip_configurations[0].public_ip_address is not None]
         private_ips = [nic.ip_configurations[0].private_ip_address for nic in network_interfaces
                        if
                        is_static_allocation(nic.ip_configurations[0].private_ip_allocation_method)]
 
-        delete_vm_command = partial(self._delete_vm,
-                                    compute_client=compute_client,
-                                    group_name=group_name,
-                                    vm_name=vm_name,
-                                    logger=logger)
+        # 1. delete VM, NICs and disk can't be deleted while they are attached to it
+        self._run_delete_command(partial(self._delete_vm,
+                                         compute_client=compute_client,
+                                         group_name=group_name,
+                                         vm_name=vm_name,
+                                         logger=logger),
+                                 logger=logger)
+
+        # 2. delete NICs with their Public IPs and the disk (async)
+        delete_results = [self.task_executor.submit(self._delete_nic_with_public_ip,
+                                                    network_client=network_client,
+                                                    group_name=group_name,
+                                                    logger=logger,
+                                                    network_interface=network_interface)
+                          for network_interface in network_interfaces]
+
+        delete_results.append(self.task_executor.submit(self._run_delete_command,
+                                                        partial(self._delete_vm_disk,
+                                                                logger=logger,
+                                                                storage_client=storage_client,
+                                                                compute_client=compute_client,
+                                                                group_name=group_name,
+                                                                vm=vm),
+                                                        logger=logger))
+
+        # wait for all deletions before raising the error, so nothing is left running in the background
+        first_error = None
+        for delete_result in delete_results:
+            try:
+                delete_result.get()
+            except Exception:
+                logger.exception("Failed to delete VM {} resources:".format(vm_name))
+                first_error = first_error or sys.exc_info()
 
-        delete_nics_command = partial(self._delete_nics,
-                                      network_client=network_client,
-                                      group_name=group_name,
-                                      vm_name=vm_name,
-                                      logger=logger,
-                                      interface_names=network_interface_names)
+        if first_error is not None:
+            raise first_error[0], first_error[1], first_error[2]
 
-        delete_public_ip_command = partial(self._delete_public_ip,
-                                           network_client=network_client,
-                                           group_name=group_name,
-                                           vm_name=vm_name,
-                                           logger=logger,
-                                           public_ip_names=public_ip_names)
+        # private ip addresses that were statically allocated are released together with the ones of other VMs
+        self.ip_release_coalescer.release_ips(logger, cloudshell_session, group_name, private_ips)
 
-        commands = [delete_vm_command,
-                    delete_nics_command,
-                    delete_public_ip_command]
+        self.network_service.delete_nsg_artifacts_associated_with_vm(
+            network_client=network_client,
+            resource_group_name=group_name,
+            vm_name=vm_name,
+            nsg_artifacts_index=inventory.get_nsg_artifacts_index() if inventory is not None else None)
 
-        try:
-            vm = self.vm_service.get_vm(compute_management_client=compute_client,
-                                        group_name=group_name,
-                                        vm_name=vm_name)
+        # the deleted VM must not be returned from the shared snapshot
+        self.inventory_provider.invalidate(group_name)
 
-        except CloudError:
-            logger.warning("Can't get VM to retrieve its VHD URL", exc_info=1)
+    def _get_shared_inventory(self, compute_client, network_client, group_name, vm_name, logger):
+        """Get shared snapshot of the resource group if the VM is in it
 
-        else:
-            delete_vhd_disk_command = partial(self._delete_vm_disk,
-                                              logger=logger,
-                                              storage_client=storage_client,
-                                              compute_client=compute_client,
-                                              group_name=group_name,
-                                              vm=vm)
+        :param azure.mgmt.compute.ComputeManagementClient compute_client:
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param str group_name: The name of the resource group
+        :param str vm_name:
+        :param logging.Logger logger:
+        :return: snapshot or None if the VM was created after it was taken (so were its NICs and NSG artifacts)
+        :rtype: cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventory
+        """
+        try:
+            inventory = self.inventory_provider.get_inventory(compute_client=compute_client,
+                                                              network_client=network_client,
+                                                              group_name=group_name,
+                                                              max_age=ResourceGroupInventoryProvider.SHARED_MAX_AGE)
+            if inventory.get_virtual_machine(vm_name) is not None:
+                return inventory
+        except Exception:
+            logger.warning("Failed to list resources of the group {}, VM {} resources will be read per "
+                           "resource".format(group_name, vm_name), exc_info=1)
+
+    @staticmethod
+    def _get_network_interface(nic_reference, network_client, group_name, inventory=None):
+        """
+        :param azure.mgmt.compute.models.NetworkInterfaceReference nic_reference:
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param str group_name: The name of the resource group
+        :param cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventory inventory:
+            snapshot of the resource group, NIC is read from Azure if it is not in it
+        :rtype: azure.mgmt.network.models.NetworkInterface
+        """
+        nic = inventory.get_network_interface(nic_reference.id) if inventory is not None else None
+        if nic is None:
+            nic = network_client.network_interfaces.get(group_name, nic_reference.id.split('/')[-1])
+        return nic
+
+    def delete_vms(self, compute_client, network_client, storage_client, group_name, vm_names, logger,
+                   cloudshell_session):
+        """Delete many VMs of the resource group and all their related resources
+
+        The resource group is inventoried once: VMs, NICs and NSGs are listed instead of being read per VM.
+        All VMs are deleted at the same time, then all their NICs (each one followed by its Public IP) and disks,
+        and at the end NSG artifacts of all VMs are removed with a single update per NSG
+        :param azure.mgmt.compute.ComputeManagementClient compute_client:
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param azure.mgmt.storage.StorageManagementClient storage_client:
+        :param str group_name: The name of the resource group
+        :param list[str] vm_names: names of the VMs to delete
+        :param logging.Logger logger:
+        :param CloudShellAPISession cloudshell_session:
+        :rtype: list[DeleteInstanceActionResult]
+        """
+        # 1. inventory the resource group
+        inventory = self.inventory_provider.get_inventory(compute_client=compute_client,
+                                                          network_client=network_client,
+                                                          group_name=group_name)
+        vms_res = self.task_executor.submit(inventory.get_virtual_machines)
+        nics_res = self.task_executor.submit(inventory.get_network_interfaces)
+        nsg_artifacts_index = inventory.get_nsg_artifacts_index()
+        vms_res.get()
+        nics_res.get()
+
+        errors = {}
+        vms = []
+        for vm_name in vm_names:
+            vm = inventory.get_virtual_machine(vm_name)
+            if vm is not None:
+                vms.append(vm)
+            else:
+                logger.info("VM {} was not found in the resource group {}".format(vm_name, group_name))
+
+        # 2. delete all VMs (async)
+        delete_vm_results = [(vm, self.task_executor.submit(self._run_delete_command,
+                                                            partial(self._delete_vm,
+                                                                    compute_client=compute_client,
+                                                                    group_name=group_name,
+                                                                    vm_name=vm.name,
+                                                                    logger=logger),
+                                                            logger=logger))
+                             for vm in vms]
+
+        deleted_vms = []
+        for vm, delete_vm_result in delete_vm_results:
+            try:
+                delete_vm_result.get()
+                deleted_vms.append(vm)
+            except Exception as e:
+                errors[vm.name] = e.message
+
+        # 3. delete NICs with their Public IPs and disks of all deleted VMs (async)
+        delete_results = []
+        private_ips_by_vm = {}
+        for vm in deleted_vms:
+            network_interfaces = inventory.get_vm_network_interfaces(vm)
+
+            private_ips_by_vm[vm.name] = [
+                nic.ip_configurations[0].private_ip_address for nic in network_interfaces
+                if is_static_allocation(nic.ip_configurations[0].private_ip_allocation_method)]
+
+            delete_results.extend((vm.name, self.task_executor.submit(self._delete_nic_with_public_ip,
+                                                                      network_client=network_client,
+                                                                      group_name=group_name,
+                                                                      logger=logger,
+                                                                      network_interface=network_interface))
+                                  for network_interface in network_interfaces)
+
+            delete_results.append((vm.name, self.task_executor.submit(self._run_delete_command,
+                                                                      partial(self._delete_vm_disk,
+                                                                              logger=logger,
+                                                                              storage_client=storage_client,
+                                                                              compute_client=compute_client,
+                                                                              group_name=group_name,
+                                                                              vm=vm),
+                                                                      logger=logger)))
+
+        for vm_name, delete_result in delete_results:
+            try:
+                delete_result.get()
+            except Exception as e:
+                errors.setdefault(vm_name, e.message)
 
-            commands.append(delete_vhd_disk_command)
+        # snapshot of the resource group doesn't reflect the deleted resources anymore
+        self.inventory_provider.invalidate(group_name)
 
-        for command in commands:
-            try:
-                command()
-            except CloudError as e:
-                if e.response.reason == "Not Found":
-                    logger.info('Deleting Azure Resource Not Found Exception:', exc_info=1)
-                    logger.info(e.message)
-                else:
-                    logger.exception('Deleting Azure VM Exception:')
-                    raise
-            except Exception:
-                logger.exception('Deleting Azure VM Exception:')
-                raise
+        # 4. remove NSG artifacts of all deleted VMs and release their static private IPs
+        completed_vm_names = [vm_name for vm_name in vm_names if vm_name not in errors]
+        private_ips = [private_ip for vm_name in completed_vm_names
+                       for private_ip in private_ips_by_vm.get(vm_name, [])]
 
-        self.network_service.delete_nsg_artifacts_associated_with_vm(
-            network_client=network_client,
-            resource_group_name=group_name,
-            vm_name=vm_name)
+        self.ip_release_coalescer.release_ips(logger, cloudshell_session, group_name, private_ips)
 
-        # try releasing private ip address that were statically allocated
         try:
-            if private_ips:
-                self.ip_service.release_ips(logger, cloudshell_session, group_name, private_ips)
-        except:
-            logger.warning('Error while trying to release private ips: {}. Error: {}'.format(','.join(private_ips),
-                                                                                             traceback.format_exc()))
-
+            self.network_service.delete_nsg_artifacts_associated_with_vms(network_client=network_client,
+                                                                          resource_group_name=group_name,
+                                                                          vm_names=completed_vm_names,
+                                                                          nsg_artifacts_index=nsg_artifacts_index)
+        except Exception as e:
+            logger.exception('Deleting NSG artifacts Exception:')
+            for vm_name in completed_vm_names:
+                errors[vm_name] = e.message
+
+        return [self._create_delete_instance_result(vm_name=vm_name, error=errors.get(vm_name))
+                for vm_name in vm_names]
+
+    @staticmethod
+    def _create_delete_instance_result(vm_name, error=None):
+        result = DeleteInstanceActionResult()
+        result.vmName = vm_name
+        result.success = error is None
+        result.error = error or ''
+        return result
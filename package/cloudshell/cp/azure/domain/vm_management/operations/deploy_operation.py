@@ -1,4 +1,5 @@
 import re
+from functools import partial
 
 from azure.mgmt.compute.models import OperatingSystemTypes
 from azure.mgmt.network.models import SecurityRuleAccess
@@ -39,7 +40,8 @@ class DeployAzureVMOperation(object):
                  generic_lock_provider,
                  image_data_factory,
                  vm_details_provider,
-                 ip_service):
+                 ip_release_coalescer,
+                 task_executor):
         """
 
         :param cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService vm_service:
@@ -55,7 +57,8 @@ class DeployAzureVMOperation(object):
         :param cloudshell.cp.azure.domain.services.lock_service.GenericLockProvider generic_lock_provider:
         :param cloudshell.cp.azure.domain.services.image_data.ImageDataFactory image_data_factory:
         :param cloudshell.cp.azure.domain.common.vm_details_provider.VmDetailsProvider vm_details_provider:
-        :param cloudshell.cp.azure.domain.services.ip_service.IpService ip_service:
+        :param cloudshell.cp.azure.domain.services.ip_release_coalescer.IpReleaseCoalescer ip_release_coalescer:
+        :param cloudshell.cp.azure.domain.services.task_executor.TaskExecutorService task_executor:
         :return:
         """
 
@@ -72,7 +75,8 @@ class DeployAzureVMOperation(object):
         self.vm_extension_service = vm_extension_service
         self.cancellation_service = cancellation_service
         self.vm_details_provider = vm_details_provider
-        self.ip_service = ip_service
+        self.ip_release_coalescer = ip_release_coalescer
+        self.task_executor = task_executor
 
     def deploy_from_custom_image(self, deployment_model,
                                  cloud_provider_model,
@@ -440,29 +444,41 @@ class DeployAzureVMOperation(object):
                                   group_name=group_name,
                                   vm_name=vm_name)
 
-        for nic_request in nic_requests:
-            ip_name = get_ip_from_interface_name(nic_request.interface_name)
-            logger.info("Delete NIC {} ".format(nic_request.interface_name))
-            self.network_service.delete_nic(network_client=network_client,
-                                            group_name=group_name,
-                                            interface_name=nic_request.interface_name)
-
-            logger.info("Delete IP {} ".format(ip_name))
-            self.network_service.delete_ip(network_client=network_client,
-                                           group_name=group_name,
-                                           ip_name=ip_name)
+        # NICs don't depend on each other, so they are deleted in the background
+        self.task_executor.map(partial(self._rollback_nic,
+                                       logger=logger,
+                                       network_client=network_client,
+                                       group_name=group_name),
+                               nic_requests)
 
         if is_static_allocation(private_ip_allocation_method):
-            try:
-                self.ip_service.release_ips(logger, cloudshell_session, reservation_id, allocated_private_ips)
-            except:
-                logger.exception('Failed to released ips from pool')
+            self.ip_release_coalescer.release_ips(logger, cloudshell_session, reservation_id, allocated_private_ips)
 
         self.network_service.delete_nsg_artifacts_associated_with_vm(
             network_client=network_client,
             resource_group_name=group_name,
             vm_name=vm_name)
 
+    def _rollback_nic(self, nic_request, logger, network_client, group_name):
+        """Delete NIC and its public IP created by Deploy VM operation
+
+        :param NicRequest nic_request:
+        :param logging.Logger logger:
+        :param network_client: azure.mgmt.network.network_management_client.NetworkManagementClient instance
+        :param str group_name: resource group name (reservation id)
+        :return:
+        """
+        ip_name = get_ip_from_interface_name(nic_request.interface_name)
+        logger.info("Delete NIC {} ".format(nic_request.interface_name))
+        self.network_service.delete_nic(network_client=network_client,
+                                        group_name=group_name,
+                                        interface_name=nic_request.interface_name)
+
+        logger.info("Delete IP {} ".format(ip_name))
+        self.network_service.delete_ip(network_client=network_client,
+                                       group_name=group_name,
+                                       ip_name=ip_name)
+
     def _get_public_ip_address(self, network_client, azure_vm_deployment_model, group_name, ip_name,
                                cancellation_context, logger):
         """
@@ -648,7 +664,7 @@ class DeployAzureVMOperation(object):
             storage_service=self.storage_service,
             key_pair_service=self.key_pair_service,
             storage_client=storage_client,
-            group_name=data.group_name,
+            group_name=data.storage_group_name,
             storage_name=data.storage_account_name)
 
         self.cancellation_service.check_if_cancelled(cancellation_context)
@@ -889,8 +905,10 @@ class DeployAzureVMOperation(object):
 
         logger.warn('interfaces:' + str(len(data.nic_requests)))
         logger.info("Retrieve sandbox storage account name by resource group {}".format(data.group_name))
-        data.storage_account_name = self.storage_service.get_sandbox_storage_account_name(storage_client=storage_client,
-                                                                                          group_name=data.group_name)
+        data.storage_group_name, data.storage_account_name = self.storage_service.get_sandbox_storage_account(
+            storage_client=storage_client,
+            group_name=data.group_name,
+            region=cloud_provider_model.region)
 
         data.tags = self.tags_service.get_tags(vm_name=data.vm_name, reservation=reservation)
         logger.info("Tags for the VM {}".format(data.tags))
@@ -906,6 +924,7 @@ class DeployAzureVMOperation(object):
             self.computer_name = ''  # type: str
             self.vm_name = ''  # type: str
             self.vm_size = ''  # type: str
+            self.storage_group_name = ''  # type: str
             self.storage_account_name = ''  # type: str
             self.tags = {}  # type: dict
             self.image_model = None  # type: ImageDataModelBase
@@ -1,27 +1,43 @@
+from cloudshell.cp.azure.domain.services.power_operation_tracker import PowerOperation
+from cloudshell.cp.azure.models.network_actions_models import PowerActionResult
+
+
 class PowerAzureVMOperation(object):
-    def __init__(self, vm_service, vm_custom_params_extractor):
+    POWER_ON = "PowerOn"
+    POWER_OFF = "PowerOff"
+    # live status of the resource after the power operation succeeded
+    LIVE_STATUSES = {POWER_ON: "Online",
+                     POWER_OFF: "Offline"}
+    ERROR_LIVE_STATUS = "Error"
+
+    def __init__(self, vm_service, vm_custom_params_extractor, task_executor, power_operation_tracker,
+                 vm_state_service):
         """
         :param cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService vm_service:
         :param cloudshell.cp.azure.common.parsers.custom_param_extractor.VmCustomParamsExtractor vm_custom_params_extractor:
+        :param cloudshell.cp.azure.domain.services.task_executor.TaskExecutorService task_executor:
+        :param cloudshell.cp.azure.domain.services.power_operation_tracker.PowerOperationTracker
+            power_operation_tracker:
+        :param cloudshell.cp.azure.domain.services.vm_state_service.VmStateService vm_state_service:
         :return:
         """
         self.vm_service = vm_service
         self.vm_custom_params_extractor = vm_custom_params_extractor
+        self.task_executor = task_executor
+        self.power_operation_tracker = power_operation_tracker
+        self.vm_state_service = vm_state_service
 
-    def power_on(self, compute_client, resource_group_name, resource_full_name, data_holder, cloudshell_session):
-        """Power on Azure VM instance
-
-        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_client:
-        :param str resource_group_name: The name of the resource group.
+    def _validate_app_is_fully_deployed(self, resource_full_name, data_holder, cloudshell_session):
+        """
         :param str resource_full_name: full resource name on the CloudShell
         :param cloudshell.cp.azure.common.deploy_data_holder.DeployDataHolder data_holder:
         :param cloudshell.api.cloudshell_api.CloudShellAPISession cloudshell_session:
-        :return
+        :return:
         """
-        vm_name = data_holder.name
-
+        # VM details can be omitted in the bulk power requests
+        vm_details = getattr(data_holder, "vmdetails", None)
         extension_time_out = self.vm_custom_params_extractor.get_custom_param_value(
-            data_holder.vmdetails.vmCustomParams,
+            getattr(vm_details, "vmCustomParams", None) or [],
             "extension_time_out")
 
         # todo: move to some generic convert to boolean function
@@ -31,8 +47,25 @@ class PowerAzureVMOperation(object):
             raise Exception("Partially deployed app: VM Custom Script Extension failed to "
                             "compete within the specified timeout")
 
-        self.vm_service.start_vm(compute_client, resource_group_name, vm_name)
+    def power_on(self, compute_client, resource_group_name, resource_full_name, data_holder, cloudshell_session):
+        """Power on Azure VM instance
+
+        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_client:
+        :param str resource_group_name: The name of the resource group.
+        :param str resource_full_name: full resource name on the CloudShell
+        :param cloudshell.cp.azure.common.deploy_data_holder.DeployDataHolder data_holder:
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession cloudshell_session:
+        :return
+        """
+        vm_name = data_holder.name
 
+        self._validate_app_is_fully_deployed(resource_full_name=resource_full_name,
+                                             data_holder=data_holder,
+                                             cloudshell_session=cloudshell_session)
+
+        self.vm_service.start_vm(compute_client, resource_group_name, vm_name)
+        # power state of the VM was changed
+        self.vm_state_service.invalidate(resource_group_name)
 
     def power_off(self, compute_client, resource_group_name, vm_name):
         """Power off Azure VM instance
@@ -43,3 +76,221 @@ class PowerAzureVMOperation(object):
         :return
         """
         self.vm_service.stop_vm(compute_client, resource_group_name, vm_name)
+        # power state of the VM was changed
+        self.vm_state_service.invalidate(resource_group_name)
+
+    def power_on_vms(self, compute_client, resource_group_name, data_holders, cloudshell_session, logger, wait=True,
+                     timeout=None):
+        """Power on many Azure VM instances at the same time
+
+        Unlike the single power on command, the bulk command is not a CloudShell "power" command, so CloudShell
+        doesn't change the state of the resources. Live status of every resource is set here once its operation
+        is finished: "Online" on success and "Error" on failure. For the operations that are still running when
+        the command returns, it is set by get_power_operations_status once they are finished
+
+        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_client:
+        :param str resource_group_name: The name of the resource group.
+        :param list[cloudshell.cp.azure.common.deploy_data_holder.DeployDataHolder] data_holders: deployed apps,
+            deployed app name is used as the full resource name on the CloudShell
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession cloudshell_session:
+        :param logging.Logger logger:
+        :param bool wait: whether wait for all VMs to start or return once the operations were accepted by Azure
+        :param int timeout: max time (in seconds) to wait for the VMs, operations that are still running after it
+            are returned in the "Accepted" status
+        :rtype: list[PowerActionResult]
+        """
+        vm_names = []
+        errors = {}
+
+        for data_holder in data_holders:
+            vm_names.append(data_holder.name)
+            try:
+                self._validate_app_is_fully_deployed(resource_full_name=data_holder.name,
+                                                     data_holder=data_holder,
+                                                     cloudshell_session=cloudshell_session)
+            except Exception as e:
+                errors[data_holder.name] = e.message
+
+        return self._run_power_operations(action=self.POWER_ON,
+                                          begin_operation=self.vm_service.begin_start_vm,
+                                          compute_client=compute_client,
+                                          resource_group_name=resource_group_name,
+                                          vm_names=vm_names,
+                                          errors=errors,
+                                          cloudshell_session=cloudshell_session,
+                                          logger=logger,
+                                          wait=wait,
+                                          timeout=timeout)
+
+    def power_off_vms(self, compute_client, resource_group_name, vm_names, cloudshell_session, logger, wait=True,
+                      timeout=None):
+        """Power off (deallocate) many Azure VM instances at the same time
+
+        Live status of the resources is set in the same way as for power_on_vms ("Offline" on success)
+
+        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_client:
+        :param str resource_group_name: The name of the resource group.
+        :param list[str] vm_names: names of the virtual machines, VM name is used as the full resource name
+            on the CloudShell
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession cloudshell_session:
+        :param logging.Logger logger:
+        :param bool wait: whether wait for all VMs to stop or return once the operations were accepted by Azure
+        :param int timeout: max time (in seconds) to wait for the VMs, operations that are still running after it
+            are returned in the "Accepted" status
+        :rtype: list[PowerActionResult]
+        """
+        return self._run_power_operations(action=self.POWER_OFF,
+                                          begin_operation=self.vm_service.begin_deallocate_vm,
+                                          compute_client=compute_client,
+                                          resource_group_name=resource_group_name,
+                                          vm_names=vm_names,
+                                          errors={},
+                                          cloudshell_session=cloudshell_session,
+                                          logger=logger,
+                                          wait=wait,
+                                          timeout=timeout)
+
+    def get_power_operations_status(self, resource_group_name, vm_names, logger, compute_client=None,
+                                    network_client=None, cloudshell_session=None):
+        """Get status of the last power operation of every VM
+
+        :param str resource_group_name: The name of the resource group.
+        :param list[str] vm_names: names of the virtual machines
+        :param logging.Logger logger:
+        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_client: if passed
+            together with the network client, current power and provisioning states of the VMs are added
+            to the results
+        :param azure.mgmt.network.NetworkManagementClient network_client:
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession cloudshell_session: if passed, live status
+            of the resources with finished operations is updated
+        :rtype: list[PowerActionResult]
+        """
+        vm_states = {}
+        if compute_client is not None and network_client is not None:
+            vm_states = self.vm_state_service.get_vm_states(compute_client=compute_client,
+                                                            network_client=network_client,
+                                                            group_name=resource_group_name,
+                                                            logger=logger,
+                                                            vm_names=vm_names)
+        results = []
+        for vm_name in vm_names:
+            operation = self.power_operation_tracker.get_operation(group_name=resource_group_name, vm_name=vm_name)
+            if operation is None:
+                result = self._create_power_action_result(vm_name=vm_name,
+                                                          status='',
+                                                          error="No power operation found for the VM")
+            else:
+                result = self._create_power_action_result(vm_name=vm_name,
+                                                          status=operation.status,
+                                                          error=operation.error)
+                if cloudshell_session is not None:
+                    self._update_resource_live_status(cloudshell_session=cloudshell_session,
+                                                      action=operation.action,
+                                                      result=result,
+                                                      logger=logger)
+
+            vm_state = vm_states.get(vm_name)
+            if vm_state is not None:
+                result.powerState = vm_state.power_state or ''
+                result.provisioningState = vm_state.provisioning_state or ''
+
+            results.append(result)
+        return results
+
+    def _run_power_operations(self, action, begin_operation, compute_client, resource_group_name, vm_names, errors,
+                              cloudshell_session, logger, wait, timeout):
+        """Start the power operation on all VMs concurrently and track them with the shared poller
+
+        :param str action: "PowerOn" or "PowerOff"
+        :param begin_operation: VM service function that starts the operation and returns its status URL
+        :param azure.mgmt.compute.compute_management_client.ComputeManagementClient compute_client:
+        :param str resource_group_name: The name of the resource group.
+        :param list[str] vm_names: names of the virtual machines
+        :param dict errors: errors by the VM name for the VMs that should be skipped, their live status
+            is expected to be already set by the caller
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession cloudshell_session:
+        :param logging.Logger logger:
+        :param bool wait: whether wait for all operations to finish
+        :param int timeout: max time (in seconds) to wait for the operations
+        :rtype: list[PowerActionResult]
+        """
+        skipped_vm_names = set(errors)
+        begin_results = [(vm_name, self.task_executor.submit(begin_operation,
+                                                             compute_management_client=compute_client,
+                                                             group_name=resource_group_name,
+                                                             vm_name=vm_name))
+                         for vm_name in vm_names if vm_name not in errors]
+
+        operations = {}
+        for vm_name, begin_result in begin_results:
+            try:
+                status_url = begin_result.get()
+            except Exception as e:
+                logger.exception("Failed to start {} operation for the VM {}:".format(action, vm_name))
+                errors[vm_name] = e.message
+                continue
+
+            operations[vm_name] = self.power_operation_tracker.track(compute_client=compute_client,
+                                                                     group_name=resource_group_name,
+                                                                     vm_name=vm_name,
+                                                                     action=action,
+                                                                     status_url=status_url,
+                                                                     logger=logger)
+
+        logger.info("{} operation was accepted for the VMs: {}".format(action, ', '.join(operations)))
+        # power states of the VMs are going to change
+        self.vm_state_service.invalidate(resource_group_name)
+
+        if wait and not self.power_operation_tracker.wait(operations.values(), timeout=timeout):
+            logger.warning("Not all {} operations were finished within {} seconds".format(action, timeout))
+
+        results = []
+        for vm_name in vm_names:
+            if vm_name in errors:
+                results.append(self._create_power_action_result(vm_name=vm_name,
+                                                                status=PowerOperation.FAILED,
+                                                                error=errors[vm_name]))
+            else:
+                results.append(self._create_power_action_result(vm_name=vm_name,
+                                                                status=operations[vm_name].status,
+                                                                error=operations[vm_name].error))
+
+        for result in results:
+            if result.vmName in skipped_vm_names:
+                continue
+            self._update_resource_live_status(cloudshell_session=cloudshell_session,
+                                              action=action,
+                                              result=result,
+                                              logger=logger)
+        return results
+
+    def _update_resource_live_status(self, cloudshell_session, action, result, logger):
+        """Set live status of the resource once its power operation is finished
+
+        :param cloudshell.api.cloudshell_api.CloudShellAPISession cloudshell_session:
+        :param str action: "PowerOn" or "PowerOff"
+        :param PowerActionResult result: result of the operation, VM name is the full resource name
+        :param logging.Logger logger:
+        :return:
+        """
+        if result.status == PowerOperation.SUCCEEDED:
+            live_status, additional_info = self.LIVE_STATUSES[action], ''
+        elif result.status == PowerOperation.FAILED:
+            live_status, additional_info = self.ERROR_LIVE_STATUS, result.error
+        else:
+            return
+
+        try:
+            cloudshell_session.SetResourceLiveStatus(result.vmName, live_status, additional_info)
+        except Exception:
+            if logger is not None:
+                logger.warning("Failed to set live status of the resource {}".format(result.vmName), exc_info=1)
+
+    @staticmethod
+    def _create_power_action_result(vm_name, status, error=None):
+        result = PowerActionResult()
+        result.vmName = vm_name
+        result.status = status
+        result.success = status in (PowerOperation.ACCEPTED, PowerOperation.SUCCEEDED)
+        result.error = error or ''
+        return result
@@ -1,13 +1,25 @@
+from cloudshell.api.cloudshell_api import AttributeNameValue, ResourceAttributesUpdateRequest
+
+from cloudshell.cp.azure.domain.services.resource_group_inventory import ResourceGroupInventoryProvider
+from cloudshell.cp.azure.domain.services.virtual_machine_service import VirtualMachineService
+from cloudshell.cp.azure.models.network_actions_models import RefreshIpActionResult
+
+
 class RefreshIPOperation(object):
-    def __init__(self, vm_service, resource_id_parser):
+    def __init__(self, vm_service, resource_id_parser, inventory_provider, vm_state_service):
         """
 
         :param vm_service: cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService
         :param resource_id_parser: cloudshell.cp.azure.common.parsers.azure_model_parser.AzureModelsParser
+        :param inventory_provider:
+            cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventoryProvider
+        :param vm_state_service: cloudshell.cp.azure.domain.services.vm_state_service.VmStateService
         :return:
         """
         self.vm_service = vm_service
         self.resource_id_parser = resource_id_parser
+        self.inventory_provider = inventory_provider
+        self.vm_state_service = vm_state_service
 
     def refresh_ip(self, cloudshell_session, compute_client, network_client, resource_group_name, vm_name,
                    private_ip_on_resource, public_ip_on_resource_attr_tuple, resource_fullname, logger):
@@ -31,30 +43,23 @@ class RefreshIPOperation(object):
         public_ip_key = public_ip_on_resource_attr_tuple[0]
         public_ip_on_resource = public_ip_on_resource_attr_tuple[1]
 
-        vm = self.vm_service.get_active_vm(
-            compute_management_client=compute_client,
+        # refresh IP runs for all apps of the sandbox at the same time, so they share a single snapshot of the group
+        vm = self.vm_state_service.get_active_vm(
+            compute_client=compute_client,
+            network_client=network_client,
             group_name=resource_group_name,
             vm_name=vm_name)
 
-        # find the primary nic
-        primary_nic_ref = next(iter(filter(lambda x: x.primary, vm.network_profile.network_interfaces)), None)
-        nic_reference = primary_nic_ref if primary_nic_ref else vm.network_profile.network_interfaces[0]
-        nic_name = self.resource_id_parser.get_name_from_resource_id(nic_reference.id)
-        logger.info("Retrieving NIC {} for VM {}".format(nic_name, vm_name))
-        nic = network_client.network_interfaces.get(resource_group_name, nic_name)
-
-        vm_ip_configuration = nic.ip_configurations[0]
-        private_ip_on_azure = vm_ip_configuration.private_ip_address
-        public_ip_reference = vm_ip_configuration.public_ip_address
+        inventory = self.inventory_provider.get_inventory(compute_client=compute_client,
+                                                          network_client=network_client,
+                                                          group_name=resource_group_name,
+                                                          max_age=ResourceGroupInventoryProvider.SHARED_MAX_AGE)
 
-        if public_ip_reference is None:
-            logger.info("There is no Public IP attached to VM {}".format(vm_name))
-            public_ip_on_azure = ""
-        else:
-            public_ip_name = self.resource_id_parser.get_name_from_resource_id(public_ip_reference.id)
-            logger.info("Retrieving Public IP {} for VM {}".format(public_ip_name, vm_name))
-            pub_ip_addr = network_client.public_ip_addresses.get(resource_group_name, public_ip_name)
-            public_ip_on_azure = pub_ip_addr.ip_address
+        private_ip_on_azure, public_ip_on_azure = self._get_vm_ips(network_client=network_client,
+                                                                   resource_group_name=resource_group_name,
+                                                                   vm=vm,
+                                                                   logger=logger,
+                                                                   inventory=inventory)
 
         logger.info("Public IP on Azure: '{}'".format(public_ip_on_azure))
         logger.info("Public IP on CloudShell: '{}'".format(public_ip_on_resource))
@@ -69,3 +74,124 @@ class RefreshIPOperation(object):
         if private_ip_on_azure != private_ip_on_resource:
             logger.info("Updating Private IP on the resource to '{}' ...".format(private_ip_on_azure))
             cloudshell_session.UpdateResourceAddress(resource_fullname, private_ip_on_azure)
+
+    def refresh_ips(self, cloudshell_session, compute_client, network_client, resource_group_name,
+                    refresh_ip_requests, logger):
+        """Refresh Public and Private IPs on many CloudShell resources from a single snapshot of the resource group
+
+        VMs, NICs and public IPs of the resource group are listed once. Only the changed values are pushed
+        to the CloudShell: all public IP attributes with a single SetAttributesValues call and the private IPs
+        with an UpdateResourceAddress call per changed resource (there is no bulk API for the resource address)
+
+        :param cloudshell_session: cloudshell.api.cloudshell_api.CloudShellAPISession instance
+        :param compute_client: azure.mgmt.compute.ComputeManagementClient instance
+        :param network_client: azure.mgmt.network.NetworkManagementClient instance
+        :param str resource_group_name: The name of the resource group
+        :param list[cloudshell.cp.azure.models.refresh_ip_request.RefreshIpRequest] refresh_ip_requests:
+        :param logging.Logger logger:
+        :rtype: list[RefreshIpActionResult]
+        """
+        inventory = self.inventory_provider.get_inventory(compute_client=compute_client,
+                                                          network_client=network_client,
+                                                          group_name=resource_group_name,
+                                                          max_age=ResourceGroupInventoryProvider.SHARED_MAX_AGE)
+        errors = {}
+        attribute_updates = []
+        address_updates = []
+
+        for request in refresh_ip_requests:
+            try:
+                vm = inventory.get_virtual_machine(request.vm_name)
+                if vm is None or vm.provisioning_state != VirtualMachineService.SUCCEEDED_PROVISIONING_STATE:
+                    # VM could be created or change its state after the resource group was listed
+                    vm = self.vm_service.get_active_vm(compute_management_client=compute_client,
+                                                       group_name=resource_group_name,
+                                                       vm_name=request.vm_name)
+
+                private_ip_on_azure, public_ip_on_azure = self._get_vm_ips(network_client=network_client,
+                                                                           resource_group_name=resource_group_name,
+                                                                           vm=vm,
+                                                                           logger=logger,
+                                                                           inventory=inventory)
+            except Exception as e:
+                logger.exception("Failed to get IPs of the VM {}:".format(request.vm_name))
+                errors[request.vm_name] = e.message
+                continue
+
+            public_ip_key, public_ip_on_resource = request.public_ip_on_resource_attr_tuple
+
+            if public_ip_on_azure != public_ip_on_resource:
+                logger.info("Public IP of the resource {} will be updated from '{}' to '{}'".format(
+                    request.resource_fullname, public_ip_on_resource, public_ip_on_azure))
+                attribute_updates.append((request, ResourceAttributesUpdateRequest(
+                    request.resource_fullname, [AttributeNameValue(public_ip_key, public_ip_on_azure)])))
+
+            if private_ip_on_azure != request.private_ip_on_resource:
+                logger.info("Private IP of the resource {} will be updated from '{}' to '{}'".format(
+                    request.resource_fullname, request.private_ip_on_resource, private_ip_on_azure))
+                address_updates.append((request, private_ip_on_azure))
+
+        if attribute_updates:
+            try:
+                cloudshell_session.SetAttributesValues([update for _, update in attribute_updates])
+            except Exception as e:
+                logger.exception("Failed to update Public IPs on the resources:")
+                for request, _ in attribute_updates:
+                    errors.setdefault(request.vm_name, e.message)
+
+        for request, private_ip_on_azure in address_updates:
+            try:
+                cloudshell_session.UpdateResourceAddress(request.resource_fullname, private_ip_on_azure)
+            except Exception as e:
+                logger.exception("Failed to update Private IP on the resource {}:".format(request.resource_fullname))
+                errors.setdefault(request.vm_name, e.message)
+
+        return [self._create_refresh_ip_result(vm_name=request.vm_name, error=errors.get(request.vm_name))
+                for request in refresh_ip_requests]
+
+    def _get_vm_ips(self, network_client, resource_group_name, vm, logger, inventory=None):
+        """Get private and public IP of the VM primary NIC
+
+        :param network_client: azure.mgmt.network.NetworkManagementClient instance
+        :param str resource_group_name: The name of the resource group
+        :param azure.mgmt.compute.models.VirtualMachine vm:
+        :param logging.Logger logger:
+        :param cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventory inventory:
+            snapshot of the resource group, NIC and public IP that are missing in it are read from Azure, as well as
+            the public IP that had no address yet when the snapshot was taken
+        :return: private IP and public IP (empty string if there is no public IP attached to the VM)
+        :rtype: tuple[str, str]
+        """
+        # find the primary nic
+        primary_nic_ref = next(iter(filter(lambda x: x.primary, vm.network_profile.network_interfaces)), None)
+        nic_reference = primary_nic_ref if primary_nic_ref else vm.network_profile.network_interfaces[0]
+
+        nic = inventory.get_network_interface(nic_reference.id) if inventory else None
+        if nic is None:
+            nic_name = self.resource_id_parser.get_name_from_resource_id(nic_reference.id)
+            logger.info("Retrieving NIC {} for VM {}".format(nic_name, vm.name))
+            nic = network_client.network_interfaces.get(resource_group_name, nic_name)
+
+        vm_ip_configuration = nic.ip_configurations[0]
+        private_ip_on_azure = vm_ip_configuration.private_ip_address
+        public_ip_reference = vm_ip_configuration.public_ip_address
+
+        if public_ip_reference is None:
+            logger.info("There is no Public IP attached to VM {}".format(vm.name))
+            return private_ip_on_azure, ""
+
+        pub_ip_addr = inventory.get_public_ip(public_ip_reference.id) if inventory else None
+        if pub_ip_addr is None or not pub_ip_addr.ip_address:
+            public_ip_name = self.resource_id_parser.get_name_from_resource_id(public_ip_reference.id)
+            logger.info("Retrieving Public IP {} for VM {}".format(public_ip_name, vm.name))
+            pub_ip_addr = network_client.public_ip_addresses.get(resource_group_name, public_ip_name)
+
+        return private_ip_on_azure, pub_ip_addr.ip_address
+
+    @staticmethod
+    def _create_refresh_ip_result(vm_name, error=None):
+        result = RefreshIpActionResult()
+        result.vmName = vm_name
+        result.success = error is None
+        result.error = error or ''
+        return result
@@ -1,17 +1,25 @@
 import traceback
+from multiprocessing.pool import ThreadPool
 
 from cloudshell.cp.azure.common.helpers.cidr_helper import is_cidr_format
 from cloudshell.cp.azure.models.network_actions_models import SetAppSecurityGroupActionResult
+from cloudshell.cp.azure.models.security_rule_request import SecurityRuleRequest
 
 
 class SetAppSecurityGroupsOperation(object):
-    def __init__(self, vm_service, resource_id_parser, nsg_service, generic_lock_provider, name_provider):
+    MAX_CONCURRENT_APPS = 10
+
+    def __init__(self, vm_service, resource_id_parser, nsg_service, generic_lock_provider, name_provider,
+                 inventory_provider, max_concurrent_apps=MAX_CONCURRENT_APPS):
         """
         :param cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService vm_service:
         :param AzureResourceIdParser resource_id_parser:
         :param cloudshell.cp.azure.domain.services.security_group.SecurityGroupService nsg_service:
         :param cloudshell.cp.azure.domain.services.lock_service.GenericLockProvider generic_lock_provider:
         :param cloudshell.cp.azure.domain.services.name_provider.NameProviderService name_provider:
+        :param cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventoryProvider
+            inventory_provider:
+        :param int max_concurrent_apps: max number of apps that are processed at the same time
 
         """
         self.name_provider = name_provider
@@ -19,6 +27,8 @@ class SetAppSecurityGroupsOperation(object):
         self.resource_id_parser = resource_id_parser
         self.nsg_service = nsg_service
         self.generic_lock_provider = generic_lock_provider
+        self.inventory_provider = inventory_provider
+        self.max_concurrent_apps = max_concurrent_apps
 
     def set_apps_security_groups(self, logger, app_security_group_models, compute_client, network_client, group_name):
         """
@@ -30,66 +40,98 @@ class SetAppSecurityGroupsOperation(object):
         """
         # purpose of set_apps_security_groups is to set custom security rules for specific apps.
         # the idea is that we can allow traffic to specific VMs
+        if not app_security_group_models:
+            return []
+
+        inventory = None
 
-        result = []
-        for app_security_group_model in app_security_group_models:
+        # VMs and NICs of the resource group are listed once instead of being read per app
+        if len(app_security_group_models) > 1:
             try:
-                vm_name = app_security_group_model.deployed_app.name
-                vm_nsg_name = 'NSG_' + vm_name
-                lock = self.generic_lock_provider.get_resource_lock(lock_key=vm_nsg_name, logger=logger)
-
-                # delete previous custom rules
-                self.nsg_service.delete_custom_security_rules_from_nsg(network_client=network_client,
-                                                                       resource_group_name=group_name,
-                                                                       network_security_group_name=vm_nsg_name,
-                                                                       lock=lock,
-                                                                       logger=logger)
-
-                # get network security group for VM
+                inventory = self.inventory_provider.get_inventory(compute_client=compute_client,
+                                                                  network_client=network_client,
+                                                                  group_name=group_name)
+                inventory.get_virtual_machines()
+                inventory.get_network_interfaces()
+            except Exception:
+                logger.warning("Failed to list resources of the group {}, VMs and NICs will be read per app".format(
+                    group_name), exc_info=1)
+                inventory = None
+
+        # every app has its own NSG, so apps can be processed concurrently
+        pool = ThreadPool(min(self.max_concurrent_apps, len(app_security_group_models)))
+        try:
+            return pool.map(lambda app_security_group_model: self._set_app_security_groups(
+                logger=logger,
+                app_security_group_model=app_security_group_model,
+                compute_client=compute_client,
+                network_client=network_client,
+                group_name=group_name,
+                inventory=inventory), app_security_group_models)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _set_app_security_groups(self, logger, app_security_group_model, compute_client, network_client, group_name,
+                                 inventory=None):
+        """Replace custom security rules of a single app
+
+        :param logging.Logger logger:
+        :param AppSecurityGroupModel app_security_group_model:
+        :param str group_name:
+        :param cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventory inventory:
+            snapshot of the resource group, VM and NICs that are missing in it are read from Azure
+        :rtype: SetAppSecurityGroupActionResult
+        """
+        try:
+            vm_name = app_security_group_model.deployed_app.name
+            vm_nsg_name = 'NSG_' + vm_name
+            lock = self.generic_lock_provider.get_resource_lock(lock_key=vm_nsg_name, logger=logger)
+
+            # get network security group for VM
+            instance = inventory.get_virtual_machine(vm_name) if inventory else None
+            if instance is None:
                 instance = self.vm_service.get_vm(compute_client, group_name, vm_name)
-                nic_to_subnet_name_map = self._create_nic_to_subnet_name_map(network_client, instance, group_name)
-
-                logger.info(
-                    "Setting custom app security rules for {}.".format(app_security_group_model.deployed_app.name))
-
-                for security_group_config in app_security_group_model.security_group_configurations:
-                    subnet_name = self._determine_name_of_subnet_from_security_group_configuration_of_request(
-                        group_name,
-                        security_group_config)
-                    nic = self._find_nic_by_subnet(nic_to_subnet_name_map, subnet_name)
-                    destination_ip = nic.ip_configurations[0].private_ip_address
-                    for i, rule in enumerate(security_group_config.rules):
-                        rule.name = "custom_rule_{2}_for_{0}_to_{1}".format(vm_name, destination_ip, i)
-
-                    # create custom rules
-                    self.nsg_service.create_network_security_group_rules(network_client=network_client,
-                                                                         group_name=group_name,
-                                                                         security_group_name=vm_nsg_name,
-                                                                         inbound_rules=security_group_config.rules,
-                                                                         destination_addr=destination_ip,
-                                                                         lock=lock)
-
-                action_result = self._create_security_group_action_result(
-                    app_name=app_security_group_model.deployed_app.name,
-                    is_success=True,
-                    message='')
-
-            except Exception as ex:
-                message = "Setting custom app security rules failed for '{0}' with error '{1}'.".format(
-                    app_security_group_model.deployed_app.name, ex.message)
-
-                action_result = self._create_security_group_action_result(
-                    app_name=app_security_group_model.deployed_app.name,
-                    is_success=False,
-                    message=message)
-
-                logger.error("Setting custom app security rules failed for '{0}' with error '{1}'.".format(
-                    app_security_group_model.deployed_app.name,
-                    traceback.format_exc()))
-
-            result.append(action_result)
 
-        return result
+            nic_to_subnet_name_map = self._create_nic_to_subnet_name_map(network_client, instance, group_name,
+                                                                         inventory)
+
+            logger.info("Setting custom app security rules for {}.".format(vm_name))
+
+            rules_requests = []
+            for security_group_config in app_security_group_model.security_group_configurations:
+                subnet_name = self._determine_name_of_subnet_from_security_group_configuration_of_request(
+                    group_name,
+                    security_group_config)
+                nic = self._find_nic_by_subnet(nic_to_subnet_name_map, subnet_name)
+                destination_ip = nic.ip_configurations[0].private_ip_address
+                for i, rule in enumerate(security_group_config.rules):
+                    rule.name = "custom_rule_{2}_for_{0}_to_{1}".format(vm_name, destination_ip, i)
+                    rules_requests.append(SecurityRuleRequest(rule_data=rule, destination_addr=destination_ip))
+
+            # apply only the difference between previous custom rules and the requested ones
+            self.nsg_service.reconcile_network_security_group_rules(
+                network_client=network_client,
+                group_name=group_name,
+                security_group_name=vm_nsg_name,
+                rules_requests=rules_requests,
+                lock=lock,
+                is_managed_rule=self.nsg_service.is_custom_rule)
+
+            return self._create_security_group_action_result(app_name=vm_name, is_success=True, message='')
+
+        except Exception as ex:
+            message = "Setting custom app security rules failed for '{0}' with error '{1}'.".format(
+                app_security_group_model.deployed_app.name, ex.message)
+
+            logger.error("Setting custom app security rules failed for '{0}' with error '{1}'.".format(
+                app_security_group_model.deployed_app.name,
+                traceback.format_exc()))
+
+            return self._create_security_group_action_result(
+                app_name=app_security_group_model.deployed_app.name,
+                is_success=False,
+                message=message)
 
     def _determine_name_of_subnet_from_security_group_configuration_of_request(self,
                                                                                resource_group_name,
@@ -123,12 +165,14 @@ class SetAppSecurityGroupsOperation(object):
                 return k
         return None
 
-    def _create_nic_to_subnet_name_map(self, network_client, instance, group_name):
+    def _create_nic_to_subnet_name_map(self, network_client, instance, group_name, inventory=None):
         map = {}
 
         for nic_ref in instance.network_profile.network_interfaces:
-            nic_name = self.resource_id_parser.get_name_from_resource_id(nic_ref.id)
-            nic = network_client.network_interfaces.get(group_name, nic_name)
+            nic = inventory.get_network_interface(nic_ref.id) if inventory else None
+            if nic is None:
+                nic_name = self.resource_id_parser.get_name_from_resource_id(nic_ref.id)
+                nic = network_client.network_interfaces.get(group_name, nic_name)
             ip_configuration = nic.ip_configurations[0]
 
             subnet_name = self.resource_id_parser.get_name_from_resource_id(ip_configuration.subnet.id)
@@ -1,16 +1,30 @@
 import traceback
+from functools import partial
 
 from cloudshell.cp.core.models import VmDetailsData
 
+from cloudshell.cp.azure.domain.services.resource_group_inventory import ResourceGroupInventoryProvider
+
 
 class VmDetailsOperation(object):
-    def __init__(self, vm_service, vm_details_provider):
+    BULK_MAX_GROUP_SIZE = 100
+
+    def __init__(self, vm_service, vm_details_provider, inventory_provider, task_executor,
+                 bulk_max_group_size=BULK_MAX_GROUP_SIZE):
         """
         :type vm_service: cloudshell.cp.azure.domain.services.virtual_machine_service.VirtualMachineService
         :type vm_details_provider: cloudshell.cp.azure.domain.common.vm_details_provider.VmDetailsProvider
+        :type inventory_provider:
+            cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventoryProvider
+        :type task_executor: cloudshell.cp.azure.domain.services.task_executor.TaskExecutorService
+        :param int bulk_max_group_size: max number of VMs in the resource group for which all NICs and public IPs
+            of the group are listed at once, NICs and public IPs of the bigger groups are read per VM
         """
         self.vm_service = vm_service
         self.vm_details_provider = vm_details_provider
+        self.inventory_provider = inventory_provider
+        self.task_executor = task_executor
+        self.bulk_max_group_size = bulk_max_group_size
 
     def get_vm_details(self, compute_client, group_name, requests, logger, network_client, model_parser, cancellation_context):
         """
@@ -23,25 +37,94 @@ class VmDetailsOperation(object):
         :param logging.Logger logger:
         :return: cloudshell.cp.azure.domain.common.vm_details_provider.VmDetails
         """
+        vms = inventory = None
+
+        # VMs, NICs and public IPs of the resource group are listed once instead of being read per request
+        if len(requests) > 1:
+            try:
+                vms, inventory = self._get_group_inventory(compute_client=compute_client,
+                                                           network_client=network_client,
+                                                           group_name=group_name,
+                                                           logger=logger)
+            except Exception:
+                logger.warning("Failed to list resources of the group {}, VM details will be read per VM".format(
+                    group_name), exc_info=1)
 
-        results = []
-        for request in requests:
-            if cancellation_context.is_cancelled:
-                break
+        get_request_vm_details = partial(self._get_request_vm_details,
+                                         compute_client=compute_client,
+                                         network_client=network_client,
+                                         group_name=group_name,
+                                         logger=logger,
+                                         cancellation_context=cancellation_context,
+                                         vms=vms,
+                                         inventory=inventory)
 
-            vm_name = request.deployedAppJson.name
-            deployment_service = request.appRequestJson.deploymentService
-            is_market_place = filter(lambda x: x.name == "Image SKU", deployment_service.attributes)
+        results = self.task_executor.map(get_request_vm_details, requests)
 
-            try:
+        return [result for result in results if result is not None]
+
+    def _get_group_inventory(self, compute_client, network_client, group_name, logger):
+        """List VMs of the resource group and, unless the group is too big, all its NICs and public IPs
+
+        :param compute_client: azure.mgmt.compute.ComputeManagementClient instance
+        :param network_client: azure.mgmt.network.NetworkManagementClient instance
+        :param str group_name: Azure resource group name (reservation id)
+        :param logging.Logger logger:
+        :return: VMs by name and inventory snapshot with the listed NICs and public IPs (None for the big groups)
+        :rtype: tuple[dict, cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventory]
+        """
+        # VM details are requested for all apps of the sandbox at the same time, so they share a single snapshot
+        inventory = self.inventory_provider.get_inventory(compute_client=compute_client,
+                                                          network_client=network_client,
+                                                          group_name=group_name,
+                                                          max_age=ResourceGroupInventoryProvider.SHARED_MAX_AGE)
+        vms = inventory.get_virtual_machines()
+        vms_by_name = {vm.name: vm for vm in vms}
+
+        if len(vms) > self.bulk_max_group_size:
+            logger.info("Resource group {} has {} VMs, NICs and public IPs will be read per VM".format(group_name,
+                                                                                                      len(vms)))
+            return vms_by_name, None
+
+        public_ips_res = self.task_executor.submit(inventory.get_public_ips)
+        inventory.get_network_interfaces()
+        public_ips_res.get()
+
+        return vms_by_name, inventory
+
+    def _get_request_vm_details(self, request, compute_client, network_client, group_name, logger,
+                                cancellation_context, vms=None, inventory=None):
+        """
+        :param request: get VM details request item
+        :param compute_client: azure.mgmt.compute.ComputeManagementClient instance
+        :param network_client: azure.mgmt.network.NetworkManagementClient instance
+        :param str group_name: Azure resource group name (reservation id)
+        :param logging.Logger logger:
+        :param cancellation_context:
+        :param dict vms: VMs of the resource group by name, VM is read from Azure if not provided
+        :param cloudshell.cp.azure.domain.services.resource_group_inventory.ResourceGroupInventory inventory:
+            snapshot of the resource group with the listed NICs and public IPs
+        :return: VM details or None if the command was cancelled
+        :rtype: VmDetailsData
+        """
+        if cancellation_context.is_cancelled:
+            return None
+
+        vm_name = request.deployedAppJson.name
+        deployment_service = request.appRequestJson.deploymentService
+        is_market_place = filter(lambda x: x.name == "Image SKU", deployment_service.attributes)
+
+        try:
+            vm = (vms or {}).get(vm_name)
+            if vm is None:
                 vm = self.vm_service.get_vm(compute_client, group_name, vm_name)
-                result = self.vm_details_provider.create(vm, is_market_place, logger, network_client, group_name)
 
-            except Exception as e:
-                logger.error("Error getting vm details for '{0}': {1}".format(vm_name, traceback.format_exc()))
-                result = VmDetailsData(errorMessage=e.message)
+            result = self.vm_details_provider.create(vm, is_market_place, logger, network_client, group_name,
+                                                     inventory=inventory)
 
-            result.appName = vm_name
-            results.append(result)
+        except Exception as e:
+            logger.error("Error getting vm details for '{0}': {1}".format(vm_name, traceback.format_exc()))
+            result = VmDetailsData(errorMessage=e.message)
 
-        return results
+        result.appName = vm_name
+        return result
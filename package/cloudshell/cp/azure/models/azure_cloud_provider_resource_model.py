@@ -15,3 +15,6 @@ class AzureCloudProviderResourceModel(object):
         self.additional_mgmt_networks = ''  # type: str
         self.cloud_provider_name = ''  # type: str
         self.private_ip_allocation_method = ''  # type: str
+        self.async_sandbox_teardown = False  # type: bool
+        self.storage_account_pool_depth = 0  # type: int
+        self.key_pair_pool_depth = 0  # type: int
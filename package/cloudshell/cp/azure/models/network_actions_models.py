@@ -141,3 +141,26 @@ class SetAppSecurityGroupActionResult(object):
 
         return json.dumps([r.__dict__ for r in results])
 
+
+class DeleteInstanceActionResult(object):
+    def __init__(self):
+        self.vmName = ''
+        self.success = True
+        self.error = ''
+
+
+class PowerActionResult(object):
+    def __init__(self):
+        self.vmName = ''
+        self.status = ''
+        self.powerState = ''
+        self.provisioningState = ''
+        self.success = True
+        self.error = ''
+
+
+class RefreshIpActionResult(object):
+    def __init__(self):
+        self.vmName = ''
+        self.success = True
+        self.error = ''
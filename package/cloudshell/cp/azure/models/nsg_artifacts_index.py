@@ -0,0 +1,59 @@
+from collections import defaultdict
+
+VM_NSG_NAME_PREFIX = "NSG_"
+VM_INBOUND_PORTS_RULE_NAME_SEPARATOR = "_inbound_ports:"
+
+
+class NsgArtifactsIndex(object):
+    def __init__(self, network_security_groups, sandbox_nsg_name_prefix):
+        """
+        Index of the NSG artifacts (VM NSGs and VM inbound ports rules on the sandbox NSG) by the VM name,
+        built from a single NSGs listing of the resource group
+
+        :param list[azure.mgmt.network.models.NetworkSecurityGroup] network_security_groups:
+        :param str sandbox_nsg_name_prefix: name prefix of the sandbox subnets NSG
+        :return:
+        """
+        self._vm_nsg_names = defaultdict(list)
+        self._vm_rule_names = defaultdict(lambda: defaultdict(list))
+
+        for nsg in network_security_groups:
+            if nsg.name.startswith(sandbox_nsg_name_prefix):
+                for rule in nsg.security_rules or []:
+                    if VM_INBOUND_PORTS_RULE_NAME_SEPARATOR in rule.name:
+                        vm_name = rule.name.split(VM_INBOUND_PORTS_RULE_NAME_SEPARATOR)[0]
+                        self._vm_rule_names[vm_name][nsg.name].append(rule.name)
+
+            elif nsg.name.startswith(VM_NSG_NAME_PREFIX):
+                self._vm_nsg_names[nsg.name[len(VM_NSG_NAME_PREFIX):]].append(nsg.name)
+
+    @staticmethod
+    def _get_key(vm_name):
+        # inbound ports rules are named after the VM name without spaces
+        return vm_name.replace(" ", "")
+
+    def get_vm_network_security_group_names(self, vm_name):
+        """
+        :param str vm_name:
+        :return: names of the NSGs created for the VM
+        :rtype: list[str]
+        """
+        return list(self._vm_nsg_names.get(vm_name, []))
+
+    def get_vm_security_rule_names(self, vm_name):
+        """
+        :param str vm_name:
+        :return: names of the VM inbound ports rules grouped by the NSG name
+        :rtype: dict[str, list[str]]
+        """
+        return {nsg_name: list(rule_names)
+                for nsg_name, rule_names in self._vm_rule_names.get(self._get_key(vm_name), {}).items()}
+
+    def remove_vm(self, vm_name):
+        """Forget all artifacts of the VM (once they were deleted on the Azure)
+
+        :param str vm_name:
+        :return:
+        """
+        self._vm_nsg_names.pop(vm_name, None)
+        self._vm_rule_names.pop(self._get_key(vm_name), None)
@@ -0,0 +1,14 @@
+class RefreshIpRequest(object):
+    def __init__(self, vm_name, resource_fullname, private_ip_on_resource, public_ip_on_resource_attr_tuple):
+        """
+        A request for refreshing IPs of a single deployed app resource
+        :param str vm_name: name of the Azure VM
+        :param str resource_fullname: full resource name on the CloudShell
+        :param str private_ip_on_resource: private IP on the CloudShell resource
+        :param tuple public_ip_on_resource_attr_tuple: (key, val) public IP attribute on the CloudShell resource
+        :return:
+        """
+        self.vm_name = vm_name
+        self.resource_fullname = resource_fullname
+        self.private_ip_on_resource = private_ip_on_resource
+        self.public_ip_on_resource_attr_tuple = public_ip_on_resource_attr_tuple
@@ -0,0 +1,17 @@
+from azure.mgmt.network.models import RouteNextHopType
+
+
+class SecurityRuleRequest(object):
+    def __init__(self, rule_data, destination_addr, source_address=RouteNextHopType.internet, start_from=None):
+        """
+        A request for a single NSG inbound rule that will be created together with other rules in one NSG update
+        :param rule_data: cloudshell.cp.azure.models.rule_data.RuleData instance
+        :param str destination_addr: Destination IP address/CIDR
+        :param str source_address: Source IP address/CIDR or RouteNextHopType
+        :param int start_from: rule priority number to start from
+        :return:
+        """
+        self.rule_data = rule_data
+        self.destination_addr = destination_addr
+        self.source_address = source_address
+        self.start_from = start_from
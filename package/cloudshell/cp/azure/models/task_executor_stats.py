@@ -0,0 +1,34 @@
+class TaskExecutorStats(object):
+    def __init__(self, max_workers, queue_depth, active_workers, completed_tasks, failed_tasks, avg_wait_time,
+                 max_wait_time, avg_run_time):
+        """
+        Snapshot of the task executor state
+        :param int max_workers: max number of tasks that can run at the same time
+        :param int queue_depth: number of submitted tasks that wait for a free worker
+        :param int active_workers: number of tasks that are running now
+        :param int completed_tasks: number of tasks that finished successfully
+        :param int failed_tasks: number of tasks that raised an exception
+        :param float avg_wait_time: average time (in seconds) a task waited in the queue
+        :param float max_wait_time: max time (in seconds) a task waited in the queue
+        :param float avg_run_time: average task run time (in seconds)
+        :return:
+        """
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self.active_workers = active_workers
+        self.completed_tasks = completed_tasks
+        self.failed_tasks = failed_tasks
+        self.avg_wait_time = avg_wait_time
+        self.max_wait_time = max_wait_time
+        self.avg_run_time = avg_run_time
+
+    def __str__(self):
+        return "workers: {}/{}, queue depth: {}, completed: {}, failed: {}, " \
+               "wait time avg/max: {:.3f}s/{:.3f}s, run time avg: {:.3f}s".format(self.active_workers,
+                                                                                  self.max_workers,
+                                                                                  self.queue_depth,
+                                                                                  self.completed_tasks,
+                                                                                  self.failed_tasks,
+                                                                                  self.avg_wait_time,
+                                                                                  self.max_wait_time,
+                                                                                  self.avg_run_time)
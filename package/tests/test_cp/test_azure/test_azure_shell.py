@@ -218,6 +218,8 @@ class TestAzureShell(TestCase):
         command_context = mock.MagicMock(reservation=mock.MagicMock(reservation_id=self.group_name))
         cloud_provider_model = mock.MagicMock()
         self.azure_shell.model_parser.convert_to_cloud_provider_resource_model.return_value = cloud_provider_model
+        self.azure_shell.ip_service = mock.MagicMock()
+        self.azure_shell.ip_release_coalescer = mock.MagicMock()
 
         # Act
         self.azure_shell.cleanup_connectivity(command_context=command_context, request=request)
@@ -233,6 +235,12 @@ class TestAzureShell(TestCase):
             resource_group_name=self.group_name,
             request=deploy_data_holder.driverRequest,
             logger=self.logger)
+        self.azure_shell.ip_release_coalescer.flush.assert_called_once_with(logger=self.logger,
+                                                                            api=cloudshell_session,
+                                                                            reservation_id=self.group_name)
+        self.azure_shell.ip_service.release_prefetched_ips.assert_called_once_with(logger=self.logger,
+                                                                                   api=cloudshell_session,
+                                                                                   reservation_id=self.group_name)
 
     @mock.patch("cloudshell.cp.azure.azure_shell.CloudShellSessionContext")
     @mock.patch("cloudshell.cp.azure.azure_shell.AzureClientsManager")
@@ -99,6 +99,32 @@ class TestVmDetailsProvider(TestCase):
         self.assertTrue(self._get_value(network_data, 'Public IP') == public_ip.ip_address)
         self.assertTrue(self._get_value(network_data, "Public IP Type") == public_ip.public_ip_allocation_method)
 
+    def test_prepare_vm_network_data_from_snapshot(self):
+        network_interface = Mock()
+        ip_configuration = Mock()
+        ip_configuration.subnet.id = 'a/a'
+        ip_configuration.public_ip_address.id = '/Azure_Resource_Id/IP_Name'
+        network_interface.ip_configurations = [ip_configuration]
+        public_ip = Mock()
+        public_ip.ip_address = 'Public Address Param'
+        nic = Mock()
+        nic.id = "/Azure_Resource_Id/NIC_Name"
+        instance = Mock()
+        instance.network_profile.network_interfaces = [nic]
+
+        inventory = Mock()
+        inventory.get_network_interface.return_value = network_interface
+        inventory.get_nic_public_ip.return_value = public_ip
+
+        network_interface_objects = self.vm_details_provider._get_vm_network_data(
+            instance, self.network_client, 'Group 1', self.logger, inventory=inventory)
+
+        inventory.get_network_interface.assert_called_once_with("/Azure_Resource_Id/NIC_Name")
+        inventory.get_nic_public_ip.assert_called_once_with(network_interface)
+        self.network_client.network_interfaces.get.assert_not_called()
+        self.network_service.get_public_ip.assert_not_called()
+        self.assertEqual(self._get_value(network_interface_objects[0].networkData, 'Public IP'), public_ip.ip_address)
+
     def _get_value(self, data, key):
         for item in data:
             if item.key == key:
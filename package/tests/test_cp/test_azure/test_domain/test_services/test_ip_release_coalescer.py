@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from cloudshell.cp.azure.domain.services.ip_release_coalescer import IpReleaseCoalescer
+
+
+class TestIpReleaseCoalescer(TestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+        self.ip_service = Mock()
+        self.logger = Mock()
+        self.api = Mock()
+        self.coalescer = IpReleaseCoalescer(ip_service=self.ip_service, journal_dir=self.journal_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir)
+
+    def _release_ips(self, ips, owner=None):
+        with patch("cloudshell.cp.azure.domain.services.ip_release_coalescer.Thread"):
+            self.coalescer.release_ips(self.logger, self.api, "reservation", ips, owner)
+
+    def _get_journal_path(self, pid=None):
+        return os.path.join(self.journal_dir, "reservation.{}.json".format(pid or os.getpid()))
+
+    def _read_journal(self, pid=None):
+        with open(self._get_journal_path(pid)) as journal_file:
+            return json.load(journal_file)
+
+    def test_release_ips_collects_ips_in_journal_without_api_call(self):
+        # Act
+        self._release_ips(["10.0.0.4"])
+        self._release_ips(["10.0.0.5", "10.0.0.4"])
+
+        # Verify
+        self.ip_service.release_ips.assert_not_called()
+        self.assertEqual(self._read_journal(), [[None, ["10.0.0.4", "10.0.0.5"]]])
+
+    def test_flush_releases_ips_with_single_call_per_owner(self):
+        self._release_ips(["10.0.0.4"])
+        self._release_ips(["10.0.0.5"])
+        self._release_ips(["10.0.0.6"], owner="app")
+
+        # Act
+        self.coalescer.flush(self.logger, self.api, "reservation")
+
+        # Verify
+        self.assertEqual(self.ip_service.release_ips.call_count, 2)
+        self.ip_service.release_ips.assert_any_call(logger=self.logger,
+                                                    api=self.api,
+                                                    reservation_id="reservation",
+                                                    ips_to_release=["10.0.0.4", "10.0.0.5"],
+                                                    owner=None)
+        self.assertFalse(os.path.exists(self._get_journal_path()))
+
+    def test_flush_releases_ips_from_journal_of_previous_process(self):
+        self._release_ips(["10.0.0.4"])
+        coalescer = IpReleaseCoalescer(ip_service=self.ip_service, journal_dir=self.journal_dir)
+
+        # Act
+        coalescer.flush(self.logger, self.api, "reservation")
+
+        # Verify
+        self.ip_service.release_ips.assert_called_once_with(logger=self.logger,
+                                                            api=self.api,
+                                                            reservation_id="reservation",
+                                                            ips_to_release=["10.0.0.4"],
+                                                            owner=None)
+
+    @patch("cloudshell.cp.azure.domain.services.ip_release_coalescer.os.getpid")
+    def test_processes_write_separate_journals_and_flush_adopts_them(self, getpid):
+        getpid.return_value = 100
+        self._release_ips(["10.0.0.4"])
+        getpid.return_value = 200
+        other_process_coalescer = IpReleaseCoalescer(ip_service=self.ip_service, journal_dir=self.journal_dir)
+        with patch("cloudshell.cp.azure.domain.services.ip_release_coalescer.Thread"):
+            other_process_coalescer.release_ips(self.logger, self.api, "reservation", ["10.0.0.5"])
+
+        # Verify
+        self.assertEqual(self._read_journal(pid=100), [[None, ["10.0.0.4"]]])
+        self.assertEqual(self._read_journal(pid=200), [[None, ["10.0.0.5"]]])
+
+        # Act
+        other_process_coalescer.flush(self.logger, self.api, "reservation")
+
+        # Verify
+        self.ip_service.release_ips.assert_called_once_with(logger=self.logger,
+                                                            api=self.api,
+                                                            reservation_id="reservation",
+                                                            ips_to_release=["10.0.0.5", "10.0.0.4"],
+                                                            owner=None)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_failed_release_is_kept_in_journal(self):
+        self.ip_service.release_ips.side_effect = Exception("API error")
+        self._release_ips(["10.0.0.4"])
+
+        # Act
+        for _ in range(IpReleaseCoalescer.MAX_ATTEMPTS):
+            self.coalescer.flush(self.logger, self.api, "reservation")
+
+        # Verify
+        self.assertEqual(self.ip_service.release_ips.call_count, IpReleaseCoalescer.MAX_ATTEMPTS)
+        self.assertEqual(self._read_journal(), [[None, ["10.0.0.4"]]])
+        self.assertEqual(self.coalescer._pending, {})
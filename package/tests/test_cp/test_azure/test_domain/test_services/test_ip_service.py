@@ -1,9 +1,12 @@
 import uuid
 from unittest import TestCase
 
+import json
+
 from mock import MagicMock
 
 from cloudshell.cp.azure.domain.services.ip_service import IpService
+from cloudshell.cp.azure.domain.services.lock_service import GenericLockProvider
 
 
 class TestIpService(TestCase):
@@ -32,3 +35,163 @@ class TestIpService(TestCase):
                                                                           reservation_id,
                                                                           subnet_cidr)
         self.assertEqual(available_ip, result)
+
+    def test_get_next_available_ip_from_cs_pool_hands_out_prefetched_block(self):
+        ip_service = IpService(GenericLockProvider(), prefetch_block_size=3)
+        api = MagicMock()
+        api.CheckoutFromPool.return_value = MagicMock(Items=['10.2.2.4', '10.2.2.5', '10.2.2.6'])
+        reservation_id = str(uuid.uuid4())
+        subnet_cidr = '10.2.2.0/24'
+
+        # Act
+        result = [ip_service.get_next_available_ip_from_cs_pool(self.logger, api, reservation_id, subnet_cidr)
+                  for _ in range(3)]
+
+        # Verify
+        self.assertEqual(result, ['10.2.2.4', '10.2.2.5', '10.2.2.6'])
+        api.CheckoutFromPool.assert_called_once()
+        request = json.loads(api.CheckoutFromPool.call_args[1]['selectionCriteriaJson'])
+        self.assertEqual(request['count'], 3)
+
+    def test_get_next_available_ip_from_cs_pool_checks_out_single_ip_for_owner(self):
+        ip_service = IpService(GenericLockProvider(), prefetch_block_size=3)
+        api = MagicMock()
+        api.CheckoutFromPool.return_value = MagicMock(Items=['10.2.2.4'])
+
+        # Act
+        result = ip_service.get_next_available_ip_from_cs_pool(self.logger, api, 'reservation', '10.2.2.0/24',
+                                                               owner='app')
+
+        # Verify
+        self.assertEqual(result, '10.2.2.4')
+        request = json.loads(api.CheckoutFromPool.call_args[1]['selectionCriteriaJson'])
+        self.assertEqual(request['count'], 1)
+        self.assertEqual(request['ownerId'], 'app')
+        self.assertEqual(ip_service._prefetched_ips, {})
+
+    def test_get_next_available_ip_from_cs_pool_limits_block_to_half_of_free_addresses(self):
+        ip_service = IpService(GenericLockProvider())
+        api = MagicMock()
+        api.CheckoutFromPool.side_effect = [MagicMock(Items=['10.2.2.4']), MagicMock(Items=['10.2.2.36', '10.2.2.37'])]
+
+        # Act
+        small_subnet_ip = ip_service.get_next_available_ip_from_cs_pool(self.logger, api, 'reservation', '10.2.2.0/29')
+        ip_service.get_next_available_ip_from_cs_pool(self.logger, api, 'reservation', '10.2.2.32/28')
+
+        # Verify
+        self.assertEqual(small_subnet_ip, '10.2.2.4')
+        # /29 subnet has 3 usable addresses and /28 has 11, the rest are reserved by Azure
+        self.assertEqual([json.loads(call[1]['selectionCriteriaJson'])['count']
+                          for call in api.CheckoutFromPool.call_args_list], [1, 5])
+
+    def test_get_next_available_ip_from_cs_pool_releases_prefetched_ips_if_owner_checkout_failed(self):
+        ip_service = IpService(GenericLockProvider(), prefetch_block_size=3)
+        api = MagicMock()
+        api.CheckoutFromPool.side_effect = [MagicMock(Items=['10.2.2.4', '10.2.2.5', '10.2.2.6']),
+                                            Exception("Could not find available IP."),
+                                            MagicMock(Items=['10.2.2.5'])]
+        ip_service.get_next_available_ip_from_cs_pool(self.logger, api, 'reservation', '10.2.2.0/24')
+
+        # Act
+        result = ip_service.get_next_available_ip_from_cs_pool(self.logger, api, 'reservation', '10.2.2.0/24',
+                                                               owner='app')
+
+        # Verify
+        self.assertEqual(result, '10.2.2.5')
+        api.ReleaseFromPool.assert_called_once_with(values=['10.2.2.5', '10.2.2.6'],
+                                                    poolId='reservation-private-ips',
+                                                    reservationId='reservation',
+                                                    ownerId='Azure-Shell')
+        self.assertEqual(ip_service._prefetched_ips, {})
+
+    def test_get_next_available_ip_from_cs_pool_raises_owner_checkout_error_without_prefetched_ips(self):
+        ip_service = IpService(GenericLockProvider())
+        api = MagicMock()
+        api.CheckoutFromPool.side_effect = Exception("Could not find available IP.")
+
+        # Act
+        with self.assertRaisesRegexp(Exception, "Could not find available IP."):
+            ip_service.get_next_available_ip_from_cs_pool(self.logger, api, 'reservation', '10.2.2.0/24',
+                                                          owner='app')
+
+        # Verify
+        api.CheckoutFromPool.assert_called_once()
+        api.ReleaseFromPool.assert_not_called()
+
+    def test_get_next_available_ip_from_cs_pool_checks_out_single_ip_if_block_failed(self):
+        ip_service = IpService(GenericLockProvider())
+        api = MagicMock()
+        api.CheckoutFromPool.side_effect = [Exception("Could not find available IP."),
+                                            MagicMock(Items=['10.2.2.5'])]
+
+        # Act
+        result = ip_service.get_next_available_ip_from_cs_pool(self.logger, api, 'reservation', '10.2.2.0/24')
+
+        # Verify
+        self.assertEqual(result, '10.2.2.5')
+        self.assertEqual([json.loads(call[1]['selectionCriteriaJson'])['count']
+                          for call in api.CheckoutFromPool.call_args_list], [8, 1])
+
+    def test_release_prefetched_ips(self):
+        ip_service = IpService(GenericLockProvider(), prefetch_block_size=3)
+        api = MagicMock()
+        api.CheckoutFromPool.return_value = MagicMock(Items=['10.2.2.4', '10.2.2.5', '10.2.2.6'])
+        ip_service.get_next_available_ip_from_cs_pool(self.logger, api, 'reservation', '10.2.2.0/24')
+        ip_service.get_next_available_ip_from_cs_pool(self.logger, api, 'other_reservation', '10.2.2.0/24')
+
+        # Act
+        ip_service.release_prefetched_ips(self.logger, api, 'reservation')
+
+        # Verify
+        api.ReleaseFromPool.assert_called_once_with(values=['10.2.2.5', '10.2.2.6'],
+                                                    poolId='reservation-private-ips',
+                                                    reservationId='reservation',
+                                                    ownerId='Azure-Shell')
+        self.assertEqual(list(ip_service._prefetched_ips.keys()), [('other_reservation', '10.2.2.0/24')])
+
+    def test_checkout_excludes_known_used_ips_and_updates_index(self):
+        ip_service = IpService(GenericLockProvider(), prefetch_block_size=2)
+        api = MagicMock()
+        api.CheckoutFromPool.return_value = MagicMock(Items=['10.2.2.5', '10.2.2.6'])
+        nics = [MagicMock(ip_configurations=[MagicMock(private_ip_address='10.2.2.4')]),
+                MagicMock(ip_configurations=[MagicMock(private_ip_address='10.3.3.4')])]
+        ip_service.seed_subnet_addresses('reservation', '10.2.2.0/29', lambda: nics)
+
+        # Act
+        ip_service.get_next_available_ip_from_cs_pool(self.logger, api, 'reservation', '10.2.2.0/29')
+
+        # Verify
+        request = json.loads(api.CheckoutFromPool.call_args[1]['selectionCriteriaJson'])
+        self.assertEqual(request['reservedIps'], ['10.2.2.0', '10.2.2.1', '10.2.2.2', '10.2.2.3', '10.2.2.4',
+                                                  '10.2.2.7'])
+        self.assertEqual(ip_service.get_available_ips_count('reservation', '10.2.2.0/29'), 0)
+
+    def test_seed_subnet_addresses_lists_nics_once(self):
+        ip_service = IpService(GenericLockProvider())
+        get_network_interfaces = MagicMock(return_value=[
+            MagicMock(ip_configurations=[MagicMock(private_ip_address='10.2.2.4')])])
+
+        # Act
+        ip_service.seed_subnet_addresses('reservation', '10.2.2.0/29', get_network_interfaces)
+        ip_service.seed_subnet_addresses('reservation', '10.2.2.0/29', get_network_interfaces)
+
+        # Verify
+        get_network_interfaces.assert_called_once_with()
+        self.assertTrue(ip_service.is_subnet_seeded('reservation', '10.2.2.0/29'))
+        self.assertEqual(ip_service.get_available_ips_count('reservation', '10.2.2.0/29'), 2)
+
+        ip_service.remove_subnet_address_indexes('reservation')
+        self.assertFalse(ip_service.is_subnet_seeded('reservation', '10.2.2.0/29'))
+
+    def test_release_ips_frees_addresses_in_index(self):
+        ip_service = IpService(GenericLockProvider())
+        api = MagicMock()
+        api.CheckoutFromPool.return_value = MagicMock(Items=['10.2.2.4'])
+        ip_service.get_next_available_ip_from_cs_pool(self.logger, api, 'reservation', '10.2.2.0/24', owner='app')
+
+        # Act
+        ip_service.release_ips(self.logger, api, 'reservation', ['10.2.2.4'], owner='app')
+
+        # Verify
+        # /24 subnet has 251 usable addresses
+        self.assertEqual(ip_service.get_available_ips_count('reservation', '10.2.2.0/24'), 251)
@@ -14,18 +14,32 @@ class TestKeyPairService(TestCase):
         self.storage_service = MagicMock()
         self.key_pair_service = KeyPairService(storage_service=self.storage_service)
 
-    @mock.patch("cloudshell.cp.azure.domain.services.key_pair.RSA")
+    @mock.patch("cloudshell.cp.azure.domain.services.key_pair.generate_rsa_key_pair")
     @mock.patch("cloudshell.cp.azure.domain.services.key_pair.SSHKey")
-    def test_generate_key_pair(self, ssh_key_class, rsa_module):
-        """Check that method uses RSA module to generate key pair and returns SSHKey model"""
+    def test_generate_key_pair(self, ssh_key_class, generate_rsa_key_pair):
+        """Check that method generates RSA key pair and returns SSHKey model"""
         ssh_key_class.return_value = ssh_key_mock = mock.MagicMock()
+        generate_rsa_key_pair.return_value = ("private_key", "public_key")
 
         ssh_key = self.key_pair_service.generate_key_pair()
 
-        ssh_key_class.assert_called_with(private_key=rsa_module.generate().exportKey(),
-                                         public_key=rsa_module.generate().publickey().exportKey())
+        generate_rsa_key_pair.assert_called_once_with(2048)
+        ssh_key_class.assert_called_with(private_key="private_key", public_key="public_key")
         self.assertIs(ssh_key, ssh_key_mock)
 
+    def test_generate_key_pair_takes_key_from_pool(self):
+        """Check that method takes ready key pair from the pool instead of generating it"""
+        key_pair_pool = MagicMock(key_length=2048)
+        key_pair_pool.get_key_pair.return_value = ("private_key", "public_key")
+        key_pair_service = KeyPairService(storage_service=self.storage_service, key_pair_pool=key_pair_pool)
+
+        # Act
+        ssh_key = key_pair_service.generate_key_pair(pool_depth=3)
+
+        # Verify
+        self.assertEqual((ssh_key.private_key, ssh_key.public_key), ("private_key", "public_key"))
+        key_pair_pool.get_key_pair.assert_called_once_with(depth=3, logger=None)
+
     def test_save_key_pair(self):
         """Check that method uses storage service to save key pair to the Azure"""
         key_pair = MagicMock()
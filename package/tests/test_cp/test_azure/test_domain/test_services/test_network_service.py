@@ -138,3 +138,175 @@ class TestNetworkService(TestCase):
                                                                    virtual_network_name=vnet_name,
                                                                    subnet_name=subnet_name)
         operation_poller.wait.assert_called_once_with()
+
+    def test_update_virtual_network(self):
+        """Check that method will update vNet with a single conditional update if it was changed"""
+        vnet = Mock(etag="etag")
+        self.network_client.virtual_networks.get.return_value = vnet
+        update_func = Mock(return_value=True)
+
+        # Act
+        self.network_service.update_virtual_network(network_client=self.network_client,
+                                                    resource_group_name="mgmt_group",
+                                                    virtual_network_name="vnet",
+                                                    update_func=update_func)
+
+        # Verify
+        update_func.assert_called_once_with(vnet)
+        self.network_client.virtual_networks.create_or_update.assert_called_once_with(
+            "mgmt_group", "vnet", vnet, custom_headers={'If-Match': "etag"})
+
+    def test_update_virtual_network_without_changes(self):
+        """Check that method will not update vNet if nothing was changed"""
+        vnet = Mock()
+        self.network_client.virtual_networks.get.return_value = vnet
+
+        # Act
+        result = self.network_service.update_virtual_network(network_client=self.network_client,
+                                                             resource_group_name="mgmt_group",
+                                                             virtual_network_name="vnet",
+                                                             update_func=Mock(return_value=False))
+
+        # Verify
+        self.assertIs(result, vnet)
+        self.network_client.virtual_networks.create_or_update.assert_not_called()
+
+    def test_update_network_security_group_rules(self):
+        """Check that method will add and remove NSG rules with a single conditional NSG update"""
+        group_name = "test_group_name"
+        nsg_name = "test_nsg_name"
+        existing_rule = Mock()
+        existing_rule.name = "existing_rule"
+        removed_rule = Mock()
+        removed_rule.name = "removed_rule"
+        new_rule = Mock()
+        new_rule.name = "new_rule"
+        nsg = Mock(security_rules=[existing_rule, removed_rule], etag="etag")
+        self.network_client.network_security_groups.get.return_value = nsg
+
+        # Act
+        self.network_service.update_network_security_group_rules(network_client=self.network_client,
+                                                                 group_name=group_name,
+                                                                 security_group_name=nsg_name,
+                                                                 rules_to_add=[new_rule],
+                                                                 rule_names_to_remove=["removed_rule"])
+
+        # Verify
+        self.assertEqual(nsg.security_rules, [existing_rule, new_rule])
+        self.network_client.network_security_groups.create_or_update.assert_called_once_with(
+            group_name, nsg_name, nsg, custom_headers={'If-Match': "etag"})
+
+    def test_update_network_security_group_rules_with_remove_filter(self):
+        """Check that method will remove existing rules matched by the filter in the same NSG update"""
+        custom_rule = Mock()
+        custom_rule.name = "custom_rule_0_for_vm"
+        existing_rule = Mock()
+        existing_rule.name = "existing_rule"
+        new_rule = Mock()
+        new_rule.name = "custom_rule_1_for_vm"
+        nsg = Mock(security_rules=[custom_rule, existing_rule], etag="etag")
+        self.network_client.network_security_groups.get.return_value = nsg
+
+        # Act
+        self.network_service.update_network_security_group_rules(
+            network_client=self.network_client,
+            group_name="test_group_name",
+            security_group_name="test_nsg_name",
+            rules_to_add=[new_rule],
+            remove_rules_filter=lambda rule: "custom_rule" in rule.name)
+
+        # Verify
+        self.assertEqual(nsg.security_rules, [existing_rule, new_rule])
+        self.network_client.network_security_groups.create_or_update.assert_called_once()
+
+    def test_update_network_security_group_rules_without_changes(self):
+        """Check that method will not update NSG if there is nothing to change"""
+        existing_rule = Mock()
+        existing_rule.name = "existing_rule"
+        nsg = Mock(security_rules=[existing_rule])
+        self.network_client.network_security_groups.get.return_value = nsg
+
+        # Act
+        result = self.network_service.update_network_security_group_rules(network_client=self.network_client,
+                                                                          group_name="test_group_name",
+                                                                          security_group_name="test_nsg_name",
+                                                                          rule_names_to_remove=["missing_rule"])
+
+        # Verify
+        self.assertIs(result, nsg)
+        self.network_client.network_security_groups.create_or_update.assert_not_called()
+
+    def test_delete_nsg_artifacts_associated_with_vm(self):
+        """Check that method will delete VM NSG and remove all VM rules from the sandbox NSG in one update"""
+        group_name = "test_group_name"
+        vm_name = "vm1"
+        vm_rules = [Mock(), Mock()]
+        vm_rules[0].name = "vm1_inbound_ports:80:tcp"
+        vm_rules[1].name = "vm1_inbound_ports:443:tcp"
+        other_vm_rule = Mock()
+        other_vm_rule.name = "vm11_inbound_ports:80:tcp"
+        sandbox_nsg = Mock(security_rules=vm_rules + [other_vm_rule])
+        sandbox_nsg.name = "NSG_sandbox_all_subnets_test_group_name"
+        vm_nsg = Mock(security_rules=[])
+        vm_nsg.name = "NSG_vm1"
+        other_vm_nsg = Mock(security_rules=[])
+        other_vm_nsg.name = "NSG_vm11"
+        self.network_client.network_security_groups.list.return_value = [sandbox_nsg, vm_nsg, other_vm_nsg]
+        self.network_service.update_network_security_group_rules = Mock()
+
+        # Act
+        self.network_service.delete_nsg_artifacts_associated_with_vm(network_client=self.network_client,
+                                                                     resource_group_name=group_name,
+                                                                     vm_name=vm_name)
+
+        # Verify
+        self.network_client.network_security_groups.delete.assert_called_once_with(group_name, "NSG_vm1")
+        self.network_service.update_network_security_group_rules.assert_called_once_with(
+            network_client=self.network_client,
+            group_name=group_name,
+            security_group_name=sandbox_nsg.name,
+            rule_names_to_remove=["vm1_inbound_ports:80:tcp", "vm1_inbound_ports:443:tcp"])
+
+    def test_delete_nsg_artifacts_associated_with_vms(self):
+        """Check that rules of all VMs are removed from the sandbox NSG with a single update"""
+        group_name = "test_group_name"
+        rules = [Mock(), Mock(), Mock()]
+        rules[0].name = "vm1_inbound_ports:80:tcp"
+        rules[1].name = "vm2_inbound_ports:443:tcp"
+        rules[2].name = "vm3_inbound_ports:22:tcp"
+        sandbox_nsg = Mock(security_rules=rules)
+        sandbox_nsg.name = "NSG_sandbox_all_subnets_test_group_name"
+        vm_nsgs = [Mock(security_rules=[]), Mock(security_rules=[])]
+        vm_nsgs[0].name = "NSG_vm1"
+        vm_nsgs[1].name = "NSG_vm2"
+        self.network_client.network_security_groups.list.return_value = [sandbox_nsg] + vm_nsgs
+        self.network_service.update_network_security_group_rules = Mock()
+
+        # Act
+        self.network_service.delete_nsg_artifacts_associated_with_vms(network_client=self.network_client,
+                                                                      resource_group_name=group_name,
+                                                                      vm_names=["vm1", "vm2"])
+
+        # Verify
+        self.assertEqual(self.network_client.network_security_groups.delete.call_count, 2)
+        self.network_service.update_network_security_group_rules.assert_called_once_with(
+            network_client=self.network_client,
+            group_name=group_name,
+            security_group_name=sandbox_nsg.name,
+            rule_names_to_remove=["vm1_inbound_ports:80:tcp", "vm2_inbound_ports:443:tcp"])
+
+    def test_delete_nsg_artifacts_associated_with_vm_uses_provided_index(self):
+        """Check that method will not list NSGs when the teardown batch index is provided"""
+        nsg_artifacts_index = Mock()
+        nsg_artifacts_index.get_vm_network_security_group_names.return_value = []
+        nsg_artifacts_index.get_vm_security_rule_names.return_value = {}
+
+        # Act
+        self.network_service.delete_nsg_artifacts_associated_with_vm(network_client=self.network_client,
+                                                                     resource_group_name="test_group_name",
+                                                                     vm_name="vm1",
+                                                                     nsg_artifacts_index=nsg_artifacts_index)
+
+        # Verify
+        self.network_client.network_security_groups.list.assert_not_called()
+        nsg_artifacts_index.remove_vm.assert_called_once_with("vm1")
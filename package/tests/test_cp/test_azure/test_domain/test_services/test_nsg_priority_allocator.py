@@ -0,0 +1,80 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from cloudshell.cp.azure.domain.services.nsg_priority_allocator import NsgPriorityAllocator, \
+    NsgPriorityAllocatorProvider
+
+
+class TestNsgPriorityAllocator(TestCase):
+    def setUp(self):
+        self.allocator = NsgPriorityAllocator()
+
+    def test_allocate_without_taken_priorities(self):
+        # Act
+        priorities = [self.allocator.allocate(start_from=1000, step=5) for _ in xrange(3)]
+
+        # Verify
+        self.assertEqual(priorities, [1000, 1005, 1010])
+
+    def test_allocate_skips_taken_priorities(self):
+        self.allocator.reset([1000, 1005, 1015, 5000])
+
+        # Act
+        priorities = [self.allocator.allocate(start_from=1000, step=5) for _ in xrange(2)]
+
+        # Verify
+        self.assertEqual(priorities, [1010, 1020])
+
+    def test_allocate_raises_when_range_is_exhausted(self):
+        self.allocator.reset([4090, 4095])
+
+        # Act & Verify
+        with self.assertRaises(ValueError):
+            self.allocator.allocate(start_from=4090, step=5)
+
+    def test_release_makes_priority_available_again(self):
+        self.allocator.reset([2000, 2005])
+
+        # Act
+        self.allocator.release(2000)
+
+        # Verify
+        self.assertFalse(self.allocator.is_taken(2000))
+        self.assertEqual(self.allocator.allocate(start_from=2000, step=5), 2000)
+
+    def test_reserve_marks_priority_as_taken(self):
+        # Act
+        self.allocator.reserve(4010)
+
+        # Verify
+        self.assertTrue(self.allocator.is_taken(4010))
+        self.assertFalse(self.allocator.is_taken(100500))
+
+
+class TestNsgPriorityAllocatorProvider(TestCase):
+    def setUp(self):
+        self.provider = NsgPriorityAllocatorProvider()
+
+    def test_seed_allocator(self):
+        # Act
+        allocator = self.provider.seed_allocator(group_name="group",
+                                                 security_group_name="nsg",
+                                                 security_rules=[Mock(priority=1000)])
+
+        # Verify
+        self.assertIs(self.provider.get_allocator("group", "nsg"), allocator)
+        self.assertTrue(allocator.is_taken(1000))
+
+    def test_remove_allocators(self):
+        self.provider.seed_allocator("group", "nsg1", [])
+        self.provider.seed_allocator("group", "nsg2", [])
+        self.provider.seed_allocator("other_group", "nsg1", [])
+
+        # Act
+        self.provider.remove_allocators("group")
+
+        # Verify
+        self.assertIsNone(self.provider.get_allocator("group", "nsg1"))
+        self.assertIsNone(self.provider.get_allocator("group", "nsg2"))
+        self.assertIsNotNone(self.provider.get_allocator("other_group", "nsg1"))
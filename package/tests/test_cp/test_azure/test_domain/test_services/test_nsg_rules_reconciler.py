@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+from azure.mgmt.network.models import SecurityRule
+
+from cloudshell.cp.azure.domain.services.nsg_rules_reconciler import NsgRulesReconciler
+
+
+def _create_rule(name, port, destination="10.0.0.4", source="Internet", protocol="Tcp", priority=None):
+    return SecurityRule(access="Allow",
+                        direction="Inbound",
+                        source_address_prefix=source,
+                        source_port_range="*",
+                        name=name,
+                        destination_address_prefix=destination,
+                        destination_port_range=port,
+                        priority=priority,
+                        protocol=protocol)
+
+
+class TestNsgRulesReconciler(TestCase):
+    def setUp(self):
+        self.reconciler = NsgRulesReconciler()
+
+    def test_get_diff_for_the_same_rules_is_empty(self):
+        """Check that rules are matched regardless of their names, priorities and letters case"""
+        existing_rules = [_create_rule("custom_rule_0", "80", priority=1000),
+                          _create_rule("custom_rule_1", "22", priority=1005)]
+        desired_rules = [_create_rule("custom_rule_a", "22", protocol="tcp"),
+                         _create_rule("custom_rule_b", "80", source="internet")]
+
+        # Act
+        diff = self.reconciler.get_diff(existing_rules=existing_rules, desired_rules=desired_rules)
+
+        # Verify
+        self.assertTrue(diff.is_empty)
+        self.assertEqual(diff.rules_to_keep, [existing_rules[1], existing_rules[0]])
+
+    def test_get_diff_returns_only_changed_rules(self):
+        existing_rules = [_create_rule("custom_rule_0", "80", priority=1000),
+                          _create_rule("custom_rule_1", "22", priority=1005)]
+        desired_rules = [_create_rule("custom_rule_0", "80"),
+                         _create_rule("custom_rule_1", "443")]
+
+        # Act
+        diff = self.reconciler.get_diff(existing_rules=existing_rules, desired_rules=desired_rules)
+
+        # Verify
+        self.assertFalse(diff.is_empty)
+        self.assertEqual(diff.rules_to_keep, [existing_rules[0]])
+        self.assertEqual(diff.rules_to_add, [desired_rules[1]])
+        self.assertEqual(diff.rules_to_remove, [existing_rules[1]])
+
+    def test_get_diff_removes_duplicated_rules(self):
+        existing_rules = [_create_rule("custom_rule_0", "80", priority=1000),
+                          _create_rule("custom_rule_1", "80", priority=1005)]
+        desired_rules = [_create_rule("custom_rule_0", "80"),
+                         _create_rule("custom_rule_1", "80")]
+
+        # Act
+        diff = self.reconciler.get_diff(existing_rules=existing_rules, desired_rules=desired_rules)
+
+        # Verify
+        self.assertEqual(diff.rules_to_keep, [existing_rules[0]])
+        self.assertEqual(diff.rules_to_add, [])
+        self.assertEqual(diff.rules_to_remove, [existing_rules[1]])
+
+    def test_get_diff_with_no_desired_rules_removes_all(self):
+        existing_rules = [_create_rule("custom_rule_0", "80", priority=1000)]
+
+        # Act
+        diff = self.reconciler.get_diff(existing_rules=existing_rules, desired_rules=[])
+
+        # Verify
+        self.assertEqual(diff.rules_to_remove, existing_rules)
+        self.assertEqual(diff.rules_to_add, [])
@@ -143,6 +143,9 @@ class TestAzureModelsParser(TestCase):
         test_resource.attributes["Management Group Name"] = test_mgmt_group_name = mock.MagicMock()
         test_resource.attributes["Execution Server Selector"] = ""
         test_resource.attributes["Private IP Allocation Method"] = "Cloudshell Allocation"
+        test_resource.attributes["Asynchronous Sandbox Teardown"] = "True"
+        test_resource.attributes["Storage Account Pool Depth"] = "2"
+        test_resource.attributes["Key Pair Pool Depth"] = "3"
         cloudshell_session = mock.MagicMock()
         decrypted_azure_application_key = mock.MagicMock()
         cloudshell_session.DecryptPassword.return_value = decrypted_azure_application_key
@@ -162,6 +165,9 @@ class TestAzureModelsParser(TestCase):
         self.assertEqual(result.management_group_name, test_mgmt_group_name)
         self.assertEqual(result.additional_mgmt_networks, ["mgmt_network1", "mgmt_network2"])
         self.assertEqual(result.azure_application_key, decrypted_azure_application_key.Value)
+        self.assertTrue(result.async_sandbox_teardown)
+        self.assertEqual(result.storage_account_pool_depth, 2)
+        self.assertEqual(result.key_pair_pool_depth, 3)
 
     def test_convert_list_attribute(self):
         """Check that method will convert sting attribute into the list"""
@@ -233,3 +239,18 @@ class TestAzureModelsParser(TestCase):
 
         # Verify
         self.assertIs(result, fullname)
+
+    def test_convert_to_refresh_ip_requests(self):
+        """Check that method will return refresh IP request for every deployed app in the request"""
+        request = '{"items": [{"deployedAppJson": {"name": "vm1", "address": "10.0.0.4", "attributes": ' \
+                  '[{"name": "App.Public IP", "value": "1.2.3.4"}]}}, {"deployedAppJson": {"name": "vm2"}}]}'
+
+        # Act
+        result = self.tested_class.convert_to_refresh_ip_requests(request)
+
+        # Verify
+        self.assertEqual([(refresh_ip_request.vm_name, refresh_ip_request.resource_fullname,
+                           refresh_ip_request.private_ip_on_resource,
+                           refresh_ip_request.public_ip_on_resource_attr_tuple) for refresh_ip_request in result],
+                         [("vm1", "vm1", "10.0.0.4", ("App.Public IP", "1.2.3.4")),
+                          ("vm2", "vm2", "", ("Public IP", None))])
@@ -0,0 +1,115 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from cloudshell.cp.azure.domain.services.power_operation_tracker import PowerOperation, PowerOperationTracker
+from cloudshell.cp.azure.domain.services.virtual_machine_service import VirtualMachineService
+
+
+class TestPowerOperationTracker(TestCase):
+    def setUp(self):
+        self.logger = Mock()
+        self.compute_client = Mock()
+        self.statuses = {}
+        self.vm_service = Mock(OPERATION_IN_PROGRESS_STATUS=VirtualMachineService.OPERATION_IN_PROGRESS_STATUS,
+                               OPERATION_SUCCEEDED_STATUS=VirtualMachineService.OPERATION_SUCCEEDED_STATUS)
+        self.vm_service.get_operation_status.side_effect = self._get_operation_status
+        self.tracker = PowerOperationTracker(vm_service=self.vm_service, result_ttl=60)
+
+    def _get_operation_status(self, compute_management_client, status_url):
+        status = self.statuses[status_url]
+        if isinstance(status, Exception):
+            raise status
+        return status
+
+    def _track(self, vm_name, status=None, operation_id=None):
+        status_url = None
+        if status is not None:
+            status_url = "https://management.azure.com/operations/{}".format(operation_id or vm_name)
+            self.statuses[status_url] = status
+
+        with patch("cloudshell.cp.azure.domain.services.power_operation_tracker.Thread"):
+            return self.tracker.track(compute_client=self.compute_client,
+                                      group_name="test_group",
+                                      vm_name=vm_name,
+                                      action="PowerOn",
+                                      status_url=status_url,
+                                      logger=self.logger)
+
+    def test_track_does_not_wait(self):
+        # Act
+        operation = self._track("vm1", ("InProgress", ""))
+
+        # Verify
+        self.assertEqual(operation.status, PowerOperation.ACCEPTED)
+        self.assertIs(self.tracker.get_operation("test_group", "vm1"), operation)
+        self.assertIsNone(self.tracker.get_operation("test_group", "vm2"))
+        self.vm_service.get_operation_status.assert_not_called()
+
+    def test_check_operations_finishes_done_operations(self):
+        running = self._track("vm1", ("InProgress", ""))
+        succeeded = self._track("vm2", ("Succeeded", ""))
+        failed = self._track("vm3", ("Failed", "failed to start"))
+        finished_right_away = self._track("vm4")
+
+        # Act
+        self.tracker.check_operations()
+
+        # Verify
+        self.assertEqual([operation.status for operation in (running, succeeded, failed, finished_right_away)],
+                         [PowerOperation.ACCEPTED, PowerOperation.SUCCEEDED, PowerOperation.FAILED,
+                          PowerOperation.SUCCEEDED])
+        self.assertEqual(failed.error, "failed to start")
+        self.assertTrue(PowerOperationTracker.wait([succeeded, failed]))
+        self.assertFalse(PowerOperationTracker.wait([succeeded, running], timeout=0))
+        self.vm_service.get_operation_status.assert_any_call(
+            compute_management_client=self.compute_client,
+            status_url="https://management.azure.com/operations/vm1")
+        self.assertEqual(self.vm_service.get_operation_status.call_count, 3)
+
+    def test_check_operations_fails_operation_after_failed_polls(self):
+        operation = self._track("vm1", Exception("connection reset"))
+
+        # Act
+        for _ in xrange(PowerOperationTracker.MAX_FAILED_POLLS - 1):
+            self.tracker.check_operations()
+        status_before_last_poll = operation.status
+        self.tracker.check_operations()
+
+        # Verify
+        self.assertEqual(status_before_last_poll, PowerOperation.ACCEPTED)
+        self.assertEqual(operation.status, PowerOperation.FAILED)
+        self.assertEqual(operation.error, "connection reset")
+
+    def test_check_operations_reports_canceled_operation_as_failed(self):
+        operation = self._track("vm1", ("Canceled", ""))
+
+        # Act
+        self.tracker.check_operations()
+
+        # Verify
+        self.assertEqual(operation.status, PowerOperation.FAILED)
+        self.assertEqual(operation.error, "PowerOn operation finished with the status Canceled")
+
+    def test_check_operations_forgets_expired_results(self):
+        operation = self._track("vm1", ("Succeeded", ""))
+        self.tracker.check_operations()
+        operation.finished_at -= 120
+
+        # Act
+        self.tracker.check_operations()
+
+        # Verify
+        self.assertIsNone(self.tracker.get_operation("test_group", "vm1"))
+
+    def test_new_operation_replaces_previous_one(self):
+        previous_operation = self._track("vm1", ("Succeeded", ""), operation_id="start")
+
+        # Act
+        operation = self._track("vm1", ("InProgress", ""), operation_id="deallocate")
+        self.tracker.check_operations()
+
+        # Verify
+        self.assertIs(self.tracker.get_operation("test_group", "vm1"), operation)
+        self.assertEqual(previous_operation.status, PowerOperation.SUCCEEDED)
+        self.assertEqual(operation.status, PowerOperation.ACCEPTED)
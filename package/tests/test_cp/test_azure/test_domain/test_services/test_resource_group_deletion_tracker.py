@@ -0,0 +1,105 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+from msrestazure.azure_exceptions import CloudError
+from requests import Response
+
+from cloudshell.cp.azure.domain.services.resource_group_deletion_tracker import ResourceGroupDeletionTracker
+
+
+class TestResourceGroupDeletionTracker(TestCase):
+    def setUp(self):
+        self.vm_service = Mock()
+        self.resource_client = Mock()
+        self.logger = Mock()
+        self.tracker = ResourceGroupDeletionTracker(vm_service=self.vm_service, max_attempts=2)
+
+    def _start_deletion(self, on_deleted=None):
+        with patch("cloudshell.cp.azure.domain.services.resource_group_deletion_tracker.Thread"):
+            self.tracker.start_deletion(resource_client=self.resource_client,
+                                        group_name="test_group",
+                                        logger=self.logger,
+                                        on_deleted=on_deleted)
+
+    def test_start_deletion_does_not_wait(self):
+        poller = Mock()
+        self.vm_service.begin_delete_resource_group.return_value = poller
+
+        # Act
+        self._start_deletion()
+
+        # Verify
+        self.vm_service.begin_delete_resource_group.assert_called_once_with(
+            resource_management_client=self.resource_client,
+            group_name="test_group")
+        poller.wait.assert_not_called()
+        poller.result.assert_not_called()
+        self.assertTrue(self.tracker.is_tracked("test_group"))
+
+    def test_check_deletions_skips_deletion_in_progress(self):
+        self.vm_service.begin_delete_resource_group.return_value = Mock(done=Mock(return_value=False))
+        self._start_deletion()
+
+        # Act
+        self.tracker.check_deletions()
+
+        # Verify
+        self.assertTrue(self.tracker.is_tracked("test_group"))
+
+    def test_check_deletions_completes_finished_deletion(self):
+        on_deleted = Mock()
+        self.vm_service.begin_delete_resource_group.return_value = Mock(done=Mock(return_value=True))
+        self._start_deletion(on_deleted=on_deleted)
+
+        # Act
+        self.tracker.check_deletions()
+
+        # Verify
+        self.assertFalse(self.tracker.is_tracked("test_group"))
+        on_deleted.assert_called_once_with()
+
+    def test_check_deletions_retries_failed_deletion(self):
+        failed_poller = Mock(done=Mock(return_value=True), result=Mock(side_effect=Exception("conflict")))
+        new_poller = Mock(done=Mock(return_value=False))
+        self.vm_service.begin_delete_resource_group.side_effect = [failed_poller, new_poller]
+        self._start_deletion()
+
+        # Act
+        self.tracker.check_deletions()
+
+        # Verify
+        self.assertEqual(self.vm_service.begin_delete_resource_group.call_count, 2)
+        self.assertTrue(self.tracker.is_tracked("test_group"))
+
+    def test_check_deletions_stops_after_max_attempts(self):
+        on_deleted = Mock()
+        self.vm_service.begin_delete_resource_group.return_value = Mock(done=Mock(return_value=True),
+                                                                        result=Mock(side_effect=Exception("conflict")))
+        self._start_deletion(on_deleted=on_deleted)
+
+        # Act
+        self.tracker.check_deletions()
+        self.tracker.check_deletions()
+
+        # Verify
+        self.assertEqual(self.vm_service.begin_delete_resource_group.call_count, 2)
+        self.assertFalse(self.tracker.is_tracked("test_group"))
+        on_deleted.assert_not_called()
+        self.logger.error.assert_called_once()
+
+    def test_check_deletions_treats_not_found_group_as_deleted(self):
+        on_deleted = Mock()
+        response = Response()
+        response.status_code = 404
+        response.reason = "Not Found"
+        not_found_error = CloudError(response)
+        self.vm_service.begin_delete_resource_group.return_value = Mock(done=Mock(return_value=True),
+                                                                        result=Mock(side_effect=not_found_error))
+        self._start_deletion(on_deleted=on_deleted)
+
+        # Act
+        self.tracker.check_deletions()
+
+        # Verify
+        self.assertFalse(self.tracker.is_tracked("test_group"))
+        on_deleted.assert_called_once_with()
@@ -0,0 +1,147 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from cloudshell.cp.azure.domain.services.resource_group_inventory import ResourceGroupInventory, \
+    ResourceGroupInventoryProvider
+from cloudshell.cp.azure.models.nsg_artifacts_index import NsgArtifactsIndex
+
+
+class TestResourceGroupInventory(TestCase):
+    def setUp(self):
+        self.vm_service = Mock()
+        self.network_service = Mock()
+        self.security_group_service = Mock()
+        self.compute_client = Mock()
+        self.network_client = Mock()
+        self.inventory = ResourceGroupInventory(vm_service=self.vm_service,
+                                                network_service=self.network_service,
+                                                security_group_service=self.security_group_service,
+                                                compute_client=self.compute_client,
+                                                network_client=self.network_client,
+                                                group_name="group")
+
+    @staticmethod
+    def _prepare_resource(resource_id, **kwargs):
+        resource = Mock(id=resource_id, **kwargs)
+        resource.name = resource_id.split("/")[-1]
+        return resource
+
+    def test_resource_type_is_listed_once(self):
+        vm = self._prepare_resource("/subscriptions/sub/virtualMachines/vm1")
+        self.vm_service.list_virtual_machines.return_value = [vm]
+
+        # Act
+        self.assertFalse(self.inventory.is_loaded(ResourceGroupInventory.VIRTUAL_MACHINES))
+        result = [self.inventory.get_virtual_machine("vm1"),
+                  self.inventory.get_virtual_machine("vm1"),
+                  self.inventory.get_virtual_machine("missing_vm")]
+
+        # Verify
+        self.assertEqual(result, [vm, vm, None])
+        self.assertTrue(self.inventory.is_loaded(ResourceGroupInventory.VIRTUAL_MACHINES))
+        self.vm_service.list_virtual_machines.assert_called_once_with(compute_management_client=self.compute_client,
+                                                                      group_name="group")
+        self.network_service.get_network_interfaces.assert_not_called()
+
+    def test_resolves_nic_references(self):
+        public_ip = self._prepare_resource("/subscriptions/sub/publicIPAddresses/ip1")
+        nsg = self._prepare_resource("/subscriptions/sub/networkSecurityGroups/NSG_vm1")
+        nic = self._prepare_resource("/subscriptions/sub/networkInterfaces/nic1",
+                                     network_security_group=Mock(id=nsg.id.upper()))
+        nic.ip_configurations = [Mock(public_ip_address=Mock(id=public_ip.id.upper()),
+                                      subnet=Mock(id="/subscriptions/sub/virtualNetworks/vnet/subnets/subnet1"))]
+        self.network_service.get_network_interfaces.return_value = [nic]
+        self.network_service.get_public_ips.return_value = [public_ip]
+        self.security_group_service.list_network_security_group.return_value = [nsg]
+        vm = Mock()
+        vm.network_profile.network_interfaces = [Mock(id="/subscriptions/sub/missingNic", primary=False),
+                                                 Mock(id=nic.id, primary=True)]
+
+        # Act
+        vm_nics = self.inventory.get_vm_network_interfaces(vm)
+        primary_nic = self.inventory.get_vm_primary_network_interface(vm)
+
+        # Verify
+        self.assertEqual(vm_nics, [nic])
+        self.assertEqual(primary_nic, nic)
+        self.assertEqual(self.inventory.get_nic_public_ip(nic), public_ip)
+        self.assertEqual(self.inventory.get_nic_subnet_name(nic), "subnet1")
+        self.assertEqual(self.inventory.get_nic_network_security_group(nic), nsg)
+        self.assertEqual(self.inventory.get_network_security_group("NSG_vm1"), nsg)
+
+    def test_nic_without_public_ip_and_nsg(self):
+        nic = Mock(network_security_group=None)
+        nic.ip_configurations = [Mock(public_ip_address=None)]
+
+        # Act
+        result = (self.inventory.get_nic_public_ip(nic), self.inventory.get_nic_network_security_group(nic))
+
+        # Verify
+        self.assertEqual(result, (None, None))
+        self.network_service.get_public_ips.assert_not_called()
+        self.security_group_service.list_network_security_group.assert_not_called()
+
+    def test_get_nsg_artifacts_index(self):
+        self.security_group_service.list_network_security_group.return_value = [
+            self._prepare_resource("/subscriptions/sub/networkSecurityGroups/NSG_vm1")]
+
+        # Act
+        result = self.inventory.get_nsg_artifacts_index()
+
+        # Verify
+        self.assertIsInstance(result, NsgArtifactsIndex)
+        self.assertEqual(result.get_vm_network_security_group_names("vm1"), ["NSG_vm1"])
+
+
+class TestResourceGroupInventoryProvider(TestCase):
+    def setUp(self):
+        self.provider = ResourceGroupInventoryProvider(vm_service=Mock(),
+                                                       network_service=Mock(),
+                                                       security_group_service=Mock())
+
+    def _get_inventory(self, group_name="group", max_age=0):
+        return self.provider.get_inventory(compute_client=Mock(),
+                                           network_client=Mock(),
+                                           group_name=group_name,
+                                           max_age=max_age)
+
+    def test_new_snapshot_is_created_by_default(self):
+        # Act
+        first = self._get_inventory()
+        first.created_at -= 1
+        second = self._get_inventory()
+
+        # Verify
+        self.assertIsNot(first, second)
+
+    def test_fresh_snapshot_is_reused(self):
+        # Act
+        first = self._get_inventory()
+        first.created_at -= 1
+        second = self._get_inventory(max_age=60)
+        other_group = self._get_inventory(group_name="other_group", max_age=60)
+
+        # Verify
+        self.assertIs(first, second)
+        self.assertIsNot(first, other_group)
+
+    def test_stale_snapshot_is_replaced(self):
+        first = self._get_inventory()
+        first.created_at -= 120
+
+        # Act
+        second = self._get_inventory(max_age=60)
+
+        # Verify
+        self.assertIsNot(first, second)
+        self.assertIs(self._get_inventory(max_age=60), second)
+
+    def test_invalidate(self):
+        first = self._get_inventory()
+
+        # Act
+        self.provider.invalidate("group")
+
+        # Verify
+        self.assertIsNot(self._get_inventory(max_age=60), first)
@@ -1,13 +1,16 @@
 from threading import Lock
 from unittest import TestCase
 
-from azure.mgmt.network.models import NetworkSecurityGroup
+from azure.mgmt.network.models import NetworkSecurityGroup, SecurityRule
+from msrestazure.azure_exceptions import CloudError
 import mock
 from mock import MagicMock
 from mock import Mock
 
 from cloudshell.cp.azure.domain.services.security_group import SecurityGroupService
+from cloudshell.cp.azure.models.port_data import PortData
 from cloudshell.cp.azure.models.rule_data import RuleData
+from cloudshell.cp.azure.models.security_rule_request import SecurityRuleRequest
 from azure.mgmt.network.models import RouteNextHopType
 
 
@@ -19,8 +22,8 @@ class TestSecurityGroupService(TestCase):
         self.security_group_name = "teststoragename"
         self.network_client = mock.MagicMock()
 
-    def test_rule_priority_generator(self):
-        """Check that method creates generator started from the given value plus increase step"""
+    def test_allocate_priority(self):
+        """Check that method allocates priorities started from the given value plus increase step"""
         expected_values = [
             self.security_group_service.RULE_DEFAULT_PRIORITY,
             (self.security_group_service.RULE_DEFAULT_PRIORITY +
@@ -29,13 +32,39 @@ class TestSecurityGroupService(TestCase):
              self.security_group_service.RULE_PRIORITY_INCREASE_STEP * 2),
             (self.security_group_service.RULE_DEFAULT_PRIORITY +
              self.security_group_service.RULE_PRIORITY_INCREASE_STEP * 3)]
+        self.network_client.security_rules.list.return_value = []
+
+        # Act
+        allocated_values = [self.security_group_service._allocate_priority(
+            network_client=self.network_client,
+            group_name=self.group_name,
+            security_group_name=self.security_group_name) for _ in xrange(4)]
+
+        # Verify
+        self.assertEqual(expected_values, allocated_values)
+        self.network_client.security_rules.list.assert_called_once_with(
+            resource_group_name=self.group_name,
+            network_security_group_name=self.security_group_name)
+
+    def test_allocate_priority_reconciles_when_no_free_priority_left(self):
+        """Check that method re-reads NSG rules from the Azure when cached priorities are exhausted"""
+        allocator = self.security_group_service._priority_allocators.seed_allocator(
+            group_name=self.group_name,
+            security_group_name=self.security_group_name,
+            security_rules=[mock.MagicMock(priority=priority) for priority in xrange(4090, 4097)])
+        self.network_client.security_rules.list.return_value = []
 
         # Act
-        generator = self.security_group_service._rule_priority_generator([])
+        priority = self.security_group_service._allocate_priority(network_client=self.network_client,
+                                                                  group_name=self.group_name,
+                                                                  security_group_name=self.security_group_name,
+                                                                  start_from=4090)
 
         # Verify
-        generated_values = [next(generator) for _ in xrange(4)]
-        self.assertEqual(expected_values, generated_values)
+        self.assertEqual(priority, 4090)
+        self.network_client.security_rules.list.assert_called_once()
+        self.assertIsNot(allocator, self.security_group_service._priority_allocators.get_allocator(
+            self.group_name, self.security_group_name))
 
     def test_list_network_security_group(self):
         """Check that method calls azure network client to get list of NSGs and converts them into list"""
@@ -70,6 +99,8 @@ class TestSecurityGroupService(TestCase):
             parameters=nsg_model)
 
         self.assertEqual(nsg, self.network_client.network_security_groups.create_or_update().result())
+        self.assertIsNotNone(self.security_group_service._priority_allocators.get_allocator(
+            self.group_name, self.security_group_name))
 
     @mock.patch("cloudshell.cp.azure.domain.services.security_group.SecurityRule")
     def test_prepare_security_group_rule(self, security_rule_class):
@@ -159,6 +190,188 @@ class TestSecurityGroupService(TestCase):
             security_rule_name=rule_model.name,
             security_rule_parameters=rule_model)
 
+    def test_create_network_security_group_rules_does_not_list_rules_for_seeded_nsg(self):
+        """Check that method will not call network_client to list NSG rules if priorities are already cached"""
+        self.security_group_service._priority_allocators.seed_allocator(
+            group_name=self.group_name,
+            security_group_name=self.security_group_name,
+            security_rules=[mock.MagicMock(priority=self.security_group_service.RULE_DEFAULT_PRIORITY)])
+        self.security_group_service._prepare_security_group_rule = mock.MagicMock()
+
+        # Act
+        self.security_group_service.create_network_security_group_rules(
+            network_client=self.network_client,
+            group_name=self.group_name,
+            security_group_name=self.security_group_name,
+            inbound_rules=[mock.MagicMock()],
+            destination_addr=mock.MagicMock(),
+            lock=MagicMock())
+
+        # Verify
+        self.network_client.security_rules.list.assert_not_called()
+        self.assertEqual(self.security_group_service._prepare_security_group_rule.call_args[1]["priority"],
+                         (self.security_group_service.RULE_DEFAULT_PRIORITY +
+                          self.security_group_service.RULE_PRIORITY_INCREASE_STEP))
+
+    def test_create_network_security_group_rules_reconciles_on_priority_conflict(self):
+        """Check that method will re-sync priorities with the Azure and retry rule creation on conflict"""
+        conflict_error = CloudError(mock.MagicMock())
+        conflict_error.error = "SecurityRuleConflict"
+        self.network_client.security_rules.list.side_effect = [
+            [],
+            [mock.MagicMock(priority=self.security_group_service.RULE_DEFAULT_PRIORITY)]]
+        self.security_group_service.create_network_security_group_rule = mock.MagicMock(
+            side_effect=[conflict_error, None])
+
+        # Act
+        self.security_group_service.create_network_security_group_rules(
+            network_client=self.network_client,
+            group_name=self.group_name,
+            security_group_name=self.security_group_name,
+            inbound_rules=[mock.MagicMock()],
+            destination_addr=mock.MagicMock(),
+            lock=MagicMock())
+
+        # Verify
+        self.assertEqual(self.network_client.security_rules.list.call_count, 2)
+        self.assertEqual(self.security_group_service.create_network_security_group_rule.call_args[1]["priority"],
+                         (self.security_group_service.RULE_DEFAULT_PRIORITY +
+                          self.security_group_service.RULE_PRIORITY_INCREASE_STEP))
+
+    def test_create_network_security_group_rules_batch(self):
+        """Check that method will add all requested rules to the NSG with a single NSG update"""
+        self.network_client.security_rules.list.return_value = []
+        rules_requests = [
+            SecurityRuleRequest(rule_data=RuleData(protocol="*", port="*", name="rule1"),
+                                destination_addr="10.0.0.0/24", start_from=2000),
+            SecurityRuleRequest(rule_data=RuleData(protocol="*", port="*", name="rule2"),
+                                destination_addr="10.0.1.0/24", start_from=2000),
+            SecurityRuleRequest(rule_data=RuleData(protocol="*", port="*", name="rule3"),
+                                destination_addr="10.0.0.0/16", source_address="10.1.0.0/16", start_from=4090)]
+        self.network_service.update_network_security_group_rules.return_value = Mock(security_rules=[])
+
+        # Act
+        self.security_group_service.create_network_security_group_rules_batch(
+            network_client=self.network_client,
+            group_name=self.group_name,
+            security_group_name=self.security_group_name,
+            rules_requests=rules_requests,
+            lock=MagicMock())
+
+        # Verify
+        self.network_service.update_network_security_group_rules.assert_called_once()
+        rules = self.network_service.update_network_security_group_rules.call_args[1]["rules_to_add"]
+        self.assertEqual([(rule.name, rule.priority, rule.source_address_prefix) for rule in rules],
+                         [("rule1", 2000, RouteNextHopType.internet),
+                          ("rule2", 2005, RouteNextHopType.internet),
+                          ("rule3", 4090, "10.1.0.0/16")])
+        self.network_client.security_rules.create_or_update.assert_not_called()
+
+    def test_create_network_security_group_rules_batch_releases_priorities_on_error(self):
+        """Check that method will return allocated priorities back if NSG update failed"""
+        self.network_client.security_rules.list.return_value = []
+        self.network_service.update_network_security_group_rules.side_effect = Exception()
+        rules_requests = [SecurityRuleRequest(rule_data=RuleData(protocol="*", port="*", name="rule1"),
+                                              destination_addr="*", start_from=2000)]
+
+        # Act
+        with self.assertRaises(Exception):
+            self.security_group_service.create_network_security_group_rules_batch(
+                network_client=self.network_client,
+                group_name=self.group_name,
+                security_group_name=self.security_group_name,
+                rules_requests=rules_requests,
+                lock=MagicMock())
+
+        # Verify
+        allocator = self.security_group_service._priority_allocators.get_allocator(self.group_name,
+                                                                                   self.security_group_name)
+        self.assertFalse(allocator.is_taken(2000))
+
+    def _create_existing_rule(self, name, port, priority, destination="10.0.0.4"):
+        return SecurityRule(access="Allow", direction="Inbound", source_address_prefix="Internet",
+                            source_port_range="*", name=name, destination_address_prefix=destination,
+                            destination_port_range=port, priority=priority, protocol="Tcp")
+
+    def test_reconcile_network_security_group_rules_without_changes(self):
+        """Check that repeated identical request will not update the NSG"""
+        existing_rules = [self._create_existing_rule("custom_rule_0_for_vm", "80", 1000),
+                          self._create_existing_rule("custom_rule_1_for_vm", "22", 1005)]
+        self.network_client.network_security_groups.get.return_value = Mock(security_rules=existing_rules)
+        rules_requests = [SecurityRuleRequest(rule_data=PortData(from_port="22", to_port="22", protocol="tcp"),
+                                              destination_addr="10.0.0.4"),
+                          SecurityRuleRequest(rule_data=PortData(from_port="80", to_port="80", protocol="tcp"),
+                                              destination_addr="10.0.0.4")]
+
+        # Act
+        self.security_group_service.reconcile_network_security_group_rules(
+            network_client=self.network_client,
+            group_name=self.group_name,
+            security_group_name=self.security_group_name,
+            rules_requests=rules_requests,
+            lock=MagicMock(),
+            is_managed_rule=self.security_group_service.is_custom_rule)
+
+        # Verify
+        self.network_service.update_network_security_group_rules.assert_not_called()
+        self.network_client.security_rules.create_or_update.assert_not_called()
+        self.network_client.security_rules.delete.assert_not_called()
+
+    def test_reconcile_network_security_group_rules_applies_only_diff(self):
+        """Check that only changed rules are sent in a single NSG update and kept rules keep their priorities"""
+        not_managed_rule = self._create_existing_rule("vm_inbound_ports:443:tcp", "443", 1000)
+        kept_rule = self._create_existing_rule("custom_rule_0_for_vm", "80", 1005)
+        removed_rule = self._create_existing_rule("custom_rule_1_for_vm", "22", 1010)
+        self.network_client.network_security_groups.get.return_value = Mock(
+            security_rules=[not_managed_rule, kept_rule, removed_rule])
+        self.network_service.update_network_security_group_rules.return_value = Mock(security_rules=[])
+        added_rule_data = PortData(from_port="8080", to_port="8080", protocol="tcp")
+        added_rule_data.name = "custom_rule_0_for_vm"
+        rules_requests = [SecurityRuleRequest(rule_data=added_rule_data, destination_addr="10.0.0.4"),
+                          SecurityRuleRequest(rule_data=PortData(from_port="80", to_port="80", protocol="tcp"),
+                                              destination_addr="10.0.0.4")]
+
+        # Act
+        self.security_group_service.reconcile_network_security_group_rules(
+            network_client=self.network_client,
+            group_name=self.group_name,
+            security_group_name=self.security_group_name,
+            rules_requests=rules_requests,
+            lock=MagicMock(),
+            is_managed_rule=self.security_group_service.is_custom_rule)
+
+        # Verify
+        self.network_service.update_network_security_group_rules.assert_called_once()
+        call_kwargs = self.network_service.update_network_security_group_rules.call_args[1]
+        self.assertEqual(call_kwargs["rule_names_to_remove"], {"custom_rule_1_for_vm"})
+        self.assertEqual([(rule.name, rule.priority, rule.destination_port_range)
+                          for rule in call_kwargs["rules_to_add"]],
+                         [("custom_rule_0_for_vm_1010", 1010, "8080")])
+
+    def test_delete_custom_security_rules_from_nsg(self):
+        """Check that all custom rules are removed with a single NSG update"""
+        custom_rule = self._create_existing_rule("custom_rule_0_for_vm", "80", 1000)
+        other_rule = self._create_existing_rule("rule_1005", "22", 1005)
+        self.network_client.network_security_groups.get.return_value = Mock(
+            security_rules=[custom_rule, other_rule])
+        self.network_service.update_network_security_group_rules.return_value = Mock(security_rules=[other_rule])
+
+        # Act
+        self.security_group_service.delete_custom_security_rules_from_nsg(
+            network_client=self.network_client,
+            resource_group_name=self.group_name,
+            network_security_group_name=self.security_group_name,
+            lock=MagicMock(),
+            logger=Mock())
+
+        # Verify
+        self.network_service.update_network_security_group_rules.assert_called_once_with(
+            network_client=self.network_client,
+            group_name=self.group_name,
+            security_group_name=self.security_group_name,
+            rules_to_add=[],
+            rule_names_to_remove={"custom_rule_0_for_vm"})
+
     def test_get_network_security_group(self):
         # Arrange
         self.network_security_group = MagicMock()
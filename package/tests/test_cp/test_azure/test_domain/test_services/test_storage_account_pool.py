@@ -0,0 +1,141 @@
+from unittest import TestCase
+
+from mock import Mock, MagicMock
+
+from cloudshell.cp.azure.domain.services.storage_account_pool import StorageAccountPool
+
+
+class TestStorageAccountPool(TestCase):
+    def setUp(self):
+        self.storage_service = Mock()
+        self.storage_service.get_pool_group_name.return_value = "cloudshell-storage-pool-westeurope"
+        self.storage_service.get_pool_storage_accounts.return_value = []
+        self.vm_service = Mock()
+        self.task_executor = Mock()
+        self.storage_client = MagicMock()
+        self.resource_client = MagicMock()
+        self.resource_client.config.subscription_id = "subscription"
+        self.logger = Mock()
+        self.pool = StorageAccountPool(storage_service=self.storage_service,
+                                       vm_service=self.vm_service,
+                                       task_executor=self.task_executor)
+
+    def _claim(self, depth=2):
+        return self.pool.claim(storage_client=self.storage_client,
+                               resource_client=self.resource_client,
+                               group_name="sandbox_group",
+                               region="westeurope",
+                               depth=depth,
+                               tags={"SandboxId": "sandbox_group"},
+                               logger=self.logger)
+
+    def _refill(self):
+        self.pool._refill(("subscription", "westeurope"), self.storage_client, self.resource_client,
+                          "westeurope", 2, self.logger)
+
+    def _prepare_storage_account(self, name):
+        storage_account = Mock()
+        storage_account.name = name
+        return storage_account
+
+    def test_claim_returns_none_when_pool_is_disabled(self):
+        # Act
+        result = self._claim(depth=0)
+
+        # Verify
+        self.assertIsNone(result)
+        self.task_executor.submit.assert_not_called()
+
+    def test_claim_returns_none_and_starts_refill_when_pool_is_empty(self):
+        # Act
+        result = self._claim()
+
+        # Verify
+        self.assertIsNone(result)
+        self.task_executor.submit.assert_called_once_with(self.pool._refill, ("subscription", "westeurope"),
+                                                          self.storage_client, self.resource_client,
+                                                          "westeurope", 2, self.logger)
+
+    def test_claim_retags_ready_storage_account_in_place(self):
+        self.pool._ready[("subscription", "westeurope")] = ["cspoolaccount"]
+
+        # Act
+        result = self._claim()
+
+        # Verify
+        self.assertEqual(result, ("cloudshell-storage-pool-westeurope", "cspoolaccount"))
+        self.assertEqual(self.pool._ready[("subscription", "westeurope")], [])
+        self.storage_service.update_storage_account_tags.assert_called_once_with(
+            storage_client=self.storage_client,
+            group_name="cloudshell-storage-pool-westeurope",
+            storage_account_name="cspoolaccount",
+            tags={"SandboxId": "sandbox_group"})
+
+    def test_claim_returns_none_when_tag_update_fails(self):
+        self.pool._ready[("subscription", "westeurope")] = ["cspoolaccount"]
+        self.storage_service.update_storage_account_tags.side_effect = Exception("update failed")
+
+        # Act
+        result = self._claim()
+
+        # Verify
+        self.assertIsNone(result)
+        self.logger.exception.assert_called_once()
+
+    def test_release_deletes_storage_accounts_claimed_by_sandbox(self):
+        self.storage_service.get_pool_storage_accounts.return_value = [self._prepare_storage_account("cspoolaccount")]
+
+        # Act
+        self.pool.release(storage_client=self.storage_client,
+                          group_name="sandbox_group",
+                          region="westeurope",
+                          logger=self.logger)
+
+        # Verify
+        self.storage_service.get_pool_storage_accounts.assert_called_once_with(storage_client=self.storage_client,
+                                                                               region="westeurope",
+                                                                               sandbox_id="sandbox_group")
+        self.storage_service.delete_storage_account.assert_called_once_with(
+            storage_client=self.storage_client,
+            group_name="cloudshell-storage-pool-westeurope",
+            storage_account_name="cspoolaccount")
+
+    def test_refill_is_not_started_twice(self):
+        # Act
+        self._claim()
+        self._claim()
+
+        # Verify
+        self.task_executor.submit.assert_called_once()
+
+    def test_refill_discovers_not_claimed_accounts_and_creates_missing(self):
+        self.storage_service.get_pool_storage_accounts.return_value = [self._prepare_storage_account("cspoolexisting")]
+
+        # Act
+        self._refill()
+
+        # Verify
+        self.vm_service.create_resource_group.assert_called_once_with(
+            resource_management_client=self.resource_client,
+            group_name="cloudshell-storage-pool-westeurope",
+            region="westeurope",
+            tags={})
+        self.storage_service.get_pool_storage_accounts.assert_called_once_with(storage_client=self.storage_client,
+                                                                               region="westeurope")
+        self.storage_service.create_storage_account.assert_called_once()
+        ready = self.pool._ready[("subscription", "westeurope")]
+        self.assertEqual(len(ready), 2)
+        self.assertEqual(ready[0], "cspoolexisting")
+        self.assertTrue(ready[1].startswith("cspool"))
+        self.assertLessEqual(len(ready[1]), 24)
+
+    def test_refill_allows_next_refill_after_failure(self):
+        self.vm_service.create_resource_group.side_effect = Exception("failed")
+        self.pool._refilling.add(("subscription", "westeurope"))
+
+        # Act
+        self._refill()
+
+        # Verify
+        self.logger.exception.assert_called_once()
+        self.assertEqual(self.pool._refilling, set())
@@ -2,6 +2,7 @@ from unittest import TestCase
 
 import mock
 from mock import MagicMock, Mock
+from msrestazure.azure_exceptions import CloudError
 
 
 from cloudshell.cp.azure.domain.services.storage_service import StorageService
@@ -61,6 +62,23 @@ class TestStorageService(TestCase):
         # Verify
         self.assertTrue(TestHelper.CheckMethodCalledXTimes(storage_accounts_create.wait))
 
+    def test_update_storage_account_tags(self):
+        # Arrange
+        storage_client = MagicMock()
+        tags = {"tag": "value"}
+
+        # Act
+        with mock.patch("cloudshell.cp.azure.domain.services.storage_service.StorageAccountUpdateParameters") as stup:
+            self.storage_service.update_storage_account_tags(storage_client=storage_client,
+                                                             group_name="a group name",
+                                                             storage_account_name="account name",
+                                                             tags=tags)
+
+            # Verify
+            stup.assert_called_once_with(tags=tags)
+            storage_client.storage_accounts.update.assert_called_once_with("a group name", "account name",
+                                                                           stup.return_value)
+
     def test_get_storage_per_resource_group(self):
         # Arrange
         storage_client = Mock()
@@ -508,20 +526,50 @@ class TestStorageService(TestCase):
 
         blob_service.delete_blob.assert_called_once_with(container_name=container_name, blob_name=blob_name)
 
-    def test_get_sandbox_storage_account_name(self):
+    def _prepare_storage_account(self, name, tags=None):
+        storage_account = MagicMock(tags=tags)
+        storage_account.name = name
+        return storage_account
+
+    def test_get_sandbox_storage_account(self):
         storage_client = MagicMock()
         group_name = "testgroupname"
-        sandbox_storage_account_name = "teststorageaccountname"
-        storage_account = MagicMock()
-        storage_account.name = sandbox_storage_account_name
-        self.storage_service.get_storage_per_resource_group = MagicMock(return_value=[storage_account])
+        self.storage_service.get_storage_per_resource_group = MagicMock(
+            return_value=[self._prepare_storage_account("teststorageaccountname")])
 
         # Act
-        storage_account_name = self.storage_service.get_sandbox_storage_account_name(
-            storage_client=storage_client,
-            group_name=group_name)
+        result = self.storage_service.get_sandbox_storage_account(storage_client=storage_client,
+                                                                  group_name=group_name,
+                                                                  region="westeurope")
 
         # Verify
         self.storage_service.get_storage_per_resource_group.assert_called_once_with(storage_client, group_name)
-        self.assertEqual(storage_account_name, sandbox_storage_account_name)
+        self.assertEqual(result, (group_name, "teststorageaccountname"))
+
+    def test_get_sandbox_storage_account_claimed_from_pool(self):
+        storage_client = MagicMock()
+        self.storage_service.get_storage_per_resource_group = MagicMock(side_effect=[
+            [],
+            [self._prepare_storage_account("cspoolready"),
+             self._prepare_storage_account("cspoolother", tags={"SandboxId": "othergroup"}),
+             self._prepare_storage_account("cspoolclaimed", tags={"SandboxId": "testgroupname"})]])
+
+        # Act
+        result = self.storage_service.get_sandbox_storage_account(storage_client=storage_client,
+                                                                  group_name="testgroupname",
+                                                                  region="westeurope")
+
+        # Verify
+        self.storage_service.get_storage_per_resource_group.assert_called_with(storage_client,
+                                                                               "cloudshell-storage-pool-westeurope")
+        self.assertEqual(result, ("cloudshell-storage-pool-westeurope", "cspoolclaimed"))
 
+    def test_get_pool_storage_accounts_when_pool_group_does_not_exist(self):
+        error = CloudError(Mock(status_code=404), error="ResourceGroupNotFound")
+        self.storage_service.get_storage_per_resource_group = MagicMock(side_effect=error)
+
+        # Act
+        result = self.storage_service.get_pool_storage_accounts(storage_client=MagicMock(), region="westeurope")
+
+        # Verify
+        self.assertEqual(result, [])
@@ -0,0 +1,93 @@
+from unittest import TestCase
+
+from cloudshell.cp.azure.domain.services.subnet_address_index import SubnetAddressIndex, \
+    SubnetAddressIndexProvider
+
+
+class TestSubnetAddressIndex(TestCase):
+    def setUp(self):
+        self.index = SubnetAddressIndex("10.0.1.0/28", addresses=["10.0.1.5"])
+
+    def test_azure_reserved_addresses_are_used(self):
+        # Verify
+        self.assertEqual(self.index.get_used_ips(), ["10.0.1.0", "10.0.1.1", "10.0.1.2", "10.0.1.3", "10.0.1.5",
+                                                     "10.0.1.15"])
+
+    def test_get_next_available_skips_used_addresses(self):
+        # Act
+        self.index.reserve("10.0.1.4")
+
+        # Verify
+        self.assertEqual(self.index.get_next_available(), "10.0.1.6")
+
+    def test_get_next_available_returns_none_for_full_subnet(self):
+        # Act
+        for i in range(4, 15):
+            self.index.reserve("10.0.1.{}".format(i))
+
+        # Verify
+        self.assertIsNone(self.index.get_next_available())
+
+    def test_get_available_count(self):
+        # Act
+        self.index.reserve("10.0.1.4")
+
+        # Verify
+        self.assertEqual(self.index.get_available_count(), 9)
+
+    def test_release_marks_address_as_available(self):
+        # Act
+        self.index.release("10.0.1.5")
+
+        # Verify
+        self.assertTrue(self.index.is_available("10.0.1.5"))
+        self.assertEqual(self.index.get_next_available(), "10.0.1.4")
+
+    def test_release_keeps_azure_reserved_addresses(self):
+        # Act
+        self.index.release("10.0.1.1")
+
+        # Verify
+        self.assertFalse(self.index.is_available("10.0.1.1"))
+
+    def test_addresses_out_of_subnet_are_ignored(self):
+        # Act
+        self.index.reserve("10.0.2.4")
+        self.index.reserve("not an ip")
+
+        # Verify
+        self.assertFalse(self.index.is_available("10.0.2.4"))
+        self.assertFalse(self.index.contains("10.0.2.4"))
+        self.assertEqual(self.index.get_next_available(), "10.0.1.4")
+
+    def test_reset_replaces_used_addresses(self):
+        # Act
+        self.index.reset(["10.0.1.4"])
+
+        # Verify
+        self.assertTrue(self.index.is_available("10.0.1.5"))
+        self.assertFalse(self.index.is_available("10.0.1.4"))
+
+
+class TestSubnetAddressIndexProvider(TestCase):
+    def setUp(self):
+        self.provider = SubnetAddressIndexProvider()
+
+    def test_get_index_returns_same_index(self):
+        # Act
+        index = self.provider.get_index("reservation", "10.0.1.0/24")
+
+        # Verify
+        self.assertIs(self.provider.get_index("reservation", "10.0.1.0/24"), index)
+        self.assertEqual(self.provider.get_indexes("reservation"), [index])
+
+    def test_remove_indexes(self):
+        self.provider.get_index("reservation", "10.0.1.0/24")
+        other_index = self.provider.get_index("other_reservation", "10.0.1.0/24")
+
+        # Act
+        self.provider.remove_indexes("reservation")
+
+        # Verify
+        self.assertEqual(self.provider.get_indexes("reservation"), [])
+        self.assertEqual(self.provider.get_indexes("other_reservation"), [other_index])
@@ -0,0 +1,74 @@
+from threading import Event
+from unittest import TestCase
+
+from cloudshell.cp.azure.domain.services.task_executor import TaskExecutorService
+
+
+class TestTaskExecutorService(TestCase):
+    def setUp(self):
+        self.task_executor = TaskExecutorService(max_workers=2)
+
+    def test_submit_returns_function_result(self):
+        # Act
+        result = self.task_executor.submit(lambda x, y: x + y, 1, y=2).get(5)
+
+        # Verify
+        self.assertEqual(result, 3)
+
+    def test_submit_reraises_function_exception(self):
+        def func():
+            raise Exception("test error")
+
+        # Act & Verify
+        with self.assertRaisesRegexp(Exception, "test error"):
+            self.task_executor.submit(func).get(5)
+
+        stats = self.task_executor.get_stats()
+        self.assertEqual(stats.failed_tasks, 1)
+        self.assertEqual(stats.completed_tasks, 0)
+
+    def test_map_preserves_items_order(self):
+        # Act
+        result = self.task_executor.map(lambda x: x * 2, range(10))
+
+        # Verify
+        self.assertEqual(result, [x * 2 for x in range(10)])
+        self.assertEqual(self.task_executor.get_stats().completed_tasks, 10)
+
+    def test_pool_is_created_once(self):
+        # Act
+        self.task_executor.map(lambda x: x, range(3))
+        pool = self.task_executor._pool
+        self.task_executor.map(lambda x: x, range(3))
+
+        # Verify
+        self.assertIs(self.task_executor._pool, pool)
+
+    def test_get_stats_reports_queue_depth_and_active_workers(self):
+        release = Event()
+        started = [Event(), Event()]
+
+        def func(i):
+            started[i].set()
+            release.wait(5)
+
+        results = [self.task_executor.submit(func, i) for i in range(2)]
+        queued_result = self.task_executor.submit(lambda: None)
+        for event in started:
+            event.wait(5)
+
+        # Act
+        stats = self.task_executor.get_stats()
+        release.set()
+        for async_result in results + [queued_result]:
+            async_result.get(5)
+
+        # Verify
+        self.assertEqual(stats.max_workers, 2)
+        self.assertEqual(stats.active_workers, 2)
+        self.assertEqual(stats.queue_depth, 1)
+        final_stats = self.task_executor.get_stats()
+        self.assertEqual(final_stats.active_workers, 0)
+        self.assertEqual(final_stats.queue_depth, 0)
+        self.assertEqual(final_stats.completed_tasks, 3)
+        self.assertGreater(final_stats.max_wait_time, 0)
@@ -1,9 +1,10 @@
 from unittest import TestCase
 
 from azure.mgmt.compute.models import Plan, DiskCreateOptionTypes, OSDisk, ManagedDiskParameters, StorageAccountTypes, \
-    ImageReference, NetworkInterfaceReference
+    ImageReference, NetworkInterfaceReference, InstanceViewTypes
 from mock import MagicMock, Mock, patch
 from msrestazure.azure_exceptions import CloudError
+from requests import Response
 
 from cloudshell.cp.azure.domain.services.virtual_machine_service import VirtualMachineService
 
@@ -325,6 +326,81 @@ class TestVirtualMachineService(TestCase):
         operation_poller.result.assert_not_called()
         self.assertIsNone(res)
 
+    def test_begin_start_vm(self):
+        """Check that method sends start request without the SDK poller and returns the operation status URL"""
+        compute_management_client = MagicMock()
+        raw_response = compute_management_client.virtual_machines.start.return_value
+        raw_response.response.status_code = 202
+        raw_response.response.headers = {"Azure-AsyncOperation": "https://test_status_url",
+                                         "Location": "https://test_location_url"}
+
+        # Act
+        res = self.vm_service.begin_start_vm(compute_management_client=compute_management_client,
+                                             group_name="test_group_name",
+                                             vm_name="test_vm_name")
+
+        # Verify
+        compute_management_client.virtual_machines.start.assert_called_once_with(
+            resource_group_name="test_group_name",
+            vm_name="test_vm_name",
+            raw=True)
+        self.assertEqual(res, "https://test_status_url")
+
+    def test_begin_deallocate_vm_finished_right_away(self):
+        """Check that method returns None when the deallocate operation was finished with the first response"""
+        compute_management_client = MagicMock()
+        raw_response = compute_management_client.virtual_machines.deallocate.return_value
+        raw_response.response.status_code = 200
+
+        # Act
+        res = self.vm_service.begin_deallocate_vm(compute_management_client=compute_management_client,
+                                                  group_name="test_group_name",
+                                                  vm_name="test_vm_name")
+
+        # Verify
+        compute_management_client.virtual_machines.deallocate.assert_called_once_with(
+            resource_group_name="test_group_name",
+            vm_name="test_vm_name",
+            raw=True)
+        self.assertIsNone(res)
+
+    @patch("cloudshell.cp.azure.domain.services.virtual_machine_service.ServiceClient")
+    def test_get_operation_status(self, service_client_class):
+        """Check that method polls the status URL with a single service client per compute client"""
+        compute_management_client = MagicMock()
+        client = service_client_class.return_value
+        client.send.side_effect = [
+            Mock(status_code=202),
+            Mock(status_code=200, content="{}", json=Mock(return_value={"status": "InProgress"})),
+            Mock(status_code=200, content="{}", json=Mock(return_value={"status": "Failed",
+                                                                        "error": {"message": "test error"}})),
+            Mock(status_code=200, content="")]
+
+        # Act
+        statuses = [self.vm_service.get_operation_status(compute_management_client=compute_management_client,
+                                                         status_url="https://test_status_url")
+                    for _ in xrange(4)]
+
+        # Verify
+        self.assertEqual(statuses, [("InProgress", ""), ("InProgress", ""), ("Failed", "test error"),
+                                    ("Succeeded", "")])
+        service_client_class.assert_called_once_with(compute_management_client.config.credentials,
+                                                     compute_management_client.config)
+        client.get.assert_called_with("https://test_status_url")
+
+    @patch("cloudshell.cp.azure.domain.services.virtual_machine_service.ServiceClient")
+    def test_get_operation_status_raises_cloud_error(self, service_client_class):
+        """Check that method raises CloudError on the unexpected status code of the status request"""
+        response = Response()
+        response.status_code = 404
+        response._content = ""
+        service_client_class.return_value.send.return_value = response
+
+        with self.assertRaises(CloudError):
+            # Act
+            self.vm_service.get_operation_status(compute_management_client=MagicMock(),
+                                                 status_url="https://test_status_url")
+
     @patch("cloudshell.cp.azure.domain.services.virtual_machine_service.LinuxConfiguration")
     def test_prepare_linux_configuration(self, linux_configuration_class):
         """Check that method will return LinuxConfiguration instance for the Azure client"""
@@ -380,6 +456,21 @@ class TestVirtualMachineService(TestCase):
             self.vm_service.get_active_vm(compute_management_client=compute_client, group_name=group_name,
                                           vm_name=vm_name)
 
+    def test_get_vm_instance_view(self):
+        """Check that method will get Azure VM with the expanded instance view"""
+        compute_client = MagicMock()
+
+        # Act
+        vm = self.vm_service.get_vm_instance_view(compute_management_client=compute_client,
+                                                  group_name="test_group_name",
+                                                  vm_name="test_vm_name")
+
+        # Verify
+        self.assertIs(vm, compute_client.virtual_machines.get.return_value)
+        compute_client.virtual_machines.get.assert_called_once_with(resource_group_name="test_group_name",
+                                                                    vm_name="test_vm_name",
+                                                                    expand=InstanceViewTypes.instance_view)
+
     @patch("cloudshell.cp.azure.domain.services.virtual_machine_service.OperatingSystemTypes")
     def test_prepare_image_os_type_returns_linux(self, operating_system_types):
         """Check that method will return Linux OS type"""
@@ -0,0 +1,154 @@
+from unittest import TestCase
+
+from mock import MagicMock, Mock
+
+from cloudshell.cp.azure.domain.services.resource_group_inventory import ResourceGroupInventoryProvider
+from cloudshell.cp.azure.domain.services.task_executor import TaskExecutorService
+from cloudshell.cp.azure.domain.services.vm_state_service import VmState, VmStateService
+
+
+class TestVmStateService(TestCase):
+    def setUp(self):
+        self.compute_client = Mock()
+        self.network_client = Mock()
+        self.group_name = "test_group"
+        self.logger = Mock()
+        self.vm_service = MagicMock()
+        self.inventory_provider = ResourceGroupInventoryProvider(vm_service=self.vm_service,
+                                                                 network_service=Mock(),
+                                                                 security_group_service=Mock())
+        self.vm_state_service = VmStateService(inventory_provider=self.inventory_provider,
+                                               vm_service=self.vm_service,
+                                               task_executor=TaskExecutorService(max_workers=2))
+
+    def _prepare_vm(self, vm_name, provisioning_state="Succeeded"):
+        vm = Mock(provisioning_state=provisioning_state)
+        vm.name = vm_name
+        return vm
+
+    def _prepare_instance_view(self, power_state):
+        return Mock(instance_view=Mock(statuses=[Mock(code="ProvisioningState/succeeded"),
+                                                 Mock(code="PowerState/" + power_state)]))
+
+    def _get_vm_states(self, vm_names=None):
+        return self.vm_state_service.get_vm_states(compute_client=self.compute_client,
+                                                   network_client=self.network_client,
+                                                   group_name=self.group_name,
+                                                   logger=self.logger,
+                                                   vm_names=vm_names)
+
+    def _get_active_vm(self, vm_name):
+        return self.vm_state_service.get_active_vm(compute_client=self.compute_client,
+                                                   network_client=self.network_client,
+                                                   group_name=self.group_name,
+                                                   vm_name=vm_name)
+
+    def test_get_vm_states(self):
+        self.vm_service.list_virtual_machines.return_value = [self._prepare_vm("vm1"),
+                                                              self._prepare_vm("vm2", provisioning_state="Creating")]
+        self.vm_service.get_vm_instance_view.return_value = self._prepare_instance_view("running")
+
+        # Act
+        states = self._get_vm_states()
+
+        # Verify
+        self.assertEqual({vm_name: (state.provisioning_state, state.power_state)
+                          for vm_name, state in states.iteritems()},
+                         {"vm1": ("Succeeded", "running"), "vm2": ("Creating", None)})
+        self.vm_service.list_virtual_machines.assert_called_once_with(compute_management_client=self.compute_client,
+                                                                      group_name=self.group_name)
+        self.vm_service.get_vm_instance_view.assert_called_once_with(compute_management_client=self.compute_client,
+                                                                     group_name=self.group_name,
+                                                                     vm_name="vm1")
+
+    def test_get_vm_states_is_cached_until_invalidated(self):
+        self.vm_service.list_virtual_machines.return_value = [self._prepare_vm("vm1")]
+        self.vm_service.get_vm_instance_view.return_value = self._prepare_instance_view("running")
+
+        # Act
+        self._get_vm_states()
+        states = self._get_vm_states(vm_names=["vm1", "missing_vm"])
+
+        # Verify
+        self.assertEqual(states["vm1"].power_state, "running")
+        self.assertIsNone(states["missing_vm"].provisioning_state)
+        self.assertEqual(self.vm_service.list_virtual_machines.call_count, 1)
+        self.assertEqual(self.vm_service.get_vm_instance_view.call_count, 1)
+
+        self.vm_state_service.invalidate(self.group_name)
+        self._get_vm_states()
+        self.assertEqual(self.vm_service.list_virtual_machines.call_count, 2)
+        self.assertEqual(self.vm_service.get_vm_instance_view.call_count, 2)
+
+    def test_get_vm_states_reuses_shared_inventory_snapshot(self):
+        self.vm_service.list_virtual_machines.return_value = [self._prepare_vm("vm1", provisioning_state="Creating")]
+        # snapshot was taken by another command of the sandbox
+        self.inventory_provider.get_inventory(compute_client=self.compute_client,
+                                              network_client=self.network_client,
+                                              group_name=self.group_name).get_virtual_machines()
+
+        # Act
+        states = self._get_vm_states()
+
+        # Verify
+        self.assertEqual(states["vm1"].provisioning_state, "Creating")
+        self.assertEqual(self.vm_service.list_virtual_machines.call_count, 1)
+
+    def test_get_vm_states_lists_vms_again_once_expired(self):
+        self.vm_state_service.ttl = -1
+        self.vm_service.list_virtual_machines.return_value = [self._prepare_vm("vm1")]
+        self.vm_service.get_vm_instance_view.return_value = self._prepare_instance_view("running")
+
+        # Act
+        self._get_vm_states()
+        self._get_vm_states()
+
+        # Verify
+        self.assertEqual(self.vm_service.list_virtual_machines.call_count, 2)
+        # power states are cached together with the snapshot they were read for
+        self.assertEqual(self.vm_service.get_vm_instance_view.call_count, 2)
+
+    def test_get_vm_states_power_state_is_unknown_if_instance_view_failed(self):
+        self.vm_service.list_virtual_machines.return_value = [self._prepare_vm("vm1")]
+        self.vm_service.get_vm_instance_view.side_effect = Exception("failed")
+
+        # Act
+        states = self._get_vm_states()
+
+        # Verify
+        self.assertIsNone(states["vm1"].power_state)
+        self.assertEqual(states["vm1"].provisioning_state, "Succeeded")
+        self.logger.warning.assert_called_once_with(
+            "Failed to get instance view of the VM vm1, its power state is unknown", exc_info=1)
+
+    def test_get_active_vm_from_listing(self):
+        vm = self._prepare_vm("vm1")
+        self.vm_service.list_virtual_machines.return_value = [vm, self._prepare_vm("vm2", "Updating")]
+
+        # Act
+        result = self._get_active_vm("vm1")
+        not_provisioned = self._get_active_vm("vm2")
+
+        # Verify
+        self.assertIs(result, vm)
+        self.assertIs(not_provisioned, self.vm_service.get_active_vm.return_value)
+        self.vm_service.list_virtual_machines.assert_called_once_with(compute_management_client=self.compute_client,
+                                                                      group_name=self.group_name)
+        self.vm_service.get_active_vm.assert_called_once_with(compute_management_client=self.compute_client,
+                                                              group_name=self.group_name,
+                                                              vm_name="vm2")
+
+    def test_remove_group_drops_inventory_snapshot(self):
+        self.vm_service.list_virtual_machines.return_value = []
+        self._get_vm_states()
+
+        # Act
+        self.vm_state_service.remove_group(self.group_name)
+
+        # Verify
+        self._get_vm_states()
+        self.assertEqual(self.vm_service.list_virtual_machines.call_count, 2)
+
+    def test_get_power_state_without_instance_view(self):
+        self.assertIsNone(VmState.get_power_state(None))
+        self.assertIsNone(VmState.get_power_state(Mock(statuses=None)))
@@ -0,0 +1,218 @@
+import sys
+import time
+import traceback
+from threading import Event, Thread
+from unittest import TestCase
+
+from mock import Mock
+
+from cloudshell.cp.azure.domain.services.vnet_mutation_queue import VnetMutationQueue, CreateSubnetMutation, \
+    DeleteSubnetMutation, UpdateSubnetMutation
+
+
+class TestVnetMutations(TestCase):
+    def setUp(self):
+        self.subnet = Mock(address_prefix="10.0.1.0/24")
+        self.subnet.name = "subnet1"
+        self.virtual_network = Mock(subnets=[self.subnet])
+
+    def test_create_subnet_mutation(self):
+        # Act
+        changed = CreateSubnetMutation(subnet_name="subnet2", subnet_cidr="10.0.2.0/24").apply(self.virtual_network)
+
+        # Verify
+        self.assertTrue(changed)
+        self.assertEqual([(subnet.name, subnet.address_prefix) for subnet in self.virtual_network.subnets],
+                         [("subnet1", "10.0.1.0/24"), ("subnet2", "10.0.2.0/24")])
+
+    def test_create_subnet_mutation_for_existing_subnet(self):
+        # Act
+        changed = CreateSubnetMutation(subnet_name="subnet1", subnet_cidr="10.0.1.0/24").apply(self.virtual_network)
+
+        # Verify
+        self.assertFalse(changed)
+        self.assertEqual(self.virtual_network.subnets, [self.subnet])
+
+    def test_delete_subnet_mutation(self):
+        # Act
+        changed = DeleteSubnetMutation(subnet_name="subnet1").apply(self.virtual_network)
+
+        # Verify
+        self.assertTrue(changed)
+        self.assertEqual(self.virtual_network.subnets, [])
+
+    def test_update_subnet_mutation_changes_only_given_attributes(self):
+        route_table = self.subnet.route_table
+
+        # Act
+        changed = UpdateSubnetMutation(subnet_name="subnet1", network_security_group=None).apply(self.virtual_network)
+
+        # Verify
+        self.assertTrue(changed)
+        self.assertIsNone(self.subnet.network_security_group)
+        self.assertIs(self.subnet.route_table, route_table)
+
+
+class TestVnetMutationQueue(TestCase):
+    def setUp(self):
+        self.network_service = Mock()
+        self.network_client = Mock()
+        self.queue = VnetMutationQueue(network_service=self.network_service)
+
+    def test_submit_applies_mutations_with_vnet_update(self):
+        virtual_network = Mock(subnets=[])
+        updated_vnet = Mock()
+
+        def update_virtual_network(update_func, **kwargs):
+            update_func(virtual_network)
+            return updated_vnet
+
+        self.network_service.update_virtual_network.side_effect = update_virtual_network
+
+        # Act
+        result = self.queue.submit(network_client=self.network_client,
+                                   resource_group_name="mgmt_group",
+                                   virtual_network_name="vnet",
+                                   mutations=[CreateSubnetMutation(subnet_name="subnet1", subnet_cidr="10.0.1.0/24")])
+
+        # Verify
+        self.assertIs(result, updated_vnet)
+        self.assertEqual([subnet.name for subnet in virtual_network.subnets], ["subnet1"])
+
+    def test_submit_coalesces_pending_mutations_into_single_update(self):
+        """Check that mutations submitted while vNet is being updated are written together with one update"""
+        virtual_network = Mock(subnets=[])
+        first_update_started = Event()
+        release_first_update = Event()
+
+        def update_virtual_network(update_func, **kwargs):
+            if not first_update_started.is_set():
+                first_update_started.set()
+                release_first_update.wait(5)
+            update_func(virtual_network)
+            return virtual_network
+
+        self.network_service.update_virtual_network.side_effect = update_virtual_network
+
+        def submit(subnet_name):
+            self.queue.submit(network_client=self.network_client,
+                              resource_group_name="mgmt_group",
+                              virtual_network_name="vnet",
+                              mutations=[CreateSubnetMutation(subnet_name=subnet_name, subnet_cidr=subnet_name)])
+
+        writer = Thread(target=submit, args=("subnet0",))
+        writer.start()
+        first_update_started.wait(5)
+        followers = [Thread(target=submit, args=("subnet{}".format(i),)) for i in range(1, 5)]
+        for follower in followers:
+            follower.start()
+
+        # wait until all followers put their mutations to the queue
+        key = (self.network_client.config.subscription_id, "mgmt_group", "vnet")
+        for _ in range(500):
+            if len(self.queue._pending.get(key, [])) == 4:
+                break
+            time.sleep(0.01)
+
+        # Act
+        release_first_update.set()
+        for thread in [writer] + followers:
+            thread.join(5)
+
+        # Verify
+        self.assertEqual(self.network_service.update_virtual_network.call_count, 2)
+        self.assertEqual(sorted(subnet.name for subnet in virtual_network.subnets),
+                         ["subnet{}".format(i) for i in range(5)])
+        self.assertEqual(self.queue._pending, {})
+        self.assertEqual(self.queue._writers, set())
+
+    def test_failed_grouped_update_is_retried_per_request(self):
+        """Check that invalid mutation fails only its own request"""
+        good_request = Mock()
+        bad_request = Mock()
+        bad_request.apply.side_effect = Exception("invalid subnet")
+
+        def update_virtual_network(update_func, **kwargs):
+            update_func(Mock())
+            return "vnet"
+
+        self.network_service.update_virtual_network.side_effect = update_virtual_network
+
+        # Act
+        self.queue._write_requests(network_client=self.network_client,
+                                   resource_group_name="mgmt_group",
+                                   virtual_network_name="vnet",
+                                   requests=[good_request, bad_request])
+
+        # Verify
+        self.assertEqual(self.network_service.update_virtual_network.call_count, 3)
+        good_request.complete.assert_called_once_with(result="vnet")
+        bad_request_exception = bad_request.complete.call_args[1]["exc_info"][1]
+        self.assertEqual(bad_request_exception.message, "invalid subnet")
+
+    def test_writer_hands_off_after_its_own_request_is_written(self):
+        """Check that writer returns once its own mutations are written and the next caller writes the rest"""
+        virtual_network = Mock(subnets=[])
+        update_started = [Event(), Event()]
+        release_update = [Event(), Event()]
+
+        def update_virtual_network(update_func, **kwargs):
+            update_number = self.network_service.update_virtual_network.call_count - 1
+            update_started[update_number].set()
+            release_update[update_number].wait(5)
+            update_func(virtual_network)
+            return virtual_network
+
+        self.network_service.update_virtual_network.side_effect = update_virtual_network
+
+        def submit(subnet_name):
+            self.queue.submit(network_client=self.network_client,
+                              resource_group_name="mgmt_group",
+                              virtual_network_name="vnet",
+                              mutations=[CreateSubnetMutation(subnet_name=subnet_name, subnet_cidr=subnet_name)])
+
+        writer = Thread(target=submit, args=("subnet0",))
+        writer.start()
+        update_started[0].wait(5)
+        follower = Thread(target=submit, args=("subnet1",))
+        follower.start()
+
+        key = (self.network_client.config.subscription_id, "mgmt_group", "vnet")
+        for _ in range(500):
+            if self.queue._pending.get(key):
+                break
+            time.sleep(0.01)
+
+        # Act
+        release_update[0].set()
+        update_started[1].wait(5)
+        writer.join(5)
+
+        # Verify
+        self.assertFalse(writer.is_alive())
+        self.assertTrue(follower.is_alive())
+
+        release_update[1].set()
+        follower.join(5)
+        self.assertEqual(sorted(subnet.name for subnet in virtual_network.subnets), ["subnet0", "subnet1"])
+        self.assertEqual(self.queue._writers, set())
+
+    def test_submit_raises_request_exception(self):
+        def update_virtual_network(**kwargs):
+            raise Exception("test error")
+
+        self.network_service.update_virtual_network.side_effect = update_virtual_network
+
+        # Act & Verify
+        with self.assertRaisesRegexp(Exception, "test error"):
+            try:
+                self.queue.submit(network_client=self.network_client,
+                                  resource_group_name="mgmt_group",
+                                  virtual_network_name="vnet",
+                                  mutations=[DeleteSubnetMutation(subnet_name="subnet1")])
+            except Exception:
+                # original traceback of the vNet update is kept
+                self.assertEqual(traceback.extract_tb(sys.exc_info()[2])[-1][2], "update_virtual_network")
+                raise
+
+        self.assertEqual(self.queue._writers, set())
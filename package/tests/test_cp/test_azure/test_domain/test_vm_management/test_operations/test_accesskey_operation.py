@@ -19,15 +19,18 @@ class TestAcessKeyOperation(TestCase):
         storage_name = "storage_name"
         storage_client = Mock()
         ssh_key = SSHKey(private_key="private-key", public_key="public-key")
-        self.storage_service.get_sandbox_storage_account_name = Mock(return_value=storage_name)
+        self.storage_service.get_sandbox_storage_account = Mock(return_value=("storage_group", storage_name))
         self.key_pair_service.get_key_pair = Mock(return_value=ssh_key)
 
         # Act
-        res = self.access_key_operation.get_access_key(storage_client, group_name)
+        res = self.access_key_operation.get_access_key(storage_client, group_name, "westeurope")
 
         # Verify
         self.assertTrue(res == "private-key")
         self.key_pair_service.get_key_pair.assert_called_with(
                 storage_client=storage_client,
-                group_name=group_name,
+                group_name="storage_group",
                 storage_name=storage_name)
+        self.storage_service.get_sandbox_storage_account.assert_called_once_with(storage_client=storage_client,
+                                                                                 group_name=group_name,
+                                                                                 region="westeurope")
@@ -4,6 +4,7 @@ import mock
 from msrest.exceptions import AuthenticationError
 from msrestazure.azure_exceptions import CloudError
 
+from cloudshell.cp.azure.domain.services.task_executor import TaskExecutorService
 from cloudshell.cp.azure.domain.vm_management.operations.autoload_operation import AutoloadOperation
 from cloudshell.cp.azure.common.exceptions.autoload_exception import AutoloadException
 
@@ -17,7 +18,8 @@ class TestAutoloadOperation(TestCase):
         self.logger = mock.MagicMock()
         self.autoload_operation = AutoloadOperation(subscription_service=self.subscription_service,
                                                     vm_service=self.vm_service,
-                                                    network_service=self.network_service)
+                                                    network_service=self.network_service,
+                                                    task_executor=TaskExecutorService(max_workers=2))
 
     @mock.patch("cloudshell.cp.azure.domain.vm_management.operations.autoload_operation.AutoLoadDetails")
     def test_get_inventory(self, autoload_details_class):
@@ -47,6 +49,47 @@ class TestAutoloadOperation(TestCase):
         self.autoload_operation._validate_vm_size.assert_called_once()
         self.autoload_operation._validate_additional_mgmt_networks.assert_called_once()
 
+    def test_get_inventory_reports_all_validation_errors(self):
+        """Check that method will run all validations and raise AutoloadException with all found errors"""
+        cloud_provider_model = mock.MagicMock(region="westus", vm_size="Standard_A1",
+                                              additional_mgmt_networks=["10.0.0.0/24"])
+        self.autoload_operation._validate_api_credentials = mock.MagicMock()
+        self.autoload_operation._register_azure_providers = mock.MagicMock()
+        self.subscription_service.list_available_regions.return_value = [mock.MagicMock()]
+        self.vm_service.get_resource_group.return_value = mock.MagicMock(location="westus")
+        self.vm_service.list_virtual_machine_sizes.return_value = []
+        self.network_service.get_virtual_network_by_tag.side_effect = [mock.MagicMock(), None]
+
+        # Act
+        with self.assertRaises(AutoloadException) as ex:
+            self.autoload_operation.get_inventory(cloud_provider_model=cloud_provider_model, logger=self.logger)
+
+        # Verify
+        self.assertIn('Region "westus" is not a valid Azure Geo-location', ex.exception.message)
+        self.assertIn("VM Size Standard_A1 is not valid", ex.exception.message)
+        self.assertIn('Failed to find Vnet with network type "{}" tag'.format(
+            self.network_service.MGMT_NETWORK_TAG_VALUE), ex.exception.message)
+        self.autoload_operation._register_azure_providers.assert_called_once()
+        self.vm_service.get_resource_group.assert_called_once()
+
+    def test_get_inventory_raises_single_validation_error_as_is(self):
+        """Check that method will raise the original error if only one validation failed"""
+        cloud_provider_model = mock.MagicMock(vm_size=None, additional_mgmt_networks=[])
+        register_error = CloudError(mock.MagicMock(), "registration failed")
+        self.autoload_operation._validate_api_credentials = mock.MagicMock()
+        self.autoload_operation._validate_region = mock.MagicMock()
+        self.autoload_operation._validate_mgmt_resource_group = mock.MagicMock()
+        self.autoload_operation._validate_vnet = mock.MagicMock()
+        self.autoload_operation._register_azure_providers = mock.MagicMock(side_effect=register_error)
+
+        # Act
+        with self.assertRaises(CloudError) as ex:
+            self.autoload_operation.get_inventory(cloud_provider_model=cloud_provider_model, logger=self.logger)
+
+        # Verify
+        self.assertIs(ex.exception, register_error)
+        self.assertEqual(self.autoload_operation._validate_vnet.call_count, 2)
+
     @mock.patch("cloudshell.cp.azure.domain.vm_management.operations.autoload_operation.AzureClientsManager")
     def test_validate_api_credentials(self, azure_clients_manager_class):
         """Check that method will raise AutoloadException if Azure API credentials aren't valid"""
@@ -181,17 +224,58 @@ class TestAutoloadOperation(TestCase):
 
     def test_register_azure_providers(self):
         """Check that method will use resource client to register Azure providers"""
-        resource_client = mock.MagicMock()
+        # child mocks are created up front, providers are registered in the worker threads
+        resource_client = mock.MagicMock(providers=mock.MagicMock(register=mock.MagicMock()))
 
         # Act
-        self.autoload_operation._register_azure_providers(resource_client=resource_client, logger=self.logger)
+        self.autoload_operation._register_azure_providers(resource_client=resource_client,
+                                                          subscription_id="test_subscription",
+                                                          logger=self.logger)
 
         # Verify
         resource_client.providers.register.assert_has_calls([
             mock.call("Microsoft.Authorization"),
             mock.call("Microsoft.Storage"),
             mock.call("Microsoft.Network"),
-            mock.call("Microsoft.Compute")])
+            mock.call("Microsoft.Compute")], any_order=True)
+
+    def test_register_azure_providers_registers_only_missing_providers_once(self):
+        """Check that method will register only not registered providers and remember the subscription"""
+        # child mocks are created up front, providers are registered in the worker threads
+        resource_client = mock.MagicMock(providers=mock.MagicMock(register=mock.MagicMock()))
+        resource_client.providers.list.return_value = [
+            mock.MagicMock(namespace="microsoft.authorization", registration_state="Registered"),
+            mock.MagicMock(namespace="Microsoft.Storage", registration_state="Registering"),
+            mock.MagicMock(namespace="Microsoft.Network", registration_state="NotRegistered")]
+
+        # Act
+        for _ in range(2):
+            self.autoload_operation._register_azure_providers(resource_client=resource_client,
+                                                              subscription_id="test_subscription",
+                                                              logger=self.logger)
+
+        # Verify
+        resource_client.providers.list.assert_called_once_with()
+        resource_client.providers.register.assert_has_calls([mock.call("Microsoft.Network"),
+                                                             mock.call("Microsoft.Compute")], any_order=True)
+        self.assertEqual(resource_client.providers.register.call_count, 2)
+
+    def test_register_azure_providers_does_not_remember_failed_registration(self):
+        """Check that method will check providers again on the next autoload if registration failed"""
+        resource_client = mock.MagicMock()
+        resource_client.providers.register.side_effect = [Exception("failed")] + [mock.MagicMock()] * 7
+
+        # Act
+        with self.assertRaises(Exception):
+            self.autoload_operation._register_azure_providers(resource_client=resource_client,
+                                                              subscription_id="test_subscription",
+                                                              logger=self.logger)
+        self.autoload_operation._register_azure_providers(resource_client=resource_client,
+                                                          subscription_id="test_subscription",
+                                                          logger=self.logger)
+
+        # Verify
+        self.assertEqual(resource_client.providers.list.call_count, 2)
 
     def test_validate_networks_in_use_not_all_sandbox_subnets_listed(self):
         """Check that method will raise AutoloadException if "Networks In Use" attribute is invalid
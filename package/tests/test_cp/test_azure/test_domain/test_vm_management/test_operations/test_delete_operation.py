@@ -2,16 +2,19 @@ from threading import Lock
 from unittest import TestCase
 
 from azure.mgmt.compute.models import NetworkInterfaceReference
-from mock import Mock, MagicMock
+from mock import ANY, Mock, MagicMock
 from msrestazure.azure_exceptions import CloudError
 from requests import Response
 
-from cloudshell.cp.azure.domain.services.ip_service import IpService
 from cloudshell.cp.azure.domain.services.network_service import NetworkService
+from cloudshell.cp.azure.domain.services.resource_group_inventory import ResourceGroupInventoryProvider
 from cloudshell.cp.azure.domain.services.security_group import SecurityGroupService
+from cloudshell.cp.azure.domain.services.task_executor import TaskExecutorService
 from cloudshell.cp.azure.domain.services.tags import TagService
 from cloudshell.cp.azure.domain.services.virtual_machine_service import VirtualMachineService
+from cloudshell.cp.azure.domain.services.vnet_mutation_queue import DeleteSubnetMutation, UpdateSubnetMutation
 from cloudshell.cp.azure.domain.vm_management.operations.delete_operation import DeleteAzureVMOperation
+from cloudshell.cp.azure.models.nsg_artifacts_index import NsgArtifactsIndex
 
 
 class TestDeleteOperation(TestCase):
@@ -24,15 +27,24 @@ class TestDeleteOperation(TestCase):
         self.security_group_service = SecurityGroupService(self.network_service)
         self.generic_lock_provider = Mock()
         self.generic_lock_provider.get_resource_lock = Mock(return_value=Mock())
-        self.ip_service = IpService(self.generic_lock_provider)
-        self.delete_operation = DeleteAzureVMOperation(vm_service=self.vm_service,
-                                                       network_service=self.network_service,
-                                                       tags_service=self.tags_service,
-                                                       security_group_service=self.security_group_service,
-                                                       storage_service=self.storage_service,
-                                                       generic_lock_provider=self.generic_lock_provider,
-                                                       subnet_locker=Lock(),
-                                                       ip_service=self.ip_service)
+        self.ip_release_coalescer = Mock()
+        self.vnet_mutation_queue = Mock()
+        self.resource_group_deletion_tracker = Mock()
+        self.inventory_provider = ResourceGroupInventoryProvider(vm_service=self.vm_service,
+                                                                 network_service=self.network_service,
+                                                                 security_group_service=self.security_group_service)
+        self.delete_operation = DeleteAzureVMOperation(
+            vm_service=self.vm_service,
+            network_service=self.network_service,
+            tags_service=self.tags_service,
+            security_group_service=self.security_group_service,
+            storage_service=self.storage_service,
+            generic_lock_provider=self.generic_lock_provider,
+            vnet_mutation_queue=self.vnet_mutation_queue,
+            ip_release_coalescer=self.ip_release_coalescer,
+            task_executor=TaskExecutorService(max_workers=2),
+            resource_group_deletion_tracker=self.resource_group_deletion_tracker,
+            inventory_provider=self.inventory_provider)
 
     def test_cleanup_on_error(self):
         # Arrange
@@ -43,8 +55,8 @@ class TestDeleteOperation(TestCase):
         # Act
         result = self.delete_operation.cleanup_connectivity(network_client=Mock(),
                                                             resource_client=Mock(),
-                                                            cloud_provider_model=Mock(),
-                                                            resource_group_name=Mock(),
+                                                            cloud_provider_model=Mock(async_sandbox_teardown=False),
+                                                            resource_group_name="test_group",
                                                             request=Mock(actions=[Mock(type="cleanupNetwork")]),
                                                             logger=self.logger)
 
@@ -66,7 +78,7 @@ class TestDeleteOperation(TestCase):
         tested_group_name = "test_group"
         resource_client = Mock()
         network_client = Mock()
-        cloud_provider_model = Mock()
+        cloud_provider_model = Mock(async_sandbox_teardown=False)
 
         vnet = Mock()
         subnet = Mock()
@@ -106,6 +118,52 @@ class TestDeleteOperation(TestCase):
                                                                        logger=self.logger,
                                                                        group_name=tested_group_name)
 
+    def test_cleanup_without_waiting_for_resource_group_deletion(self):
+        # Arrange
+        self.delete_operation.remove_nsg_and_routetable_from_subnets = Mock()
+        self.delete_operation.delete_resource_group = Mock()
+        self.delete_operation.delete_sandbox_subnets = Mock()
+        resource_client = Mock()
+
+        # Act
+        result = self.delete_operation.cleanup_connectivity(network_client=Mock(),
+                                                            resource_client=resource_client,
+                                                            cloud_provider_model=Mock(async_sandbox_teardown=True),
+                                                            resource_group_name="test_group",
+                                                            request=Mock(actions=[Mock(type="cleanupNetwork")]),
+                                                            logger=self.logger)
+
+        # Verify
+        self.assertTrue(result['success'])
+        self.delete_operation.delete_sandbox_subnets.assert_called_once()
+        self.delete_operation.remove_nsg_and_routetable_from_subnets.assert_not_called()
+        self.delete_operation.delete_resource_group.assert_not_called()
+        self.resource_group_deletion_tracker.start_deletion.assert_called_once_with(resource_client=resource_client,
+                                                                                   group_name="test_group",
+                                                                                   logger=self.logger,
+                                                                                   on_deleted=None)
+
+    def test_cleanup_without_waiting_deletes_used_subnets_after_resource_group(self):
+        # Arrange
+        self.delete_operation.remove_nsg_and_routetable_from_subnets = Mock()
+        self.delete_operation.delete_sandbox_subnets = Mock(side_effect=Exception("InUseSubnetCannotBeDeleted"))
+
+        # Act
+        result = self.delete_operation.cleanup_connectivity(network_client=Mock(),
+                                                            resource_client=Mock(),
+                                                            cloud_provider_model=Mock(async_sandbox_teardown=True),
+                                                            resource_group_name="test_group",
+                                                            request=Mock(actions=[Mock(type="cleanupNetwork")]),
+                                                            logger=self.logger)
+
+        # Verify
+        self.assertTrue(result['success'])
+        self.delete_operation.remove_nsg_and_routetable_from_subnets.assert_called_once()
+        on_deleted = self.resource_group_deletion_tracker.start_deletion.call_args[1]["on_deleted"]
+        self.delete_operation.delete_sandbox_subnets.reset_mock(side_effect=True)
+        on_deleted()
+        self.delete_operation.delete_sandbox_subnets.assert_called_once()
+
     def test_delete_sandbox_subnet_on_error(self):
         # Arrange
         self.vm_service.delete_resource_group = Mock()
@@ -166,6 +224,181 @@ class TestDeleteOperation(TestCase):
                 group_name=group_name,
                 vm=vm)
 
+    def test_delete_operation_deletes_vm_before_dependent_resources(self):
+        """Check that VM is fetched once and NICs, Public IPs and disk are deleted only after the VM"""
+        vm = Mock()
+        vm.network_profile.network_interfaces = [NetworkInterfaceReference(id='1/1/1/nic1'),
+                                                 NetworkInterfaceReference(id='1/1/1/nic2')]
+        compute_client = Mock()
+        compute_client.virtual_machines.get.return_value = vm
+        network_client = self._prepare_mock_network_client()
+        calls = []
+        self.vm_service.delete_vm = Mock(side_effect=lambda **kwargs: calls.append("vm"))
+        self.network_service.delete_nic = Mock(side_effect=lambda **kwargs: calls.append("nic"))
+        self.network_service.delete_ip = Mock(side_effect=lambda **kwargs: calls.append("ip"))
+        self.network_service.delete_nsg_artifacts_associated_with_vm = Mock()
+        self.delete_operation._delete_vm_disk = Mock(side_effect=lambda **kwargs: calls.append("disk"))
+
+        # Act
+        self.delete_operation.delete(compute_client=compute_client,
+                                     network_client=network_client,
+                                     storage_client=Mock(),
+                                     group_name="AzureTestGroup",
+                                     vm_name="AzureTestVM",
+                                     logger=self.logger,
+                                     cloudshell_session=MagicMock())
+
+        # Verify
+        compute_client.virtual_machines.get.assert_called_once()
+        self.assertEqual(calls[0], "vm")
+        self.assertEqual(sorted(calls[1:]), ["disk", "ip", "ip", "nic", "nic"])
+
+    def test_delete_operation_waits_for_all_deletions_on_error(self):
+        """Check that failed NIC deletion doesn't stop deletion of the disk"""
+        compute_client = self._prepare_mock_compute_client()
+        network_client = self._prepare_mock_network_client()
+        self.vm_service.delete_vm = Mock()
+        self.network_service.delete_nic = Mock(side_effect=Exception("Boom!"))
+        self.network_service.delete_nsg_artifacts_associated_with_vm = Mock()
+        self.delete_operation._delete_vm_disk = Mock()
+
+        # Act
+        with self.assertRaisesRegexp(Exception, "Boom!"):
+            self.delete_operation.delete(compute_client=compute_client,
+                                         network_client=network_client,
+                                         storage_client=Mock(),
+                                         group_name="AzureTestGroup",
+                                         vm_name="AzureTestVM",
+                                         logger=self.logger,
+                                         cloudshell_session=MagicMock())
+
+        # Verify
+        self.delete_operation._delete_vm_disk.assert_called_once()
+        self.network_service.delete_nsg_artifacts_associated_with_vm.assert_not_called()
+        self.logger.exception.assert_any_call("Failed to delete VM AzureTestVM resources:")
+
+    def _prepare_vm_with_nic(self, vm_name):
+        nic_id = "/subscriptions/sub/resourceGroups/group/providers/Microsoft.Network/networkInterfaces/" + vm_name
+        vm = Mock()
+        vm.name = vm_name
+        vm.network_profile.network_interfaces = [NetworkInterfaceReference(id=nic_id)]
+        nic = Mock(id=nic_id.upper())
+        nic.name = vm_name
+        nic.ip_configurations = [Mock(private_ip_address="10.0.0.{}".format(len(vm_name)),
+                                      private_ip_allocation_method="Static",
+                                      public_ip_address=Mock(id="/public_ip/" + vm_name))]
+        return vm, nic
+
+    def test_delete_operation_uses_shared_group_snapshot(self):
+        """Check that VM, its NICs and NSG artifacts are taken from the snapshot shared by the teardown"""
+        vm, nic = self._prepare_vm_with_nic("vm1")
+        self.vm_service.list_virtual_machines = Mock(return_value=[vm])
+        self.vm_service.get_vm = Mock()
+        self.vm_service.delete_vm = Mock()
+        self.network_service.get_network_interfaces = Mock(return_value=[nic])
+        self.security_group_service.list_network_security_group = Mock(return_value=[])
+        self.network_service.delete_nic = Mock()
+        self.network_service.delete_ip = Mock()
+        self.network_service.delete_nsg_artifacts_associated_with_vm = Mock()
+        self.delete_operation._delete_vm_disk = Mock()
+        network_client = Mock()
+
+        # Act
+        self.delete_operation.delete(compute_client=Mock(),
+                                     network_client=network_client,
+                                     storage_client=Mock(),
+                                     group_name="group",
+                                     vm_name="vm1",
+                                     logger=self.logger,
+                                     cloudshell_session=Mock())
+
+        # Verify
+        self.vm_service.get_vm.assert_not_called()
+        network_client.network_interfaces.get.assert_not_called()
+        self.network_service.delete_nic.assert_called_once_with(network_client=network_client,
+                                                                group_name="group",
+                                                                interface_name="vm1")
+        self.assertIsInstance(self.network_service.delete_nsg_artifacts_associated_with_vm.call_args[1][
+            "nsg_artifacts_index"], NsgArtifactsIndex)
+        self.assertEqual(self.ip_release_coalescer.release_ips.call_args[0][3], ["10.0.0.3"])
+        # the deleted VM is not returned from the snapshot anymore
+        self.inventory_provider.get_inventory(compute_client=Mock(),
+                                              network_client=network_client,
+                                              group_name="group",
+                                              max_age=60).get_virtual_machines()
+        self.assertEqual(self.vm_service.list_virtual_machines.call_count, 2)
+
+    def test_delete_vms(self):
+        """Check that resource group is inventoried once and NSG artifacts of all VMs are removed together"""
+        vm1, nic1 = self._prepare_vm_with_nic("vm1")
+        vm2, nic2 = self._prepare_vm_with_nic("vm22")
+        self.vm_service.list_virtual_machines = Mock(return_value=[vm1, vm2])
+        self.vm_service.get_vm = Mock()
+        self.vm_service.delete_vm = Mock()
+        self.network_service.get_network_interfaces = Mock(return_value=[nic1, nic2])
+        self.security_group_service.list_network_security_group = Mock(return_value=[])
+        self.network_service.delete_nic = Mock()
+        self.network_service.delete_ip = Mock()
+        self.network_service.delete_nsg_artifacts_associated_with_vms = Mock()
+        self.delete_operation._delete_vm_disk = Mock()
+        network_client = Mock()
+
+        # Act
+        results = self.delete_operation.delete_vms(compute_client=Mock(),
+                                                   network_client=network_client,
+                                                   storage_client=Mock(),
+                                                   group_name="group",
+                                                   vm_names=["vm1", "vm22", "missing_vm"],
+                                                   logger=self.logger,
+                                                   cloudshell_session=Mock())
+
+        # Verify
+        self.assertEqual([(result.vmName, result.success) for result in results],
+                         [("vm1", True), ("vm22", True), ("missing_vm", True)])
+        self.vm_service.get_vm.assert_not_called()
+        self.assertEqual(self.vm_service.delete_vm.call_count, 2)
+        self.assertEqual(sorted(call[1]["interface_name"] for call in self.network_service.delete_nic.call_args_list),
+                         ["vm1", "vm22"])
+        self.assertEqual(self.delete_operation._delete_vm_disk.call_count, 2)
+        self.network_service.delete_nsg_artifacts_associated_with_vms.assert_called_once_with(
+            network_client=network_client,
+            resource_group_name="group",
+            vm_names=["vm1", "vm22", "missing_vm"],
+            nsg_artifacts_index=ANY)
+        self.assertIsInstance(self.network_service.delete_nsg_artifacts_associated_with_vms.call_args[1][
+            "nsg_artifacts_index"], NsgArtifactsIndex)
+        self.vm_service.list_virtual_machines.assert_called_once()
+        self.network_service.get_network_interfaces.assert_called_once()
+        self.assertEqual(sorted(self.ip_release_coalescer.release_ips.call_args[0][3]), ["10.0.0.3", "10.0.0.4"])
+
+    def test_delete_vms_reports_failed_vm(self):
+        """Check that failed VM deletion doesn't stop deletion of other VMs and keeps its NSG artifacts"""
+        vm1, nic1 = self._prepare_vm_with_nic("vm1")
+        vm2, nic2 = self._prepare_vm_with_nic("vm2")
+        self.vm_service.list_virtual_machines = Mock(return_value=[vm1, vm2])
+        self.vm_service.delete_vm = Mock(side_effect=lambda vm_name, **kwargs: vm_name == "vm1" and 1 / 0)
+        self.network_service.get_network_interfaces = Mock(return_value=[nic1, nic2])
+        self.security_group_service.list_network_security_group = Mock(return_value=[])
+        self.network_service.delete_nic = Mock()
+        self.network_service.delete_ip = Mock()
+        self.network_service.delete_nsg_artifacts_associated_with_vms = Mock()
+        self.delete_operation._delete_vm_disk = Mock()
+
+        # Act
+        results = self.delete_operation.delete_vms(compute_client=Mock(),
+                                                   network_client=Mock(),
+                                                   storage_client=Mock(),
+                                                   group_name="group",
+                                                   vm_names=["vm1", "vm2"],
+                                                   logger=self.logger,
+                                                   cloudshell_session=Mock())
+
+        # Verify
+        self.assertEqual([(result.vmName, result.success) for result in results], [("vm1", False), ("vm2", True)])
+        self.network_service.delete_nic.assert_called_once()
+        self.assertEqual(self.network_service.delete_nsg_artifacts_associated_with_vms.call_args[1]["vm_names"],
+                         ["vm2"])
+
     def test_delete_operation_on_error(self):
         # Arrange
         self.vm_service.delete_vm = Mock(side_effect=Exception("Boom!"))
@@ -377,7 +610,6 @@ class TestDeleteOperation(TestCase):
         virtual_network.subnets = [subnet]
         self.network_service.get_sandbox_virtual_network = Mock()
         self.network_service.get_sandbox_virtual_network.return_value = virtual_network
-        self.network_service.update_subnet = Mock()
 
         # Act
         self.delete_operation.remove_nsg_and_routetable_from_subnets(network_client,
@@ -386,11 +618,14 @@ class TestDeleteOperation(TestCase):
                                                                      logger)
 
         # Verify
-        self.network_service.update_subnet.assert_called_with(network_client=network_client,
-                                                              resource_group_name=resource_group_name,
-                                                              virtual_network_name=virtual_network.name,
-                                                              subnet_name=subnet.name,
-                                                              subnet=subnet)
+        self.vnet_mutation_queue.submit.assert_called_once()
+        call_kwargs = self.vnet_mutation_queue.submit.call_args[1]
+        self.assertEqual(call_kwargs["resource_group_name"], resource_group_name)
+        self.assertEqual(call_kwargs["virtual_network_name"], virtual_network.name)
+        mutation = call_kwargs["mutations"][0]
+        self.assertIsInstance(mutation, UpdateSubnetMutation)
+        self.assertEqual((mutation.subnet_name, mutation.network_security_group, mutation.route_table),
+                         (subnet.name, None, None))
 
     def test_delete_sandbox_subnets(self):
         resource_group_name = 'my_sandbox'
@@ -405,14 +640,36 @@ class TestDeleteOperation(TestCase):
         virtual_network.subnets = [subnet]
         self.network_service.get_sandbox_virtual_network = Mock()
         self.network_service.get_sandbox_virtual_network.return_value = virtual_network
-        self.network_service.delete_subnet = Mock()
 
         self.delete_operation.delete_sandbox_subnets(network_client,
                                                      cloud_provider_model,
                                                      resource_group_name,
                                                      logger)
 
-        self.network_service.delete_subnet.assert_called_with(network_client=network_client,
-                                                              group_name=resource_group_name,
-                                                              vnet_name=virtual_network.name,
-                                                              subnet_name=subnet.name)
+        self.vnet_mutation_queue.submit.assert_called_once()
+        call_kwargs = self.vnet_mutation_queue.submit.call_args[1]
+        self.assertEqual(call_kwargs["virtual_network_name"], virtual_network.name)
+        self.assertEqual([(type(mutation), mutation.subnet_name) for mutation in call_kwargs["mutations"]],
+                         [(DeleteSubnetMutation, subnet.name)])
+
+    def test_delete_sandbox_subnets_with_single_vnet_update(self):
+        """Check that all subnets of the sandbox are deleted with one vNet update"""
+        resource_group_name = 'my_sandbox'
+        cloud_provider_model = Mock(management_group_name="mgmt_group")
+        virtual_network = Mock()
+        virtual_network.name = 'sandbox_vnet'
+        virtual_network.subnets = []
+        for subnet_name in ["{}_10.0.{}.0-24".format(resource_group_name, i) for i in range(5)] + ["other_sandbox"]:
+            subnet = Mock()
+            subnet.name = subnet_name
+            virtual_network.subnets.append(subnet)
+        self.network_service.get_sandbox_virtual_network = Mock(return_value=virtual_network)
+
+        # Act
+        self.delete_operation.delete_sandbox_subnets(Mock(), cloud_provider_model, resource_group_name, Mock())
+
+        # Verify
+        self.vnet_mutation_queue.submit.assert_called_once()
+        mutations = self.vnet_mutation_queue.submit.call_args[1]["mutations"]
+        self.assertEqual([mutation.subnet_name for mutation in mutations],
+                         [subnet.name for subnet in virtual_network.subnets[:5]])
@@ -6,8 +6,8 @@ from cloudshell.cp.core.models import Attribute
 from mock import MagicMock
 from mock import Mock
 
-from cloudshell.cp.azure.domain.services.ip_service import IpService
 from cloudshell.cp.azure.domain.services.network_service import NetworkService
+from cloudshell.cp.azure.domain.services.task_executor import TaskExecutorService
 from cloudshell.cp.azure.domain.services.tags import TagService
 from cloudshell.cp.azure.domain.services.virtual_machine_service import VirtualMachineService
 from cloudshell.cp.azure.domain.vm_management.operations.deploy_operation import DeployAzureVMOperation
@@ -31,7 +31,7 @@ class TestDeployAzureVMOperation(TestCase):
         self.cancellation_service = MagicMock()
         self.image_data_factory = MagicMock()
         self.vm_details_provider = MagicMock()
-        self.ip_service = IpService(self.generic_lock_provider)
+        self.ip_release_coalescer = Mock()
 
         self.deploy_operation = DeployAzureVMOperation(vm_service=self.vm_service,
                                                        network_service=self.network_service,
@@ -46,7 +46,8 @@ class TestDeployAzureVMOperation(TestCase):
                                                        cancellation_service=self.cancellation_service,
                                                        image_data_factory=self.image_data_factory,
                                                        vm_details_provider=self.vm_details_provider,
-                                                       ip_service=self.ip_service)
+                                                       ip_release_coalescer=self.ip_release_coalescer,
+                                                       task_executor=TaskExecutorService(max_workers=2))
 
     def test_get_sandbox_subnet_with_multiple_subnet_mode(self):
         """Check that method will call network service to get sandbox vNet and will return it's subnet by given name"""
@@ -490,17 +491,19 @@ class TestDeployAzureVMOperation(TestCase):
         self.vm_service.delete_vm = Mock()
         private_ip_allocation_method = "Static"
         cloudshell_session = Mock()
+        logger = MagicMock()
+        reservation_id = Mock()
 
         # Act
-        self.deploy_operation._rollback_deployed_resources(logger=MagicMock(),
+        self.deploy_operation._rollback_deployed_resources(logger=logger,
                                                            compute_client=MagicMock(),
                                                            network_client=MagicMock(),
                                                            group_name=MagicMock(),
                                                            nic_requests=[MagicMock()],
                                                            vm_name=MagicMock(),
                                                            private_ip_allocation_method=private_ip_allocation_method,
-                                                           allocated_private_ips=[],
-                                                           reservation_id=Mock(),
+                                                           allocated_private_ips=["10.0.0.4"],
+                                                           reservation_id=reservation_id,
                                                            cloudshell_session=cloudshell_session
                                                            )
 
@@ -508,7 +511,8 @@ class TestDeployAzureVMOperation(TestCase):
         self.network_service.delete_nic.assert_called_once()
         self.network_service.delete_ip.assert_called_once()
         self.vm_service.delete_vm.assert_called_once()
-        cloudshell_session.ReleaseFromPool.assert_called_once()
+        self.ip_release_coalescer.release_ips.assert_called_once_with(logger, cloudshell_session, reservation_id,
+                                                                      ["10.0.0.4"])
 
 
     def test_validate_resource_is_single_per_group(self):
@@ -615,7 +619,8 @@ class TestDeployAzureVMOperation(TestCase):
         self.deploy_operation._prepare_vm_size = Mock(return_value="vm_size")
         self.deploy_operation._get_nic_requests = Mock(return_value=[NicRequest('random_name-0', Mock(), True),
                                                                      NicRequest('random_name-1', Mock(), True)])
-        self.deploy_operation.storage_service.get_sandbox_storage_account_name = Mock(return_value="storage")
+        self.deploy_operation.storage_service.get_sandbox_storage_account = Mock(
+            return_value=("storage_group", "storage"))
         self.deploy_operation.tags_service.get_tags = Mock()
         self.name_provider_service.normalize_name = Mock(return_value="cool-app")
         logger = Mock()
@@ -649,7 +654,11 @@ class TestDeployAzureVMOperation(TestCase):
                                                                                  network_actions=network_actions)
         self.deploy_operation._prepare_vm_size.assert_called_once()
         self.deploy_operation._prepare_vm_size._get_sandbox_subnet()
-        self.deploy_operation.storage_service.get_sandbox_storage_account_name()
+        self.deploy_operation.storage_service.get_sandbox_storage_account.assert_called_once_with(
+            storage_client=storage_client,
+            group_name=reservation_id,
+            region=cloud_provider_model.region)
+        self.assertEquals((data.storage_group_name, data.storage_account_name), ("storage_group", "storage"))
         self.deploy_operation.tags_service.get_tags()
         self.assertEquals(data.reservation_id, reservation_id)
         self.assertEquals(data.group_name, reservation_id)
@@ -740,7 +749,7 @@ class TestDeployAzureVMOperation(TestCase):
             storage_service=self.storage_service,
             key_pair_service=self.key_pair_service,
             storage_client=storage_client,
-            group_name=data.group_name,
+            group_name=data.storage_group_name,
             storage_name=data.storage_account_name)
         self.assertEquals(data_res.nics[0], nic)
         self.assertEquals(data_res.primary_private_ip_address, nic.ip_configurations[0].private_ip_address)
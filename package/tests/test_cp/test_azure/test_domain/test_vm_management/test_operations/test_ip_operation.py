@@ -10,6 +10,7 @@ class TestIpOperation(TestCase):
     def setUp(self):
         self.mocks = Mock()
         self.mocks.ip_service = Mock()
+        self.mocks.ip_service.is_subnet_seeded.return_value = False
         self.mocks.logger = Mock()
         self.mocks.cloudshell_session = Mock()
         self.mocks.cloud_provider_model = Mock()
@@ -43,6 +44,33 @@ class TestIpOperation(TestCase):
 
         # Verify
         self.assertEqual(ip_address, result)
+        m.network_client.subnets.get.assert_called_once()
+        m.ip_service.seed_subnet_addresses.assert_called_once()
+        seed_kwargs = m.ip_service.seed_subnet_addresses.call_args[1]
+        self.assertEqual((seed_kwargs["reservation_id"], seed_kwargs["subnet_cidr"]), (m.reservation_id, m.subnet_cidr))
+        seed_kwargs["get_network_interfaces"]()
+        m.network_service.get_network_interfaces.assert_called_once_with(network_client=m.network_client,
+                                                                         group_name=m.reservation_id)
+
+    def test_get_available_private_ip_skips_subnet_lookup_once_seeded(self):
+        # Prepare
+        m = self.mocks
+        m.ip_service.is_subnet_seeded.return_value = True
+
+        result = self.ip_operation.get_available_private_ip(
+            m.logger,
+            m.cloudshell_session,
+            m.cloud_provider_model,
+            m.network_client,
+            m.reservation_id,
+            m.subnet_cidr,
+            m.owner
+        )
+
+        # Verify
+        self.assertEqual(result, m.ip_service.get_next_available_ip_from_cs_pool.return_value)
+        m.network_client.subnets.get.assert_not_called()
+        m.ip_service.seed_subnet_addresses.assert_not_called()
 
     def test_get_available_private_ip_blocked_when_cloud_provider_uses_static(self):
         # Prepare
@@ -2,12 +2,18 @@ from unittest import TestCase
 
 import mock
 
+from cloudshell.cp.azure.domain.services.power_operation_tracker import PowerOperationTracker
+from cloudshell.cp.azure.domain.services.resource_group_inventory import ResourceGroupInventoryProvider
+from cloudshell.cp.azure.domain.services.task_executor import TaskExecutorService
+from cloudshell.cp.azure.domain.services.vm_state_service import VmStateService
 from cloudshell.cp.azure.domain.vm_management.operations.power_operation import PowerAzureVMOperation
 
 
 class TestPowerAzureVMOperation(TestCase):
     def setUp(self):
-        self.vm_service = mock.MagicMock()
+        self.vm_service = mock.MagicMock(OPERATION_IN_PROGRESS_STATUS="InProgress",
+                                         OPERATION_SUCCEEDED_STATUS="Succeeded")
+        self.vm_service.get_operation_status.return_value = ("Succeeded", "")
         self.data_holder = mock.MagicMock()
         self.cloudshell_session = mock.MagicMock()
         self.vm_custom_params_extractor = mock.MagicMock()
@@ -15,8 +21,20 @@ class TestPowerAzureVMOperation(TestCase):
         self.resource_group_name = "test_group_name"
         self.resource_full_name = "test_resource_full_name"
         self.vm_name = "test_vm_name"
+        self.logger = mock.MagicMock()
+        self.power_operation_tracker = PowerOperationTracker(vm_service=self.vm_service, poll_interval=0.01)
+        self.task_executor = TaskExecutorService(max_workers=2)
+        self.inventory_provider = ResourceGroupInventoryProvider(vm_service=self.vm_service,
+                                                                 network_service=mock.MagicMock(),
+                                                                 security_group_service=mock.MagicMock())
+        self.vm_state_service = VmStateService(inventory_provider=self.inventory_provider,
+                                               vm_service=self.vm_service,
+                                               task_executor=self.task_executor)
         self.power_operation = PowerAzureVMOperation(vm_service=self.vm_service,
-                                                     vm_custom_params_extractor=self.vm_custom_params_extractor)
+                                                     vm_custom_params_extractor=self.vm_custom_params_extractor,
+                                                     task_executor=self.task_executor,
+                                                     power_operation_tracker=self.power_operation_tracker,
+                                                     vm_state_service=self.vm_state_service)
 
     def test_power_on(self):
         self.vm_custom_params_extractor.get_custom_param_value.return_value = False
@@ -34,8 +52,23 @@ class TestPowerAzureVMOperation(TestCase):
                                                          self.data_holder.name)
 
     def test_power_off(self):
+        self.vm_service.list_virtual_machines.return_value = []
+        self.vm_state_service.get_vm_states(compute_client=self.compute_client,
+                                            network_client=mock.MagicMock(),
+                                            group_name=self.resource_group_name,
+                                            logger=self.logger)
+
+        # Act
         self.power_operation.power_off(self.compute_client, self.resource_group_name, self.vm_name)
+
+        # Verify
         self.vm_service.stop_vm.assert_called_once_with(self.compute_client, self.resource_group_name, self.vm_name)
+        self.vm_state_service.get_vm_states(compute_client=self.compute_client,
+                                            network_client=mock.MagicMock(),
+                                            group_name=self.resource_group_name,
+                                            logger=self.logger)
+        # cached VM states were dropped, so the VMs were listed again
+        self.assertEqual(self.vm_service.list_virtual_machines.call_count, 2)
 
     def test_power_on_when_extension_time_out_is_true(self):
         """Check that method will set "Error" live status for the VM and throw exception
@@ -57,3 +90,113 @@ class TestPowerAzureVMOperation(TestCase):
             self.resource_full_name,
             "Error",
             "Partially deployed app")
+
+    def _prepare_data_holder(self, vm_name):
+        data_holder = mock.MagicMock()
+        data_holder.name = vm_name
+        return data_holder
+
+    def test_power_on_vms_waits_for_all_vms(self):
+        self.vm_custom_params_extractor.get_custom_param_value.return_value = None
+        self.vm_service.begin_start_vm.side_effect = lambda vm_name, **kwargs: "https://status/{}".format(vm_name)
+        self.vm_service.get_operation_status.side_effect = lambda status_url, **kwargs: {
+            "https://status/vm1": ("Succeeded", ""), "https://status/vm2": ("Failed", "start failed")}[status_url]
+
+        # Act
+        results = self.power_operation.power_on_vms(compute_client=self.compute_client,
+                                                    resource_group_name=self.resource_group_name,
+                                                    data_holders=[self._prepare_data_holder("vm1"),
+                                                                  self._prepare_data_holder("vm2")],
+                                                    cloudshell_session=self.cloudshell_session,
+                                                    logger=self.logger)
+
+        # Verify
+        self.assertEqual([(result.vmName, result.status, result.success, result.error) for result in results],
+                         [("vm1", "Succeeded", True, ""), ("vm2", "Failed", False, "start failed")])
+        self.assertEqual(self.vm_service.begin_start_vm.call_count, 2)
+        self.assertEqual(self.cloudshell_session.SetResourceLiveStatus.call_args_list,
+                         [mock.call("vm1", "Online", ""), mock.call("vm2", "Error", "start failed")])
+        self.vm_service.begin_start_vm.assert_any_call(compute_management_client=self.compute_client,
+                                                       group_name=self.resource_group_name,
+                                                       vm_name="vm1")
+        self.vm_service.get_operation_status.assert_any_call(compute_management_client=self.compute_client,
+                                                             status_url="https://status/vm1")
+        self.vm_service.start_vm.assert_not_called()
+
+    def test_power_on_vms_skips_partially_deployed_app(self):
+        self.vm_custom_params_extractor.get_custom_param_value.side_effect = [None, "True"]
+
+        # Act
+        results = self.power_operation.power_on_vms(compute_client=self.compute_client,
+                                                    resource_group_name=self.resource_group_name,
+                                                    data_holders=[self._prepare_data_holder("vm1"),
+                                                                  self._prepare_data_holder("vm2")],
+                                                    cloudshell_session=self.cloudshell_session,
+                                                    logger=self.logger)
+
+        # Verify
+        self.assertEqual([(result.vmName, result.success) for result in results], [("vm1", True), ("vm2", False)])
+        self.vm_service.begin_start_vm.assert_called_once_with(compute_management_client=self.compute_client,
+                                                               group_name=self.resource_group_name,
+                                                               vm_name="vm1")
+        self.assertEqual(self.cloudshell_session.SetResourceLiveStatus.call_args_list,
+                         [mock.call("vm2", "Error", "Partially deployed app"), mock.call("vm1", "Online", "")])
+
+    def test_power_off_vms_in_accepted_mode_and_status_query(self):
+        self.vm_service.get_operation_status.return_value = ("InProgress", "")
+        # operations are started in the worker threads, so the result depends on the VM, not on the call order
+        def begin_deallocate_vm(vm_name, **kwargs):
+            if vm_name == "vm2":
+                raise Exception("deallocate failed")
+            return "https://status/{}".format(vm_name)
+
+        self.vm_service.begin_deallocate_vm.side_effect = begin_deallocate_vm
+
+        # Act
+        results = self.power_operation.power_off_vms(compute_client=self.compute_client,
+                                                     resource_group_name=self.resource_group_name,
+                                                     vm_names=["vm1", "vm2"],
+                                                     cloudshell_session=self.cloudshell_session,
+                                                     logger=self.logger,
+                                                     wait=False)
+        statuses = self.power_operation.get_power_operations_status(resource_group_name=self.resource_group_name,
+                                                                    vm_names=["vm1", "unknown_vm"],
+                                                                    logger=self.logger)
+
+        # Verify
+        self.assertEqual([(result.vmName, result.status, result.success) for result in results],
+                         [("vm1", "Accepted", True), ("vm2", "Failed", False)])
+        self.assertEqual([(result.vmName, result.status, result.success) for result in statuses],
+                         [("vm1", "Accepted", True), ("unknown_vm", "", False)])
+        self.vm_service.stop_vm.assert_not_called()
+        self.cloudshell_session.SetResourceLiveStatus.assert_called_once_with("vm2", "Error", "deallocate failed")
+
+        self.vm_service.get_operation_status.return_value = ("Succeeded", "")
+        self.power_operation_tracker.check_operations()
+        statuses = self.power_operation.get_power_operations_status(resource_group_name=self.resource_group_name,
+                                                                    vm_names=["vm1"],
+                                                                    cloudshell_session=self.cloudshell_session,
+                                                                    logger=self.logger)
+        self.assertEqual(statuses[0].status, "Succeeded")
+        self.cloudshell_session.SetResourceLiveStatus.assert_called_with("vm1", "Offline", "")
+
+    def test_get_power_operations_status_with_power_states(self):
+        vm = mock.MagicMock(provisioning_state="Succeeded")
+        vm.name = "vm1"
+        self.vm_service.list_virtual_machines.return_value = [vm]
+        self.vm_service.get_vm_instance_view.return_value.instance_view.statuses = [
+            mock.MagicMock(code="ProvisioningState/succeeded"), mock.MagicMock(code="PowerState/deallocated")]
+
+        # Act
+        statuses = self.power_operation.get_power_operations_status(resource_group_name=self.resource_group_name,
+                                                                    vm_names=["vm1", "vm2"],
+                                                                    logger=self.logger,
+                                                                    compute_client=self.compute_client,
+                                                                    network_client=mock.MagicMock())
+
+        # Verify
+        self.assertEqual([(result.vmName, result.powerState, result.provisioningState) for result in statuses],
+                         [("vm1", "deallocated", "Succeeded"), ("vm2", "", "")])
+        self.vm_service.get_vm_instance_view.assert_called_once_with(compute_management_client=self.compute_client,
+                                                                     group_name=self.resource_group_name,
+                                                                     vm_name="vm1")
@@ -1,5 +1,5 @@
 import uuid
-from threading import Lock
+from threading import Event
 from unittest import TestCase
 
 from mock import MagicMock, Mock
@@ -9,6 +9,8 @@ from cloudshell.cp.azure.common.exceptions.virtual_network_not_found_exception i
 from cloudshell.cp.azure.domain.services.key_pair import KeyPairService
 from cloudshell.cp.azure.domain.services.security_group import SecurityGroupService
 from cloudshell.cp.azure.domain.services.tags import TagService
+from cloudshell.cp.azure.domain.services.task_executor import TaskExecutorService
+from cloudshell.cp.azure.domain.services.vnet_mutation_queue import DeleteSubnetMutation, UpdateSubnetMutation
 from cloudshell.cp.azure.domain.vm_management.operations.PrepareSandboxInfraOperation import \
     PrepareSandboxInfraOperation
 from tests.helpers.test_helper import TestHelper
@@ -19,6 +21,7 @@ from cloudshell.cp.core.models import PrepareCloudInfra, PrepareSubnet, CreateKe
 class TestPrepareSandboxInfra(TestCase):
     def setUp(self):
         self.storage_service = MagicMock()
+        self.storage_service.get_sandbox_storage_accounts.return_value = ("group_name", [])
         self.cancellation_service = MagicMock()
         self.task_waiter_service = MagicMock()
         self.vm_service = MagicMock()
@@ -29,6 +32,8 @@ class TestPrepareSandboxInfra(TestCase):
         self.logger = MagicMock()
         self.name_provider_service = MagicMock()
         self.resource_id_parser = MagicMock()
+        self.vnet_mutation_queue = MagicMock()
+        self.storage_account_pool = MagicMock(claim=Mock(return_value=None))
 
         self.prepare_connectivity_operation = PrepareSandboxInfraOperation(
             vm_service=self.vm_service,
@@ -38,8 +43,11 @@ class TestPrepareSandboxInfra(TestCase):
             key_pair_service=self.key_pair_service,
             security_group_service=self.security_group_service,
             name_provider_service=self.name_provider_service,
-            subnet_locker=Lock(),
+            vnet_mutation_queue=self.vnet_mutation_queue,
+            generic_lock_provider=MagicMock(),
             cancellation_service=self.cancellation_service,
+            task_executor=TaskExecutorService(max_workers=3),
+            storage_account_pool=self.storage_account_pool,
             resource_id_parser=self.resource_id_parser)
 
     def test_prepare_connectivity(self):
@@ -71,9 +79,9 @@ class TestPrepareSandboxInfra(TestCase):
         network_client.subnets.create_or_update = Mock(return_value=result)
         network_client.virtual_networks.list = Mock(return_value="test")
         network_client.security_rules.list = Mock(return_value=[])
-        network_client._rule_priority_generator = Mock(return_value=[1111, 2222, 3333, 4444])
         network_client.security_rules.create_or_update = Mock()
         network_client.network_security_groups.create_or_update = Mock()
+        network_client.network_security_groups.create_or_update.return_value.result.return_value.security_rules = []
         cancellation_context = MagicMock()
         self.prepare_connectivity_operation._cleanup_stale_data = MagicMock()
 
@@ -99,10 +107,149 @@ class TestPrepareSandboxInfra(TestCase):
         # key pair created
         self.assertTrue(TestHelper.CheckMethodCalledXTimes(self.key_pair_service.save_key_pair))
 
-        self.assertTrue(TestHelper.CheckMethodCalledXTimes(network_client.security_rules.create_or_update, 3))
+        network_client.security_rules.create_or_update.assert_not_called()
+        self.network_service.update_network_security_group_rules.assert_called_once()
+        self.assertEqual(len(self.network_service.update_network_security_group_rules.call_args[1]["rules_to_add"]),
+                         3)
         network_client.network_security_groups.create_or_update.assert_called_once()
+        self.vnet_mutation_queue.submit.assert_called_once()
+        self.network_service.create_subnet.assert_not_called()
         self.cancellation_service.check_if_cancelled.assert_called_with(cancellation_context)
 
+    def test_prepare_connectivity_discovers_vnets_while_creating_resource_group(self):
+        """Check that MGMT vNets discovery doesn't wait for the resource group creation"""
+        vnets_requested = Event()
+
+        def create_resource_group(**kwargs):
+            if not vnets_requested.wait(5):
+                raise Exception("vNets discovery waits for the resource group creation")
+
+        def get_virtual_networks(**kwargs):
+            vnets_requested.set()
+            return []
+
+        self.vm_service.create_resource_group = MagicMock(side_effect=create_resource_group)
+        self.network_service.get_virtual_networks = MagicMock(side_effect=get_virtual_networks)
+        self.key_pair_service.generate_key_pair = MagicMock()
+        self.key_pair_service.save_key_pair = MagicMock()
+        self.security_group_service.create_network_security_group = MagicMock()
+        self.security_group_service.create_network_security_group_rules_batch = MagicMock()
+
+        network_action = PrepareCloudInfra()
+        network_action.actionParams = PrepareCloudInfraParams()
+        network_action.actionParams.cidr = "10.0.0.0/24"
+        network_action.actionId = '1'
+        create_keys_action = CreateKeys()
+        create_keys_action.actionId = '3'
+
+        # Act
+        self.prepare_connectivity_operation.prepare_connectivity(
+            reservation=MagicMock(),
+            cloud_provider_model=MagicMock(),
+            storage_client=MagicMock(),
+            resource_client=MagicMock(),
+            network_client=MagicMock(),
+            logger=MagicMock(),
+            actions=[network_action, create_keys_action],
+            cancellation_context=MagicMock())
+
+        # Verify
+        self.vm_service.create_resource_group.assert_called_once()
+        self.security_group_service.create_network_security_group.assert_called_once()
+        self.security_group_service.create_network_security_group_rules_batch.assert_called_once()
+
+    def _create_storage_and_keypairs(self, storage_client, storage_account_pool_depth=2):
+        self.key_pair_service.generate_key_pair = MagicMock()
+        self.key_pair_service.save_key_pair = MagicMock()
+
+        self.prepare_connectivity_operation._create_storage_and_keypairs(
+            logger=self.logger,
+            storage_client=storage_client,
+            resource_client=MagicMock(),
+            storage_account_name="sandboxaccount",
+            group_name="group_name",
+            cloud_provider_model=MagicMock(region="westeurope",
+                                           storage_account_pool_depth=storage_account_pool_depth,
+                                           key_pair_pool_depth=5),
+            tags={},
+            cancellation_context=MagicMock(),
+            create_key_action_result=MagicMock())
+
+    def _prepare_storage_account(self, name):
+        storage_account = Mock()
+        storage_account.name = name
+        return storage_account
+
+    def test_create_storage_and_keypairs_uses_claimed_storage_account(self):
+        # Arrange
+        self.storage_account_pool.claim.return_value = ("cloudshell-storage-pool-westeurope", "cspoolaccount")
+        storage_client = MagicMock()
+
+        # Act
+        self._create_storage_and_keypairs(storage_client)
+
+        # Verify
+        self.storage_service.create_storage_account.assert_not_called()
+        self.assertEqual(self.storage_account_pool.claim.call_args[1]["depth"], 2)
+        self.key_pair_service.generate_key_pair.assert_called_once_with(pool_depth=5, logger=self.logger)
+        self.key_pair_service.save_key_pair.assert_called_once_with(
+            storage_client=storage_client,
+            group_name="cloudshell-storage-pool-westeurope",
+            storage_name="cspoolaccount",
+            key_pair=self.key_pair_service.generate_key_pair.return_value)
+
+    def test_create_storage_and_keypairs_uses_existing_sandbox_storage_account(self):
+        # Arrange
+        self.storage_service.get_sandbox_storage_accounts.return_value = (
+            "group_name", [self._prepare_storage_account("sandboxaccount")])
+        storage_client = MagicMock()
+
+        # Act
+        self._create_storage_and_keypairs(storage_client)
+
+        # Verify
+        self.storage_account_pool.claim.assert_not_called()
+        self.storage_service.create_storage_account.assert_not_called()
+        self.assertEqual(self.key_pair_service.save_key_pair.call_args[1]["storage_name"], "sandboxaccount")
+
+    def test_create_storage_and_keypairs_lists_storage_accounts_after_failed_claim(self):
+        """Check that a new storage account is not created if the failed claim tagged the pooled one anyway"""
+        # Arrange
+        self.storage_service.get_sandbox_storage_accounts.side_effect = [
+            ("group_name", []),
+            ("cloudshell-storage-pool-westeurope", [self._prepare_storage_account("cspoolaccount")])]
+        storage_client = MagicMock()
+
+        # Act
+        self._create_storage_and_keypairs(storage_client)
+
+        # Verify
+        self.storage_service.create_storage_account.assert_not_called()
+        self.key_pair_service.save_key_pair.assert_called_once_with(
+            storage_client=storage_client,
+            group_name="cloudshell-storage-pool-westeurope",
+            storage_name="cspoolaccount",
+            key_pair=self.key_pair_service.generate_key_pair.return_value)
+
+    def test_create_storage_and_keypairs_creates_storage_account_without_pool(self):
+        # Arrange
+        storage_client = MagicMock()
+
+        # Act
+        self._create_storage_and_keypairs(storage_client, storage_account_pool_depth=0)
+
+        # Verify
+        self.storage_service.get_sandbox_storage_accounts.assert_called_once_with(storage_client=storage_client,
+                                                                                  group_name="group_name",
+                                                                                  region="westeurope")
+        self.storage_service.create_storage_account.assert_called_once_with(storage_client=storage_client,
+                                                                            group_name="group_name",
+                                                                            region="westeurope",
+                                                                            storage_account_name="sandboxaccount",
+                                                                            tags={},
+                                                                            wait_until_created=True)
+        self.assertEqual(self.key_pair_service.save_key_pair.call_args[1]["group_name"], "group_name")
+
     def test_prepare_storage_account_name(self):
         # Arrange
         reservation_id = "some-id"
@@ -199,18 +346,12 @@ class TestPrepareSandboxInfra(TestCase):
                                                                 logger=self.logger)
 
         # Verify
-        self.network_service.delete_subnet.assert_called_once_with(
-            group_name=cloud_provider_model.management_group_name,
-            network_client=network_client,
-            subnet_name=subnet.name,
-            vnet_name=sandbox_vnet.name)
-
-        self.network_service.update_subnet.assert_called_once_with(
-            network_client=network_client,
-            resource_group_name=cloud_provider_model.management_group_name,
-            virtual_network_name=sandbox_vnet.name,
-            subnet_name=subnet.name,
-            subnet=subnet)
+        self.vnet_mutation_queue.submit.assert_called_once()
+        call_kwargs = self.vnet_mutation_queue.submit.call_args[1]
+        self.assertEqual(call_kwargs["resource_group_name"], cloud_provider_model.management_group_name)
+        self.assertEqual(call_kwargs["virtual_network_name"], sandbox_vnet.name)
+        self.assertEqual([(type(mutation), mutation.subnet_name) for mutation in call_kwargs["mutations"]],
+                         [(UpdateSubnetMutation, subnet.name), (DeleteSubnetMutation, subnet.name)])
 
     def test_create_subnet_calls_cleanup_stale_data(self):
         """Check that method will call _cleanup_stale_data method on CloudError"""
@@ -223,7 +364,7 @@ class TestPrepareSandboxInfra(TestCase):
         subnet = MagicMock(address_prefix=subnet_cidr, ip_configurations=[MagicMock(), MagicMock()])
         sandbox_vnet = MagicMock(subnets=[subnet])
         self.prepare_connectivity_operation._cleanup_stale_data = MagicMock()
-        self.network_service.create_subnet.side_effect = [CloudError(MagicMock(__str__=MagicMock(
+        self.vnet_mutation_queue.submit.side_effect = [CloudError(MagicMock(__str__=MagicMock(
             return_value="NetcfgInvalidSubnet")),
             error=True), MagicMock()]
 
@@ -246,3 +387,36 @@ class TestPrepareSandboxInfra(TestCase):
             sandbox_vnet=sandbox_vnet,
             subnet_cidr=subnet_cidr,
             logger=self.logger)
+
+    def test_create_subnets_falls_back_to_create_subnet_on_stale_subnet(self):
+        """Check that method will create subnets one by one if some CIDR is used by a stale subnet"""
+        network_client = MagicMock()
+        resource_client = MagicMock()
+        cloud_provider_model = MagicMock()
+        network_security_group = MagicMock()
+        sandbox_vnet = MagicMock()
+        subnet_actions = [MagicMock(), MagicMock()]
+        subnet_names = ["subnet1", "subnet2"]
+        self.prepare_connectivity_operation._create_subnet = MagicMock()
+        self.vnet_mutation_queue.submit.side_effect = CloudError(MagicMock(__str__=MagicMock(
+            return_value="NetcfgInvalidSubnet")), error=True)
+
+        # Act
+        self.prepare_connectivity_operation._create_subnets(subnet_actions=subnet_actions,
+                                                            subnet_names=subnet_names,
+                                                            cloud_provider_model=cloud_provider_model,
+                                                            logger=self.logger,
+                                                            network_client=network_client,
+                                                            resource_client=resource_client,
+                                                            network_security_group=network_security_group,
+                                                            sandbox_vnet=sandbox_vnet)
+
+        # Verify
+        self.vnet_mutation_queue.submit.assert_called_once()
+        call_kwargs = self.vnet_mutation_queue.submit.call_args[1]
+        self.assertEqual(call_kwargs["virtual_network_name"], sandbox_vnet.name)
+        self.assertEqual([(mutation.subnet_name, mutation.subnet_cidr, mutation.network_security_group)
+                          for mutation in call_kwargs["mutations"]],
+                         [("subnet1", subnet_actions[0].actionParams.cidr, network_security_group),
+                          ("subnet2", subnet_actions[1].actionParams.cidr, network_security_group)])
+        self.assertEqual(self.prepare_connectivity_operation._create_subnet.call_count, 2)
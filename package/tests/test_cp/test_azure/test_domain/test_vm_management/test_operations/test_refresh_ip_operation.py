@@ -3,7 +3,11 @@ from unittest import TestCase
 import mock
 from mock import Mock
 
+from cloudshell.cp.azure.domain.services.resource_group_inventory import ResourceGroupInventoryProvider
+from cloudshell.cp.azure.domain.services.task_executor import TaskExecutorService
+from cloudshell.cp.azure.domain.services.vm_state_service import VmStateService
 from cloudshell.cp.azure.domain.vm_management.operations.refresh_ip_operation import RefreshIPOperation
+from cloudshell.cp.azure.models.refresh_ip_request import RefreshIpRequest
 
 
 class TestRefreshIPOperation(TestCase):
@@ -17,10 +21,22 @@ class TestRefreshIPOperation(TestCase):
         self.private_ip_on_resource = "10.0.0.1"
         self.public_ip_on_resource = "172.29.128.255"
         self.vm_service = Mock()
+        self.vm_service.list_virtual_machines.return_value = []
         self.resource_id_parser = mock.MagicMock()
         self.logger = Mock()
-        self.refresh_ip_operation = RefreshIPOperation(vm_service=self.vm_service,
-                                                       resource_id_parser=self.resource_id_parser)
+        self.network_service = Mock()
+        self.network_service.get_network_interfaces.return_value = []
+        self.network_service.get_public_ips.return_value = []
+        self.inventory_provider = ResourceGroupInventoryProvider(vm_service=self.vm_service,
+                                                                 network_service=self.network_service,
+                                                                 security_group_service=Mock())
+        self.refresh_ip_operation = RefreshIPOperation(
+            vm_service=self.vm_service,
+            resource_id_parser=self.resource_id_parser,
+            inventory_provider=self.inventory_provider,
+            vm_state_service=VmStateService(inventory_provider=self.inventory_provider,
+                                            vm_service=self.vm_service,
+                                            task_executor=TaskExecutorService(max_workers=2)))
 
     def test_refresh_ip(self):
         """Check that method uses network client to get public IP value and updates it on CloudShell"""
@@ -122,3 +138,151 @@ class TestRefreshIPOperation(TestCase):
         # Verify
         self.cloudshell_session.SetAttributeValue.assert_not_called()
         self.cloudshell_session.UpdateResourceAddress.assert_not_called()
+
+    def test_refresh_ip_of_many_vms_shares_group_snapshot(self):
+        """Check that concurrent refresh IP commands of the sandbox don't read every VM and NIC from Azure"""
+        vms = []
+        nics = []
+        for vm_name in ("vm1", "vm2"):
+            vm, nic, _ = self._prepare_vm_resources(vm_name=vm_name, private_ip=self.private_ip_on_resource)
+            vms.append(vm)
+            nics.append(nic)
+        self.vm_service.list_virtual_machines.return_value = vms
+        self.network_service.get_network_interfaces.return_value = nics
+
+        # Act
+        for vm_name in ("vm1", "vm2"):
+            self.refresh_ip_operation.refresh_ip(
+                cloudshell_session=self.cloudshell_session,
+                compute_client=self.compute_client,
+                network_client=self.network_client,
+                resource_group_name=self.resource_group_name,
+                vm_name=vm_name,
+                private_ip_on_resource=self.private_ip_on_resource,
+                public_ip_on_resource_attr_tuple=("Public IP", ""),
+                resource_fullname=self.resource_fullname,
+                logger=self.logger)
+
+        # Verify
+        self.vm_service.list_virtual_machines.assert_called_once_with(compute_management_client=self.compute_client,
+                                                                      group_name=self.resource_group_name)
+        self.network_service.get_network_interfaces.assert_called_once_with(network_client=self.network_client,
+                                                                            group_name=self.resource_group_name)
+        self.vm_service.get_active_vm.assert_not_called()
+        self.network_client.network_interfaces.get.assert_not_called()
+        self.cloudshell_session.SetAttributeValue.assert_not_called()
+        self.cloudshell_session.UpdateResourceAddress.assert_not_called()
+
+    def test_refresh_ip_reads_public_ip_without_address_from_azure(self):
+        """Check that public IP which had no address when the snapshot was taken is read again"""
+        vm, nic, public_ip = self._prepare_vm_resources(vm_name=self.vm_name,
+                                                        private_ip=self.private_ip_on_resource,
+                                                        public_ip="1.1.1.1")
+        public_ip.ip_address = None
+        self.vm_service.list_virtual_machines.return_value = [vm]
+        self.network_service.get_network_interfaces.return_value = [nic]
+        self.network_service.get_public_ips.return_value = [public_ip]
+        self.resource_id_parser.get_name_from_resource_id.return_value = "ip_name"
+        self.network_client.public_ip_addresses.get.return_value = Mock(ip_address="2.2.2.2")
+
+        # Act
+        self.refresh_ip_operation.refresh_ip(
+            cloudshell_session=self.cloudshell_session,
+            compute_client=self.compute_client,
+            network_client=self.network_client,
+            resource_group_name=self.resource_group_name,
+            vm_name=self.vm_name,
+            private_ip_on_resource=self.private_ip_on_resource,
+            public_ip_on_resource_attr_tuple=("Public IP", ""),
+            resource_fullname=self.resource_fullname,
+            logger=self.logger)
+
+        # Verify
+        self.network_client.network_interfaces.get.assert_not_called()
+        self.network_client.public_ip_addresses.get.assert_called_once_with(self.resource_group_name, "ip_name")
+        self.cloudshell_session.SetAttributeValue.assert_called_once_with(self.resource_fullname, "Public IP",
+                                                                          "2.2.2.2")
+
+    def _prepare_vm_resources(self, vm_name, private_ip, public_ip=None, provisioning_state="Succeeded"):
+        nic = Mock(id="/resource_group/nic_" + vm_name)
+        nic.ip_configurations = [Mock(private_ip_address=private_ip, public_ip_address=None)]
+        public_ip_resource = None
+        if public_ip:
+            public_ip_resource = Mock(id="/resource_group/ip_" + vm_name, ip_address=public_ip)
+            nic.ip_configurations[0].public_ip_address = Mock(id=public_ip_resource.id.upper())
+
+        vm = Mock(provisioning_state=provisioning_state)
+        vm.name = vm_name
+        vm.network_profile.network_interfaces = [Mock(primary=True, id=nic.id.upper())]
+        return vm, nic, public_ip_resource
+
+    def _refresh_ips(self, refresh_ip_requests):
+        return self.refresh_ip_operation.refresh_ips(cloudshell_session=self.cloudshell_session,
+                                                     compute_client=self.compute_client,
+                                                     network_client=self.network_client,
+                                                     resource_group_name=self.resource_group_name,
+                                                     refresh_ip_requests=refresh_ip_requests,
+                                                     logger=self.logger)
+
+    def test_refresh_ips_pushes_only_changed_ips_from_group_snapshot(self):
+        """Check that IPs of all VMs are taken from a single listing and only the changed ones are updated"""
+        vm1, nic1, ip1 = self._prepare_vm_resources("vm1", "10.0.0.4", "1.1.1.1")
+        vm2, nic2, _ = self._prepare_vm_resources("vm2", "10.0.0.5")
+        vm3, nic3, ip3 = self._prepare_vm_resources("vm3", "10.0.0.6", "3.3.3.3")
+        self.vm_service.list_virtual_machines.return_value = [vm1, vm2, vm3]
+        self.network_service.get_network_interfaces.return_value = [nic1, nic2, nic3]
+        self.network_service.get_public_ips.return_value = [ip1, ip3]
+        requests = [RefreshIpRequest("vm1", "vm1", "10.0.0.4", ("App.Public IP", "9.9.9.9")),
+                    RefreshIpRequest("vm2", "vm2", "10.0.0.100", ("Public IP", "")),
+                    RefreshIpRequest("vm3", "vm3", "10.0.0.6", ("Public IP", "3.3.3.3"))]
+
+        # Act
+        results = self._refresh_ips(requests)
+
+        # Verify
+        self.assertEqual([(result.vmName, result.success) for result in results],
+                         [("vm1", True), ("vm2", True), ("vm3", True)])
+        self.vm_service.get_active_vm.assert_not_called()
+        self.network_client.network_interfaces.get.assert_not_called()
+        self.network_client.public_ip_addresses.get.assert_not_called()
+        self.cloudshell_session.SetAttributeValue.assert_not_called()
+        self.cloudshell_session.SetAttributesValues.assert_called_once()
+        attribute_updates = self.cloudshell_session.SetAttributesValues.call_args[0][0]
+        self.assertEqual([(update.ResourceFullName, update.AttributeNamesValues[0].Name,
+                           update.AttributeNamesValues[0].Value) for update in attribute_updates],
+                         [("vm1", "App.Public IP", "1.1.1.1")])
+        self.cloudshell_session.UpdateResourceAddress.assert_called_once_with("vm2", "10.0.0.5")
+
+    def test_refresh_ips_reports_failed_vm(self):
+        """Check that VM which is not active fails only its own result"""
+        vm1, nic1, _ = self._prepare_vm_resources("vm1", "10.0.0.4", provisioning_state="Failed")
+        vm2, nic2, _ = self._prepare_vm_resources("vm2", "10.0.0.5")
+        self.vm_service.list_virtual_machines.return_value = [vm1, vm2]
+        self.network_service.get_network_interfaces.return_value = [nic1, nic2]
+        self.vm_service.get_active_vm.side_effect = Exception("not active")
+        requests = [RefreshIpRequest("vm1", "vm1", "", ("Public IP", "")),
+                    RefreshIpRequest("vm2", "vm2", "", ("Public IP", ""))]
+
+        # Act
+        results = self._refresh_ips(requests)
+
+        # Verify
+        self.assertEqual([(result.vmName, result.success, result.error) for result in results],
+                         [("vm1", False, "not active"), ("vm2", True, "")])
+        self.cloudshell_session.SetAttributesValues.assert_not_called()
+        self.cloudshell_session.UpdateResourceAddress.assert_called_once_with("vm2", "10.0.0.5")
+
+    def test_refresh_ips_reports_failed_attributes_update(self):
+        """Check that failed SetAttributesValues call fails results of all VMs with the changed public IP"""
+        vm1, nic1, ip1 = self._prepare_vm_resources("vm1", "10.0.0.4", "1.1.1.1")
+        self.vm_service.list_virtual_machines.return_value = [vm1]
+        self.network_service.get_network_interfaces.return_value = [nic1]
+        self.network_service.get_public_ips.return_value = [ip1]
+        self.cloudshell_session.SetAttributesValues.side_effect = Exception("api error")
+
+        # Act
+        results = self._refresh_ips([RefreshIpRequest("vm1", "vm1", "10.0.0.4", ("Public IP", ""))])
+
+        # Verify
+        self.assertFalse(results[0].success)
+        self.assertEqual(results[0].error, "api error")
@@ -0,0 +1,147 @@
+from unittest import TestCase
+
+from mock import Mock, MagicMock
+
+from cloudshell.cp.azure.domain.vm_management.operations.set_app_security_groups import \
+    SetAppSecurityGroupsOperation
+
+
+class TestSetAppSecurityGroupsOperation(TestCase):
+    def setUp(self):
+        # child mocks are created up front, apps are processed in the worker threads
+        self.vm_service = Mock(get_vm=Mock())
+        self.resource_id_parser = Mock()
+        self.nsg_service = Mock(reconcile_network_security_group_rules=Mock(), is_custom_rule=Mock())
+        self.generic_lock_provider = Mock(get_resource_lock=Mock())
+        self.name_provider = Mock()
+        self.inventory_provider = Mock()
+        self.logger = Mock()
+        self.compute_client = Mock()
+        self.network_client = Mock()
+        self.group_name = "group_name"
+        self.operation = SetAppSecurityGroupsOperation(vm_service=self.vm_service,
+                                                       resource_id_parser=self.resource_id_parser,
+                                                       nsg_service=self.nsg_service,
+                                                       generic_lock_provider=self.generic_lock_provider,
+                                                       name_provider=self.name_provider,
+                                                       inventory_provider=self.inventory_provider,
+                                                       max_concurrent_apps=2)
+
+    def _create_app_security_group_model(self, app_name, rules_count=1):
+        app_security_group_model = Mock()
+        app_security_group_model.deployed_app.name = app_name
+        security_group_config = Mock(rules=[Mock() for _ in range(rules_count)])
+        app_security_group_model.security_group_configurations = [security_group_config]
+        return app_security_group_model
+
+    def test_set_apps_security_groups_returns_results_in_request_order(self):
+        """Check that results are returned for every app in the same order as requested"""
+        app_names = ["app_{}".format(i) for i in range(5)]
+        models = [self._create_app_security_group_model(app_name) for app_name in app_names]
+        nic = Mock(ip_configurations=[Mock(private_ip_address="10.0.0.4")])
+        self.operation._create_nic_to_subnet_name_map = Mock(return_value={nic: "subnet"})
+        self.operation._determine_name_of_subnet_from_security_group_configuration_of_request = Mock(
+            return_value="subnet")
+
+        # Act
+        result = self.operation.set_apps_security_groups(logger=self.logger,
+                                                         app_security_group_models=models,
+                                                         compute_client=self.compute_client,
+                                                         network_client=self.network_client,
+                                                         group_name=self.group_name)
+
+        # Verify
+        self.assertEqual([action_result.appName for action_result in result], app_names)
+        self.assertTrue(all(action_result.success for action_result in result))
+        self.assertEqual(self.nsg_service.reconcile_network_security_group_rules.call_count, 5)
+
+    def test_set_apps_security_groups_reconciles_custom_rules(self):
+        """Check that custom rules of the app are reconciled with the requested ones in a single call"""
+        model = self._create_app_security_group_model("app", rules_count=3)
+        nic = MagicMock()
+        nic.ip_configurations[0].private_ip_address = "10.0.0.4"
+        self.operation._create_nic_to_subnet_name_map = Mock(return_value={nic: "subnet"})
+        self.operation._determine_name_of_subnet_from_security_group_configuration_of_request = Mock(
+            return_value="subnet")
+
+        # Act
+        self.operation.set_apps_security_groups(logger=self.logger,
+                                                app_security_group_models=[model],
+                                                compute_client=self.compute_client,
+                                                network_client=self.network_client,
+                                                group_name=self.group_name)
+
+        # Verify
+        self.nsg_service.delete_custom_security_rules_from_nsg.assert_not_called()
+        self.nsg_service.reconcile_network_security_group_rules.assert_called_once()
+        call_kwargs = self.nsg_service.reconcile_network_security_group_rules.call_args[1]
+        self.assertEqual(call_kwargs["security_group_name"], "NSG_app")
+        self.assertEqual(call_kwargs["is_managed_rule"], self.nsg_service.is_custom_rule)
+        self.assertEqual([request.rule_data.name for request in call_kwargs["rules_requests"]],
+                         ["custom_rule_{}_for_app_to_10.0.0.4".format(i) for i in range(3)])
+
+    def test_set_apps_security_groups_failure_of_one_app_does_not_affect_others(self):
+        """Check that error on a single app is reported in its own action result only"""
+        models = [self._create_app_security_group_model("app_ok"),
+                  self._create_app_security_group_model("app_failed")]
+        nic = MagicMock()
+        self.operation._create_nic_to_subnet_name_map = Mock(return_value={nic: "subnet"})
+        self.operation._determine_name_of_subnet_from_security_group_configuration_of_request = Mock(
+            return_value="subnet")
+
+        def reconcile_side_effect(**kwargs):
+            if kwargs["security_group_name"] == "NSG_app_failed":
+                raise Exception("test error")
+
+        self.nsg_service.reconcile_network_security_group_rules.side_effect = reconcile_side_effect
+
+        # Act
+        result = self.operation.set_apps_security_groups(logger=self.logger,
+                                                         app_security_group_models=models,
+                                                         compute_client=self.compute_client,
+                                                         network_client=self.network_client,
+                                                         group_name=self.group_name)
+
+        # Verify
+        self.assertTrue(result[0].success)
+        self.assertFalse(result[1].success)
+        self.assertIn("test error", result[1].error)
+
+    def test_set_apps_security_groups_reads_vms_and_nics_from_group_snapshot(self):
+        """Check that VMs and NICs of many apps are taken from a single snapshot of the resource group"""
+        models = [self._create_app_security_group_model("app_1"), self._create_app_security_group_model("app_2")]
+        nic = MagicMock()
+        nic.ip_configurations[0].private_ip_address = "10.0.0.4"
+        vm = MagicMock()
+        vm.network_profile.network_interfaces = [Mock(id="nic_id")]
+        inventory = Mock(get_virtual_machine=Mock(return_value=vm), get_network_interface=Mock(return_value=nic))
+        self.inventory_provider.get_inventory.return_value = inventory
+        self.resource_id_parser.get_name_from_resource_id.return_value = "subnet"
+        self.operation._determine_name_of_subnet_from_security_group_configuration_of_request = Mock(
+            return_value="subnet")
+
+        # Act
+        result = self.operation.set_apps_security_groups(logger=self.logger,
+                                                         app_security_group_models=models,
+                                                         compute_client=self.compute_client,
+                                                         network_client=self.network_client,
+                                                         group_name=self.group_name)
+
+        # Verify
+        self.assertTrue(all(action_result.success for action_result in result))
+        self.inventory_provider.get_inventory.assert_called_once_with(compute_client=self.compute_client,
+                                                                      network_client=self.network_client,
+                                                                      group_name=self.group_name)
+        self.vm_service.get_vm.assert_not_called()
+        self.network_client.network_interfaces.get.assert_not_called()
+        self.assertEqual(inventory.get_network_interface.call_count, 2)
+
+    def test_set_apps_security_groups_with_no_apps(self):
+        """Check that no thread pool work is done when there are no apps"""
+        result = self.operation.set_apps_security_groups(logger=self.logger,
+                                                         app_security_group_models=[],
+                                                         compute_client=self.compute_client,
+                                                         network_client=self.network_client,
+                                                         group_name=self.group_name)
+
+        self.assertEqual(result, [])
@@ -0,0 +1,111 @@
+from unittest import TestCase
+
+from mock import Mock, MagicMock
+
+from cloudshell.cp.azure.domain.services.resource_group_inventory import ResourceGroupInventoryProvider
+from cloudshell.cp.azure.domain.services.task_executor import TaskExecutorService
+from cloudshell.cp.azure.domain.vm_management.operations.vm_details_operation import VmDetailsOperation
+
+
+class TestVmDetailsOperation(TestCase):
+    def setUp(self):
+        self.vm_service = Mock()
+        self.vm_details_provider = Mock()
+        self.vm_details_provider.create.side_effect = lambda *args, **kwargs: Mock()
+        self.network_service = Mock()
+        self.logger = Mock()
+        self.compute_client = Mock()
+        self.network_client = Mock()
+        self.cancellation_context = Mock(is_cancelled=False)
+        self.vm_details_operation = VmDetailsOperation(vm_service=self.vm_service,
+                                                       vm_details_provider=self.vm_details_provider,
+                                                       inventory_provider=ResourceGroupInventoryProvider(
+                                                           vm_service=self.vm_service,
+                                                           network_service=self.network_service,
+                                                           security_group_service=Mock()),
+                                                       task_executor=TaskExecutorService(max_workers=2),
+                                                       bulk_max_group_size=2)
+
+    def _prepare_request(self, vm_name):
+        request = MagicMock()
+        request.deployedAppJson.name = vm_name
+        request.appRequestJson.deploymentService.attributes = []
+        return request
+
+    def _prepare_vm(self, vm_name):
+        vm = Mock()
+        vm.name = vm_name
+        return vm
+
+    def _get_vm_details(self, requests):
+        return self.vm_details_operation.get_vm_details(compute_client=self.compute_client,
+                                                        group_name="group",
+                                                        requests=requests,
+                                                        logger=self.logger,
+                                                        network_client=self.network_client,
+                                                        model_parser=Mock(),
+                                                        cancellation_context=self.cancellation_context)
+
+    def test_get_vm_details_for_single_request_reads_vm(self):
+        # Act
+        results = self._get_vm_details([self._prepare_request("vm1")])
+
+        # Verify
+        self.assertEqual([result.appName for result in results], ["vm1"])
+        self.vm_service.get_vm.assert_called_once_with(self.compute_client, "group", "vm1")
+        self.vm_service.list_virtual_machines.assert_not_called()
+
+    def test_get_vm_details_uses_group_snapshot(self):
+        vm1, vm2 = self._prepare_vm("vm1"), self._prepare_vm("vm2")
+        self.vm_service.list_virtual_machines.return_value = [vm1, vm2]
+        nic = Mock(id="/Subscriptions/sub/NIC1")
+        public_ip = Mock(id="/Subscriptions/sub/IP1")
+        self.network_service.get_network_interfaces.return_value = [nic]
+        self.network_service.get_public_ips.return_value = [public_ip]
+
+        # Act
+        results = self._get_vm_details([self._prepare_request("vm2"), self._prepare_request("vm1")])
+
+        # Verify
+        self.assertEqual([result.appName for result in results], ["vm2", "vm1"])
+        self.vm_service.get_vm.assert_not_called()
+        self.assertEqual(self.vm_details_provider.create.call_count, 2)
+        inventory = self.vm_details_provider.create.call_args[1]["inventory"]
+        self.assertEqual(inventory.get_network_interface("/subscriptions/sub/nic1"), nic)
+        self.assertEqual(inventory.get_public_ip("/subscriptions/sub/ip1"), public_ip)
+        self.vm_service.list_virtual_machines.assert_called_once()
+        self.network_service.get_network_interfaces.assert_called_once()
+        self.network_service.get_public_ips.assert_called_once()
+
+    def test_get_vm_details_for_large_group_reads_network_per_vm(self):
+        self.vm_service.list_virtual_machines.return_value = [self._prepare_vm("vm{}".format(i)) for i in range(3)]
+
+        # Act
+        results = self._get_vm_details([self._prepare_request("vm1"), self._prepare_request("vm2")])
+
+        # Verify
+        self.assertEqual(len(results), 2)
+        self.network_service.get_network_interfaces.assert_not_called()
+        self.network_service.get_public_ips.assert_not_called()
+        self.vm_service.get_vm.assert_not_called()
+        self.assertIsNone(self.vm_details_provider.create.call_args[1]["inventory"])
+
+    def test_get_vm_details_falls_back_to_per_vm_reads_when_listing_fails(self):
+        self.vm_service.list_virtual_machines.side_effect = Exception("listing failed")
+
+        # Act
+        results = self._get_vm_details([self._prepare_request("vm1"), self._prepare_request("vm2")])
+
+        # Verify
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.vm_service.get_vm.call_count, 2)
+
+    def test_get_vm_details_returns_error_for_failed_vm(self):
+        self.vm_service.get_vm.side_effect = Exception("not found")
+
+        # Act
+        results = self._get_vm_details([self._prepare_request("vm1")])
+
+        # Verify
+        self.assertEqual(results[0].appName, "vm1")
+        self.assertEqual(results[0].errorMessage, "not found")